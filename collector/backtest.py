@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+backtest - replay the roof open/close rules over the sensors history.
+
+The thresholds in safety_rules.yaml were tuned by editing a constant and
+waiting for real nights (required_baa_delta_t 30 -> 18 -> 15 -> 13 ...). This
+loads the sensors history ONCE into NumPy arrays and evaluates the same
+compiled rule plan the live evaluator uses over every row:
+
+  * the "now" checks are element-wise comparisons,
+  * the "past" outlier counts (sqm 300 s, rain/infrared 3600 s) are rolling
+    window sums: a cumulative sum of the hit mask and one searchsorted() for
+    the window starts, so every row's count costs O(1),
+  * both hysteresis variants (roof closed / roof open thresholds) are
+    computed up front; only the final pass that picks the variant by the
+    previous open_ok and applies the event rules (the "closing" cooldown) is
+    sequential, and it is a plain loop over booleans.
+
+Rows are evaluated at their own create_time, i.e. as if the evaluator ran
+right after each minute row; DB freshness is not replayed (with no fresh row
+the live evaluator exits without a verdict). History is read from sensors_all,
+which on SQLite also covers the month chunks partitions.py moved out of sensors.
+
+    ./backtest.py --start 2025-01-01 --end 2026-01-01 --cache /tmp/sensors-2025.npz
+    ./backtest.py --cache /tmp/sensors-2025.npz --set required_baa_delta_t=15 --timeline open_ok.csv
+    ./backtest.py --archive /srv/observatory/columns --start 2020-01-01     # see columnar_archive.py
+"""
+
+import argparse
+import datetime
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import columnar_archive
+import query_sky_and_obsy_conditions as rules
+import safety_rules
+
+logger = logging.getLogger("collector.backtest")
+
+# Everything the rules read, besides create_time. NULL becomes NaN, which
+# fails every comparison - a missing value is never "ok" and never a hit.
+HISTORY_COLUMNS = rules.PLAN.columns
+
+
+def history_sql(start=None, end=None):
+    where = []
+    params = []
+    if start is not None:
+        where.append("create_time >= %s")
+        params.append(start)
+    if end is not None:
+        where.append("create_time < %s")
+        params.append(end)
+    sql = """
+      SELECT create_time,{columns}
+        FROM sensors_all
+       {where}
+    ORDER BY create_time;
+    """.format(columns=",".join(HISTORY_COLUMNS),
+               where="WHERE " + " AND ".join(where) if where else "")
+    return (sql, params)
+
+
+def history_from_rows(rows):
+    """[(create_time, col, ...), ...] -> {"create_time": int64 epoch seconds,
+    column: float64 (NaN for NULL)}."""
+    rows = list(rows)
+    history = {"create_time": np.array([r[0] for r in rows], dtype="datetime64[s]").astype(np.int64)}
+    for i, column in enumerate(HISTORY_COLUMNS, start=1):
+        history[column] = np.array([np.nan if r[i] is None else float(r[i]) for r in rows], dtype=np.float64)
+    return history
+
+
+def load_history(db_cursor, start=None, end=None):
+    """One range query for the whole period."""
+    (sql, params) = history_sql(start, end)
+    db_cursor.execute(sql, params)
+    return history_from_rows(db_cursor.fetchall())
+
+
+def load_archive(directory, start=None, end=None):
+    """The history from a columnar_archive.py directory instead of the DB
+    (start / end as for history_sql(): ISO strings)."""
+    return columnar_archive.load(directory, HISTORY_COLUMNS,
+                                 datetime.datetime.fromisoformat(start) if start else None,
+                                 datetime.datetime.fromisoformat(end) if end else None)
+
+
+def save_history(history, path):
+    np.savez(path, **history)
+
+
+def read_history(path):
+    with np.load(path) as npz:
+        return {k: npz[k] for k in npz.files}
+
+
+def replay(create_time, ok_closed, ok_open, events_closed, events_open, last_open_ok=False):
+    """Sequential pass: pick the hysteresis variant by the previous open_ok and
+    apply the event rules (Plan.event_checks) to the events replayed so far.
+    Returns (open_ok, events) with events = [(index, "opening"|"closing")]."""
+    n = len(create_time)
+    open_ok = np.zeros(n, dtype=bool)
+    events = []
+    log = safety_rules.EventLog()
+    ct = create_time.tolist()
+    closed = ok_closed.tolist()
+    opened = ok_open.tolist()
+    for i in range(n):
+        ok = opened[i] if last_open_ok else closed[i]
+        if ok:
+            for (event, seconds, check) in (events_open if last_open_ok else events_closed):
+                if not check(log.count(event, seconds, ct[i])):
+                    ok = False
+                    break
+        if ok != last_open_ok:
+            event = "opening" if ok else "closing"
+            events.append((i, event))
+            log.add(event, ct[i])
+        open_ok[i] = ok
+        last_open_ok = ok
+    return (open_ok, events)
+
+
+def backtest(history, params=None, last_open_ok=False, plan=None):
+    """Evaluate the rule plan (default: the live one) over the whole history.
+    Returns a dict with the open_ok timeline, the events and the summary
+    numbers."""
+    plan = plan or rules.PLAN
+    closed = plan.thresholds(False, params)
+    opened = plan.thresholds(True, params)
+    ok_closed = plan.verdicts(history, closed)["ok"]
+    ok_open = plan.verdicts(history, opened)["ok"]
+    (open_ok, events) = replay(history["create_time"], ok_closed, ok_open,
+                               plan.event_checks(closed), plan.event_checks(opened), last_open_ok)
+    return {"create_time": history["create_time"], "open_ok": open_ok, "events": events,
+            **summarize(history["create_time"], open_ok, events)}
+
+
+def summarize(create_time, open_ok, events, max_gap_seconds=rules.DB_MAX_AGE_MINUTES * 60):
+    """Open/close counts and hours open. A row stays in effect until the next
+    one, at most max_gap_seconds (past that the live evaluator sees a stale DB
+    and closes)."""
+    dt = np.minimum(np.diff(create_time, append=create_time[-1:]), max_gap_seconds) if len(create_time) else create_time
+    return {"rows": int(len(create_time)),
+            "openings": sum(1 for (_, e) in events if e == "opening"),
+            "closings": sum(1 for (_, e) in events if e == "closing"),
+            "hours_open": float(dt[open_ok].sum()) / 3600.0 if len(create_time) else 0.0}
+
+
+def write_timeline(result, path):
+    """CSV of create_time (UTC), open_ok and the event where it changed."""
+    event_at = dict(result["events"])
+    with open(path, "w") as f:
+        f.write("create_time,open_ok,event\n")
+        for i, (ct, ok) in enumerate(zip(result["create_time"].tolist(), result["open_ok"].tolist())):
+            f.write("{},{},{}\n".format(datetime.datetime.fromtimestamp(ct, datetime.UTC).strftime("%Y-%m-%d %H:%M:%S"),
+                                        int(ok), event_at.get(i, "")))
+
+
+def parse_set(values):
+    """['required_baa_delta_t=15', ...] -> params dict on top of the defaults."""
+    params = rules.default_params()
+    for item in values or []:
+        (key, sep, value) = item.partition("=")
+        if not sep or key not in params:
+            raise ValueError("unknown parameter {!r} (one of {})".format(key, ", ".join(sorted(params))))
+        params[key] = int(value) if value.lstrip("-").isdigit() else float(value)
+    return params
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(description="replay the roof open/close rules over the sensors history")
+    parser.add_argument('--start', help='first create_time (UTC), e.g. 2025-01-01')
+    parser.add_argument('--end', help='create_time (UTC) to stop before')
+    parser.add_argument('--cache', help='.npz file: read the history from it if present, else save it there')
+    parser.add_argument('--archive', help='read the history from this columnar_archive.py directory, not the DB')
+    parser.add_argument('--set', action='append', metavar='KEY=VALUE',
+                        help='override a threshold (repeatable), e.g. required_baa_delta_t=15')
+    parser.add_argument('--timeline', help='write the open_ok timeline as CSV')
+    parser.add_argument('--debug', action='store_true', help='enable debug level verbosity')
+    return parser
+
+
+def main():
+    args = _build_parser().parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format="%(asctime)s %(levelname)-8s %(name)s %(message)s")
+    params = parse_set(args.set)
+    t0 = time.time()
+    if args.archive:
+        history = load_archive(args.archive, args.start, args.end)
+    elif args.cache and os.path.exists(args.cache):
+        history = read_history(args.cache)
+    else:
+        rules.db_connect()
+        history = load_history(rules.db_cursor, args.start, args.end)
+        if args.cache:
+            save_history(history, args.cache)
+    logger.info("loaded %d rows in %.1fs", len(history["create_time"]), time.time() - t0)
+    t0 = time.time()
+    result = backtest(history, params)
+    logger.info("replayed in %.2fs", time.time() - t0)
+    print("rows {rows}, openings {openings}, closings {closings}, hours open {hours_open:.1f}".format(**result))
+    if args.timeline:
+        write_timeline(result, args.timeline)
+
+
+if __name__ == "__main__":
+    main()
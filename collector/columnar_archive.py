@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+columnar_archive - the sensors history as monthly chunks of typed NumPy
+columns, for backtests and analysis without the database.
+
+Pulling years of sensors through a DB cursor means a Python tuple per row and
+a float per value before NumPy ever sees it (backtest.load_history()). The
+archive holds the same history column-wise:
+
+    <archive>/index.json                 chunks, their row counts and time span
+    <archive>/2025-06/create_time.npy    int64 epoch seconds, sorted
+    <archive>/2025-06/sqm1_sqm.npy       float64, NaN for NULL
+    ...                                  one .npy per sensors column
+
+Each chunk is one month; each .npy is memory-mappable (np.load(mmap_mode='r'))
+and create_time is its time index (np.searchsorted). load() opens only the
+requested columns of only the chunks overlapping the range, so a decade opens
+in milliseconds and reads from the page cache what is used; a range inside
+one chunk is returned as views of the mapped files, without a copy. The
+arrays are the backtest's history dict (backtest.py / sweep.py --archive).
+
+Columns are float64 like the DB's DOUBLE: the backtest compares them with the
+same thresholds as the live rules, and a narrower type would move values
+across a threshold. Parquet would need pyarrow; .npy needs nothing beyond the
+NumPy the backtest already uses.
+
+export() appends: it reads only the rows after the archive's last time (up to
+SETTLE ago, so only finalised minutes) and rewrites only the newest month's
+files; closed months are never touched again. Rows that land behind the
+archive later (an RRD backfill) are picked up by re-exporting their month
+(--month). It works a month at a time - fetchmany() straight into the
+month's preallocated arrays, the month written, the index saved - so a
+multi-year export holds one month in memory and an interrupted one resumes
+after the last month written. A month's columns are all written to temp
+names before any is renamed, index.json last, so a reader never sees a
+half-written chunk: it uses the row counts of the index it read.
+
+    ./columnar_archive.py --archive /srv/observatory/columns             # append (cron)
+    ./columnar_archive.py --archive /srv/observatory/columns --month 2025-06
+    ./backtest.py --archive /srv/observatory/columns --start 2020-01-01
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import partitions
+import schema
+import storage
+
+logger = logging.getLogger("collector.columnar_archive")
+
+INDEX = "index.json"
+COLUMNS = schema.SENSOR_COLUMNS
+SETTLE = datetime.timedelta(minutes=2)      # newer rows may still be upserted
+FETCH_ROWS = 10000
+MONTH_ROWS = 31 * 24 * 60                   # initial array size: a month of minute rows
+
+
+def chunk_name(month):
+    return "{:%Y-%m}".format(month)
+
+
+def to_epoch(t):
+    """datetime (naive UTC) -> int epoch seconds."""
+    return int(t.replace(tzinfo=datetime.UTC).timestamp())
+
+
+def read_index(directory):
+    try:
+        with open(os.path.join(directory, INDEX)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"chunks": {}, "last_time": None}
+
+
+def _write_atomic(path, write):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def write_index(directory, index):
+    _write_atomic(os.path.join(directory, INDEX),
+                  lambda f: f.write(json.dumps(index, indent=1, sort_keys=True).encode()))
+
+
+def first_time(db_cursor, start, end):
+    """create_time of the first sensors row with start < create_time <= end,
+    or None."""
+    db_cursor.execute("""
+      SELECT create_time
+        FROM sensors_all
+       WHERE create_time > %s AND create_time <= %s
+    ORDER BY create_time
+       LIMIT 1;""", [start, end])
+    row = db_cursor.fetchone()
+    return row[0] if row else None
+
+
+def fetch_columns(db_cursor, start, end):
+    """{column: array} of the sensors rows with start < create_time <= end
+    (sensors_all: also the SQLite month chunks), in time order, NaN for NULL.
+    Read FETCH_ROWS at a time into preallocated arrays."""
+    db_cursor.execute("""
+      SELECT create_time,{}
+        FROM sensors_all
+       WHERE create_time > %s AND create_time <= %s
+    ORDER BY create_time;""".format(",".join(COLUMNS)), [start, end])
+    size = MONTH_ROWS
+    arrays = {"create_time": np.empty(size, dtype=np.int64)}
+    arrays.update((column, np.empty(size, dtype=np.float64)) for column in COLUMNS)
+    n = 0
+    while True:
+        batch = db_cursor.fetchmany(FETCH_ROWS)
+        if not batch:
+            return {c: a[:n] for (c, a) in arrays.items()}
+        if n + len(batch) > size:
+            size = max(2 * size, n + len(batch))
+            for (c, a) in arrays.items():
+                grown = np.empty(size, dtype=a.dtype)
+                grown[:n] = a[:n]
+                arrays[c] = grown
+        m = n + len(batch)
+        arrays["create_time"][n:m] = [to_epoch(r[0]) for r in batch]
+        for i, column in enumerate(COLUMNS, start=1):
+            arrays[column][n:m] = [np.nan if r[i] is None else float(r[i]) for r in batch]
+        n = m
+
+
+def write_chunk(directory, month, arrays):
+    """Write a month's columns: all to temp files first, then renamed, so
+    an interrupted write never leaves columns of different lengths. Returns
+    its index entry."""
+    path = os.path.join(directory, chunk_name(month))
+    os.makedirs(path, exist_ok=True)
+    files = []
+    try:
+        for column, a in arrays.items():
+            target = os.path.join(path, column + ".npy")
+            files.append(target)
+            with open(target + ".tmp", "wb") as f:
+                np.save(f, np.ascontiguousarray(a))
+    except BaseException:
+        for target in files:
+            if os.path.exists(target + ".tmp"):
+                os.remove(target + ".tmp")
+        raise
+    for target in files:
+        os.replace(target + ".tmp", target)
+    ct = arrays["create_time"]
+    return {"rows": int(len(ct)), "first": int(ct[0]), "last": int(ct[-1]), "columns": sorted(arrays)}
+
+
+def _read_chunk(directory, name, entry, columns, mmap_mode):
+    """{column: array[:rows]} of one chunk; a column the chunk predates is NaN."""
+    path = os.path.join(directory, name)
+    rows = entry["rows"]
+    out = {}
+    for column in ["create_time"] + columns:
+        if column in entry["columns"]:
+            out[column] = np.load(os.path.join(path, column + ".npy"), mmap_mode=mmap_mode)[:rows]
+        else:
+            out[column] = np.full(rows, np.nan)
+    return out
+
+
+def export(db_cursor, directory, until=None):
+    """Append the rows after the archive's last time up to until (default:
+    SETTLE ago), a month at a time. Returns the number of rows appended."""
+    os.makedirs(directory, exist_ok=True)
+    until = until or partitions.utcnow() - SETTLE
+    index = read_index(directory)
+    last = index["last_time"]
+    start = datetime.datetime.fromtimestamp(last, datetime.UTC).replace(tzinfo=None) if last is not None \
+        else datetime.datetime(1970, 1, 1)
+    first = first_time(db_cursor, start, until)
+    if first is None:
+        return 0
+    total = 0
+    month = partitions.month_start(first)
+    while month <= until:
+        end = min(until, partitions.add_months(month, 1) - datetime.timedelta(microseconds=1))
+        new = fetch_columns(db_cursor, start, end)
+        start = end
+        n = len(new["create_time"])
+        if n:
+            name = chunk_name(month)
+            if name in index["chunks"]:        # only the newest month can still grow
+                old = _read_chunk(directory, name, index["chunks"][name], COLUMNS, None)
+                new = {c: np.concatenate([old[c], new[c]]) for c in new}
+            index["chunks"][name] = write_chunk(directory, month, new)
+            total += n
+            index["last_time"] = int(new["create_time"][-1])
+            write_index(directory, index)
+        month = partitions.add_months(month, 1)
+    logger.info("appended %d rows", total)
+    return total
+
+
+def export_month(db_cursor, directory, month):
+    """(Re)write one whole month from the database. Returns its row count."""
+    os.makedirs(directory, exist_ok=True)
+    index = read_index(directory)
+    end = partitions.add_months(month, 1) - datetime.timedelta(microseconds=1)
+    arrays = fetch_columns(db_cursor, month - datetime.timedelta(microseconds=1), end)
+    n = len(arrays["create_time"])
+    if not n:
+        return 0
+    index["chunks"][chunk_name(month)] = write_chunk(directory, month, arrays)
+    index["last_time"] = max(index["last_time"] or 0, int(arrays["create_time"][-1]))
+    write_index(directory, index)
+    return n
+
+
+def load(directory, columns=None, start=None, end=None, mmap_mode="r"):
+    """{"create_time": int64 epoch seconds, column: float64} for
+    start <= create_time < end (datetimes, naive UTC; None: open). Within one
+    chunk the arrays are views of the memory-mapped files."""
+    columns = list(columns or COLUMNS)
+    index = read_index(directory)
+    lo = to_epoch(start) if start is not None else None
+    hi = to_epoch(end) if end is not None else None
+    parts = []
+    for name in sorted(index["chunks"]):
+        entry = index["chunks"][name]
+        if (lo is not None and entry["last"] < lo) or (hi is not None and entry["first"] >= hi):
+            continue
+        chunk = _read_chunk(directory, name, entry, columns, mmap_mode)
+        ct = chunk["create_time"]
+        i = np.searchsorted(ct, lo, "left") if lo is not None else 0
+        j = np.searchsorted(ct, hi, "left") if hi is not None else len(ct)
+        parts.append({c: a[i:j] for c, a in chunk.items()})
+    if not parts:
+        return {c: np.empty(0, dtype=np.int64 if c == "create_time" else np.float64) for c in ["create_time"] + columns}
+    if len(parts) == 1:
+        return parts[0]
+    return {c: np.concatenate([p[c] for p in parts]) for c in parts[0]}
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(description="export the sensors history to a columnar NumPy archive")
+    parser.add_argument('--archive', required=True, help='archive directory')
+    parser.add_argument('--month', help='re-export this month (YYYY-MM) instead of appending')
+    parser.add_argument('--storage_config', default=storage.CONFIG_PATH,
+                        help='file with the [storage] / [mysqlDB] sections (default %(default)s)')
+    parser.add_argument('--debug', action='store_true', help='enable debug level verbosity')
+    return parser
+
+
+def main():
+    args = _build_parser().parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format="%(asctime)s %(levelname)-8s %(name)s %(message)s")
+    db_cursor = storage.from_config(args.storage_config).connect().cursor()
+    t0 = time.time()
+    if args.month:
+        n = export_month(db_cursor, args.archive, datetime.datetime.strptime(args.month, "%Y-%m"))
+    else:
+        n = export(db_cursor, args.archive)
+    logger.info("%d rows written in %.1fs", n, time.time() - t0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+evaluation_trigger - run the safety evaluation off the ingest path.
+
+sensors_to_database.py used to run ./query_sky_and_obsy_conditions.py
+synchronously whenever a new minute row started ("Hack: but first call ..."),
+so ingest latency was hostage to a Python start, a dozen queries and the
+Mattermost POST with its 10 s timeout. The ingest side now only calls
+EvaluationTrigger.fire(create_time) once a minute row is committed and
+complete; a worker thread runs the evaluator.
+
+Triggers coalesce: while an evaluation is running at most ONE more is kept
+pending, and a newer fire replaces an older pending one (evaluating a stale
+minute after a newer one is pointless).
+
+With the long-lived safety_evaluator.py service running, notify_evaluator()
+replaces the script run: it just sends the service one UDP datagram.
+"""
+
+import logging
+import os
+import socket
+import subprocess
+import threading
+
+logger = logging.getLogger("collector.evaluation_trigger")
+
+EVALUATOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_sky_and_obsy_conditions.py")
+EVALUATOR_TIMEOUT = 120  # seconds; a hung evaluator must not wedge the worker forever
+
+
+def run_evaluator_script(create_time, evaluator=EVALUATOR, timeout=EVALUATOR_TIMEOUT):
+    """Default action: run the evaluator script as its own process."""
+    try:
+        subprocess.run([evaluator], timeout=timeout, check=True)
+    except subprocess.CalledProcessError as e:
+        logger.warning("%s exited %s", evaluator, e.returncode)
+    except subprocess.TimeoutExpired:
+        logger.error("%s timed out after %ss", evaluator, timeout)
+
+
+def notify_evaluator(create_time, address=("127.0.0.1", 7778)):
+    """Tell a running safety_evaluator.py that the minute row create_time is
+    committed. Fire-and-forget: a service that is down simply misses it (and
+    still evaluates on its own interval)."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.sendto(str(create_time).encode(), address)
+
+
+class EvaluationTrigger:
+    """Non-blocking evaluation trigger with a single worker thread.
+
+        trigger = EvaluationTrigger()
+        trigger.start()
+        trigger.fire(create_time)     # returns immediately
+        trigger.stop()"""
+
+    def __init__(self, evaluate=run_evaluator_script):
+        self.evaluate = evaluate
+        self._cond = threading.Condition()
+        self._pending = None
+        self._stopping = False
+        self._thread = None
+        self.fired = 0
+        self.coalesced = 0
+        self.runs = 0
+        self.errors = 0
+
+    def start(self):
+        self._stopping = False
+        self._thread = threading.Thread(target=self._loop, name="evaluation", daemon=True)
+        self._thread.start()
+        return self
+
+    def fire(self, create_time):
+        """Request an evaluation for the minute row stamped create_time."""
+        with self._cond:
+            if self._pending is not None:
+                self.coalesced += 1
+            self._pending = create_time
+            self.fired += 1
+            self._cond.notify()
+
+    def stop(self, timeout=None):
+        """Finish a pending evaluation, then stop the worker."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._stopping:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+                create_time, self._pending = self._pending, None
+            logger.info("evaluating after minute row %s", create_time)
+            try:
+                self.evaluate(create_time)
+                self.runs += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error("evaluation for %s failed: %s", create_time, e)
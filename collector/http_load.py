@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+http_load - hammer an HTTP endpoint from concurrent keep-alive clients and
+report the request rate and the latency percentiles.
+
+Each client is a thread with one persistent connection (reopened when the
+server closes it) sending GETs back to back for --duration seconds, like the
+INDI weather drivers and dashboards polling /weather/safety or the roof
+controller. Compare a service before and after a change:
+
+    ./weather_safety_service.py --server dev &         # app.run(), as before
+    ./http_load.py --url http://localhost:5000/weather/safety --clients 16
+    ./weather_safety_service.py --server werkzeug &
+    ./http_load.py --url http://localhost:5000/weather/safety --clients 16
+
+Stays Python 3.5 compatible, to run on rpi1 against roof/controller.py.
+"""
+
+import argparse
+import http.client
+import json
+import threading
+import time
+import urllib.parse
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100.0))]
+
+
+def _ms(seconds):
+    return round(seconds * 1000.0, 2) if seconds is not None else None
+
+
+class _Client(threading.Thread):
+
+    def __init__(self, url, headers, deadline, timeout):
+        threading.Thread.__init__(self, daemon=True)
+        self.url = urllib.parse.urlsplit(url)
+        self.headers = headers
+        self.deadline = deadline
+        self.timeout = timeout
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+        self.connections = 0
+
+    def _connect(self):
+        self.connections += 1
+        return http.client.HTTPConnection(self.url.hostname, self.url.port or 80, timeout=self.timeout)
+
+    def run(self):
+        path = self.url.path + ("?" + self.url.query if self.url.query else "")
+        connection = self._connect()
+        while time.monotonic() < self.deadline:
+            t0 = time.monotonic()
+            try:
+                connection.request("GET", path, headers=self.headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                self.errors += 1
+                connection.close()
+                time.sleep(0.01)
+                connection = self._connect()
+                continue
+            self.latencies.append(time.monotonic() - t0)
+            self.statuses[response.status] = self.statuses.get(response.status, 0) + 1
+            if response.will_close:
+                connection.close()
+                connection = self._connect()
+        connection.close()
+
+
+def run(url, clients=8, duration=10.0, headers=None, timeout=10.0):
+    """Load url for duration seconds. Returns a dict of counts, the rate
+    (requests/s) and latency percentiles (ms)."""
+    start = time.monotonic()
+    threads = [_Client(url, headers or {}, start + duration, timeout) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - start
+    latencies = sorted(l for t in threads for l in t.latencies)
+    statuses = {}
+    for t in threads:
+        for (status, n) in t.statuses.items():
+            statuses[status] = statuses.get(status, 0) + n
+    return {"clients": clients, "requests": len(latencies), "errors": sum(t.errors for t in threads),
+            "connections": sum(t.connections for t in threads), "statuses": statuses,
+            "rate": len(latencies) / elapsed, "p50_ms": _ms(percentile(latencies, 50)),
+            "p90_ms": _ms(percentile(latencies, 90)), "p99_ms": _ms(percentile(latencies, 99)),
+            "max_ms": _ms(latencies[-1] if latencies else None)}
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(description="concurrent keep-alive HTTP load test")
+    parser.add_argument('--url', required=True, help='URL to GET, e.g. http://localhost:5000/weather/safety')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent connections (default %(default)s)')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds to run (default %(default)s)')
+    parser.add_argument('--header', action='append', metavar='NAME:VALUE',
+                        help='request header (repeatable), e.g. If-None-Match:"abc"')
+    parser.add_argument('--json', action='store_true', help='print the result as JSON')
+    return parser
+
+
+def main():
+    args = _build_parser().parse_args()
+    headers = dict(h.split(":", 1) for h in args.header or [])
+    result = run(args.url, args.clients, args.duration, headers)
+    if args.json:
+        print(json.dumps(result, sort_keys=True))
+        return
+    print("{requests} requests ({errors} errors, {connections} connections) from {clients} clients: "
+          "{rate:.0f} req/s, p50 {p50_ms} ms, p90 {p90_ms} ms, p99 {p99_ms} ms, max {max_ms} ms".format(**result))
+    print("statuses: {}".format(result["statuses"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+ingest - persistent DB and RRD writers for the port-7777 rrd update protocol.
+
+server.pl forks ./sensors_to_database.py and /usr/bin/rrdtool for every
+'update <file>.rrd -t k1:k2 N:v1:v2' line it receives on port 7777. Each fork
+pays a Python start, a MySQLdb import, a fresh MySQL connection and a
+'newest row' SELECT. The ingest daemon speaks the same protocol but imports the
+db_mapper/key_mapper logic once, keeps one DB connection open (reconnecting
+when MySQL drops it) and coalesces the ~10 files of a minute into one
+upsert, so an update line costs a dict merge and no process launch.
+
+RRD files are still updated too: through the python rrdtool binding when it
+is installed, else by running rrdtool like server.pl did.
+
+The network side (replacing server.pl) lives in ingest_server.py.
+"""
+
+import datetime
+import logging
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import schema
+import sensors_to_database as std
+import storage
+
+try:
+    import rrdtool
+except ImportError:
+    rrdtool = None
+
+logger = logging.getLogger("collector.ingest")
+
+# Only a row still inside its window can be continued, so only that much is
+# searched: a bounded range stays on the newest partition (partitions.py).
+NEWEST_ROW_SQL = """
+          SELECT create_time
+            FROM sensors
+           WHERE create_time >= %s
+        ORDER BY create_time DESC
+           LIMIT 1;"""
+
+
+def utcnow():
+    return datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+
+
+def to_sql_value(value):
+    """rrdtool's 'U' (unknown) becomes NULL; everything else is passed as-is
+    and left to the driver to quote."""
+    return None if value == "U" else value
+
+
+class Database:
+    """One persistent connection to the configured storage backend (see
+    storage.py). execute() commits, and reconnects once if the server went
+    away; any other error is rolled back and raised as it is."""
+
+    def __init__(self, backend=None):
+        self.backend = backend or storage.from_config()
+        self.database = None
+
+    def connect(self):
+        self.database = self.backend.connect()
+        self.backend.autocommit(self.database, False)
+        logger.info("connected to %s", self.backend)
+
+    def upsert_sql(self, names, rows=1):
+        """Multi-row upsert of create_time + names into sensors."""
+        return self.backend.upsert_sql("sensors", "create_time", names, rows)
+
+    def execute(self, sql, args=None):
+        """Execute + commit, reconnecting once if the server went away."""
+        return self.transaction([(sql, args)])
+
+    def transaction(self, statements):
+        """Execute [(sql, args)] and commit them together, reconnecting once if
+        the server went away. Returns the cursor of the last statement."""
+        for attempt in (1, 2):
+            if self.database is None:
+                self.connect()
+            try:
+                db_cursor = self.database.cursor()
+                for (sql, args) in statements:
+                    db_cursor.execute(sql, args)
+                self.database.commit()
+                return db_cursor
+            except self.backend.Error as e:
+                if not self.backend.disconnected(e, self.database):
+                    self.database.rollback()
+                    raise
+                logger.warning("DB connection lost (%s), reconnecting", e)
+                self.database = None
+                if attempt == 2:
+                    raise
+
+
+class SensorIngest:
+    """Coalesces mapped update lines into ONE sensors row per minute and writes
+    it over ONE persistent connection.
+
+    sensors_to_database.py SELECTs the newest row and then INSERTs or UPDATEs
+    for every rrd file - two round trips per file, ~10 files per minute, and
+    concurrent arrivals race on the minute boundary. Here all '<prefix>_<field>'
+    values are merged in memory into the current minute bucket and written as a
+    single parameterised
+
+        INSERT INTO sensors (create_time, ...) VALUES (...)
+            ON DUPLICATE KEY UPDATE col=VALUES(col), ...
+
+    A bucket is the one-minute window opened by its first value (the same
+    'more than a minute after the row's create_time -> new row' rule as
+    sensors_to_database.py), so a loops.pl burst that straddles a clock minute
+    still lands in one row. Pending values are flushed when the bucket closes
+    or when no new value arrived for `quiet_seconds` (the burst is over); later
+    values for the same bucket simply upsert into the row again.
+
+    Once a bucket's window has passed its row is complete: it is flushed and
+    on_row_committed(create_time) is called (the ingest server hands that to an
+    EvaluationTrigger, so the safety evaluation sees the full minute and never
+    delays ingestion).
+
+    Needs the UNIQUE key on sensors.create_time for the upsert (schema.py
+    migration 2: sensors_create_time).
+
+    With a spool.Spool the upserts are appended to the local spool instead
+    (and a spool.SpoolDrainer writes them to MySQL and reports the committed
+    rows), so a MySQL restart loses nothing.
+
+    Not thread-safe: ingest() and tick() must be called from one thread (the
+    ingest server's DB worker)."""
+
+    def __init__(self, backend=None, window_seconds=60, quiet_seconds=5, on_row_committed=None, spool=None):
+        self.db = Database(backend)
+        self.on_row_committed = on_row_committed
+        self.spool = spool
+        self.window = datetime.timedelta(seconds=window_seconds)
+        self.quiet = datetime.timedelta(seconds=quiet_seconds)
+        self.bucket_time = None     # create_time of the row being filled
+        self.pending = {}           # {column: value} not yet written
+        self.last_value_time = None
+        self.closed_bucket_time = None
+        self.loaded = False
+        self.flushes = 0
+        self.unmapped = set()       # columns map_update produced that sensors has not
+
+    def _load_current_row(self, now):
+        """After a restart keep filling the newest row if it is still open (the
+        spool's newest row, if it has one: MySQL may be down)."""
+        newest = self.spool.last_time if self.spool else None
+        if newest is None:
+            try:
+                db_cursor = self.db.execute(NEWEST_ROW_SQL, [now - self.window])
+                db_result_tuple = db_cursor.fetchone()
+                newest = db_result_tuple[0] if db_result_tuple else None
+            except self.db.backend.Error as e:
+                if not self.spool:
+                    raise
+                logger.warning("cannot read the newest row (%s), starting a new one", e)
+        if newest is not None and newest >= now - self.window:
+            self.bucket_time = newest
+        self.loaded = True
+
+    # ---- ingest ----
+    def ingest(self, db, keys, values, now=None):
+        """Merge one mapped rrd update into the current minute bucket. Returns the
+        {column: value} dict merged. Nothing is written until flush(). Values
+        for a column sensors does not have (an rrd file db_mapper does not
+        know) are skipped, logged once per column."""
+        now = now or utcnow()
+        columns = {}
+        for (column, value) in std.map_update(db, keys, values).items():
+            if column in schema.SENSOR_COLUMNS:
+                columns[column] = to_sql_value(value)
+            elif column not in self.unmapped:
+                logger.warning("%s: no sensors column %s, skipped", db, column)
+                self.unmapped.add(column)
+        if not self.loaded:
+            self._load_current_row(now)
+        if self.bucket_time is None or self.bucket_time < now - self.window:
+            self.close_bucket()
+            logger.info("%s is More than a minute ago -> new row", self.bucket_time)
+            self.bucket_time = now.replace(microsecond=0)
+        self.pending.update(columns)
+        self.last_value_time = now
+        return columns
+
+    def tick(self, now=None):
+        """Flush the pending values once the burst went quiet, and close the
+        bucket once its window has passed. Call periodically (about once a
+        second)."""
+        if self.bucket_time is None:
+            return False
+        now = now or utcnow()
+        if now >= self.bucket_time + self.window:
+            return self.close_bucket()
+        if self.pending and now - self.last_value_time >= self.quiet:
+            return self.flush()
+        return False
+
+    def close_bucket(self):
+        """Final flush of the current bucket, then report its row as committed
+        (once per bucket; with a spool the drainer reports it once written)."""
+        if self.bucket_time is None or self.closed_bucket_time == self.bucket_time:
+            return self.flush()
+        self.closed_bucket_time = self.bucket_time
+        flushed = self.flush(final=True)
+        if self.on_row_committed and not self.spool:
+            self.on_row_committed(self.bucket_time)
+        return flushed
+
+    def flush(self, final=False):
+        """Upsert the pending values of the current bucket in one statement.
+        A lost connection is raised with the values kept for the next flush;
+        values the database rejects are logged and dropped, so they cannot
+        block every row after them."""
+        if self.spool:
+            if not self.pending and not final:
+                return False
+            self.spool.append(self.bucket_time, self.pending, final)
+        else:
+            if not self.pending:
+                return False
+            names = list(self.pending)
+            try:
+                self.db.execute(self.db.upsert_sql(names), [self.bucket_time] + [self.pending[n] for n in names])
+            except self.db.backend.Error as e:
+                if self.db.database is None:        # connection lost (or not back yet)
+                    raise
+                logger.error("sensors row %s rejected (%s), dropped %s", self.bucket_time, e, self.pending)
+                self.pending = {}
+                return False
+        flushed = bool(self.pending)
+        self.pending = {}
+        self.flushes += flushed
+        return flushed
+
+
+class RrdWriter:
+    """rrdtool update, in-process when the python binding is available."""
+
+    def __init__(self, rrd_dir="."):
+        self.rrd_dir = rrd_dir
+
+    def update(self, db, keys, values):
+        path = os.path.join(self.rrd_dir, db)
+        template = ":".join(keys)
+        data = ":".join(values)
+        if rrdtool is not None:
+            rrdtool.update(path, "-t", template, data)
+        else:
+            subprocess.run(["/usr/bin/rrdtool", "update", path, "-t", template, data], check=True)
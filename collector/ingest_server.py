@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+ingest_server - asyncio replacement for server.pl on port 7777.
+
+server.pl runs one accept() loop and blocks on two system() calls per
+connection, so one slow MySQL commit stalls every sensor client (loops.pl
+sendToRRD then dies with "Can't talk to"). This server accepts any number of
+clients concurrently, parses the same 'update <file>.rrd -t k1:k2 N:v1:v2'
+lines and hands them to two independent writers (DB and RRD) through BOUNDED
+queues:
+
+  * Each writer runs in its own worker thread, so a slow DB never delays the
+    RRD files and vice versa, and the asyncio loop itself never blocks.
+  * Backpressure: when a queue is full the client connection waits up to
+    --put_timeout seconds for room; after that the update is DROPPED for that
+    writer and counted (the sensor client is never held hostage).
+  * A client sending the line 'stats' gets a JSON dict back with the queue
+    depths and the received / written / error / dropped counters; the same
+    counters are logged every --stats_interval seconds.
+  * Once a minute row is complete and committed, the safety evaluation
+    (--evaluator) is triggered on its own worker thread - never inline - or
+    the safety_evaluator.py service is notified (--notify).
+  * With --spool the rows go to a local write-ahead spool first and a drainer
+    thread replays them into MySQL (spool.py): a MySQL restart loses nothing.
+  * Committed rows are published to shared memory (latest_cache.py) before
+    the evaluation is triggered, so the evaluator and the weather services
+    need not query for them, and merged into the hourly / daily rollups
+    (rollups.py) after it.
+
+Run it from the directory holding the .rrd files (like server.pl):
+    cd /path/to/rrds && /path/to/collector/ingest_server.py
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import signal
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import evaluation_trigger
+import ingest
+import latest_cache
+import rollups
+import sensors_to_database as std
+import spool
+import storage
+
+logger = logging.getLogger("collector.ingest_server")
+
+LISTEN_HOST = "0.0.0.0"
+LISTEN_PORT = 7777
+QUEUE_SIZE = 1000       # per writer; ~100 minutes of the observatory's ~10 files/minute
+PUT_TIMEOUT = 1.0       # seconds a client may be held waiting for queue room
+READ_TIMEOUT = 10.0     # seconds to wait for a client to send its line
+MAX_LINE = 1024         # same limit as server.pl's recv()
+
+
+class _Sink:
+    """One writer: bounded queue + single worker thread + counters."""
+
+    def __init__(self, name, write, queue_size):
+        self.name = name
+        self.write = write
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self.written = 0
+        self.errors = 0
+        self.dropped = 0
+        self.overflows = 0
+
+    async def put(self, item, timeout):
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            self.overflows += 1
+        try:
+            await asyncio.wait_for(self.queue.put(item), timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.dropped += 1
+            logger.warning("%s queue full (%d), dropped %s", self.name, self.queue.qsize(), item[0])
+            return False
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.queue.get()
+            try:
+                await loop.run_in_executor(self.executor, self.write, *item)
+                self.written += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error("%s write of %s failed: %s", self.name, item[0], e)
+            finally:
+                self.queue.task_done()
+
+    def stats(self):
+        return {"depth": self.queue.qsize(), "max": self.queue.maxsize, "written": self.written,
+                "errors": self.errors, "overflows": self.overflows, "dropped": self.dropped}
+
+
+class IngestServer:
+    """Concurrent port-7777 server feeding the DB and RRD writers."""
+
+    def __init__(self, db_write, rrd_write, queue_size=QUEUE_SIZE, put_timeout=PUT_TIMEOUT,
+                 read_timeout=READ_TIMEOUT):
+        self.sinks = [_Sink("db", db_write, queue_size), _Sink("rrd", rrd_write, queue_size)]
+        self.put_timeout = put_timeout
+        self.read_timeout = read_timeout
+        self.received = 0
+        self.unknown = 0
+        self.clients = 0
+        self._workers = []
+        self._server = None
+
+    def stats(self):
+        s = {"received": self.received, "unknown": self.unknown, "clients": self.clients}
+        for sink in self.sinks:
+            s[sink.name] = sink.stats()
+        return s
+
+    async def start(self, host, port):
+        self._workers = [asyncio.create_task(sink.run()) for sink in self.sinks]
+        self._server = await asyncio.start_server(self._handle_client, host, port, reuse_address=True)
+        return self._server
+
+    async def stop(self, drain_timeout=10.0):
+        """Stop accepting, give the writers drain_timeout seconds to empty their
+        queues, then cancel them."""
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        try:
+            await asyncio.wait_for(asyncio.gather(*(s.queue.join() for s in self.sinks)), drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("shutdown with undrained queues: %s", self.stats())
+        for w in self._workers:
+            w.cancel()
+        for sink in self.sinks:
+            sink.executor.shutdown(wait=True)
+
+    async def handle_line(self, line):
+        """Queue one update line to every writer. Returns a reply for 'stats',
+        else None."""
+        if line == "stats":
+            return json.dumps(self.stats(), sort_keys=True)
+        try:
+            item = std.parse_update(line)
+        except ValueError:
+            self.unknown += 1
+            logger.warning("received UNKNOWN data: [%s]", line)
+            return None
+        self.received += 1
+        logger.debug("%s", line)
+        for sink in self.sinks:
+            await sink.put(item, self.put_timeout)
+        return None
+
+    async def _handle_client(self, reader, writer):
+        self.clients += 1
+        try:
+            data = await asyncio.wait_for(reader.read(MAX_LINE), self.read_timeout)
+            for line in data.decode("ascii", "replace").splitlines():
+                line = line.strip()
+                if not line:
+                    continue
+                reply = await self.handle_line(line)
+                if reply is not None:
+                    writer.write(reply.encode() + b"\n")
+                    await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            logger.debug("client dropped: %s", e)
+        finally:
+            self.clients -= 1
+            writer.close()
+
+    async def tick(self, sink_name, fn, interval=1.0):
+        """Run fn() every interval seconds on the named writer's worker thread
+        (so it is serialised with that writer's own writes)."""
+        sink = next(s for s in self.sinks if s.name == sink_name)
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await loop.run_in_executor(sink.executor, fn)
+            except Exception as e:
+                sink.errors += 1
+                logger.error("%s tick failed: %s", sink_name, e)
+
+    async def log_stats(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            logger.info("stats %s", json.dumps(self.stats(), sort_keys=True))
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(description="asyncio port-7777 rrd update ingest server")
+    parser.add_argument('--host', default=LISTEN_HOST, help='listen address (default %(default)s)')
+    parser.add_argument('--port', type=int, default=LISTEN_PORT, help='listen port (default %(default)s)')
+    parser.add_argument('--rrd_dir', default='.', help='directory holding the .rrd files (default: cwd)')
+    parser.add_argument('--queue_size', type=int, default=QUEUE_SIZE, help='per-writer queue bound (default %(default)s)')
+    parser.add_argument('--put_timeout', type=float, default=PUT_TIMEOUT,
+                        help='seconds a client waits for queue room before its update is dropped (default %(default)s)')
+    parser.add_argument('--evaluator', default=evaluation_trigger.EVALUATOR,
+                        help='safety evaluator run after each committed minute row (default %(default)s)')
+    parser.add_argument('--notify', metavar='HOST:PORT',
+                        help='notify a running safety_evaluator.py over UDP instead of running --evaluator')
+    parser.add_argument('--no_evaluate', action='store_true', help='do not trigger the safety evaluation')
+    parser.add_argument('--no_rollups', action='store_true',
+                        help='do not merge committed rows into the hourly / daily rollups')
+    parser.add_argument('--cache_dir', default=latest_cache.CACHE_DIR,
+                        help='publish each committed row to the latest_cache.py record here (default %(default)s)')
+    parser.add_argument('--no_cache', action='store_true', help='do not publish committed rows to --cache_dir')
+    parser.add_argument('--spool', metavar='PATH',
+                        help='write rows to this local spool first; a drainer thread replays it into the database')
+    parser.add_argument('--storage_config', default=storage.CONFIG_PATH,
+                        help='file with the [storage] / [mysqlDB] sections (default %(default)s)')
+    parser.add_argument('--stats_interval', type=float, default=600, help='seconds between stats log lines (default %(default)s)')
+    parser.add_argument('--debug', action='store_true', help='enable debug level verbosity')
+    return parser
+
+
+def _chain(hooks):
+    """One on_row_committed calling each hook in order (None for none)."""
+    if not hooks:
+        return None
+
+    def on_row_committed(create_time):
+        for hook in hooks:
+            hook(create_time)
+    return on_row_committed
+
+
+async def _serve(args):
+    trigger = None
+    if args.notify:
+        (host, _, port) = args.notify.rpartition(":")
+        trigger = evaluation_trigger.EvaluationTrigger(
+            lambda create_time: evaluation_trigger.notify_evaluator(create_time, (host, int(port)))).start()
+    elif not args.no_evaluate:
+        trigger = evaluation_trigger.EvaluationTrigger(
+            lambda create_time: evaluation_trigger.run_evaluator_script(create_time, args.evaluator)).start()
+    backend = storage.from_config(args.storage_config)
+    logger.info("storing rows in %s", backend)
+    # In this order: the evaluator reads the published row, the rollups can wait.
+    hooks = []
+    if not args.no_cache:
+        hooks.append(latest_cache.SensorsPublisher(backend, latest_cache.LatestCache(args.cache_dir)))
+    if trigger:
+        hooks.append(trigger.fire)
+    if not args.no_rollups:
+        hooks.append(rollups.Rollups(backend).roll)
+    on_row_committed = _chain(hooks)
+    row_spool = drainer = None
+    if args.spool:
+        row_spool = spool.Spool(args.spool)
+        drainer = spool.SpoolDrainer(row_spool, backend, on_row_committed=on_row_committed).start()
+        on_row_committed = None
+    sensor_ingest = ingest.SensorIngest(backend, on_row_committed=on_row_committed, spool=row_spool)
+    rrd_writer = ingest.RrdWriter(args.rrd_dir)
+    server = IngestServer(sensor_ingest.ingest, rrd_writer.update,
+                          queue_size=args.queue_size, put_timeout=args.put_timeout)
+    await server.start(args.host, args.port)
+    logger.info("server waiting for client connection on port %d", args.port)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signo in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signo, stop.set)
+    tasks = [asyncio.create_task(server.log_stats(args.stats_interval)),
+             asyncio.create_task(server.tick("db", sensor_ingest.tick))]
+    if row_spool:
+        tasks.append(asyncio.create_task(server.tick("db", row_spool.tick)))
+    await stop.wait()
+    for t in tasks:
+        t.cancel()
+    logger.info("stopping, draining queues")
+    await server.stop()
+    await loop.run_in_executor(None, sensor_ingest.flush)
+    if drainer:
+        row_spool.sync()
+        drainer.stop(timeout=30)
+        row_spool.close()
+    if trigger:
+        trigger.stop(timeout=evaluation_trigger.EVALUATOR_TIMEOUT)
+
+
+def main():
+    args = _build_parser().parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format="%(asctime)s %(levelname)-8s %(name)s %(message)s")
+    asyncio.run(_serve(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+latest_cache - the newest completed sensors row and the newest roof verdict,
+published to shared memory for every reader.
+
+Every minute the safety evaluator asks the database for the newest sensors
+row and the one before it, and weather_status.py / weather_safety_service.py
+ask it for the newest roof row - the same two answers, fetched over and over
+by whoever asks. The writers already know them when they change:
+
+  * the ingest server, once a minute row is complete and committed, reads that
+    row and the one before it ONCE (SensorsPublisher, chained before the
+    evaluation trigger so the evaluator finds it published),
+  * query_sky_and_obsy_conditions.store_roof_status(), once the verdict is
+    committed, publishes it as it stored it.
+
+Each kind is one small JSON file, /dev/shm/observatory-<kind>.json (tmpfs: no
+disk write), replaced atomically (tmp + os.replace) so a reader sees the old
+record or the new one, never half of one. A record carries a sequence number
+(continued across writer restarts) and the time it was written. Readers stat
+the file and only parse it again when it was replaced, so a read costs a
+stat() and no query.
+
+A record whose create_time is older than the reader's max_age is stale: the
+writer is down or behind (rows may still reach the database some other way),
+and the reader asks the database as before. A missing or unreadable file is
+the same.
+
+    ./latest_cache.py          # show what is published and how old it is
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import ingest
+import schema
+
+logger = logging.getLogger("collector.latest_cache")
+
+CACHE_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+KINDS = ("sensors", "roof")
+DATETIME_KEYS = ("create_time", "written")
+# As query_sky_and_obsy_conditions.LATEST_LOOKBACK: stay on the newest partition.
+LOOKBACK = datetime.timedelta(days=1)
+
+LATEST_ROWS_SQL = """
+      SELECT sensors_id,create_time,{columns}
+        FROM sensors
+       WHERE create_time > %s AND create_time <= %s
+    ORDER BY create_time DESC
+       LIMIT 2;""".format(columns=",".join(schema.SENSOR_COLUMNS))
+
+
+def utcnow():
+    return datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+
+
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError("{!r} is not JSON serializable".format(value))
+
+
+def _decode(d):
+    for key in DATETIME_KEYS:
+        if isinstance(d.get(key), str):
+            d[key] = datetime.datetime.fromisoformat(d[key])
+    return d
+
+
+class LatestCache:
+    """Publisher and reader of the per-kind record files in directory."""
+
+    def __init__(self, directory=CACHE_DIR, prefix="observatory-"):
+        self.directory = directory
+        self.prefix = prefix
+        self.seq = {}           # {kind: last sequence number published}
+        self._read = {}         # {kind: ((st_ino, st_mtime_ns, st_size), record)}
+
+    def path(self, kind):
+        return os.path.join(self.directory, "{}{}.json".format(self.prefix, kind))
+
+    def publish(self, kind, record):
+        """Replace the kind's record (a dict with create_time). Returns its
+        sequence number; raises OSError if it cannot be written, TypeError or
+        ValueError (before anything is written) if it cannot be encoded."""
+        if kind not in self.seq:
+            previous = self.read(kind)
+            self.seq[kind] = previous["seq"] if previous else 0
+        seq = self.seq[kind] + 1
+        text = json.dumps(dict(record, seq=seq, written=utcnow()), default=_encode)
+        path = self.path(kind)
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp, "w") as f:
+            f.write(text)
+        os.replace(tmp, path)
+        self.seq[kind] = seq
+        return seq
+
+    def read(self, kind):
+        """The kind's record as published, or None if there is none (or it is
+        unreadable). Parsed again only after the file was replaced."""
+        try:
+            st = os.stat(self.path(kind))
+            key = (st.st_ino, st.st_mtime_ns, st.st_size)
+            cached = self._read.get(kind)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+            with open(self.path(kind)) as f:
+                record = json.load(f, object_hook=_decode)
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning("cannot read %s (%s)", self.path(kind), e)
+            return None
+        self._read[kind] = (key, record)
+        return record
+
+    def get(self, kind, max_age, now=None):
+        """The kind's record if its create_time is newer than now - max_age
+        (the bound the database query would use), else None: ask the DB."""
+        record = self.read(kind)
+        if record is None or record["create_time"] <= (now or utcnow()) - max_age:
+            return None
+        return record
+
+
+class SensorsPublisher:
+    """on_row_committed for the ingest server: publish the committed row and
+    the row before it. Its own connection; errors (a value that does not
+    encode included) are logged, not raised, so the hooks chained after it
+    still run."""
+
+    def __init__(self, backend=None, cache=None):
+        self.db = ingest.Database(backend)
+        self.cache = cache or LatestCache()
+        self.published = 0
+
+    def rows(self, create_time):
+        """The newest two sensors rows up to create_time, newest first, as
+        dicts of sensors_id, create_time and the SENSOR_COLUMNS."""
+        db_cursor = self.db.execute(LATEST_ROWS_SQL, [create_time - LOOKBACK, create_time])
+        names = ["sensors_id", "create_time"] + schema.SENSOR_COLUMNS
+        return [dict(zip(names, db_result_tuple)) for db_result_tuple in db_cursor.fetchall()]
+
+    def __call__(self, create_time):
+        try:
+            rows = self.rows(create_time)
+            if not rows:
+                return None
+            seq = self.cache.publish("sensors", {"create_time": rows[0]["create_time"], "row": rows[0],
+                                                 "previous": rows[1] if len(rows) > 1 else None})
+        except (self.db.backend.Error, OSError, TypeError, ValueError) as e:
+            logger.warning("latest row %s not published (%s)", create_time, e)
+            return None
+        self.published += 1
+        return seq
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(description="show the published latest sensors row and roof verdict")
+    parser.add_argument('--cache_dir', default=CACHE_DIR, help='directory of the record files (default %(default)s)')
+    return parser
+
+
+def main():
+    args = _build_parser().parse_args()
+    cache = LatestCache(args.cache_dir)
+    now = utcnow()
+    for kind in KINDS:
+        record = cache.read(kind)
+        if record is None:
+            print("{}: nothing published in {}".format(kind, cache.path(kind)))
+            continue
+        print("{}: seq {} create_time {} ({:.0f}s ago), written {}".format(
+            kind, record["seq"], record["create_time"], (now - record["create_time"]).total_seconds(),
+            record["written"]))
+        if kind == "roof":
+            print("    open_ok {} {}".format(record["open_ok"], record["reasons"]))
+
+
+if __name__ == "__main__":
+    main()
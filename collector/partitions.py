@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+partitions - monthly partitions of sensors, hourly / daily rollups and the
+retention policy. Run it daily from cron.
+
+sensors grows by one wide row a minute, forever. Every month is now a unit:
+
+  * MySQL: sensors is PARTITION BY RANGE COLUMNS(create_time), one partition
+    per month plus pmax. The conversion rewrites the table once and is only
+    done on request (--partition); afterwards each run splits pmax so the
+    next AHEAD_MONTHS months always have their partition. The hot queries all
+    carry a create_time bound, so they are pruned to the newest partition.
+  * SQLite: sensors holds only the current month (plus GRACE); once a month
+    has settled its rows move to a chunk table sensors_YYYYMM. The sensors_all
+    view (UNION ALL of the chunks and sensors) is what history readers
+    (backtest, archives) query.
+
+sensors_hourly and sensors_daily hold min, max, sum and count of every
+column per bucket, so any average can be recomputed and buckets can be
+merged. rollups.py keeps them current row by row; once a month has settled
+(GRACE after its end, so late rows from a draining spool still land) it is
+recomputed here once from its minute rows, which also covers months from
+before the incremental rollups and rows backfilled behind them.
+sensors_months records what has been done to each month.
+
+Retention, from the [retention] section of ~/.my.cnf.python:
+
+    [retention]
+    raw_months    = 24      # minute rows kept this many months (0: forever)
+    hourly_months = 60      # sensors_hourly kept this many months (0: forever)
+    daily_months  = 0       # sensors_daily kept this many months (0: forever)
+    archive_dir   = /srv/observatory/archive    # empty: drop without archive
+
+A month older than raw_months is rolled up (if it was not yet), written to
+archive_dir/sensors-YYYY-MM.csv.gz when that is set, and then its partition
+or chunk is dropped - DROP PARTITION / DROP TABLE, no row-by-row DELETE.
+
+    ./partitions.py                 # partitions / chunks, rollups, retention
+    ./partitions.py --partition     # MySQL: convert sensors to partitions once
+    ./partitions.py --dry_run       # show what would be done
+"""
+
+import argparse
+import collections
+import csv
+import datetime
+import gzip
+import logging
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import schema
+import storage
+
+logger = logging.getLogger("collector.partitions")
+
+RAW_MONTHS = 24
+HOURLY_MONTHS = 60
+DAILY_MONTHS = 0
+AHEAD_MONTHS = 2
+GRACE = datetime.timedelta(days=2)      # late rows of a month still expected
+ROLLUPS = (("sensors_hourly", "hour"), ("sensors_daily", "day"))
+CHUNK = re.compile(r"sensors_(\d{4})(\d{2})$")
+
+Policy = collections.namedtuple("Policy", "raw_months hourly_months daily_months archive_dir")
+
+
+def utcnow():
+    return datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+
+
+def _datetime(value):
+    """MIN() / MAX() lose the DATETIME column type on SQLite: ISO text."""
+    return datetime.datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def month_start(t):
+    return datetime.datetime(t.year, t.month, 1)
+
+
+def add_months(month, n):
+    (year, m) = divmod(month.year * 12 + month.month - 1 + n, 12)
+    return datetime.datetime(year, m + 1, 1)
+
+
+def months_between(first, end):
+    """Month starts from first's month up to (excluding) end."""
+    month = month_start(first)
+    while month < end:
+        yield month
+        month = add_months(month, 1)
+
+
+def partition_name(month):
+    return "p{:%Y%m}".format(month)
+
+
+def chunk_table(month):
+    return "sensors_{:%Y%m}".format(month)
+
+
+def load_policy(path=storage.CONFIG_PATH):
+    import configparser
+    config = configparser.ConfigParser()
+    config.read(path)
+    return Policy(config.getint("retention", "raw_months", fallback=RAW_MONTHS),
+                  config.getint("retention", "hourly_months", fallback=HOURLY_MONTHS),
+                  config.getint("retention", "daily_months", fallback=DAILY_MONTHS),
+                  config.get("retention", "archive_dir", fallback="") or None)
+
+
+# ---- MySQL partitions ----
+def _less_than(month):
+    return "PARTITION {} VALUES LESS THAN ('{:%Y-%m-%d %H:%M:%S}')".format(partition_name(month), add_months(month, 1))
+
+
+def mysql_partitions(db_cursor):
+    """Month starts of the existing monthly partitions (pmax not included)."""
+    db_cursor.execute("""
+      SELECT partition_name
+        FROM information_schema.partitions
+       WHERE table_schema = DATABASE() AND table_name = 'sensors' AND partition_name IS NOT NULL
+    """)
+    return sorted(datetime.datetime.strptime(name[1:], "%Y%m")
+                  for (name,) in db_cursor.fetchall() if re.match(r"p\d{6}$", name))
+
+
+def mysql_partition_sql(first, until):
+    """The one-time conversion: the primary key must include create_time
+    (every unique key of a partitioned table must), then one partition per
+    month from first's up to until's, then pmax."""
+    parts = [_less_than(m) for m in months_between(first, add_months(month_start(until), 1))]
+    return ["ALTER TABLE sensors DROP PRIMARY KEY, ADD PRIMARY KEY (sensors_id, create_time)",
+            "ALTER TABLE sensors PARTITION BY RANGE COLUMNS(create_time) ({}, "
+            "PARTITION pmax VALUES LESS THAN (MAXVALUE))".format(", ".join(parts))]
+
+
+def mysql_extend_sql(existing, until):
+    """Split the (empty) pmax so every month up to until's has a partition,
+    or None when they all exist."""
+    start = add_months(existing[-1], 1) if existing else month_start(until)
+    parts = [_less_than(m) for m in months_between(start, add_months(month_start(until), 1))]
+    if not parts:
+        return None
+    return "ALTER TABLE sensors REORGANIZE PARTITION pmax INTO ({}, PARTITION pmax VALUES LESS THAN (MAXVALUE))".format(
+        ", ".join(parts))
+
+
+# ---- SQLite chunks ----
+def sqlite_chunks(db_cursor):
+    db_cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'sensors%%'")
+    return sorted(datetime.datetime(int(m.group(1)), int(m.group(2)), 1)
+                  for (name,) in db_cursor.fetchall() for m in [CHUNK.match(name)] if m)
+
+
+def sqlite_rebuild_view(connection):
+    """sensors_all = the chunks + sensors, UNION ALL (SQLite pushes a
+    create_time range down into every branch)."""
+    db_cursor = connection.cursor()
+    columns = ",".join(["sensors_id", "create_time"] + schema.SENSOR_COLUMNS)
+    tables = [chunk_table(m) for m in sqlite_chunks(db_cursor)] + ["sensors"]
+    db_cursor.execute("DROP VIEW IF EXISTS sensors_all")
+    db_cursor.execute("CREATE VIEW sensors_all AS " + " UNION ALL ".join(
+        "SELECT {} FROM {}".format(columns, t) for t in tables))
+
+
+def sqlite_rotate(connection, settled):
+    """Move the rows of every month before settled out of sensors into its
+    chunk table. Returns the months moved."""
+    db_cursor = connection.cursor()
+    db_cursor.execute("SELECT MIN(create_time) FROM sensors WHERE create_time < %s", [settled])
+    oldest = _datetime(db_cursor.fetchone()[0])
+    if oldest is None:
+        return []
+    db_cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'sensors'")
+    (ddl,) = db_cursor.fetchone()
+    moved = []
+    for month in months_between(oldest, settled):
+        table = chunk_table(month)
+        end = add_months(month, 1)
+        db_cursor.execute(ddl.replace("CREATE TABLE sensors", "CREATE TABLE IF NOT EXISTS " + table, 1))
+        db_cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS {0}_create_time ON {0} (create_time)".format(table))
+        db_cursor.execute("INSERT OR REPLACE INTO {} SELECT * FROM sensors WHERE create_time >= %s AND create_time < %s"
+                          .format(table), [month, end])
+        db_cursor.execute("DELETE FROM sensors WHERE create_time >= %s AND create_time < %s", [month, end])
+        moved.append(month)
+    connection.commit()
+    sqlite_rebuild_view(connection)
+    return moved
+
+
+# ---- rollups, archive, drop ----
+def rollup_sql(backend, table, period):
+    """(DELETE, INSERT .. SELECT .. GROUP BY) recomputing table's buckets of
+    one [start, end) range from sensors_all."""
+    bucket = backend.time_bucket_sql("create_time", period)
+    aggregates = ",".join("{}({})".format("COUNT" if f == "count" else f.upper(), c)
+                          for (c, r, f) in schema.rollup_columns())
+    delete = "DELETE FROM {} WHERE bucket >= %s AND bucket < %s".format(table)
+    insert = """
+INSERT INTO {table} (bucket,n,{names})
+     SELECT {bucket} AS b, COUNT(*), {aggregates}
+       FROM sensors_all
+      WHERE create_time >= %s AND create_time < %s
+   GROUP BY b""".format(table=table, names=",".join(r for (c, r, f) in schema.rollup_columns()),
+                        bucket=bucket, aggregates=aggregates)
+    return (delete, insert)
+
+
+def rollup_month(connection, backend, month):
+    """(Re)compute the hourly and daily buckets of one month."""
+    db_cursor = connection.cursor()
+    end = add_months(month, 1)
+    for (table, period) in ROLLUPS:
+        (delete, insert) = rollup_sql(backend, table, period)
+        db_cursor.execute(delete, [month, end])
+        db_cursor.execute(insert, [month, end])
+    db_cursor.execute("UPDATE sensors_months SET rolled_up = %s WHERE month = %s", [utcnow(), month])
+    connection.commit()
+
+
+def archive_month(connection, month, directory):
+    """The month's minute rows as directory/sensors-YYYY-MM.csv.gz."""
+    path = os.path.join(directory, "sensors-{:%Y-%m}.csv.gz".format(month))
+    db_cursor = connection.cursor()
+    db_cursor.execute("SELECT * FROM sensors_all WHERE create_time >= %s AND create_time < %s ORDER BY create_time",
+                      [month, add_months(month, 1)])
+    tmp = path + ".tmp"
+    with gzip.open(tmp, "wt", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([d[0] for d in db_cursor.description])
+        for row in db_cursor:
+            writer.writerow(["" if v is None else v for v in row])
+    os.replace(tmp, path)
+    return path
+
+
+def drop_month(connection, backend, month):
+    """Drop the month's partition / chunk (DELETE only for stray rows)."""
+    db_cursor = connection.cursor()
+    end = add_months(month, 1)
+    if backend.dialect == "mysql":
+        if month in mysql_partitions(db_cursor):
+            db_cursor.execute("ALTER TABLE sensors DROP PARTITION {}".format(partition_name(month)))
+        else:
+            db_cursor.execute("DELETE FROM sensors WHERE create_time >= %s AND create_time < %s", [month, end])
+    else:
+        db_cursor.execute("DROP TABLE IF EXISTS {}".format(chunk_table(month)))
+        db_cursor.execute("DELETE FROM sensors WHERE create_time >= %s AND create_time < %s", [month, end])
+    db_cursor.execute("UPDATE sensors_months SET dropped = %s WHERE month = %s", [utcnow(), month])
+    connection.commit()
+    if backend.dialect == "sqlite":
+        sqlite_rebuild_view(connection)
+
+
+def prune_rollups(connection, policy, current):
+    """Delete rollup buckets older than their retention. Returns rows deleted."""
+    db_cursor = connection.cursor()
+    deleted = 0
+    for (table, months) in (("sensors_hourly", policy.hourly_months), ("sensors_daily", policy.daily_months)):
+        if months > 0:
+            db_cursor.execute("DELETE FROM {} WHERE bucket < %s".format(table), [add_months(current, -months)])
+            deleted += db_cursor.rowcount
+    connection.commit()
+    return deleted
+
+
+def _register(connection, settled, dry_run=False):
+    """Add every month with rows before settled to sensors_months; returns
+    {month: (rolled_up, archived, dropped)}."""
+    db_cursor = connection.cursor()
+    db_cursor.execute("SELECT MIN(create_time) FROM sensors_all")
+    oldest = _datetime(db_cursor.fetchone()[0])
+    db_cursor.execute("SELECT month, rolled_up, archived, dropped FROM sensors_months")
+    known = {row[0]: row[1:] for row in db_cursor.fetchall()}
+    if oldest is not None:
+        for month in months_between(oldest, settled):
+            if month not in known:
+                if not dry_run:
+                    db_cursor.execute("INSERT INTO sensors_months (month) VALUES (%s)", [month])
+                known[month] = (None, None, None)
+    connection.commit()
+    return known
+
+
+def maintain(connection, backend, policy, now=None, partition=False, dry_run=False):
+    """One maintenance pass. Returns what was (or, dry_run, would be) done."""
+    now = now or utcnow()
+    current = month_start(now)
+    settled = month_start(now - GRACE)      # months before this one are complete
+    done = collections.defaultdict(list)
+    db_cursor = connection.cursor()
+
+    if backend.dialect == "mysql":
+        existing = mysql_partitions(db_cursor)
+        until = add_months(current, AHEAD_MONTHS)
+        if not existing:
+            if partition:
+                db_cursor.execute("SELECT MIN(create_time) FROM sensors")
+                first = _datetime(db_cursor.fetchone()[0]) or current
+                statements = mysql_partition_sql(first, until)
+            else:
+                logger.warning("sensors is not partitioned (run with --partition once); retention uses DELETE")
+                statements = []
+        else:
+            statements = [s for s in [mysql_extend_sql(existing, until)] if s]
+        for sql in statements:
+            done["ddl"].append(sql)
+            if not dry_run:
+                db_cursor.execute(sql)
+    elif not dry_run:
+        done["rotated"] = sqlite_rotate(connection, settled)
+
+    months = _register(connection, settled, dry_run)
+    expired = add_months(current, -policy.raw_months) if policy.raw_months > 0 else None
+    for month in sorted(months):
+        (rolled_up, archived, dropped) = months[month]
+        if dropped:
+            continue
+        if not rolled_up:
+            done["rolled_up"].append(month)
+            if not dry_run:
+                rollup_month(connection, backend, month)
+        if expired is not None and month < expired:
+            if policy.archive_dir and not archived:
+                done["archived"].append(month)
+                if not dry_run:
+                    path = archive_month(connection, month, policy.archive_dir)
+                    db_cursor.execute("UPDATE sensors_months SET archived = %s WHERE month = %s", [path, month])
+                    connection.commit()
+            done["dropped"].append(month)
+            if not dry_run:
+                drop_month(connection, backend, month)
+    if not dry_run:
+        done["pruned"] = prune_rollups(connection, policy, current)
+    return dict(done)
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(description="sensors partitions / chunks, rollups and retention")
+    parser.add_argument('--storage_config', default=storage.CONFIG_PATH,
+                        help='file with the [storage] / [mysqlDB] / [retention] sections (default %(default)s)')
+    parser.add_argument('--partition', action='store_true',
+                        help='MySQL: convert sensors to monthly partitions (rewrites the table once)')
+    parser.add_argument('--dry_run', action='store_true', help='only show what would be done')
+    parser.add_argument('--debug', action='store_true', help='enable debug level verbosity')
+    return parser
+
+
+def main():
+    args = _build_parser().parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format="%(asctime)s %(levelname)-8s %(name)s %(message)s")
+    backend = storage.from_config(args.storage_config)
+    connection = backend.connect()
+    schema.migrate(connection, backend.dialect)
+    done = maintain(connection, backend, load_policy(args.storage_config),
+                    partition=args.partition, dry_run=args.dry_run)
+    for (what, items) in sorted(done.items()):
+        if isinstance(items, list):
+            items = ", ".join(i.strftime("%Y-%m") if isinstance(i, datetime.datetime) else i for i in items)
+        print("{}{}: {}".format("(dry run) " if args.dry_run else "", what, items or "-"))
+
+
+if __name__ == "__main__":
+    main()
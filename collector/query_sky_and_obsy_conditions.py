@@ -2,9 +2,15 @@
 
 import datetime
 import json
+import os
+import sys
 from pathlib import Path
 import requests
-import MySQLdb
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import latest_cache
+import safety_rules
+import storage
 
 # Mattermost rich-format constants (kept in sync with observatorylib.Reporter so
 # this script's messages look the same as sentinel/scripts in #observatory).
@@ -12,224 +18,163 @@ SEVERITY_EMOJI = {"info": ":information_source:", "warn": ":warning:", "critical
 MM_TAG = "safety-conditions"
 MM_MENTION = "@hans"
 
-db = MySQLdb.connect(
-    host="localhost",
-    port=3306,
-    user='sens',
-    passwd='sens',
-    db="observatory1")
-db_cursor = db.cursor()
-
-def check_db(minutes):
+backend = None
+db = None
+db_cursor = None
+# Every stored verdict is also published here for weather_status.py and
+# weather_safety_service.py (latest_cache.py).
+cache = latest_cache.LatestCache()
+
+def db_connect(storage_backend=None):
+    """Connect on first use (not at import), so the rule code can be imported
+    by tools that never touch the database (backtest, sweep). The backend
+    (MySQL or SQLite) comes from ~/.my.cnf.python, see storage.py."""
+    global backend, db, db_cursor
+    backend = storage_backend or storage.from_config()
+    db = backend.connect()
+    db_cursor = db.cursor()
+
+# The rules, thresholds and hysteresis live in safety_rules.yaml, compiled
+# once here; backtest.py and sweep.py replay the same plan over the history.
+PLAN = safety_rules.load()
+DB_MAX_AGE_MINUTES = 2
+# The newest row is looked for within this much history only, so the lookup
+# stays on the newest partition (partitions.py) however long sensors grows.
+LATEST_LOOKBACK = datetime.timedelta(days=1)
+
+SNAPSHOT_COLUMNS = ["sensors_id", "create_time"] + PLAN.columns
+PREVIOUS_COLUMNS = PLAN.previous_columns
+
+def default_params():
+    """The rule file's params as a dict; backtest/sweep override entries of it."""
+    return dict(PLAN.params)
+
+def thresholds(last_open_ok, params=None):
+    """Effective params for the current roof state (hysteresis applied)."""
+    return PLAN.thresholds(last_open_ok, params)
+
+def all_past_windows():
+    """Window and event counts for BOTH hysteresis variants, so they can be
+    fetched (or kept in memory) before the previous open_ok is known."""
+    return PLAN.all_windows()
+
+def snapshot_sql(windows, events, utcnow, roof_state=True):
+    """One statement returning the newest sensors row, the row before it, every
+    windowed outlier count (conditional aggregation over ONE range scan of the
+    longest window), the previous open_ok and the recent event counts.
+    With no windows (counts kept in memory by sensor_windows) the range scan is
+    left out; with roof_state=False (kept in memory by safety_evaluator) so
+    are the roof and events subqueries. Returns (sql, params)."""
+    event_counts = ["(SELECT COUNT(*) FROM events WHERE create_time > %s AND event = %s)"] * len(events)
+    event_params = []
+    for (event, seconds) in events:
+        event_params += [utcnow - datetime.timedelta(seconds=seconds), event]
+    select = [",".join("cur." + c for c in SNAPSHOT_COLUMNS)]
+    if PREVIOUS_COLUMNS:
+        select.append(",".join("prev." + c for c in PREVIOUS_COLUMNS))
+    select += ["win.w{}".format(i) for i in range(len(windows))]
+    if roof_state:
+        select.append("(SELECT open_ok FROM roof ORDER BY roof_id DESC LIMIT 1)")
+        select += event_counts
+    else:
+        event_params = []
     sql = """
-      SELECT  sensors_id
-             ,create_time
-        FROM sensors
-    ORDER BY create_time DESC
-       LIMIT 1;
-    """
-    db_cursor.execute(sql)
-    db_result_tuple = db_cursor.fetchone()
-    try:
-        sensors_id  = db_result_tuple[0]
-        db_date = db_result_tuple[1]
-    except:
-        raise
+      SELECT {select}
+        FROM (SELECT {columns} FROM sensors WHERE create_time > %s ORDER BY create_time DESC LIMIT 1) AS cur
+   LEFT JOIN sensors AS prev
+          ON prev.create_time = (SELECT MAX(create_time) FROM sensors
+                                  WHERE create_time > %s AND create_time < cur.create_time)""".format(
+        select="\n             ,".join(select), columns=",".join(SNAPSHOT_COLUMNS))
+    event_params += [utcnow - LATEST_LOOKBACK] * 2
+    params = event_params
+    if windows:
+        counts = []
+        count_params = []
+        for i, (name, threshold, seconds) in enumerate(windows):
+            counts.append("SUM(create_time > %s AND {}) AS w{}".format(PLAN.sql_predicates[name], i))
+            count_params += [utcnow - datetime.timedelta(seconds=seconds), threshold]
+        longest = max(seconds for (name, threshold, seconds) in windows)
+        sql += """
+  CROSS JOIN (SELECT {counts}
+                FROM sensors
+               WHERE create_time > %s) AS win""".format(counts=",".join(counts))
+        params = event_params + count_params + [utcnow - datetime.timedelta(seconds=longest)]
+    return (sql + ";\n", params)
+
+def snapshot_from_cache(cache, utcnow, sensor_windows):
+    """The newest row and the row before it as latest_cache.py published them,
+    the window counts advanced by that row - no query. None when the record is
+    stale (older than DB_MAX_AGE_MINUTES, which db_fresh() would refuse) or the
+    windows missed rows before it: load_snapshot() asks the DB then."""
+    record = cache.get("sensors", datetime.timedelta(minutes=DB_MAX_AGE_MINUTES), utcnow)
+    if record is None:
+        return None
+    previous = record["previous"] or {}
+    if not sensor_windows.follow(record["row"], previous.get("create_time"), utcnow):
+        return None
+    snapshot = {c: record["row"].get(c) for c in SNAPSHOT_COLUMNS}
+    snapshot["previous"] = {c: previous.get(c) for c in PREVIOUS_COLUMNS}
+    return snapshot
+
+def load_snapshot(utcnow, windows, events, sensor_windows=None, state=None, cache=None):
+    """Fetch the whole evaluation input in a single round trip. Raises if the
+    sensors table has no row within LATEST_LOOKBACK (as check_db always did
+    for an empty table). With a
+    sensor_windows.SensorWindows the window counts come from memory instead
+    (after one small catch-up query for the rows it has not seen yet); with a
+    safety_evaluator.EvaluatorState so do the previous open_ok and the event
+    counts. With both and a latest_cache.LatestCache holding a fresh row, the
+    snapshot takes no query at all."""
+    snapshot = None
+    if cache is not None and sensor_windows is not None and state is not None:
+        snapshot = snapshot_from_cache(cache, utcnow, sensor_windows)
+    if snapshot is None:
+        if sensor_windows is not None:
+            sensor_windows.catch_up(db_cursor, utcnow)
+            windows = []
+        (sql, params) = snapshot_sql(windows, events, utcnow, roof_state=state is None)
+        db_cursor.execute(sql, params)
+        db_result_tuple = db_cursor.fetchone()
+        if db_result_tuple is None:
+            raise RuntimeError("no sensors row since {}".format(utcnow - LATEST_LOOKBACK))
+        n_cur = len(SNAPSHOT_COLUMNS)
+        n_prev = len(PREVIOUS_COLUMNS)
+        snapshot = dict(zip(SNAPSHOT_COLUMNS, db_result_tuple[:n_cur]))
+        snapshot["previous"] = dict(zip(PREVIOUS_COLUMNS, db_result_tuple[n_cur:n_cur + n_prev]))
+        rest = db_result_tuple[n_cur + n_prev:]
+    if sensor_windows is not None:
+        snapshot["windows"] = sensor_windows.counts(utcnow)
+    else:
+        snapshot["windows"] = {w: int(c or 0) for w, c in zip(windows, rest[:len(windows)])}
+        rest = rest[len(windows):]
+    if state is not None:
+        snapshot["last_open_ok"] = state.last_open_ok
+        snapshot["events"] = state.event_counts(events, utcnow)
+    else:
+        snapshot["last_open_ok"] = bool(rest[0])
+        snapshot["events"] = {e: int(c or 0) for e, c in zip(events, rest[1:])}
+    return snapshot
+
+def db_fresh(snapshot, minutes):
+    """sensors_id of the newest row, or None if it is older than minutes."""
+    sensors_id = snapshot["sensors_id"]
+    db_date = snapshot["create_time"]
     if db_date < datetime.datetime.now(datetime.UTC).replace(tzinfo=None) - datetime.timedelta(minutes=minutes) :
         print("DB last timestamp {db_date} is More than {minutes} minutes ago -> close".format(db_date=db_date, minutes=minutes))
         print("Stop_Imaging (do not wait). Park (wait), Close_Roof")
-        quit(1)
+        return None
     else:
         print("DB last timestamp {db_date} is Less than {minutes} minutes ago -> open".format(db_date=db_date, minutes=minutes))
         return(sensors_id)
 
-def check_sqm(sensors_id, sqm_min):
-    sql = """
-      SELECT sqm1_sqm
-        FROM sensors
-       WHERE sensors_id = {sensors_id}
-       LIMIT 1;
-    """.format(sensors_id=sensors_id)
-    db_cursor.execute(sql)
-    db_result_tuple = db_cursor.fetchone()
-    #print(db_result_tuple)
-    try:
-        sqm  = db_result_tuple[0]
-    except:
-        raise
-    if sqm >= sqm_min:
-        print("SQM {sqm} >= minimum {sqm_min} -> open".format(sqm=sqm, sqm_min=sqm_min))
-        return(True)
-    else:
-        print("SQM {sqm} < minimum {sqm_min} -> close".format(sqm=sqm, sqm_min=sqm_min))
-        return(False)
-
-def check_sqm_past(sqm_min, seconds, outlier_count_max):
-    sql = """
-      SELECT COUNT(*)
-        FROM sensors
-       WHERE create_time > DATE_SUB(UTC_TIMESTAMP(), INTERVAL {seconds} second)
-         AND sqm1_sqm < {sqm_min};
-    """.format(seconds=seconds, sqm_min=sqm_min)
-    #print(sql)
-    db_cursor.execute(sql)
-    db_result_tuple = db_cursor.fetchone()
-    #print(db_result_tuple)
-    try:
-        count  = db_result_tuple[0]
-    except:
-        raise
-    if count <= outlier_count_max:
-        print("SQM < minimum {sqm_min} count over the last {seconds} seconds is {count} <= {outlier_count_max} -> open".format(sqm_min=sqm_min, seconds=seconds, count=count, outlier_count_max=outlier_count_max))
-        return(True)
-    else:
-        print("SQM < minimum {sqm_min} count over the last {seconds} seconds is {count} > {outlier_count_max} -> close".format(sqm_min=sqm_min, seconds=seconds, count=count, outlier_count_max=outlier_count_max))
-        return(False)
-
-def check_rain(sensors_id, drops_min):
-    sql = """
-      SELECT rainsensor1_drops
-        FROM sensors
-       WHERE sensors_id = {sensors_id}
-       LIMIT 1;
-    """.format(sensors_id=sensors_id)
-    db_cursor.execute(sql)
-    db_result_tuple = db_cursor.fetchone()
-    #print(db_result_tuple)
-    try:
-        drops  = db_result_tuple[0]
-    except:
-        raise
-    if drops <= drops_min:
-        print("Rain drops {drops} <= minimum {drops_min} -> open".format(drops=drops, drops_min=drops_min))
-        return(True)
-    else:
-        print("Rain drops {drops} > minimum {drops_min} -> close".format(drops=drops, drops_min=drops_min))
-        return(False)
-
-def check_rain_past(drops_min, seconds, outlier_count_max):
-    sql = """
-      SELECT COUNT(*)
-        FROM sensors
-       WHERE create_time > DATE_SUB(UTC_TIMESTAMP(), INTERVAL {seconds} second)
-         AND rainsensor1_drops > {drops_min};
-    """.format(seconds=seconds, drops_min=drops_min)
-    db_cursor.execute(sql)
-    db_result_tuple = db_cursor.fetchone()
-    #print(db_result_tuple)
-    try:
-        count  = db_result_tuple[0]
-    except:
-        raise
-    if count <= outlier_count_max:
-        print("Rain drops <= minimum {drops_min} count over the last {seconds} seconds is {count} <= {outlier_count_max} -> open".format(drops_min=drops_min, seconds=seconds, count=count, outlier_count_max=outlier_count_max))
-        return(True)
-    else:
-        print("Rain drops > minimum {drops_min} count over the last {seconds} seconds is {count} > {outlier_count_max} -> close".format(drops_min=drops_min, seconds=seconds, count=count, outlier_count_max=outlier_count_max))
-        return(False)
-
-def check_ups_is_on_mains(sensors_id, min_ups_bcharge):
-    sql = """
-      SELECT ups1_status, ups1_bcharge
-        FROM sensors
-       WHERE sensors_id = {sensors_id}
-       LIMIT 1;
-    """.format(sensors_id=sensors_id)
-    db_cursor.execute(sql)
-    db_result_tuple = db_cursor.fetchone()
-#    print(db_result_tuple)
-    try:
-        ups_status  = db_result_tuple[0]
-        ups_bcharge = db_result_tuple[1]
-    except:
-        raise
-    if ups_status == 1 and ups_bcharge >= min_ups_bcharge:
-        print("UPS is powered and battery charge {bcharge} >= {min_ups_bcharge} -> open".format(bcharge=ups_bcharge, min_ups_bcharge=min_ups_bcharge))
-        return True
-    else:
-        if ups_status != 1:
-            print("UPS is on battery (and battery charge is {bcharge}) -> close".format(bcharge=ups_bcharge))
-        else:
-            print("UPS is powered but battery charge {bcharge} < {min_ups_bcharge} -> open".format(bcharge=ups_bcharge, min_ups_bcharge=min_ups_bcharge))
-        return False
-
-def check_infrared(sensors_id, sensor, minimum_delta_t):
-    sql = """
-      SELECT {sensor}_temperature_sensor
-             , {sensor}_temperature_sky
-             , {sensor}_temperature_sensor - {sensor}_temperature_sky
-        FROM sensors
-       WHERE sensors_id = {sensors_id}
-       LIMIT 1;
-    """.format(sensor=sensor, sensors_id=sensors_id)
-    db_cursor.execute(sql)
-    db_result_tuple = db_cursor.fetchone()
-    #print(db_result_tuple)
-    try:
-        temperature_sensor = db_result_tuple[0]
-        temperature_sky    = db_result_tuple[1]
-        delta_t            = db_result_tuple[2]
-    except:
-        raise
-    if delta_t >= minimum_delta_t:
-        print("Sensor {sensor} sky temperature delta ({temperature_sensor} - {temperature_sky} = {delta_t}) >= {minimum_delta_t} -> open".format(sensor=sensor, temperature_sensor=temperature_sensor, temperature_sky=temperature_sky, delta_t=delta_t, minimum_delta_t=minimum_delta_t))
-        return(True)
-    else:
-        print("Sensor {sensor} sky temperature delta ({temperature_sensor} - {temperature_sky} = {delta_t}) < {minimum_delta_t} -> close".format(sensor=sensor, temperature_sensor=temperature_sensor, temperature_sky=temperature_sky, delta_t=delta_t, minimum_delta_t=minimum_delta_t))
-        return(False)
-
-def check_infrared_past(sensor, minimum_delta_t, seconds, outlier_count_max):
-    sql = """
-      SELECT COUNT(*)
-        FROM sensors
-       WHERE create_time > DATE_SUB(UTC_TIMESTAMP(), INTERVAL {seconds} second)
-         AND {sensor}_temperature_sensor - {sensor}_temperature_sky < {minimum_delta_t};
-    """.format(sensor=sensor, seconds=seconds, minimum_delta_t=minimum_delta_t)
-    db_cursor.execute(sql)
-    db_result_tuple = db_cursor.fetchone()
-    #print(db_result_tuple)
-    try:
-        count  = db_result_tuple[0]
-    except:
-        raise
-    if count < outlier_count_max:
-        print("Sensor {sensor} sky temperature delta < {minimum_delta_t} count over the last {seconds} seconds is {count} <= {outlier_count_max} -> open".format(sensor=sensor, minimum_delta_t=minimum_delta_t, seconds=seconds, count=count, outlier_count_max=outlier_count_max))
-        return(True)
-    else:
-        print("Sensor {sensor} sky temperature delta < {minimum_delta_t} count over the last {seconds} seconds is {count} > {outlier_count_max} -> close".format(sensor=sensor, minimum_delta_t=minimum_delta_t, seconds=seconds, count=count, outlier_count_max=outlier_count_max))
-        return(False)
-
-def last_event_long_enough_ago(event, seconds, outlier_count_max):
-    sql = """
-      SELECT COUNT(*)
-        FROM events
-       WHERE create_time > DATE_SUB(UTC_TIMESTAMP(), INTERVAL {seconds} second)
-         AND event = '{event}';
-    """.format(event=event, seconds=seconds)
-    db_cursor.execute(sql)
-    db_result_tuple = db_cursor.fetchone()
-    #print(db_result_tuple)
-    try:
-        count  = db_result_tuple[0]
-    except:
-        raise
-    if count < outlier_count_max:
-        print("Event {event} count over the last {seconds} seconds is {count} < {outlier_count_max} -> open".format(event=event, seconds=seconds, count=count, outlier_count_max=outlier_count_max))
-        return(True)
-    else:
-        print("Event {event} count over the last {seconds} seconds is {count} >= {outlier_count_max} -> close".format(event=event, seconds=seconds, count=count, outlier_count_max=outlier_count_max))
-        return(False)
+def check_db(snapshot, minutes):
+    sensors_id = db_fresh(snapshot, minutes)
+    if sensors_id is None:
+        quit(1)
+    return(sensors_id)
 
-def retrieve_previous_open_ok():
-    sql = """
-      SELECT create_time,open_ok
-        FROM roof
-    ORDER BY roof_id DESC
-       LIMIT 1;
-    """
-    db_cursor.execute(sql)
-    db_result_tuple = db_cursor.fetchone()
-    last_open_ok = bool(db_result_tuple[1])
+def retrieve_previous_open_ok(snapshot):
+    last_open_ok = snapshot["last_open_ok"]
     print("Roof open status is {}".format(last_open_ok))
     return(last_open_ok)
 
@@ -252,29 +197,24 @@ def retrieve_previous_open_ok():
 #    return(bool(open))
 
 def store_roof_status(utcnow, sensors_id, open_ok, reasons):
-    sql_keys = []
-    sql_values = []
-    sql_keys.append("create_time")
-    sql_values.append('"' + str(utcnow) + '"')
-    sql_keys.append("sensors_id")
-    sql_values.append(str(sensors_id))
-    sql_keys.append("open_ok")
-    sql_values.append(str(open_ok))
-    sql_keys.append("reasons")
-    sql_values.append('"' + reasons + '"')
     sql = """
-INSERT INTO observatory1.roof ({keys})
-     VALUES ({values});
-    """.format(keys = ','.join(sql_keys),
-               values = ','.join(sql_values))
-    #print("{}".format(sql.lstrip().rstrip()))
+INSERT INTO roof (create_time,sensors_id,open_ok,reasons)
+     VALUES (%s,%s,%s,%s);
+    """
     try:
-        db_cursor.execute(sql)
+        db_cursor.execute(sql, [utcnow, sensors_id, open_ok, reasons])
         db.commit()
         #print(db_cursor.rowcount, "record inserted.")
     except:
         db.rollback()
         raise
+    # Stored as the roof table holds it (open_ok as its TINYINT), so readers of
+    # the cache answer exactly what a roof query would.
+    try:
+        cache.publish("roof", {"create_time": utcnow, "sensors_id": sensors_id,
+                               "open_ok": int(open_ok), "reasons": reasons})
+    except OSError as e:
+        print("WARNING: verdict not published to {}: {}".format(cache.directory, e))
 
 #def get_roof_status(minutes):
 #    sql = """
@@ -299,23 +239,12 @@ INSERT INTO observatory1.roof ({keys})
 #        return(last_open_ok)
 
 def store_event(utcnow, event, reason = None):
-    sql_keys = []
-    sql_values = []
-    sql_keys.append("create_time")
-    sql_values.append('"' + str(utcnow) + '"')
-    sql_keys.append("event")
-    sql_values.append('"' + event + '"')
-    if reason:
-        sql_keys.append("reason")
-        sql_values.append('"' + reason + '"')
     sql = """
-INSERT INTO observatory1.events ({keys})
-     VALUES ({values});
-    """.format(keys = ','.join(sql_keys),
-               values = ','.join(sql_values))
-    #print("{}".format(sql.lstrip().rstrip()))
+INSERT INTO events (create_time,event,reason)
+     VALUES (%s,%s,%s);
+    """
     try:
-        db_cursor.execute(sql)
+        db_cursor.execute(sql, [utcnow, event, reason])
         db.commit()
         #print(db_cursor.rowcount, "record inserted.")
     except:
@@ -341,58 +270,11 @@ def sendToMattermost(url, severity, message):
     if r.status_code != 200:
         print("WARNING: Mattermost returned {}: {}".format(r.status_code, r.text[:200]))
 
-def main():
-    home = str(Path.home())
-    mattermost_url_file = open(home + "/.mattermosturl-observatory", 'r')
-    url = mattermost_url_file.read().rstrip('\n')
-    mattermost_url_file.close()
-
-    sensors_id       = check_db(minutes=2)
-#    roof_status      = get_roof_status(minutes=2)
-#    if roof_status == 1:
-    last_open_ok     = retrieve_previous_open_ok()
-    if last_open_ok is True:
-#        sqm_min_hysterese = 6
-#        sqm_min_hysterese = 5
-        sqm_min_hysterese = 1
-#        minimum_delta_t_hysterese = 7
-#        minimum_delta_t_hysterese = 5
-#        minimum_delta_t_hysterese = 4
-        minimum_delta_t_hysterese = 3
-    else:
-        sqm_min_hysterese = 0
-        minimum_delta_t_hysterese = 0
-
-#    required_baa_delta_t = 11
-#    required_baa_delta_t = 17
-    required_baa_delta_t = 30
-    required_baa_delta_t = 18
-    required_baa_delta_t = 15
-    required_baa_delta_t = 13
-    required_bcc_delta_t = 20
-    required_bcc_delta_t = 14
-
-    sqm_now_ok       = check_sqm(sensors_id, sqm_min=17.5 - sqm_min_hysterese)
-#    sqm_now_ok       = check_sqm(sensors_id, sqm_min=16.5 - sqm_min_hysterese)
-    rain_now_ok      = check_rain(sensors_id, drops_min=1)
-    ups_now_ok1      = check_ups_is_on_mains(sensors_id, 99.0)
-    if ups_now_ok1 is False:
-        # might be self-test. check previous minute
-        ups_now_ok2  = check_ups_is_on_mains(sensors_id - 1, 99.0)
-
-    #infrared1_now_ok = check_infrared(sensors_id, sensor='BAA1', minimum_delta_t=20 - minimum_delta_t_hysterese)
-    infrared1_now_ok = check_infrared(sensors_id, sensor='BAA1', minimum_delta_t=required_baa_delta_t - minimum_delta_t_hysterese)
-    infrared2_now_ok = check_infrared(sensors_id, sensor='BCC1', minimum_delta_t=required_bcc_delta_t - minimum_delta_t_hysterese)
-
-#    sqm_past_ok       = check_sqm_past(sqm_min=17.5 - sqm_min_hysterese, seconds=3600, outlier_count_max=5)
-    sqm_past_ok       = check_sqm_past(sqm_min=16.5 - sqm_min_hysterese, seconds=300, outlier_count_max=5)
-    rain_past_ok      = check_rain_past(drops_min=1, seconds=3600, outlier_count_max=2)
-    #infrared1_past_ok = check_infrared_past(sensor='BAA1', minimum_delta_t=20 - minimum_delta_t_hysterese, seconds=3600, outlier_count_max=5)
-    infrared1_past_ok = check_infrared_past(sensor='BAA1', minimum_delta_t=required_baa_delta_t - minimum_delta_t_hysterese, seconds=3600, outlier_count_max=5)
-    infrared2_past_ok = check_infrared_past(sensor='BCC1', minimum_delta_t=required_bcc_delta_t - minimum_delta_t_hysterese, seconds=3600, outlier_count_max=5)
-
-    closing_event_past_ok = last_event_long_enough_ago(event="closing", seconds=3600, outlier_count_max=1)
-    #closing_event_past_ok = last_event_long_enough_ago(event="closing", seconds=60, outlier_count_max=1)
+def decide(snapshot, sensors_id, last_open_ok):
+    """Roof verdict for a snapshot: (open_ok, reasons, event, roof_change)."""
+    verdict          = PLAN.evaluate(snapshot, last_open_ok)
+    for line in verdict.lines:
+        print(line)
 
     reason_open = []
     reason_close = []
@@ -400,60 +282,13 @@ def main():
         reason_open.append("DB ok")
     else:
         reason_close.append("DB not ok")
-
-    if sqm_now_ok:
-        if sqm_past_ok:
-            reason_open.append("Dark long enough")
-        else:
-            reason_close.append("Not dark long enough")
-    else:
-        if sqm_past_ok:
-            reason_close.append("Not dark enough anymore")
-        else:
-            reason_close.append("Still not dark enough")
-
-    if rain_now_ok:
-        if rain_past_ok:
-            reason_open.append("Dry long enough")
-        else:
-            reason_close.append("Not dry long enough")
-    else:
-        if rain_past_ok:
-            reason_close.append("Started raining")
-        else:
-            reason_close.append("Still raining")
-
-    if ups_now_ok1:
-        reason_open.append("UPS works")
-        ups_now_ok = True
-    else:
-        if ups_now_ok2:
-            reason_open.append("UPS selftest or on battery")
-            ups_now_ok = True
-        else:
-            reason_close.append("UPS on battery")
-            ups_now_ok = False
-
-    if infrared1_now_ok or infrared2_now_ok:
-        if infrared1_past_ok or infrared2_past_ok:
-            reason_open.append("Clear long enough")
-        else:
-            reason_close.append("Not clear long enough")
-    else:
-        if infrared1_past_ok or infrared2_past_ok:
-            reason_close.append("Too cloudy")
-        else:
-            reason_close.append("Still too cloudy")
-
-    if closing_event_past_ok:
-        reason_open.append("Roof has been closed long enough")
-    else:
-        reason_close.append("Roof was just closed")
+    reason_open += verdict.reason_open
+    reason_close += verdict.reason_close
 
     #print(reason_open)
     #print(reason_close)
 
-    if sensors_id and sqm_now_ok and sqm_past_ok and rain_now_ok and rain_past_ok and ups_now_ok and (infrared1_now_ok or infrared2_now_ok) and (infrared1_past_ok or infrared2_past_ok) and closing_event_past_ok:
+    if sensors_id and verdict.open_ok:
         open_ok = True
         reasons = "All sensors are go"
         #reasons = "{}".format(', '.join(reason_open))
@@ -465,7 +300,6 @@ def main():
 
 #    print(reasons)
 
-    utcnow = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
 #    last_open_ok = retrieve_previous_open_ok()
     event = ''
     roof_change = False
@@ -482,6 +316,10 @@ def main():
         else:
             event = "stays open"
 
+    return (open_ok, reasons, event, roof_change)
+
+def publish(url, utcnow, sensors_id, open_ok, reasons, event, roof_change):
+    """Report a verdict: Mattermost + events row on a change, roof row always."""
     print("Roof {}, {}".format(event, reasons))
 
     if roof_change is True:
@@ -501,5 +339,28 @@ def main():
     store_roof_status(utcnow, sensors_id, open_ok, reasons)
     print("")
 
+def evaluate(url, sensor_windows=None):
+    """One safety evaluation: snapshot, rules, roof verdict, event + report."""
+    utcnow = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+    (windows, events) = all_past_windows()
+    snapshot         = load_snapshot(utcnow, windows, events, sensor_windows)
+
+    sensors_id       = check_db(snapshot, minutes=DB_MAX_AGE_MINUTES)
+    last_open_ok     = retrieve_previous_open_ok(snapshot)
+    (open_ok, reasons, event, roof_change) = decide(snapshot, sensors_id, last_open_ok)
+    publish(url, utcnow, sensors_id, open_ok, reasons, event, roof_change)
+
+def read_mattermost_url():
+    home = str(Path.home())
+    mattermost_url_file = open(home + "/.mattermosturl-observatory", 'r')
+    url = mattermost_url_file.read().rstrip('\n')
+    mattermost_url_file.close()
+    return url
+
+def main():
+    url = read_mattermost_url()
+    db_connect()
+    evaluate(url)
+
 if __name__ == "__main__":
     main()
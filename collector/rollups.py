@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+rollups - sensors_hourly / sensors_daily kept current as the minute rows are
+finalised, and history queries that read the coarsest table that will do.
+
+Graphing a month or a year of sky temperature, SQM or rain meant reading
+every minute row (half a million for a year) or going to the RRDs through
+graph.sh. The rollup tables (schema migration 3) hold min, max, sum and count
+of every column per hour and per day; a year at one point a day is 365 rows.
+
+Incremental: Rollups.roll(create_time) is called once a minute row is
+committed (the ingest server chains it after the evaluation trigger). It
+reads the rows committed since rollup_state.rolled_to - normally the one new
+row - folds them per bucket in memory and merges that into the stored buckets
+(one upsert per table: min / max kept, sums and counts added), in the same
+transaction as the new rolled_to. A repeated call never counts a row twice
+and a failed one is caught up by the next. Only with no rolled_to yet is the
+current month computed from its rows, once; settled months are recomputed
+once more by partitions.py.
+
+Queries: query() reads sensors_daily when the requested resolution is a day
+or coarser, sensors_hourly when it is an hour or coarser, else the minute
+rows. Every row is the time followed by min, avg and max of each column.
+
+    ./rollups.py --columns sqm1_sqm,BAA1_temperature_sky --start 2025-01-01 --resolution 1d > sky-2025.csv
+"""
+
+import argparse
+import csv
+import datetime
+import logging
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import ingest
+import partitions
+import schema
+import storage
+
+logger = logging.getLogger("collector.rollups")
+
+STATE_NAME = "sensors"
+# Coarsest first: query() takes the first whose bucket fits the resolution.
+RESOLUTIONS = (("sensors_daily", "day", datetime.timedelta(days=1)),
+               ("sensors_hourly", "hour", datetime.timedelta(hours=1)))
+
+ROWS_SQL = """
+      SELECT create_time,{columns}
+        FROM sensors_all
+       WHERE create_time > %s AND create_time <= %s
+    ORDER BY create_time;""".format(columns=",".join(schema.SENSOR_COLUMNS))
+
+ROLLUP_NAMES = ["n"] + [r for (c, r, f) in schema.rollup_columns()]
+ROLLUP_MERGE = dict([("n", "add")] + [(r, "add" if f in ("sum", "count") else f)
+                                      for (c, r, f) in schema.rollup_columns()])
+
+
+def bucket_of(t, period):
+    if period == "hour":
+        return t.replace(minute=0, second=0, microsecond=0)
+    return t.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def fold(rows, period):
+    """{bucket: [n, min, max, sum, count, min, max, ...]} (ROLLUP_NAMES order)
+    of [(create_time, <SENSOR_COLUMNS>), ...]."""
+    buckets = {}
+    for row in rows:
+        bucket = bucket_of(row[0], period)
+        acc = buckets.get(bucket)
+        if acc is None:
+            acc = buckets[bucket] = [0] + [None, None, None, 0] * len(schema.SENSOR_COLUMNS)
+        acc[0] += 1
+        for (i, value) in enumerate(row[1:]):
+            if value is None:
+                continue
+            value = float(value)
+            j = 1 + 4 * i
+            if acc[j] is None or value < acc[j]:
+                acc[j] = value
+            if acc[j + 1] is None or value > acc[j + 1]:
+                acc[j + 1] = value
+            acc[j + 2] = value if acc[j + 2] is None else acc[j + 2] + value
+            acc[j + 3] += 1
+    return buckets
+
+
+class Rollups:
+    """Merges finalised minute rows into sensors_hourly / sensors_daily over
+    one persistent connection. Not thread-safe: call roll() from one thread
+    (the one reporting committed rows)."""
+
+    def __init__(self, backend=None):
+        self.db = ingest.Database(backend)
+        self.rolled = 0
+
+    def merge_sql(self, table, buckets):
+        """(sql, args) merging {bucket: fold() values} into table."""
+        sql = self.db.backend.upsert_sql(table, "bucket", ROLLUP_NAMES, len(buckets), ROLLUP_MERGE)
+        return (sql, [a for (bucket, values) in sorted(buckets.items()) for a in [bucket] + values])
+
+    def _state_sql(self, until):
+        return (self.db.backend.upsert_sql("rollup_state", "name", ["rolled_to"]), [STATE_NAME, until])
+
+    def rolled_to(self):
+        db_cursor = self.db.execute("SELECT rolled_to FROM rollup_state WHERE name = %s", [STATE_NAME])
+        db_result_tuple = db_cursor.fetchone()
+        return db_result_tuple[0] if db_result_tuple else None
+
+    def roll(self, until):
+        """Merge the rows committed after rolled_to up to (and including)
+        until. Returns the number of rows merged; errors are logged, not
+        raised - the next call catches up."""
+        try:
+            return self._roll(until)
+        except self.db.backend.Error as e:
+            logger.warning("rollups not updated to %s (%s), catching up next time", until, e)
+            return 0
+
+    def _roll(self, until):
+        rolled_to = self.rolled_to()
+        if rolled_to is None:
+            return self.rebuild(partitions.month_start(until), until)
+        if until <= rolled_to:
+            return 0
+        rows = self.db.execute(ROWS_SQL, [rolled_to, until]).fetchall()
+        statements = []
+        for (table, period) in partitions.ROLLUPS:
+            buckets = fold(rows, period)
+            if buckets:
+                statements.append(self.merge_sql(table, buckets))
+        self.db.transaction(statements + [self._state_sql(until)])
+        self.rolled += len(rows)
+        return len(rows)
+
+    def rebuild(self, start, until):
+        """Recompute the buckets from start up to until from the minute rows
+        and continue incrementally from there."""
+        end = until + datetime.timedelta(seconds=1)
+        statements = []
+        for (table, period) in partitions.ROLLUPS:
+            for sql in partitions.rollup_sql(self.db.backend, table, period):
+                statements.append((sql, [start, end]))
+        logger.info("rollups computed from %s to %s", start, until)
+        self.db.transaction(statements + [self._state_sql(until)])
+        return self.db.execute("SELECT COUNT(*) FROM sensors_all WHERE create_time >= %s AND create_time < %s",
+                               [start, end]).fetchone()[0]
+
+
+def source_for(resolution):
+    """The rollup table for a resolution (a timedelta), None: the minute rows."""
+    for (table, period, width) in RESOLUTIONS:
+        if resolution >= width:
+            return (table, period)
+    return None
+
+
+def query_sql(columns, start, end, resolution):
+    """(sql, params) of min, avg and max of columns from start to end, from
+    the coarsest table whose buckets are not wider than resolution."""
+    unknown = set(columns) - set(schema.SENSOR_COLUMNS)
+    if unknown:
+        raise ValueError("unknown sensors column(s): {}".format(", ".join(sorted(unknown))))
+    source = source_for(resolution)
+    if source is None:
+        return ("""
+      SELECT create_time,{}
+        FROM sensors_all
+       WHERE create_time >= %s AND create_time < %s
+    ORDER BY create_time;""".format(",".join("{0},{0},{0}".format(c) for c in columns)), [start, end])
+    (table, period) = source
+    return ("""
+      SELECT bucket,{}
+        FROM {}
+       WHERE bucket >= %s AND bucket < %s
+    ORDER BY bucket;""".format(",".join("{0}_min,{0}_sum/NULLIF({0}_count,0),{0}_max".format(c) for c in columns),
+                               table), [bucket_of(start, period), end])
+
+
+def query(db_cursor, columns, start, end, resolution):
+    """[(time, min, avg, max of columns[0], min, avg, max of columns[1], ..)]."""
+    (sql, params) = query_sql(columns, start, end, resolution)
+    db_cursor.execute(sql, params)
+    return db_cursor.fetchall()
+
+
+def parse_resolution(text):
+    """'90s', '5m', '1h', '7d' -> timedelta."""
+    match = re.match(r"(\d+)([smhd])$", text)
+    if not match:
+        raise argparse.ArgumentTypeError("resolution like 90s, 5m, 1h or 7d, not {!r}".format(text))
+    unit = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}[match.group(2)]
+    return datetime.timedelta(**{unit: int(match.group(1))})
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(description="sensors history at a resolution, as CSV, from the rollups")
+    parser.add_argument('--columns', required=True, help='comma separated sensors columns')
+    parser.add_argument('--start', type=datetime.datetime.fromisoformat, required=True, help='UTC start time')
+    parser.add_argument('--end', type=datetime.datetime.fromisoformat, help='UTC end time (default: now)')
+    parser.add_argument('--resolution', type=parse_resolution, default=parse_resolution("1h"),
+                        help='wanted point spacing: 1m (minute rows), 1h (hourly) or 1d (daily) and up (default 1h)')
+    parser.add_argument('--storage_config', default=storage.CONFIG_PATH,
+                        help='file with the [storage] / [mysqlDB] sections (default %(default)s)')
+    parser.add_argument('--debug', action='store_true', help='enable debug level verbosity')
+    return parser
+
+
+def main():
+    args = _build_parser().parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format="%(asctime)s %(levelname)-8s %(name)s %(message)s")
+    columns = args.columns.split(",")
+    backend = storage.from_config(args.storage_config)
+    rows = query(backend.connect().cursor(), columns, args.start, args.end or partitions.utcnow(), args.resolution)
+    writer = csv.writer(sys.stdout)
+    writer.writerow(["time"] + ["{}_{}".format(c, f) for c in columns for f in ("min", "avg", "max")])
+    for row in rows:
+        writer.writerow(["" if v is None else v for v in row])
+
+
+if __name__ == "__main__":
+    main()
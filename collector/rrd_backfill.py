@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+rrd_backfill - fill the minutes missing from sensors from the .rrd files.
+
+The rrd files server.pl / ingest_server.py keep updating (db_mapper in
+sensors_to_database.py) reach back to before the database existed, and they
+kept running through every database outage. This reads them back with
+`rrdtool fetch` (the python rrdtool binding when installed), maps the data
+sources to sensors columns with the same db_mapper / key_mapper as the live
+path, and inserts a row for every bucket that has no sensors row yet:
+
+  * Time goes in windows (--window_days). For each window every rrd file is
+    fetched once at the finest resolution rrdtool still has for it (a minute
+    for recent data, the consolidated 5 min / hourly archives further back).
+  * A value at rrd time t with step s averages (t - s, t]; it becomes the
+    bucket starting at t - s, minute-aligned like rrdtool's steps. The files'
+    values for a bucket are merged into one row; NaN (unknown) is NULL, and a
+    bucket with no value at all is skipped.
+  * A bucket is missing when no sensors row (sensors_all: SQLite month
+    chunks included) has its create_time within one step of it - live rows
+    are not minute-aligned (a row opens on the first value after the last
+    one's minute, so they drift: :59, :02:01, :03:03 ...) and a bucket
+    between two of them is not a gap. One range query on the create_time
+    index per window. Existing rows are never touched.
+  * Missing rows go in with multi-row INSERT IGNORE / INSERT OR IGNORE
+    statements of --batch_rows rows, committed per window.
+  * After each committed window the state file records how far the run got,
+    so an interrupted run continues there (a rerun without it would find
+    nothing missing in the done windows anyway, it just has to look). A rerun
+    with the same --start and rrd directory resumes; without --end it also
+    keeps the end of the interrupted run (which defaulted to its "now").
+
+Months that got rows are marked for a rollup recompute (sensors_months
+rolled_up = NULL): partitions.py recomputes them on its next run, and the
+current month once it has settled.
+
+    ./rrd_backfill.py --rrd_dir /path/to/rrds --start 2016-01-01
+    ./rrd_backfill.py --rrd_dir /path/to/rrds --start 2024-03-02T10:00 --end 2024-03-04 --dry_run
+"""
+
+import argparse
+import bisect
+import datetime
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import ingest
+import partitions
+import schema
+import sensors_to_database as std
+import storage
+
+try:
+    import rrdtool
+except ImportError:
+    rrdtool = None
+
+logger = logging.getLogger("collector.rrd_backfill")
+
+RESOLUTION = 60         # seconds; rrdtool falls back to coarser archives by itself
+WINDOW_DAYS = 7
+BATCH_ROWS = 500
+STATE_FILE = ".rrd_backfill.state"
+
+
+def to_epoch(t):
+    return int(t.replace(tzinfo=datetime.UTC).timestamp())
+
+
+def from_epoch(seconds):
+    return datetime.datetime.fromtimestamp(seconds, datetime.UTC).replace(tzinfo=None)
+
+
+def _value(text):
+    """One `rrdtool fetch` value: a float, or None for nan / -nan / NaN."""
+    value = float(text)
+    return None if value != value else value
+
+
+def parse_fetch(text):
+    """`rrdtool fetch` output -> (names, [(timestamp, [value or None, ...])])."""
+    names = None
+    points = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        if names is None:
+            names = line.split()
+            continue
+        (ts, _, values) = line.partition(":")
+        points.append((int(ts), [_value(v) for v in values.split()]))
+    return (names or [], points)
+
+
+def fetch_rrd(path, start, end, resolution=RESOLUTION):
+    """(step, names, [(timestamp, values)]) of AVERAGE over (start, end]
+    (epoch seconds)."""
+    args = ["AVERAGE", "-r", str(resolution), "-s", str(start), "-e", str(end)]
+    if rrdtool is not None:
+        ((first, last, step), names, rows) = rrdtool.fetch(path, *args)
+        return (step, list(names), [(first + step * (i + 1), list(row)) for (i, row) in enumerate(rows)])
+    output = subprocess.run(["/usr/bin/rrdtool", "fetch", path] + args, check=True,
+                            capture_output=True, text=True).stdout
+    (names, points) = parse_fetch(output)
+    step = points[1][0] - points[0][0] if len(points) > 1 else resolution
+    return (step, names, points)
+
+
+def rrd_files(rrd_dir):
+    """The db_mapper files present in rrd_dir."""
+    return sorted(db for db in std.db_mapper if os.path.exists(os.path.join(rrd_dir, db)))
+
+
+def read_state(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def write_state(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+class Backfill:
+    """Window by window: fetch, merge, find the missing buckets, insert."""
+
+    def __init__(self, backend=None, rrd_dir=".", fetch=fetch_rrd, batch_rows=BATCH_ROWS):
+        self.db = ingest.Database(backend)
+        self.rrd_dir = rrd_dir
+        self.fetch = fetch
+        self.batch_rows = batch_rows
+        self.files = rrd_files(rrd_dir)
+        self.unmapped = set()
+        self.points = 0
+
+    def buckets(self, start, end):
+        """{bucket datetime: (step, {column: value})} of the rrd files over
+        [start, end)."""
+        buckets = {}
+        for db in self.files:
+            (step, names, points) = self.fetch(os.path.join(self.rrd_dir, db), to_epoch(start), to_epoch(end))
+            self.points += len(points)
+            for (ts, values) in points:
+                bucket = from_epoch(ts - step)
+                if not start <= bucket < end or all(v is None for v in values):
+                    continue
+                columns = std.map_update(db, names, [ts] + values)
+                for column in [c for c in columns if c not in schema.SENSOR_COLUMNS]:
+                    if column not in self.unmapped:
+                        logger.warning("%s: no sensors column %s, skipped", db, column)
+                        self.unmapped.add(column)
+                    del columns[column]
+                (old_step, row) = buckets.get(bucket, (step, {}))
+                row.update((c, v) for (c, v) in columns.items() if v is not None)
+                buckets[bucket] = (max(old_step, step), row)
+        return buckets
+
+    def existing(self, start, end):
+        """Sorted create_times of the sensors rows in [start, end)."""
+        db_cursor = self.db.execute("SELECT create_time FROM sensors_all WHERE create_time >= %s AND create_time < %s"
+                                    " ORDER BY create_time", [start, end])
+        return [r[0] for r in db_cursor.fetchall()]
+
+    def missing(self, buckets, existing):
+        """The buckets with no existing row less than a step away, in time
+        order."""
+        out = []
+        for bucket in sorted(buckets):
+            (step, row) = buckets[bucket]
+            step = datetime.timedelta(seconds=step)
+            i = bisect.bisect_right(existing, bucket - step)
+            if row and (i == len(existing) or existing[i] >= bucket + step):
+                out.append((bucket, row))
+        return out
+
+    def insert_statements(self, rows):
+        """[(sql, args)]: multi-row inserts of batch_rows rows, each with the
+        columns of the whole batch (NULL where a row has none)."""
+        statements = []
+        for i in range(0, len(rows), self.batch_rows):
+            batch = rows[i:i + self.batch_rows]
+            names = sorted(set(c for (bucket, row) in batch for c in row))
+            sql = self.db.backend.insert_missing_sql("sensors", "create_time", names, len(batch))
+            statements.append((sql, [a for (bucket, row) in batch for a in [bucket] + [row.get(n) for n in names]]))
+        return statements
+
+    def window(self, start, end, dry_run=False):
+        """Backfill [start, end). Returns the missing buckets found."""
+        buckets = self.buckets(start, end)
+        if not buckets:
+            return []
+        step = max(s for (s, row) in buckets.values())
+        margin = datetime.timedelta(seconds=step)
+        rows = self.missing(buckets, self.existing(start - margin, end + margin))
+        if rows and not dry_run:
+            months = sorted(set(partitions.month_start(bucket) for (bucket, row) in rows))
+            self.db.transaction(self.insert_statements(rows) + [
+                ("UPDATE sensors_months SET rolled_up = NULL WHERE month = %s", [m]) for m in months])
+        return rows
+
+    def run(self, start, end=None, window=datetime.timedelta(days=WINDOW_DAYS), state_path=None, dry_run=False):
+        """Backfill [start, end) window by window, resuming from state_path
+        when it is a run from the same start and rrd_dir. end None: the
+        resumed run's end, else now. Returns the number of rows inserted
+        (found, with dry_run)."""
+        state = read_state(state_path) if state_path else {}
+        source = os.path.abspath(self.rrd_dir)
+        if state.get("start") == start.isoformat() and state.get("rrd_dir", source) == source:
+            end = end or datetime.datetime.fromisoformat(state["end"])
+            logger.info("resuming at %s (%d rows inserted before)", state["done_until"], state["inserted"])
+            state.update(end=end.isoformat(), rrd_dir=source)
+        else:
+            end = end or partitions.utcnow().replace(second=0, microsecond=0)
+            state = {"start": start.isoformat(), "end": end.isoformat(), "rrd_dir": source,
+                     "done_until": start.isoformat(), "inserted": 0}
+        t = datetime.datetime.fromisoformat(state["done_until"])
+        inserted = 0
+        t0 = time.time()
+        while t < end:
+            window_end = min(t + window, end)
+            rows = self.window(t, window_end, dry_run)
+            inserted += len(rows)
+            logger.info("%s .. %s: %d missing buckets%s", t, window_end, len(rows), " (dry run)" if dry_run else "")
+            t = window_end
+            if state_path and not dry_run:
+                state.update(done_until=t.isoformat(), inserted=state["inserted"] + len(rows))
+                write_state(state_path, state)
+        logger.info("%d rrd points read, %d rows %s in %.1fs", self.points, inserted,
+                    "missing" if dry_run else "inserted", time.time() - t0)
+        return inserted
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(description="insert the sensors rows missing from the database from the .rrd files")
+    parser.add_argument('--rrd_dir', default='.', help='directory holding the .rrd files (default: cwd)')
+    parser.add_argument('--start', type=datetime.datetime.fromisoformat, required=True, help='first time (UTC)')
+    parser.add_argument('--end', type=datetime.datetime.fromisoformat,
+                        help='time (UTC) to stop before (default: now, or the end of the run resumed)')
+    parser.add_argument('--window_days', type=float, default=WINDOW_DAYS,
+                        help='days fetched, checked and committed at a time (default %(default)s)')
+    parser.add_argument('--batch_rows', type=int, default=BATCH_ROWS, help='rows per INSERT (default %(default)s)')
+    parser.add_argument('--state', help='resume state file (default: <rrd_dir>/{})'.format(STATE_FILE))
+    parser.add_argument('--dry_run', action='store_true', help='only count the missing buckets')
+    parser.add_argument('--storage_config', default=storage.CONFIG_PATH,
+                        help='file with the [storage] / [mysqlDB] sections (default %(default)s)')
+    parser.add_argument('--debug', action='store_true', help='enable debug level verbosity')
+    return parser
+
+
+def main():
+    args = _build_parser().parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format="%(asctime)s %(levelname)-8s %(name)s %(message)s")
+    backfill = Backfill(storage.from_config(args.storage_config), args.rrd_dir, batch_rows=args.batch_rows)
+    if not backfill.files:
+        sys.exit("no rrd files of sensors_to_database.db_mapper in {}".format(args.rrd_dir))
+    backfill.run(args.start, args.end, datetime.timedelta(days=args.window_days),
+                 args.state or os.path.join(args.rrd_dir, STATE_FILE), args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+safety_evaluator - query_sky_and_obsy_conditions.py as a long-lived service.
+
+Run from cron (or per minute row by the ingest server) the evaluator pays a
+Python start, a MySQL connect at startup, a read of ~/.mattermosturl-observatory
+and, every time, queries for the last roof row (hysteresis), the recent
+closing events (cooldown) and the full outlier windows. This service keeps
+all of that in memory:
+
+  * ONE database connection (autocommit, so every snapshot sees fresh rows),
+    re-established after the server went away,
+  * the Mattermost url, read once (re-read on SIGHUP),
+  * the previous verdict (open_ok) and the recent opening/closing event times
+    (EvaluatorState), so the snapshot query drops its roof and events
+    subqueries; they are persisted to a small JSON file (written atomically,
+    tmp + os.replace) purely for crash recovery - without a usable file, or
+    with one older than the longest event window or than the newest roof row
+    (the service was down, maybe the cron script wrote verdicts meanwhile),
+    the state is recovered from the roof and events tables once,
+  * the outlier windows (sensor_windows.SensorWindows): each cycle reads only
+    the rows it has not seen,
+  * the newest row itself, when the ingest server published it to the
+    latest_cache.py record (--cache_dir): then a cycle reads nothing from the
+    DB at all and only writes the verdict (which is published in turn).
+
+An evaluation runs whenever a datagram arrives on the local UDP port (the
+ingest server sends one per committed minute row: ingest_server.py --notify)
+and at least every --interval seconds; a burst of triggers is coalesced into
+one run. A stale DB or a failing query is logged and the cycle skipped - the
+service never quit()s the way check_db does for the cron script.
+
+    ./safety_evaluator.py --interval 60
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import latest_cache
+import query_sky_and_obsy_conditions as rules
+import sensor_windows
+import storage
+
+logger = logging.getLogger("collector.safety_evaluator")
+
+LISTEN_HOST = "127.0.0.1"
+LISTEN_PORT = 7778
+INTERVAL = 60.0     # seconds between evaluations when no trigger arrives
+STATE_PATH = os.path.join(str(Path.home()), ".safety_evaluator_state.json")
+
+
+def utcnow():
+    return datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+
+
+class EvaluatorState:
+    """Previous verdict + recent event times, persisted for crash recovery."""
+
+    def __init__(self, path=STATE_PATH, keep_seconds=3600):
+        self.path = path
+        self.keep = datetime.timedelta(seconds=keep_seconds)
+        self.last_open_ok = False
+        self.events = {}        # {event: [create_time, ...]} oldest first
+        self.updated = None
+
+    def load(self):
+        """Restore from the state file. False if it is missing or unreadable."""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.last_open_ok = bool(data["last_open_ok"])
+            self.events = {e: [datetime.datetime.fromisoformat(t) for t in times]
+                           for e, times in data["events"].items()}
+            self.updated = datetime.datetime.fromisoformat(data["updated"])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.info("no usable state in %s (%s)", self.path, e)
+            return False
+        logger.info("state restored from %s (updated %s, open_ok %s)", self.path, self.updated, self.last_open_ok)
+        return True
+
+    def save(self):
+        data = {"last_open_ok": self.last_open_ok,
+                "events": {e: [t.isoformat() for t in times] for e, times in self.events.items()},
+                "updated": self.updated.isoformat() if self.updated else None}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def stale(self, db_cursor, now):
+        """True if the DB may know better: the state is older than the longest
+        event window, or a roof row was written after it."""
+        if self.updated is None or self.updated < now - self.keep:
+            return True
+        db_cursor.execute("""
+          SELECT create_time
+            FROM roof
+        ORDER BY roof_id DESC
+           LIMIT 1;
+        """)
+        db_result_tuple = db_cursor.fetchone()
+        return bool(db_result_tuple and db_result_tuple[0] and db_result_tuple[0] > self.updated)
+
+    def recover(self, db_cursor, now):
+        """Rebuild the state from the DB (what every cron run used to query)."""
+        db_cursor.execute("""
+          SELECT open_ok
+            FROM roof
+        ORDER BY roof_id DESC
+           LIMIT 1;
+        """)
+        db_result_tuple = db_cursor.fetchone()
+        self.last_open_ok = bool(db_result_tuple and db_result_tuple[0])
+        db_cursor.execute("""
+          SELECT event, create_time
+            FROM events
+           WHERE create_time > %s
+        ORDER BY create_time;
+        """, [now - self.keep])
+        self.events = {}
+        for (event, create_time) in db_cursor.fetchall():
+            self.events.setdefault(event, []).append(create_time)
+        self.updated = now
+        logger.info("state recovered from the DB (open_ok %s)", self.last_open_ok)
+
+    def event_counts(self, events, now):
+        """{(event, seconds): events with create_time > now - seconds}, the
+        shape load_snapshot() returns from the events table."""
+        return {(event, seconds): sum(1 for t in self.events.get(event, [])
+                                      if t > now - datetime.timedelta(seconds=seconds))
+                for (event, seconds) in events}
+
+    def record(self, now, open_ok, event=None):
+        """Remember a verdict (and its opening/closing event), then persist."""
+        self.last_open_ok = open_ok
+        if event:
+            self.events.setdefault(event, []).append(now)
+        cutoff = now - self.keep
+        self.events = {e: [t for t in times if t > cutoff] for e, times in self.events.items()}
+        self.events = {e: times for e, times in self.events.items() if times}
+        self.updated = now
+        self.save()
+
+
+class SafetyEvaluator:
+    """One connection, one state, many evaluations."""
+
+    def __init__(self, url, state, settle_seconds=60, backend=None, cache=None):
+        self.url = url
+        self.state = state
+        self.backend = backend or storage.from_config()
+        self.cache = cache
+        (self.windows, self.events) = rules.all_past_windows()
+        self.sensor_windows = sensor_windows.SensorWindows(self.windows, settle_seconds,
+                                                           predicates=rules.PLAN.predicates)
+        self.state_loaded = state.load()
+        self.connected = False
+        self.evaluations = 0
+        self.skipped = 0
+        self.errors = 0
+
+    def connect(self, now=None):
+        now = now or utcnow()
+        rules.db_connect(self.backend)
+        self.backend.autocommit(rules.db, True)
+        self.connected = True
+        if self.state_loaded and self.state.stale(rules.db_cursor, now):
+            logger.info("state of %s is behind the DB, recovering", self.state.updated)
+            self.state_loaded = False
+        if not self.state_loaded:
+            self.state.recover(rules.db_cursor, now)
+            self.state.save()
+            self.state_loaded = True
+
+    def evaluate_once(self, now=None):
+        """One evaluation. Returns open_ok, or None when the cycle was skipped."""
+        now = now or utcnow()
+        try:
+            if not self.connected:
+                self.connect(now)
+            snapshot = rules.load_snapshot(now, self.windows, self.events, self.sensor_windows, self.state,
+                                          self.cache)
+            sensors_id = rules.db_fresh(snapshot, minutes=rules.DB_MAX_AGE_MINUTES)
+            if sensors_id is None:
+                self.skipped += 1
+                return None
+            last_open_ok = rules.retrieve_previous_open_ok(snapshot)
+            (open_ok, reasons, event, roof_change) = rules.decide(snapshot, sensors_id, last_open_ok)
+            rules.publish(self.url, now, sensors_id, open_ok, reasons, event, roof_change)
+            self.state.record(now, open_ok, event if roof_change else None)
+            self.evaluations += 1
+            return open_ok
+        except self.backend.OperationalError as e:
+            logger.warning("DB connection lost (%s), reconnecting next cycle", e)
+            self.connected = False
+        except Exception as e:
+            logger.exception("evaluation failed: %s", e)
+        self.errors += 1
+        return None
+
+    def serve(self, sock, interval=INTERVAL, stop=None):
+        """Evaluate on every trigger datagram (coalesced) and at least every
+        interval seconds, until stop is set."""
+        stop = stop or threading.Event()
+        due = time.monotonic()
+        while not stop.is_set():
+            sock.settimeout(max(0.0, min(1.0, due - time.monotonic())))
+            triggered = False
+            try:
+                sock.recv(256)
+                triggered = True
+                sock.setblocking(False)
+                while True:
+                    sock.recv(256)
+            except (socket.timeout, BlockingIOError):
+                pass
+            if triggered or time.monotonic() >= due:
+                self.evaluate_once()
+                due = time.monotonic() + interval
+
+
+def bind(host=LISTEN_HOST, port=LISTEN_PORT):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((host, port))
+    return sock
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(description="long-lived roof safety evaluator")
+    parser.add_argument('--host', default=LISTEN_HOST, help='trigger UDP address (default %(default)s)')
+    parser.add_argument('--port', type=int, default=LISTEN_PORT, help='trigger UDP port (default %(default)s)')
+    parser.add_argument('--interval', type=float, default=INTERVAL,
+                        help='evaluate at least every this many seconds (default %(default)s)')
+    parser.add_argument('--state', default=STATE_PATH, help='crash-recovery state file (default %(default)s)')
+    parser.add_argument('--cache_dir', default=latest_cache.CACHE_DIR,
+                        help='latest row / verdict records of latest_cache.py (default %(default)s)')
+    parser.add_argument('--storage_config', default=storage.CONFIG_PATH,
+                        help='file with the [storage] / [mysqlDB] sections (default %(default)s)')
+    parser.add_argument('--debug', action='store_true', help='enable debug level verbosity')
+    return parser
+
+
+def main():
+    args = _build_parser().parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format="%(asctime)s %(levelname)-8s %(name)s %(message)s")
+    (windows, events) = rules.all_past_windows()
+    keep = max([seconds for (_, seconds) in events] or [0])
+    rules.cache = latest_cache.LatestCache(args.cache_dir)
+    evaluator = SafetyEvaluator(rules.read_mattermost_url(), EvaluatorState(args.state, keep),
+                                backend=storage.from_config(args.storage_config), cache=rules.cache)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signo, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signo, frame: stop.set())
+    def reload(signo, frame):
+        evaluator.url = rules.read_mattermost_url()
+        logger.info("reloaded the Mattermost url")
+    signal.signal(signal.SIGHUP, reload)
+    sock = bind(args.host, args.port)
+    logger.info("evaluating every %ss and on triggers to udp %s:%d", args.interval, args.host, args.port)
+    evaluator.serve(sock, args.interval, stop)
+    logger.info("stopped after %d evaluations (%d skipped, %d errors)",
+                evaluator.evaluations, evaluator.skipped, evaluator.errors)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+safety_rules - the roof safety verdict as data.
+
+The verdict used to be a chain of check_* functions and if/else blocks in
+query_sky_and_obsy_conditions.py, each with its own SQL; a new sensor (e.g.
+the allskycam1_stars column that is already stored) meant another function
+and another query. The rules now live in safety_rules.yaml (sensors,
+comparators, thresholds, hysteresis, windows and reason strings) and load()
+compiles them ONCE into a Plan:
+
+  * columns / previous_columns: every sensors column the rules read, so the
+    evaluator fetches them all in its one snapshot query,
+  * windows(t): the distinct (name, threshold, seconds) outlier windows - two
+    rules counting the same predicate over the same span share one scan,
+  * predicates / sql_predicates: each window's predicate in Python (for
+    sensor_windows.SensorWindows) and SQL (for the snapshot query),
+  * evaluate(snapshot, last_open_ok): the verdict for one live snapshot,
+  * verdicts(history, t): the same rules over NumPy history arrays, one
+    bool array per rule (backtest.py / sweep.py).
+
+    plan = safety_rules.load()
+    t = plan.thresholds(last_open_ok)
+    verdict = plan.evaluate(snapshot, last_open_ok)
+"""
+
+import bisect
+import collections
+import operator
+import os
+
+import yaml
+
+try:
+    import numpy as np
+except ImportError:
+    np = None   # only the historical (array) path needs it
+
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "safety_rules.yaml")
+
+# op -> (function, word used in window names: sqm < x is the "sqm_below" window)
+OPS = {
+    "<" : (operator.lt, "below"),
+    "<=": (operator.le, "at_most"),
+    ">" : (operator.gt, "above"),
+    ">=": (operator.ge, "at_least"),
+    "==": (operator.eq, "equal"),
+}
+
+Condition = collections.namedtuple("Condition", "sensor op threshold")
+Window = collections.namedtuple("Window", "name condition seconds ok_op ok_threshold")
+Event = collections.namedtuple("Event", "event seconds ok_op ok_threshold")
+Verdict = collections.namedtuple("Verdict", "open_ok reason_open reason_close lines")
+
+
+class RuleError(ValueError):
+    """safety_rules.yaml does not compile."""
+
+
+def rolling_count(t, hits, seconds):
+    """Per row i: number of hits with t[i] - seconds < t <= t[i] (the SQL
+    'create_time > utcnow - seconds' window, current row included).
+    t must be sorted ascending."""
+    csum = np.concatenate(([0], np.cumsum(hits, dtype=np.int64)))
+    start = np.searchsorted(t, t - seconds, side="right")
+    return csum[1:] - csum[start]
+
+
+def previous_row(a):
+    """a shifted by one row (NaN before the first)."""
+    return np.concatenate(([np.nan], a[:-1]))
+
+
+class Rule:
+    def __init__(self, name, now_any, now, previous, past_any, past, event, reasons):
+        self.name = name
+        self.now_any = now_any
+        self.now = now
+        self.previous = previous
+        self.past_any = past_any
+        self.past = past
+        self.event = event
+        self.reasons = reasons
+
+
+class Plan:
+    """A compiled rule file. See the module docstring."""
+
+    def __init__(self, params, hysteresis, sensors, rules):
+        self.params = params
+        self.hysteresis = hysteresis
+        self.sensors = sensors
+        self.rules = rules
+        used = set()
+        previous = set()
+        for rule in rules:
+            for c in rule.now:
+                used.update(sensors[c.sensor])
+                if rule.previous:
+                    previous.update(sensors[c.sensor])
+            for w in rule.past:
+                used.update(sensors[w.condition.sensor])
+        self.columns = sorted(used)
+        self.previous_columns = sorted(previous)
+        self.predicates = {}
+        self.sql_predicates = {}
+        for rule in rules:
+            for w in rule.past:
+                (sensor, op) = (w.condition.sensor, w.condition.op)
+                (fn, _) = OPS[op]
+                self.predicates[w.name] = (sensors[sensor], self._predicate(sensor, fn))
+                self.sql_predicates[w.name] = "{} {} %s".format(" - ".join(sensors[sensor]), op)
+
+    def _predicate(self, sensor, fn):
+        def predicate(values, threshold):
+            v = self.sensor_value(sensor, values)
+            return v is not None and fn(v, threshold)
+        return predicate
+
+    # ---- thresholds ----
+    def thresholds(self, last_open_ok, params=None):
+        """Effective params for the current roof state: the hysteresis amounts
+        are subtracted while the previous verdict was open_ok."""
+        p = dict(params or self.params)
+        if last_open_ok is True:
+            for key, amount in self.hysteresis.items():
+                p[key] = p[key] - self.value(amount, p)
+        return p
+
+    @staticmethod
+    def value(ref, t):
+        """A threshold reference: a param name or a literal number."""
+        return t[ref] if isinstance(ref, str) else ref
+
+    def windows(self, t):
+        """Distinct (name, threshold, seconds) outlier windows for params t."""
+        out = []
+        for rule in self.rules:
+            for w in rule.past:
+                key = (w.name, self.value(w.condition.threshold, t), self.value(w.seconds, t))
+                if key not in out:
+                    out.append(key)
+        return out
+
+    def events(self, t):
+        """Distinct (event, seconds) event-count windows for params t."""
+        out = []
+        for rule in self.rules:
+            if rule.event:
+                key = (rule.event.event, self.value(rule.event.seconds, t))
+                if key not in out:
+                    out.append(key)
+        return out
+
+    def all_windows(self, params=None):
+        """Windows (and event windows) for BOTH hysteresis variants, so they can
+        be fetched before the previous open_ok is known."""
+        both = [self.thresholds(True, params), self.thresholds(False, params)]
+        return (sorted({w for t in both for w in self.windows(t)}),
+                sorted({e for t in both for e in self.events(t)}))
+
+    # ---- one live snapshot ----
+    def sensor_value(self, sensor, values):
+        """Column values (in sensors[sensor] order) -> the sensor value, None
+        if any is NULL."""
+        if any(v is None for v in values):
+            return None
+        return values[0] - values[1] if len(values) == 2 else values[0]
+
+    def _condition(self, c, row, t, rule, lines):
+        v = self.sensor_value(c.sensor, [row.get(col) for col in self.sensors[c.sensor]])
+        threshold = self.value(c.threshold, t)
+        ok = v is not None and OPS[c.op][0](v, threshold)
+        lines.append("{}: {} {} {} {} -> {}".format(rule.name, c.sensor, v, c.op, threshold, "open" if ok else "close"))
+        return ok
+
+    def _window(self, w, snapshot, t, rule, lines):
+        threshold = self.value(w.condition.threshold, t)
+        seconds = self.value(w.seconds, t)
+        count = snapshot["windows"][(w.name, threshold, seconds)]
+        ok = OPS[w.ok_op][0](count, self.value(w.ok_threshold, t))
+        lines.append("{}: {} {} {} count over the last {} seconds is {}, ok if {} {} -> {}".format(
+            rule.name, w.condition.sensor, w.condition.op, threshold, seconds, count,
+            w.ok_op, self.value(w.ok_threshold, t), "open" if ok else "close"))
+        return ok
+
+    def evaluate(self, snapshot, last_open_ok, params=None):
+        """Verdict for one snapshot (query_sky_and_obsy_conditions.load_snapshot):
+        open_ok, the open / close reason strings and one log line per check."""
+        t = self.thresholds(last_open_ok, params)
+        reason_open = []
+        reason_close = []
+        lines = []
+        open_ok = True
+        for rule in self.rules:
+            combine = any if rule.now_any else all
+            now_ok = combine([self._condition(c, snapshot, t, rule, lines) for c in rule.now]) if rule.now else True
+            via_previous = False
+            if not now_ok and rule.previous:
+                now_ok = via_previous = combine([self._condition(c, snapshot["previous"], t, rule, lines)
+                                                 for c in rule.now])
+            combine = any if rule.past_any else all
+            past_ok = combine([self._window(w, snapshot, t, rule, lines) for w in rule.past]) if rule.past else True
+            if rule.event:
+                e = rule.event
+                seconds = self.value(e.seconds, t)
+                count = snapshot["events"][(e.event, seconds)]
+                now_ok = OPS[e.ok_op][0](count, self.value(e.ok_threshold, t))
+                lines.append("{}: {} event count over the last {} seconds is {}, ok if {} {} -> {}".format(
+                    rule.name, e.event, seconds, count, e.ok_op, self.value(e.ok_threshold, t),
+                    "open" if now_ok else "close"))
+            if now_ok and past_ok:
+                reason_open.append(rule.reasons["previous" if via_previous else "ok"])
+            else:
+                open_ok = False
+                if now_ok:
+                    reason_close.append(rule.reasons["past"])
+                elif past_ok:
+                    reason_close.append(rule.reasons["now"])
+                else:
+                    reason_close.append(rule.reasons.get("both", rule.reasons["now"]))
+        return Verdict(open_ok, reason_open, reason_close, lines)
+
+    # ---- history arrays ----
+    def sensor_array(self, sensor, history, shift=False):
+        a = [history[col] for col in self.sensors[sensor]]
+        if shift:
+            a = [previous_row(x) for x in a]
+        return a[0] - a[1] if len(a) == 2 else a[0]
+
+    def verdicts(self, history, t):
+        """Every non-event rule over history ({"create_time": int64 seconds,
+        column: float64 with NaN for NULL}) for params t. Returns
+        {rule name: bool array, "ok": their conjunction}. Event rules depend on
+        earlier verdicts; see event_checks()."""
+        ct = history["create_time"]
+        v = {}
+        ok = np.ones(len(ct), dtype=bool)
+        for rule in self.rules:
+            if rule.event:
+                continue
+            now_ok = np.ones(len(ct), dtype=bool)
+            if rule.now:
+                combine = np.logical_or.reduce if rule.now_any else np.logical_and.reduce
+                now_ok = combine([OPS[c.op][0](self.sensor_array(c.sensor, history), self.value(c.threshold, t))
+                                  for c in rule.now])
+                if rule.previous:
+                    now_ok = now_ok | combine([OPS[c.op][0](self.sensor_array(c.sensor, history, shift=True),
+                                                            self.value(c.threshold, t))
+                                               for c in rule.now])
+            past_ok = np.ones(len(ct), dtype=bool)
+            if rule.past:
+                combine = np.logical_or.reduce if rule.past_any else np.logical_and.reduce
+                past_ok = combine([OPS[w.ok_op][0](
+                    rolling_count(ct, OPS[w.condition.op][0](self.sensor_array(w.condition.sensor, history),
+                                                             self.value(w.condition.threshold, t)),
+                                  self.value(w.seconds, t)),
+                    self.value(w.ok_threshold, t)) for w in rule.past])
+            v[rule.name] = now_ok & past_ok
+            ok &= v[rule.name]
+        v["ok"] = ok
+        return v
+
+    def event_checks(self, t):
+        """[(event, seconds, ok(count))] of the event rules for params t."""
+        return [(r.event.event, self.value(r.event.seconds, t),
+                 lambda count, e=r.event: OPS[e.ok_op][0](count, self.value(e.ok_threshold, t)))
+                for r in self.rules if r.event]
+
+
+class EventLog:
+    """Event times for replaying event rules in create_time order."""
+
+    def __init__(self):
+        self.times = collections.defaultdict(list)
+
+    def add(self, event, at):
+        self.times[event].append(at)
+
+    def count(self, event, seconds, now):
+        """Events with now - seconds < time <= now."""
+        times = self.times[event]
+        return bisect.bisect_right(times, now) - bisect.bisect_right(times, now - seconds)
+
+
+# ---- compiler ----
+def _condition(text, sensors, params, where):
+    parts = str(text).split()
+    if len(parts) != 3:
+        raise RuleError("{}: condition {!r} is not '<sensor> <op> <threshold>'".format(where, text))
+    (sensor, op, threshold) = parts
+    if sensor not in sensors and sensor != "count":
+        raise RuleError("{}: unknown sensor {!r}".format(where, sensor))
+    if op not in OPS:
+        raise RuleError("{}: unknown comparator {!r} (one of {})".format(where, op, " ".join(OPS)))
+    return Condition(sensor, op, _reference(threshold, params, where))
+
+
+def _reference(ref, params, where):
+    if isinstance(ref, (int, float)):
+        return ref
+    for number in (int, float):
+        try:
+            return number(ref)
+        except ValueError:
+            pass
+    if ref not in params:
+        raise RuleError("{}: unknown param {!r}".format(where, ref))
+    return ref
+
+
+def _mode(spec, where):
+    if not spec:
+        return (False, [])
+    if set(spec) - {"all", "any"} or len(spec) != 1:
+        raise RuleError("{}: expected exactly one of all: / any:".format(where))
+    return ("any" in spec, spec.get("any") or spec.get("all"))
+
+
+def compile_rules(config):
+    """Parsed safety_rules.yaml -> Plan. Raises RuleError."""
+    params = dict(config.get("params") or {})
+    hysteresis = dict(config.get("hysteresis") or {})
+    for key, amount in hysteresis.items():
+        if key not in params:
+            raise RuleError("hysteresis: unknown param {!r}".format(key))
+        _reference(amount, params, "hysteresis")
+    sensors = {}
+    for name, column in (config.get("sensors") or {}).items():
+        columns = tuple(column) if isinstance(column, list) else (column,)
+        if len(columns) not in (1, 2):
+            raise RuleError("sensor {}: a column or [a, b] for a - b".format(name))
+        sensors[name] = columns
+    rules = []
+    for spec in config.get("rules") or []:
+        name = spec.get("name")
+        where = "rule {}".format(name)
+        (now_any, now) = _mode(spec.get("now"), where + " now")
+        now = [_condition(c, sensors, params, where) for c in now]
+        if any(c.sensor == "count" for c in now):
+            raise RuleError("{}: 'count' is only valid in a window's ok:".format(where))
+        (past_any, past_specs) = _mode(spec.get("past"), where + " past")
+        past = []
+        for w in past_specs:
+            c = _condition(w["count"], sensors, params, where)
+            ok = _condition(w["ok"], sensors, params, where)
+            if ok.sensor != "count":
+                raise RuleError("{}: window ok must be 'count <op> <threshold>'".format(where))
+            past.append(Window("{}_{}".format(c.sensor, OPS[c.op][1]), c,
+                               _reference(w["seconds"], params, where), ok.op, ok.threshold))
+        event = None
+        if spec.get("event"):
+            e = spec["event"]
+            ok = _condition(e["ok"], sensors, params, where)
+            event = Event(e["count"], _reference(e["seconds"], params, where), ok.op, ok.threshold)
+        if not (now or past or event):
+            raise RuleError("{}: needs now:, past: or event:".format(where))
+        reasons = spec.get("reasons") or {}
+        needed = {"ok", "now"} if not past else {"ok", "past"} | ({"now"} if now else set())
+        if spec.get("previous"):
+            needed.add("previous")
+        missing = needed - set(reasons)
+        if missing:
+            raise RuleError("{}: missing reasons {}".format(where, ", ".join(sorted(missing))))
+        rules.append(Rule(name, now_any, now, bool(spec.get("previous")), past_any, past, event, reasons))
+    return Plan(params, hysteresis, sensors, rules)
+
+
+def load(path=RULES_FILE):
+    with open(path) as f:
+        return compile_rules(yaml.safe_load(f))
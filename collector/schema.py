@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+schema - versioned migrations for the sensors / roof / events tables, and an
+EXPLAIN check of the queries that run every minute.
+
+The tables were created by hand once and never written down, so whether the
+hot queries hit an index was luck. MIGRATIONS is now the definition:
+
+  1. the three tables (CREATE TABLE IF NOT EXISTS - an existing MySQL
+     database keeps its tables and their data),
+  2. the indexes for the access paths the collector actually uses:
+       sensors_create_time   UNIQUE (create_time): the upsert key, the newest
+                             row (ORDER BY create_time DESC LIMIT 1) and the
+                             previous row (MAX(create_time) < ..),
+       sensors_window        (create_time, <every column the rules read>):
+                             the outlier windows, the sensor_windows catch-up
+                             and the backtest history are range scans that
+                             never touch the wide row,
+       roof_create_time      (create_time): the weather status services,
+       events_event_time     (event, create_time): the cooldown counts,
+       events_time_event     (create_time, event): the evaluator's recovery.
+     ORDER BY roof_id DESC LIMIT 1 is the primary key already. Rows that
+     share a create_time (the insert / update race of sensors_to_database.py)
+     are merged into the oldest one first, or the UNIQUE index would fail.
+  3. sensors_hourly / sensors_daily (min, max, sum and count of every column
+     per bucket), the sensors_months registry and the sensors_all view that
+     history readers use - all maintained by partitions.py.
+  4. rollup_state: how far rollups.py has merged the minute rows into the
+     rollups incrementally.
+
+Applied versions are recorded in schema_version; migrate() applies only the
+missing ones, in order. An index that already exists under the same name is
+left alone (MySQL has no CREATE INDEX IF NOT EXISTS, so it is looked up in
+information_schema). SQLite databases are migrated on every connect
+(storage.py); MySQL only when this script runs.
+
+check() runs EXPLAIN on each hot query and reports full table scans and
+sorts; `./schema.py --check` exits 1 when there is one, so a missing index
+fails loudly instead of turning into a slow minute.
+
+    ./schema.py              # migrate the configured database
+    ./schema.py --status     # show applied versions
+    ./schema.py --check      # EXPLAIN the hot queries
+"""
+
+import argparse
+import collections
+import datetime
+import logging
+import os
+import re
+import sys
+
+logger = logging.getLogger("collector.schema")
+
+# Every column sensors_to_database.map_update() can produce.
+SENSOR_COLUMNS = [
+    "observatory_temperature1", "observatory_humidity1", "observatory_dewpoint1",
+    "outside_temperature1", "outside_humidity1", "outside_dewpoint1",
+    "BAA1_temperature_sky", "BAA1_temperature_sensor",
+    "BCC1_temperature_sky", "BCC1_temperature_sensor",
+    "sqm1_luminosity", "sqm1_frequency", "sqm1_sqm",
+    "rainsensor1_pulses", "rainsensor1_drops",
+    "allskycam1_temperature1", "allskycam1_humidity1", "allskycam1_dewpoint1", "allskycam1_stars",
+    "ups1_status", "ups1_linev", "ups1_loadpct", "ups1_bcharge", "ups1_timeleft",
+    "ups1_itemp", "ups1_battv", "ups1_linefreq",
+]
+
+# The columns safety_rules.yaml reads (sorted, as Plan.columns). A sensor
+# added to the rules later is still found through sensors_window, it just
+# costs a row lookup until a migration adds it here.
+WINDOW_COLUMNS = [
+    "BAA1_temperature_sensor", "BAA1_temperature_sky", "BCC1_temperature_sensor", "BCC1_temperature_sky",
+    "rainsensor1_drops", "sqm1_sqm", "ups1_bcharge", "ups1_status",
+]
+
+ROLLUP_FIELDS = ("min", "max", "sum", "count")
+
+
+def rollup_columns(columns=None):
+    """[(sensor column, rollup column, field)]: <column>_min/_max/_sum/_count;
+    avg is sum / count, which (unlike an average) merges across rows."""
+    return [(c, "{}_{}".format(c, f), f) for c in (columns or SENSOR_COLUMNS) for f in ROLLUP_FIELDS]
+
+
+def _rollup_table(name, real, integer):
+    return """
+CREATE TABLE IF NOT EXISTS {} (
+    bucket      DATETIME NOT NULL PRIMARY KEY,
+    n           {} NOT NULL,
+    {}
+)""".format(name, integer, ",\n    ".join("{} {}".format(r, integer if f == "count" else real)
+                                           for (c, r, f) in rollup_columns()))
+
+
+Index = collections.namedtuple("Index", "table name columns unique")
+
+
+def merge_duplicate_sensors(db_cursor, dialect):
+    """Merge sensors rows sharing a create_time into the one with the lowest
+    sensors_id (per column the newest value that is not NULL) and delete the
+    others. Returns the number of rows deleted."""
+    db_cursor.execute("SELECT create_time FROM sensors GROUP BY create_time HAVING COUNT(*) > 1")
+    deleted = 0
+    for (create_time, ) in db_cursor.fetchall():
+        db_cursor.execute("SELECT sensors_id,{} FROM sensors WHERE create_time = %s ORDER BY sensors_id".format(
+            ",".join(SENSOR_COLUMNS)), [create_time])
+        rows = db_cursor.fetchall()
+        merged = {}
+        for row in rows:
+            merged.update((c, v) for (c, v) in zip(SENSOR_COLUMNS, row[1:]) if v is not None)
+        if merged:
+            db_cursor.execute("UPDATE sensors SET {} WHERE sensors_id = %s".format(
+                ",".join("{}=%s".format(c) for c in merged)), list(merged.values()) + [rows[0][0]])
+        ids = [row[0] for row in rows[1:]]
+        db_cursor.execute("DELETE FROM sensors WHERE sensors_id IN ({})".format(",".join(["%s"] * len(ids))), ids)
+        logger.warning("sensors: %d rows at %s merged into sensors_id %s (deleted %s)", len(rows), create_time,
+                       rows[0][0], ids)
+        deleted += len(ids)
+    return deleted
+Migration = collections.namedtuple("Migration", "version description steps")
+
+MIGRATIONS = [
+    Migration(1, "sensors, roof and events tables", [
+        {"mysql": """
+CREATE TABLE IF NOT EXISTS sensors (
+    sensors_id  INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    create_time DATETIME NOT NULL,
+    {}
+) ENGINE=InnoDB""".format(",\n    ".join("{} DOUBLE".format(c) for c in SENSOR_COLUMNS)),
+         "sqlite": """
+CREATE TABLE IF NOT EXISTS sensors (
+    sensors_id  INTEGER PRIMARY KEY AUTOINCREMENT,
+    create_time DATETIME NOT NULL,
+    {}
+)""".format(",\n    ".join("{} REAL".format(c) for c in SENSOR_COLUMNS))},
+        {"mysql": """
+CREATE TABLE IF NOT EXISTS roof (
+    roof_id     INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    create_time DATETIME NOT NULL,
+    sensors_id  INT,
+    open_ok     TINYINT(1),
+    reasons     VARCHAR(255)
+) ENGINE=InnoDB""",
+         "sqlite": """
+CREATE TABLE IF NOT EXISTS roof (
+    roof_id     INTEGER PRIMARY KEY AUTOINCREMENT,
+    create_time DATETIME NOT NULL,
+    sensors_id  INTEGER,
+    open_ok     INTEGER,
+    reasons     TEXT
+)"""},
+        {"mysql": """
+CREATE TABLE IF NOT EXISTS events (
+    events_id   INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    create_time DATETIME NOT NULL,
+    event       VARCHAR(32) NOT NULL,
+    reason      VARCHAR(255)
+) ENGINE=InnoDB""",
+         "sqlite": """
+CREATE TABLE IF NOT EXISTS events (
+    events_id   INTEGER PRIMARY KEY AUTOINCREMENT,
+    create_time DATETIME NOT NULL,
+    event       TEXT NOT NULL,
+    reason      TEXT
+)"""},
+    ]),
+    Migration(2, "indexes for the hot access paths", [
+        merge_duplicate_sensors,
+        Index("sensors", "sensors_create_time", ["create_time"], True),
+        Index("sensors", "sensors_window", ["create_time"] + WINDOW_COLUMNS, False),
+        Index("roof", "roof_create_time", ["create_time"], False),
+        Index("events", "events_event_time", ["event", "create_time"], False),
+        Index("events", "events_time_event", ["create_time", "event"], False),
+    ]),
+    Migration(3, "hourly / daily rollups, month registry, sensors_all view", [
+        {"mysql": _rollup_table("sensors_hourly", "DOUBLE", "INT") + " ENGINE=InnoDB",
+         "sqlite": _rollup_table("sensors_hourly", "REAL", "INTEGER")},
+        {"mysql": _rollup_table("sensors_daily", "DOUBLE", "INT") + " ENGINE=InnoDB",
+         "sqlite": _rollup_table("sensors_daily", "REAL", "INTEGER")},
+        """
+CREATE TABLE IF NOT EXISTS sensors_months (
+    month       DATETIME NOT NULL PRIMARY KEY,
+    rolled_up   DATETIME,
+    archived    VARCHAR(255),
+    dropped     DATETIME
+)""",
+        {"mysql": "CREATE OR REPLACE VIEW sensors_all AS SELECT * FROM sensors",
+         "sqlite": "CREATE VIEW IF NOT EXISTS sensors_all AS SELECT * FROM sensors"},
+    ]),
+    Migration(4, "incremental rollup watermark", [
+        """
+CREATE TABLE IF NOT EXISTS rollup_state (
+    name        VARCHAR(32) NOT NULL PRIMARY KEY,
+    rolled_to   DATETIME NOT NULL
+)""",
+    ]),
+]
+
+VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version     INTEGER NOT NULL PRIMARY KEY,
+    description VARCHAR(255),
+    applied     DATETIME NOT NULL
+)"""
+
+
+def utcnow():
+    return datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+
+
+def applied_versions(connection):
+    db_cursor = connection.cursor()
+    db_cursor.execute(VERSION_TABLE)
+    db_cursor.execute("SELECT version FROM schema_version ORDER BY version")
+    return [row[0] for row in db_cursor.fetchall()]
+
+
+def _index_exists(db_cursor, dialect, index):
+    if dialect == "sqlite":
+        db_cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND name = %s", [index.name])
+    else:
+        db_cursor.execute("""
+          SELECT COUNT(*)
+            FROM information_schema.statistics
+           WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        """, [index.table, index.name])
+    return db_cursor.fetchone()[0] > 0
+
+
+def _apply(db_cursor, dialect, step):
+    if isinstance(step, Index):
+        if _index_exists(db_cursor, dialect, step):
+            logger.info("index %s already exists", step.name)
+            return
+        sql = "CREATE {}INDEX {} ON {} ({})".format("UNIQUE " if step.unique else "", step.name,
+                                                    step.table, ",".join(step.columns))
+    elif isinstance(step, dict):
+        sql = step[dialect]
+    elif callable(step):
+        step(db_cursor, dialect)
+        return
+    else:
+        sql = step
+    db_cursor.execute(sql)
+
+
+def _missing(done, target):
+    return [m for m in MIGRATIONS if m.version not in done and (target is None or m.version <= target)]
+
+
+def migrate(connection, dialect, target=None):
+    """Apply the missing migrations up to target (default: all), each one
+    recorded in schema_version. Returns the versions applied."""
+    if not _missing(set(applied_versions(connection)), target):
+        return []
+    db_cursor = connection.cursor()
+    if dialect == "sqlite":
+        # One writer migrates; SQLite DDL is transactional, so a concurrent
+        # connect waits here and then finds everything applied.
+        connection.commit()
+        db_cursor.execute("BEGIN IMMEDIATE")
+    try:
+        applied = []
+        for migration in _missing(set(applied_versions(connection)), target):
+            logger.info("migration %d: %s", migration.version, migration.description)
+            for step in migration.steps:
+                _apply(db_cursor, dialect, step)
+            db_cursor.execute("INSERT INTO schema_version (version, description, applied) VALUES (%s,%s,%s)",
+                              [migration.version, migration.description, utcnow()])
+            applied.append(migration.version)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    return applied
+
+
+# ---- query plans ----
+def hot_queries(now=None):
+    """[(name, sql, params)] of the queries the collector runs every minute,
+    built by the code that runs them where it has a builder."""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import ingest
+    import query_sky_and_obsy_conditions as rules
+    import sensor_windows
+    import weather_status
+    now = now or utcnow()
+    (windows, events) = rules.all_past_windows()
+    queries = [("snapshot", ) + rules.snapshot_sql(windows, events, now),
+               ("snapshot, counts in memory", ) + rules.snapshot_sql([], events, now, roof_state=False)]
+    counter = sensor_windows.SensorWindows(windows, predicates=rules.PLAN.predicates)
+    queries.append(("sensor_windows catch-up", ) + counter.rows_sql(now))
+    queries.append(("newest sensors row", ingest.NEWEST_ROW_SQL, [now - datetime.timedelta(minutes=1)]))
+    queries.append(("weather status", weather_status.ROOF_STATUS_SQL, [now - datetime.timedelta(seconds=520)]))
+    queries.append(("recent events", """
+          SELECT event, create_time
+            FROM events
+           WHERE create_time > %s
+        ORDER BY create_time;""", [now - datetime.timedelta(hours=1)]))
+    return queries
+
+
+def _newest_by_rowid(sql, table):
+    """SQLite shows ORDER BY <integer primary key> DESC LIMIT n as a plain
+    SCAN; it reads n rows from the end of the table, not the table."""
+    return re.search(r"FROM {0} ORDER BY {0}_id DESC LIMIT \d+".format(table), sql) is not None
+
+
+def _sqlite_plan(db_cursor, sql, params):
+    db_cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+    details = [row[3] for row in db_cursor.fetchall()]
+    subqueries = {m.group(1) for d in details for m in [re.match(r"(?:CO-ROUTINE|MATERIALIZE) (\w+)", d)] if m}
+    problems = []
+    for detail in details:
+        m = re.match(r"SCAN (\w+)$", detail)
+        if m and m.group(1) not in subqueries and not _newest_by_rowid(sql, m.group(1)):
+            problems.append("full scan: " + detail)
+        elif detail.startswith("USE TEMP B-TREE"):
+            problems.append("sort: " + detail)
+    return (details, problems)
+
+
+def _mysql_plan(db_cursor, sql, params):
+    db_cursor.execute("EXPLAIN " + sql, params)
+    names = [d[0].lower() for d in db_cursor.description]
+    rows = [dict(zip(names, row)) for row in db_cursor.fetchall()]
+    details = ["{} {} key={} rows={} {}".format(r.get("table"), r.get("type"), r.get("key"), r.get("rows"),
+                                                r.get("extra") or "") for r in rows]
+    problems = []
+    for (r, detail) in zip(rows, details):
+        if r.get("type") == "ALL" and not str(r.get("table")).startswith("<"):     # not <derivedN>
+            problems.append("full scan: " + detail)
+        if "filesort" in (r.get("extra") or ""):
+            problems.append("sort: " + detail)
+    return (details, problems)
+
+
+def check(connection, dialect, queries=None):
+    """EXPLAIN every hot query: {name: (plan lines, problems)}."""
+    db_cursor = connection.cursor()
+    plan = _sqlite_plan if dialect == "sqlite" else _mysql_plan
+    return {name: plan(db_cursor, " ".join(sql.split()).rstrip(";"), params)
+            for (name, sql, params) in (queries if queries is not None else hot_queries())}
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(description="migrate the collector database and check its query plans")
+    parser.add_argument('--storage_config', help='file with the [storage] / [mysqlDB] sections (default ~/.my.cnf.python)')
+    parser.add_argument('--target', type=int, help='migrate up to this version only')
+    parser.add_argument('--status', action='store_true', help='show the applied versions and exit')
+    parser.add_argument('--check', action='store_true', help='EXPLAIN the hot queries, exit 1 on a full scan')
+    parser.add_argument('--debug', action='store_true', help='enable debug level verbosity')
+    return parser
+
+
+def main():
+    args = _build_parser().parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format="%(asctime)s %(levelname)-8s %(name)s %(message)s")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import storage
+    backend = storage.from_config(args.storage_config or storage.CONFIG_PATH)
+    connection = backend.connect()
+    if args.status:
+        done = applied_versions(connection)
+        for migration in MIGRATIONS:
+            print("{} {:>3}  {}".format("applied" if migration.version in done else "MISSING",
+                                        migration.version, migration.description))
+        return
+    if args.check:
+        failed = False
+        for name, (details, problems) in check(connection, backend.dialect).items():
+            print("{}{}".format(name, ": OK" if not problems else ""))
+            for line in details:
+                print("    " + line)
+            for problem in problems:
+                print("  !! " + problem)
+            failed = failed or bool(problems)
+        sys.exit(1 if failed else 0)
+    applied = migrate(connection, backend.dialect, args.target)
+    print("{}: applied {}".format(backend, applied or "nothing, up to date"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+sensor_windows - incremental sliding-window outlier counts for the "past"
+safety checks.
+
+The past: windows of safety_rules.yaml ask "how many rows in the last N
+seconds had <predicate> <threshold>". Recounting that in SQL every
+minute scans up to 3600 rows. SensorWindows keeps one ring buffer of hit
+times per (predicate, threshold, seconds) window instead: each new minute row
+costs O(1) per window, expired hits are evicted from the front, and a count is
+just the buffer length. After a (re)start it warms itself from ONE bulk range
+query; from then on it only reads the rows it has not seen yet - or none,
+when the row it has not seen is the one latest_cache.py published.
+
+Only rows whose one-minute ingest window has closed (create_time older than
+settle_seconds) are consumed, so a row is counted once, with its final
+values, never while the ingest side is still filling it.
+"""
+
+import collections
+import datetime
+
+# The built-in rule set's window predicates, in Python; a compiled
+# safety_rules.Plan supplies its own (Plan.predicates, same shape and names).
+# A NULL column is never a hit (as in SQL, where NULL < x is not true).
+PREDICATES = {
+    "sqm_below"       : (("sqm1_sqm",), lambda v, t: v[0] < t),
+    "drops_above"     : (("rainsensor1_drops",), lambda v, t: v[0] > t),
+    "BAA1_delta_below": (("BAA1_temperature_sensor", "BAA1_temperature_sky"), lambda v, t: v[0] - v[1] < t),
+    "BCC1_delta_below": (("BCC1_temperature_sensor", "BCC1_temperature_sky"), lambda v, t: v[0] - v[1] < t),
+}
+
+
+class WindowCounter:
+    """Hit count of one predicate over the last `seconds`."""
+
+    def __init__(self, seconds):
+        self.span = datetime.timedelta(seconds=seconds)
+        self.hits = collections.deque()
+
+    def add(self, create_time):
+        self.hits.append(create_time)
+
+    def count(self, now):
+        """Rows with create_time > now - seconds (the SQL window semantics)."""
+        cutoff = now - self.span
+        while self.hits and self.hits[0] <= cutoff:
+            self.hits.popleft()
+        return len(self.hits)
+
+
+class SensorWindows:
+    """All window counters the evaluator needs, keyed (name, threshold, seconds)."""
+
+    def __init__(self, windows, settle_seconds=60, predicates=None):
+        self.predicates = predicates or PREDICATES
+        self.counters = {w: WindowCounter(w[2]) for w in windows}
+        self.longest = datetime.timedelta(seconds=max(w[2] for w in windows))
+        self.settle = datetime.timedelta(seconds=settle_seconds)
+        self.columns = sorted({c for (name, _, _) in windows for c in self.predicates[name][0]})
+        self.last_seen = None
+        self.rows = 0
+
+    def add_row(self, row):
+        """Feed one finished sensors row (a dict with create_time + columns).
+        Rows must arrive in create_time order."""
+        create_time = row["create_time"]
+        for (name, threshold, seconds), counter in self.counters.items():
+            (columns, predicate) = self.predicates[name]
+            values = [row.get(c) for c in columns]
+            if None not in values and predicate(values, threshold):
+                counter.add(create_time)
+        self.last_seen = create_time
+        self.rows += 1
+
+    def rows_sql(self, now):
+        """(sql, params) for the finished rows not seen yet: the whole longest
+        window on the first call (warm-up), only the new ones afterwards."""
+        since = self.last_seen if self.last_seen is not None else now - self.longest
+        sql = """
+          SELECT create_time,{columns}
+            FROM sensors
+           WHERE create_time > %s
+             AND create_time <= %s
+        ORDER BY create_time;
+        """.format(columns=",".join(self.columns))
+        return (sql, [since, now - self.settle])
+
+    def catch_up(self, db_cursor, now):
+        """One (usually single-row) range query; returns the number of rows fed."""
+        (sql, params) = self.rows_sql(now)
+        db_cursor.execute(sql, params)
+        n = 0
+        for db_result_tuple in db_cursor.fetchall():
+            self.add_row(dict(zip(["create_time"] + self.columns, db_result_tuple)))
+            n += 1
+        return n
+
+    def follow(self, row, previous_time, now):
+        """Feed a published row (latest_cache) whose predecessor is at
+        previous_time, without a query. False when that would skip rows (or
+        the row has not settled yet): catch_up() from the DB instead."""
+        if self.last_seen is None:
+            return False
+        if row["create_time"] == self.last_seen:
+            return True
+        if previous_time != self.last_seen or row["create_time"] > now - self.settle:
+            return False
+        self.add_row(row)
+        return True
+
+    def counts(self, now):
+        return {w: counter.count(now) for w, counter in self.counters.items()}
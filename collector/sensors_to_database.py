@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 
+import os
 import sys
-import MySQLdb
 import datetime
 import subprocess
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import storage
+
 # update skytemperature-BAA.rrd -t BAA_sensor:BAA_sky N:8.06:4.06
 #
 # tempandhum-observatory.rrd temperature  -> observatory_temperature1
@@ -35,28 +38,6 @@ import subprocess
 # ups.rrd battv                           -> ups1_battv              
 # ups.rrd linefreq                        -> ups1_linefreq           
 
-def printHelpAndExit(exitValue):
-    print("feed this thing rrdtool update lines")
-    sys.exit(exitValue)
-
-if len(sys.argv) != 6:
-    printHelpAndExit(1)
-
-(me,update,db,t,keys_str,values_str)=sys.argv
-#print("db {},t {},keys {},values {}".format(db,t,keys_str,values_str))
-keys   = keys_str.split(':')
-values = values_str.split(':')
-
-utcnow = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
-
-database = MySQLdb.connect(
-    host="localhost",
-    port=3306,
-    user='sens',
-    passwd='sens',
-    db="observatory1")
-db_cursor = database.cursor()
-
 db_mapper = {
     'tempandhum-observatory.rrd': 'observatory',
     'tempandhum-outside.rrd'    : 'outside',
@@ -69,8 +50,6 @@ db_mapper = {
     'allskycamstars.rrd'        : 'allskycam1',
     'ups.rrd'                   : 'ups1'
 }
-field_name_1 = db_mapper.get(db, "Unknown DB")
-#print("db {}".format(field_name_1))
 
 key_mapper = {
     'temperature' : 'temperature1',
@@ -96,66 +75,98 @@ key_mapper = {
     'linefreq'    : 'linefreq'
 }
 
-sql_keys = []
-sql_values = []
-sql_assignments = []
-i = 0
-while i < len(keys):
-    field_name_2 = key_mapper.get(keys[i], "Unknown KEY")
-    sql_keys.append("{}_{}".format(field_name_1, field_name_2))
-    sql_values.append("{}".format(values[i+1]))
-    #print("{}_{} = {}".format(field_name_1, keys[i], values[i+1]))
-    sql_assignments.append("{}_{}={}".format(field_name_1, field_name_2, values[i+1]))
-    i += 1
-
-sql = """
-  SELECT sensors_id
-         ,create_time
-    FROM sensors
-ORDER BY create_time DESC
-   LIMIT 1;
-"""
-db_cursor.execute(sql)
-db_result_tuple = db_cursor.fetchone()
-#print(db_result_tuple)
-try:
-    row_id  = db_result_tuple[0]
-    db_date = db_result_tuple[1]
-    must_insert = False
-except:
-    db_date = utcnow
-    must_insert = True
-
-if must_insert or db_date < datetime.datetime.now(datetime.UTC).replace(tzinfo=None) - datetime.timedelta(minutes=1) :
-    print("{} is More than a minute ago -> INSERT".format(db_date))
-
-    print("Hack: but first call ./query_sky_and_obsy_conditions.py")
-    subprocess.call("./query_sky_and_obsy_conditions.py")
-    print("Hack: done with query_sky_and_obsy_conditions.py, continue")
-
-    sql_keys.append("create_time")
-    sql_values.append('"' + str(utcnow) + '"')
-    sql = """
-INSERT INTO observatory1.sensors ({keys})
-     VALUES ({values});
-    """.format(keys = ','.join(sql_keys),
-               values = ','.join(sql_values))
-else:
-    #print("{} is Less than a minute ago -> UPDATE".format(db_date))
+def printHelpAndExit(exitValue):
+    print("feed this thing rrdtool update lines")
+    sys.exit(exitValue)
+
+def parse_update(line):
+    """Split one wire-format line 'update <file>.rrd -t k1:k2 N:v1:v2' into
+    (rrd_file, keys, values). values[0] is the rrdtool timestamp ('N').
+    Raises ValueError on anything else."""
+    parts = line.split()
+    if len(parts) != 5 or parts[0].lower() != 'update' or parts[2] != '-t':
+        raise ValueError("not an rrdtool update line: {!r}".format(line))
+    (update, db, t, keys_str, values_str) = parts
+    return (db, keys_str.split(':'), values_str.split(':'))
+
+def map_update(db, keys, values):
+    """Map one rrd update to {sensors column: value string}, e.g.
+    skytemperature-BAA.rrd BAA_sky=4.06 -> {'BAA1_temperature_sky': '4.06'}."""
+    field_name_1 = db_mapper.get(db, "Unknown DB")
+    columns = {}
+    i = 0
+    while i < len(keys):
+        field_name_2 = key_mapper.get(keys[i], "Unknown KEY")
+        columns["{}_{}".format(field_name_1, field_name_2)] = values[i+1]
+        i += 1
+    return columns
+
+def main():
+    if len(sys.argv) != 6:
+        printHelpAndExit(1)
+
+    (me,update,db,t,keys_str,values_str)=sys.argv
+    #print("db {},t {},keys {},values {}".format(db,t,keys_str,values_str))
+    columns = map_update(db, keys_str.split(':'), values_str.split(':'))
+
+    utcnow = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+
+    backend = storage.from_config()
+    database = backend.connect()
+    db_cursor = database.cursor()
+
+    sql_keys = list(columns.keys())
+    sql_values = [None if v == "U" else v for v in columns.values()]
+
     sql = """
-UPDATE observatory1.sensors
-   SET {assignment_list}
- WHERE sensors_id = {sensors_id}
- LIMIT 1;
-    """.format(assignment_list = ','.join(sql_assignments),
-               sensors_id = row_id)
-
-#print("{}".format(sql.lstrip().rstrip()))
-try:
+      SELECT sensors_id
+             ,create_time
+        FROM sensors
+    ORDER BY create_time DESC
+       LIMIT 1;
+    """
     db_cursor.execute(sql)
-    database.commit()
-#    print(db_cursor.rowcount, "record inserted.")
-except:
-    database.rollback()
-    raise
-
+    db_result_tuple = db_cursor.fetchone()
+    #print(db_result_tuple)
+    try:
+        row_id  = db_result_tuple[0]
+        db_date = db_result_tuple[1]
+        must_insert = False
+    except:
+        db_date = utcnow
+        must_insert = True
+
+    if must_insert or db_date < datetime.datetime.now(datetime.UTC).replace(tzinfo=None) - datetime.timedelta(minutes=1) :
+        print("{} is More than a minute ago -> INSERT".format(db_date))
+
+        print("Hack: but first call ./query_sky_and_obsy_conditions.py")
+        subprocess.call("./query_sky_and_obsy_conditions.py")
+        print("Hack: done with query_sky_and_obsy_conditions.py, continue")
+
+        sql_keys.append("create_time")
+        sql_values.append(utcnow)
+        sql = """
+    INSERT INTO sensors ({keys})
+         VALUES ({values});
+        """.format(keys = ','.join(sql_keys),
+                   values = ','.join(['%s'] * len(sql_keys)))
+    else:
+        #print("{} is Less than a minute ago -> UPDATE".format(db_date))
+        sql = """
+    UPDATE sensors
+       SET {assignment_list}
+     WHERE sensors_id = %s;
+        """.format(assignment_list = ','.join("{}=%s".format(k) for k in sql_keys))
+        sql_values.append(row_id)
+
+    #print("{}".format(sql.lstrip().rstrip()))
+    try:
+        db_cursor.execute(sql, sql_values)
+        database.commit()
+    #    print(db_cursor.rowcount, "record inserted.")
+    except:
+        database.rollback()
+        raise
+
+if __name__ == "__main__":
+    main()
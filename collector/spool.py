@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+spool - durable local write-ahead spool between the ingest and MySQL.
+
+When MySQL on the collector host restarts, an upsert raises and that minute's
+values are gone (and check_db then closes the roof on a stale newest row).
+With a spool the ingest side never writes to MySQL itself:
+
+  * Spool.append() adds one line per coalesced upsert to an append-only file:
+
+        {"t": "2026-01-01 22:00:59", "v": {"sqm1_sqm": "19.2", ...}, "f": 1}
+
+    (t the row's create_time, v the columns, f set on the bucket's final
+    flush). Writes are unbuffered; fsync is batched - after fsync_records
+    lines, after fsync_seconds, and always for a final line - so a crash
+    loses at most the last second of a running minute.
+  * SpoolDrainer, on its own thread, reads the spool from its committed
+    offset and replays it into observatory1.sensors in file order with
+    multi-row INSERT .. ON DUPLICATE KEY UPDATE statements (hundreds of rows
+    per statement, rows of one create_time merged first). The offset is
+    saved (tmp + fsync + os.replace) only after the batch's one commit, so a
+    crash replays a batch again - harmless, the upsert is idempotent. While MySQL is down it
+    backs off and retries; the spool simply grows.
+  * A batch MySQL rejects for any other reason (a column it does not have)
+    is replayed one record at a time; a record that still fails is moved to
+    <spool>.rejected with an error log and the offset moves past it, so one
+    bad record cannot hold up every row after it.
+  * Rows reach MySQL strictly in create_time order, so a reader never sees a
+    newer row while an older one is still missing. The drainer reports the
+    newest completed row of each batch (on_row_committed) - that is when the
+    safety evaluation may run.
+  * Once fully drained the spool file is truncated - after offset 0 is
+    saved, and a saved offset past the end of the file reads as the end, so
+    a crash in between can never make the drainer skip new lines.
+"""
+
+import datetime
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import ingest
+
+logger = logging.getLogger("collector.spool")
+
+FSYNC_RECORDS = 64
+FSYNC_SECONDS = 1.0
+BATCH_ROWS = 500
+READ_BYTES = 1 << 20
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def encode(create_time, values, final=False):
+    record = {"t": create_time.strftime(TIME_FORMAT), "v": values}
+    if final:
+        record["f"] = 1
+    return (json.dumps(record, separators=(",", ":")) + "\n").encode()
+
+
+def decode(line):
+    record = json.loads(line)
+    return (datetime.datetime.strptime(record["t"], TIME_FORMAT), record["v"], bool(record.get("f")))
+
+
+class Spool:
+    """The append-only spool file plus its committed-offset file."""
+
+    def __init__(self, path, fsync_records=FSYNC_RECORDS, fsync_seconds=FSYNC_SECONDS):
+        self.path = path
+        self.offset_path = path + ".offset"
+        self.fsync_records = fsync_records
+        self.fsync_seconds = fsync_seconds
+        self.lock = threading.Lock()
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+        self.appended = 0
+        self.last_time = self._scan_last_time()
+
+    def _scan_last_time(self):
+        """create_time of the newest complete line (a torn tail is ignored)."""
+        size = os.fstat(self.fd).st_size
+        if size == 0:
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(max(0, size - 64 * 1024))
+            lines = f.read().split(b"\n")[:-1]
+        for line in reversed(lines):
+            try:
+                return decode(line)[0]
+            except ValueError:
+                continue
+        return None
+
+    def append(self, create_time, values, final=False):
+        data = encode(create_time, values, final)
+        with self.lock:
+            os.write(self.fd, data)
+            self.appended += 1
+            self.unsynced += 1
+            self.last_time = create_time
+            if final or self.unsynced >= self.fsync_records:
+                self._sync()
+
+    def tick(self):
+        """Time-based fsync; call about once a second."""
+        with self.lock:
+            if self.unsynced and time.monotonic() - self.synced_at >= self.fsync_seconds:
+                self._sync()
+
+    def sync(self):
+        with self.lock:
+            if self.unsynced:
+                self._sync()
+
+    def _sync(self):
+        os.fsync(self.fd)
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+    def size(self):
+        return os.fstat(self.fd).st_size
+
+    def read_offset(self):
+        """The committed offset, never past the end of the spool."""
+        try:
+            with open(self.offset_path) as f:
+                offset = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+        return min(offset, self.size())
+
+    def write_offset(self, offset):
+        tmp = self.offset_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.offset_path)
+
+    def truncate_if_drained(self, offset):
+        """Empty the spool once everything up to offset is committed. Returns
+        the new offset."""
+        with self.lock:
+            if offset != self.size():
+                return offset
+            # Offset 0 first: a crash before the truncate replays the spool
+            # (idempotent), never skips what is appended after it.
+            self.write_offset(0)
+            os.ftruncate(self.fd, 0)
+            self._sync()
+            return 0
+
+    def close(self):
+        self.sync()
+        os.close(self.fd)
+
+
+class SpoolDrainer:
+    """Replays the spool into MySQL, in order, in multi-row upserts."""
+
+    def __init__(self, spool, backend=None, batch_rows=BATCH_ROWS, on_row_committed=None,
+                 truncate_bytes=1 << 20):
+        self.spool = spool
+        self.db = ingest.Database(backend)
+        self.batch_rows = batch_rows
+        self.on_row_committed = on_row_committed
+        self.truncate_bytes = truncate_bytes
+        self.offset = spool.read_offset()
+        self._stop = threading.Event()
+        self._thread = None
+        self.rows = 0
+        self.statements = 0
+        self.errors = 0
+        self.rejected = 0
+
+    def read_batch(self):
+        """Up to batch_rows complete records after the offset:
+        ([(create_time, values, final)], offset after them)."""
+        records = []
+        offset = self.offset
+        with open(self.spool.path, "rb") as f:
+            f.seek(offset)
+            data = f.read(READ_BYTES)
+        start = 0
+        while len(records) < self.batch_rows:
+            end = data.find(b"\n", start)
+            if end < 0:
+                break           # torn / still being written: next time
+            line = data[start:end]
+            start = end + 1
+            try:
+                records.append(decode(line))
+            except ValueError:
+                logger.error("skipping corrupt spool line at byte %d: %r", offset + start, line[:80])
+        return (records, offset + start)
+
+    def statements_for(self, records):
+        """Records -> [(sql, args)] in order: rows of one create_time merged,
+        consecutive rows with the same columns in one multi-row upsert."""
+        merged = {}
+        for (create_time, values, final) in records:
+            merged.setdefault(create_time, {}).update(values)
+        out = []
+        run = []
+        names = None
+        for create_time, values in merged.items():
+            if not values:
+                continue
+            row_names = sorted(values)
+            if row_names != names and run:
+                out.append((self.db.upsert_sql(names, len(run)), [a for row in run for a in row]))
+                run = []
+            names = row_names
+            run.append([create_time] + [ingest.to_sql_value(values[n]) for n in names])
+        if run:
+            out.append((self.db.upsert_sql(names, len(run)), [a for row in run for a in row]))
+        return out
+
+    def drain_once(self):
+        """Replay one batch. Returns the number of records replayed."""
+        (records, offset) = self.read_batch()
+        if not records:
+            if offset != self.offset:
+                self.offset = offset
+                self.spool.write_offset(offset)
+            if self.offset and self.offset >= self.truncate_bytes:
+                self.offset = self.spool.truncate_if_drained(self.offset)
+            return 0
+        statements = self.statements_for(records)
+        try:
+            self.db.transaction(statements)     # the whole batch commits, or none of it
+            self.statements += len(statements)
+        except self.db.backend.Error:
+            if self.db.database is None:        # connection lost: back off, replay the batch
+                raise
+            self.replay_each(records)
+        self.offset = offset
+        self.spool.write_offset(offset)
+        self.rows += len(records)
+        finals = [create_time for (create_time, values, final) in records if final]
+        if finals and self.on_row_committed:
+            self.on_row_committed(finals[-1])
+        return len(records)
+
+    def replay_each(self, records):
+        """Replay a rejected batch record by record, moving the records that
+        fail on their own to the .rejected file."""
+        for (create_time, values, final) in records:
+            statements = self.statements_for([(create_time, values, final)])
+            try:
+                self.db.transaction(statements)
+                self.statements += len(statements)
+            except self.db.backend.Error as e:
+                if self.db.database is None:
+                    raise
+                logger.error("spool record %s rejected (%s), moved to %s: %s", create_time, e,
+                             self.spool.path + ".rejected", values)
+                with open(self.spool.path + ".rejected", "ab") as f:
+                    f.write(encode(create_time, values, final))
+                    f.flush()
+                    os.fsync(f.fileno())
+                self.rejected += 1
+
+    def drain(self):
+        """Replay everything there is now. Returns the records replayed."""
+        total = 0
+        while True:
+            n = self.drain_once()
+            if not n:
+                return total
+            total += n
+
+    def start(self, interval=1.0):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(interval,), name="spool-drainer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _loop(self, interval):
+        backoff = interval
+        while True:
+            try:
+                self.drain()
+                backoff = interval
+            except Exception as e:
+                self.errors += 1
+                backoff = min(backoff * 2, 30.0)
+                logger.warning("spool drain failed (%s), %d bytes waiting, retry in %.0fs",
+                               e, self.spool.size() - self.offset, backoff)
+            if self._stop.wait(backoff):
+                try:
+                    self.drain()    # final pass on shutdown
+                except Exception as e:
+                    logger.error("spool left undrained at shutdown: %s", e)
+                return
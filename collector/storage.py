@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+storage - where the sensors / roof / events tables live: MySQL or SQLite.
+
+The collector scripts and the two weather status services used to hard-wire a
+MySQL server on localhost (MySQLdb with sens/sens in the code, or pymysql with
+the [mysqlDB] section of ~/.my.cnf.python). On the small collector box that is
+a server process and a network hop for a few kB per minute, and nothing can be
+tested or benchmarked without it. The backend is now chosen in the same
+~/.my.cnf.python:
+
+    [storage]
+    backend = sqlite                                # or mysql (the default)
+    path    = /var/lib/observatory/observatory1.sqlite
+
+    [mysqlDB]                                       # used by backend = mysql
+    host = localhost
+    port = 3306
+    user = sens
+    pass = sens
+    db   = observatory1
+
+Without a [mysqlDB] section MySQL is localhost/sens/observatory1 as before.
+
+Both backends hand out plain DB-API connections and share the SQL:
+
+  * Queries are written with %s placeholders (MySQLdb/pymysql paramstyle);
+    the SQLite connection translates them to ? itself.
+  * The dialect differences the code needs come from the backend: the upsert
+    (upsert_sql(): ON DUPLICATE KEY UPDATE on MySQL, ON CONFLICT .. DO UPDATE
+    on SQLite, optionally merging min / max / sums into the stored row), the
+    insert that skips existing keys (insert_missing_sql()) and the hour / day
+    truncation (time_bucket_sql()).
+  * DATETIME columns come back as datetime.datetime from both (SQLite stores
+    them as ISO text, which sorts in time order).
+  * Error / OperationalError are the backend's exception classes, and
+    disconnected() tells a lost connection (reconnect and try again) from an
+    error in the statement (a missing column, a locked file) that a retry on
+    a new connection would only repeat.
+
+Request handlers that only read (weather_safety_service.py) borrow
+connections from a ConnectionPool instead of connecting per request.
+
+SQLite runs in WAL mode (readers never block the writer and vice versa) with
+synchronous=NORMAL and a busy timeout, and brings the sensors / roof / events
+schema up to date on every connect (schema.migrate()).
+"""
+
+import configparser
+import contextlib
+import datetime
+import os
+import re
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import schema
+
+CONFIG_FILE_IN_HOME = ".my.cnf.python"
+CONFIG_PATH = os.path.join(str(Path.home()), CONFIG_FILE_IN_HOME)
+
+DB_CONFIG = {"host": "localhost", "port": 3306, "user": "sens", "passwd": "sens", "db": "observatory1"}
+SQLITE_PATH = "/var/lib/observatory/observatory1.sqlite"
+BUSY_TIMEOUT = 10.0     # seconds a SQLite writer waits for the lock
+POOL_SIZE = 4           # idle connections a ConnectionPool keeps
+# CR_SERVER_GONE_ERROR, CR_SERVER_LOST, CR_SERVER_LOST_EXTENDED
+MYSQL_DISCONNECTS = (2006, 2013, 2055)
+
+# DATE_FORMAT / strftime formats (same codes), %% because the statements
+# using them always carry parameters.
+BUCKET_FORMATS = {"hour": "%%Y-%%m-%%d %%H:00:00", "day": "%%Y-%%m-%%d 00:00:00"}
+
+
+def _mysql_driver():
+    """MySQLdb (mysqlclient) when installed, else pymysql - same API."""
+    try:
+        import MySQLdb
+    except ImportError:
+        import pymysql as MySQLdb
+    return MySQLdb
+
+
+class MySQLStorage:
+    """A MySQL server, as before."""
+
+    dialect = "mysql"
+
+    def __init__(self, db_config=None):
+        self.db_config = dict(db_config or DB_CONFIG)
+        self.driver = _mysql_driver()
+
+    @property
+    def Error(self):
+        return self.driver.Error
+
+    @property
+    def OperationalError(self):
+        return self.driver.OperationalError
+
+    def __str__(self):
+        return "mysql {}@{}".format(self.db_config["db"], self.db_config["host"])
+
+    def connect(self):
+        return self.driver.connect(**self.db_config)
+
+    def disconnected(self, error, connection):
+        """True if error means the connection is gone: a client 'server gone
+        away / lost' code, or a ping that fails (without reconnecting)."""
+        if not isinstance(error, self.OperationalError):
+            return False
+        if error.args and error.args[0] in MYSQL_DISCONNECTS:
+            return True
+        try:
+            connection.ping(False)
+        except self.Error:
+            return True
+        return False
+
+    def autocommit(self, connection, on):
+        connection.autocommit(on)
+
+    def time_bucket_sql(self, column, period):
+        """SQL truncating a DATETIME column to its 'hour' or 'day'."""
+        return "DATE_FORMAT({}, '{}')".format(column, BUCKET_FORMATS[period])
+
+    def insert_missing_sql(self, table, key, names, rows=1):
+        """Multi-row INSERT IGNORE of key + names: rows whose key exists are skipped."""
+        return "INSERT IGNORE INTO {} ({},{}) VALUES {};".format(table, key, ",".join(names), _values(names, rows))
+
+    def upsert_sql(self, table, key, names, rows=1, merge=None):
+        """Multi-row INSERT .. ON DUPLICATE KEY UPDATE of key + names; names in
+        merge ({name: 'min' | 'max' | 'add'}) are merged into the stored value."""
+        return """
+INSERT INTO {table} ({key},{names})
+     VALUES {values}
+ON DUPLICATE KEY UPDATE {assignments};
+    """.format(table=table, key=key, names=",".join(names), values=_values(names, rows),
+               assignments=_assignments(names, merge, "VALUES({})", "LEAST", "GREATEST"))
+
+
+def _values(names, rows):
+    return ",".join(["(%s,{})".format(",".join(["%s"] * len(names)))] * rows)
+
+
+# How upsert_sql(merge=) combines the stored and the new value. Both dialects'
+# LEAST / MIN and + are NULL when either side is, hence the COALESCE: a NULL
+# (no reading) never replaces a value.
+_MERGES = {"min": "COALESCE({least}({0},{1}),{0},{1})",
+           "max": "COALESCE({greatest}({0},{1}),{0},{1})",
+           "add": "COALESCE({0}+{1},{0},{1})"}
+
+
+def _assignments(names, merge, new, least, greatest):
+    merge = merge or {}
+    return ",".join("{}={}".format(n, _MERGES[merge[n]].format(n, new.format(n), least=least, greatest=greatest)
+                                   if n in merge else new.format(n)) for n in names)
+
+
+_PLACEHOLDER = re.compile(r"%[s%]")
+
+
+def _qmark(sql):
+    return _PLACEHOLDER.sub(lambda m: "?" if m.group(0) == "%s" else "%", sql)
+
+
+class _Cursor(sqlite3.Cursor):
+    """Accepts the %s placeholders the MySQL code is written with."""
+
+    def execute(self, sql, args=()):
+        return super().execute(_qmark(sql), () if args is None else args)
+
+    def executemany(self, sql, seq_of_args):
+        return super().executemany(_qmark(sql), seq_of_args)
+
+
+class _Connection(sqlite3.Connection):
+
+    def cursor(self, factory=_Cursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, args=()):
+        return self.cursor().execute(sql, args)
+
+    def executemany(self, sql, seq_of_args):
+        return self.cursor().executemany(sql, seq_of_args)
+
+
+def _adapt_datetime(value):
+    return value.isoformat(" ")
+
+
+def _convert_datetime(value):
+    return datetime.datetime.fromisoformat(value.decode())
+
+
+sqlite3.register_adapter(datetime.datetime, _adapt_datetime)
+sqlite3.register_converter("DATETIME", _convert_datetime)
+
+
+class SQLiteStorage:
+    """One SQLite file in WAL mode, shared by the collector processes."""
+
+    dialect = "sqlite"
+    Error = sqlite3.Error
+    OperationalError = sqlite3.OperationalError
+
+    def __init__(self, path=SQLITE_PATH, busy_timeout=BUSY_TIMEOUT):
+        self.path = path
+        self.busy_timeout = busy_timeout
+
+    def __str__(self):
+        return "sqlite {}".format(self.path)
+
+    def connect(self):
+        # check_same_thread off: a pooled connection moves between threads,
+        # one at a time (ConnectionPool), which the sqlite3 module allows.
+        connection = sqlite3.connect(self.path, timeout=self.busy_timeout, factory=_Connection,
+                                     detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        schema.migrate(connection, self.dialect)
+        return connection
+
+    def disconnected(self, error, connection):
+        """Never: a file has no connection to lose, a reopened one would
+        fail the same way (no such column, database is locked)."""
+        return False
+
+    def autocommit(self, connection, on):
+        # Plain SELECTs never open a transaction in the sqlite3 module, so
+        # reads are fresh either way; this only changes how DML commits.
+        connection.isolation_level = None if on else ""
+
+    def time_bucket_sql(self, column, period):
+        """SQL truncating a DATETIME column to its 'hour' or 'day'."""
+        return "strftime('{}', {})".format(BUCKET_FORMATS[period], column)
+
+    def insert_missing_sql(self, table, key, names, rows=1):
+        """Multi-row INSERT OR IGNORE of key + names: rows whose key exists are skipped."""
+        return "INSERT OR IGNORE INTO {} ({},{}) VALUES {};".format(table, key, ",".join(names), _values(names, rows))
+
+    def upsert_sql(self, table, key, names, rows=1, merge=None):
+        """Multi-row INSERT .. ON CONFLICT(key) DO UPDATE of key + names; names
+        in merge ({name: 'min' | 'max' | 'add'}) are merged into the stored
+        value."""
+        return """
+INSERT INTO {table} ({key},{names})
+     VALUES {values}
+ON CONFLICT({key}) DO UPDATE SET {assignments};
+    """.format(table=table, key=key, names=",".join(names), values=_values(names, rows),
+               assignments=_assignments(names, merge, "excluded.{}", "MIN", "MAX"))
+
+
+class ConnectionPool:
+    """Reusable autocommit connections for request handlers that only read.
+
+    connection() hands out an idle connection (or opens one) and takes it
+    back afterwards; up to `size` idle ones are kept, more are closed. A
+    connection whose use raised (an OperationalError: the server went away)
+    is closed instead of returned. Autocommit, so a reused MySQL connection never reads
+    from an old REPEATABLE READ snapshot."""
+
+    def __init__(self, backend, size=POOL_SIZE):
+        self.backend = backend
+        self.size = size
+        self.idle = []
+        self.lock = threading.Lock()
+        self.opened = 0
+
+    @contextlib.contextmanager
+    def connection(self):
+        with self.lock:
+            connection = self.idle.pop() if self.idle else None
+        if connection is None:
+            connection = self.backend.connect()
+            self.backend.autocommit(connection, True)
+            self.opened += 1
+        try:
+            yield connection
+        except Exception:
+            connection.close()
+            raise
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append(connection)
+                connection = None
+        if connection is not None:
+            connection.close()
+
+    def close(self):
+        with self.lock:
+            (idle, self.idle) = (self.idle, [])
+        for connection in idle:
+            connection.close()
+
+
+def mysql_config(config):
+    """The [mysqlDB] section as connect() kwargs, or the localhost defaults."""
+    if not config.has_section("mysqlDB"):
+        return dict(DB_CONFIG)
+    section = config["mysqlDB"]
+    return {"host": section.get("host", DB_CONFIG["host"]),
+            "port": int(section.get("port", DB_CONFIG["port"])),
+            "user": section.get("user", DB_CONFIG["user"]),
+            "passwd": section.get("pass", DB_CONFIG["passwd"]),
+            "db": section.get("db", DB_CONFIG["db"])}
+
+
+def from_config(path=CONFIG_PATH):
+    """The backend selected by the [storage] section of path."""
+    config = configparser.ConfigParser()
+    config.read(path)
+    backend = config.get("storage", "backend", fallback="mysql")
+    if backend == "mysql":
+        return MySQLStorage(mysql_config(config))
+    if backend == "sqlite":
+        return SQLiteStorage(config.get("storage", "path", fallback=SQLITE_PATH),
+                             config.getfloat("storage", "busy_timeout", fallback=BUSY_TIMEOUT))
+    raise ValueError("unknown storage backend {!r} in {}".format(backend, path))
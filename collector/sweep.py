@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+sweep - search the safety threshold grid with the backtest.
+
+One backtest answers "how would THIS set of constants have done". The sweep
+runs backtest.backtest() for every combination of a parameter grid (SQM
+minimum, BAA1/BCC1 delta-T, hysteresis, window lengths, outlier counts ...)
+and ranks them by
+
+    score = hours_open - flap_penalty * closings - rain_penalty * rain_hours
+
+where rain_hours is the time the roof was open (by the previous verdict)
+while the rain sensor counted drops - the rain the rules let in.
+
+The history is written ONCE as one .npy file per column; every worker of the
+process pool maps those files read-only (np.load(mmap_mode='r')), so N
+workers share one copy in the page cache instead of pickling the arrays N
+times. Parameter names are the keys of
+query_sky_and_obsy_conditions.default_params(), and the rules are the ones
+the live evaluator uses, so a winning row translates 1:1 into its constants.
+
+    ./sweep.py --cache /tmp/sensors-2025.npz \\
+        --grid required_baa_delta_t=11:19:1 --grid required_bcc_delta_t=12,14,16 \\
+        --grid sqm_min=16.5,17,17.5,18 --grid minimum_delta_t_hysterese=2,3,4 \\
+        --results sweep.csv
+"""
+
+import argparse
+import concurrent.futures
+import csv
+import itertools
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import backtest
+import query_sky_and_obsy_conditions as rules
+
+logger = logging.getLogger("collector.sweep")
+
+FLAP_PENALTY = 0.5      # hours of imaging one closing is worth
+RAIN_PENALTY = 20.0     # hours of imaging one hour open in the rain is worth
+METRICS = ["score", "hours_open", "openings", "closings", "rain_hours"]
+
+
+def write_history_dir(history, directory):
+    """One <column>.npy per array, for np.load(mmap_mode='r')."""
+    os.makedirs(directory, exist_ok=True)
+    for column, a in history.items():
+        np.save(os.path.join(directory, column + ".npy"), np.ascontiguousarray(a))
+
+
+def read_history_dir(directory, mmap_mode="r"):
+    return {name[:-4]: np.load(os.path.join(directory, name), mmap_mode=mmap_mode)
+            for name in os.listdir(directory) if name.endswith(".npy")}
+
+
+def parse_grid(values):
+    """['sqm_min=16.5,17', 'required_baa_delta_t=11:15:2'] -> {key: [values]}.
+    start:stop:step is inclusive of stop."""
+    defaults = rules.default_params()
+    grid = {}
+    for item in values or []:
+        (key, sep, spec) = item.partition("=")
+        if not sep or key not in defaults:
+            raise ValueError("unknown parameter {!r} (one of {})".format(key, ", ".join(sorted(defaults))))
+        if ":" in spec:
+            (start, stop, step) = (float(x) for x in spec.split(":"))
+            count = int(round((stop - start) / step)) + 1
+            grid[key] = [round(start + i * step, 6) for i in range(count)]
+        else:
+            grid[key] = [float(x) for x in spec.split(",")]
+        grid[key] = [int(v) if float(v).is_integer() else v for v in grid[key]]
+    return grid
+
+
+def combinations(grid):
+    """Every params dict of the grid (defaults for the keys not swept)."""
+    keys = sorted(grid)
+    for values in itertools.product(*(grid[k] for k in keys)):
+        params = rules.default_params()
+        params.update(zip(keys, values))
+        yield params
+
+
+def rain_hours(history, open_ok, max_gap_seconds=rules.DB_MAX_AGE_MINUTES * 60):
+    """Hours the roof was open, by the previous row's verdict, at rows that
+    saw drops."""
+    ct = history["create_time"]
+    if len(ct) < 2:
+        return 0.0
+    dt = np.minimum(np.diff(ct), max_gap_seconds)
+    wet = (history["rainsensor1_drops"][1:] > 0) & open_ok[:-1]
+    return float(dt[wet].sum()) / 3600.0
+
+
+def score(result, flap_penalty=FLAP_PENALTY, rain_penalty=RAIN_PENALTY):
+    return result["hours_open"] - flap_penalty * result["closings"] - rain_penalty * result["rain_hours"]
+
+
+def evaluate(history, params, flap_penalty=FLAP_PENALTY, rain_penalty=RAIN_PENALTY):
+    """One grid point -> its metrics row."""
+    result = backtest.backtest(history, params)
+    result["rain_hours"] = rain_hours(history, result["open_ok"])
+    row = {k: result[k] for k in METRICS if k != "score"}
+    row["score"] = score(result, flap_penalty, rain_penalty)
+    return row
+
+
+# ---- process pool: each worker maps the history once ----
+_worker = {}
+
+def _init_worker(directory, flap_penalty, rain_penalty):
+    _worker["history"] = read_history_dir(directory)
+    _worker["penalties"] = (flap_penalty, rain_penalty)
+
+def _run(params):
+    return (params, evaluate(_worker["history"], params, *_worker["penalties"]))
+
+
+def sweep(directory, grid, processes=None, flap_penalty=FLAP_PENALTY, rain_penalty=RAIN_PENALTY, chunksize=8):
+    """Evaluate every combination of grid over the history in directory.
+    Returns [(params, metrics)] best score first."""
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=processes, initializer=_init_worker,
+            initargs=(directory, flap_penalty, rain_penalty)) as pool:
+        results = list(pool.map(_run, combinations(grid), chunksize=chunksize))
+    results.sort(key=lambda r: r[1]["score"], reverse=True)
+    return results
+
+
+def write_results(results, grid, path):
+    """Ranked CSV: rank, the metrics, then the swept parameters."""
+    keys = sorted(grid)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["rank"] + METRICS + keys)
+        for rank, (params, metrics) in enumerate(results, start=1):
+            writer.writerow([rank] + ["{:.3f}".format(metrics[m]) if isinstance(metrics[m], float) else metrics[m]
+                                      for m in METRICS] + [params[k] for k in keys])
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(description="parallel threshold sweep over the sensors history")
+    parser.add_argument('--start', help='first create_time (UTC) when loading from the DB or --archive')
+    parser.add_argument('--end', help='create_time (UTC) to stop before when loading from the DB or --archive')
+    parser.add_argument('--cache', help='backtest .npz history: read if present, else saved there')
+    parser.add_argument('--archive', help='read the history from this columnar_archive.py directory, not the DB')
+    parser.add_argument('--history_dir', help='directory for the memory-mapped .npy columns (default: a temp dir)')
+    parser.add_argument('--grid', action='append', required=True, metavar='KEY=V1,V2|START:STOP:STEP',
+                        help='parameter values to sweep (repeatable)')
+    parser.add_argument('--processes', type=int, help='worker processes (default: one per CPU)')
+    parser.add_argument('--flap_penalty', type=float, default=FLAP_PENALTY,
+                        help='score hours per closing (default %(default)s)')
+    parser.add_argument('--rain_penalty', type=float, default=RAIN_PENALTY,
+                        help='score hours per hour open in the rain (default %(default)s)')
+    parser.add_argument('--results', default='sweep.csv', help='ranked results CSV (default %(default)s)')
+    parser.add_argument('--debug', action='store_true', help='enable debug level verbosity')
+    return parser
+
+
+def main():
+    args = _build_parser().parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format="%(asctime)s %(levelname)-8s %(name)s %(message)s")
+    grid = parse_grid(args.grid)
+    if args.archive:
+        history = backtest.load_archive(args.archive, args.start, args.end)
+    elif args.cache and os.path.exists(args.cache):
+        history = backtest.read_history(args.cache)
+    else:
+        rules.db_connect()
+        history = backtest.load_history(rules.db_cursor, args.start, args.end)
+        if args.cache:
+            backtest.save_history(history, args.cache)
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = args.history_dir or tmp
+        write_history_dir(history, directory)
+        del history
+        n = 1
+        for values in grid.values():
+            n *= len(values)
+        logger.info("sweeping %d combinations", n)
+        t0 = time.time()
+        results = sweep(directory, grid, args.processes, args.flap_penalty, args.rain_penalty)
+    logger.info("swept in %.1fs", time.time() - t0)
+    write_results(results, grid, args.results)
+    (best, metrics) = results[0]
+    print("best: " + ", ".join("{} {}".format(m, metrics[m]) for m in METRICS))
+    print("      " + " ".join("--set {}={}".format(k, best[k]) for k in sorted(grid)))
+
+
+if __name__ == "__main__":
+    main()
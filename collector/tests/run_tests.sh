@@ -0,0 +1,62 @@
+#!/bin/bash
+# Static checks (pyflakes, if installed) + unit tests for the collector code.
+# No MySQL / rrdtool / Mattermost needed (stubbed, or SQLite) - safe anywhere, including CI.
+# Install the linter with:  sudo apt install python3-pyflakes
+set -e
+cd "$(dirname "$0")"
+COLLECTOR="$(cd .. && pwd)"
+
+if python3 -c "import pyflakes" 2>/dev/null; then
+    echo "== pyflakes =="
+    python3 -m pyflakes \
+        "$COLLECTOR/sensors_to_database.py" "$COLLECTOR/ingest.py" "$COLLECTOR/ingest_server.py" \
+        "$COLLECTOR/evaluation_trigger.py" "$COLLECTOR/sensor_windows.py" \
+        "$COLLECTOR/query_sky_and_obsy_conditions.py" "$COLLECTOR/backtest.py" \
+        "$COLLECTOR/sweep.py" "$COLLECTOR/safety_rules.py" \
+        "$COLLECTOR/safety_evaluator.py" "$COLLECTOR/spool.py" "$COLLECTOR/storage.py" "$COLLECTOR/schema.py" \
+        "$COLLECTOR/weather_status.py" "$COLLECTOR/weather_safety_service.py" "$COLLECTOR/partitions.py" \
+        "$COLLECTOR/rollups.py" "$COLLECTOR/columnar_archive.py" "$COLLECTOR/rrd_backfill.py" \
+        "$COLLECTOR/latest_cache.py" "$COLLECTOR/wsgi_serve.py" "$COLLECTOR/http_load.py" \
+        test_ingest.py test_sensor_windows.py test_backtest.py test_sweep.py test_safety_rules.py \
+        test_safety_evaluator.py test_spool.py test_storage.py test_schema.py test_partitions.py test_rollups.py \
+        test_columnar_archive.py test_rrd_backfill.py test_latest_cache.py test_weather_safety_service.py \
+        test_wsgi_serve.py
+    echo "pyflakes clean"
+else
+    echo "(pyflakes not installed - skipping static checks; sudo apt install python3-pyflakes)"
+fi
+
+echo "== unit tests =="
+python3 test_ingest.py
+echo
+python3 test_sensor_windows.py
+echo
+python3 test_backtest.py
+echo
+python3 test_sweep.py
+echo
+python3 test_safety_rules.py
+echo
+python3 test_safety_evaluator.py
+echo
+python3 test_spool.py
+echo
+python3 test_storage.py
+echo
+python3 test_schema.py
+echo
+python3 test_partitions.py
+echo
+python3 test_rollups.py
+echo
+python3 test_columnar_archive.py
+echo
+python3 test_rrd_backfill.py
+echo
+python3 test_latest_cache.py
+echo
+python3 test_weather_safety_service.py
+echo
+python3 test_wsgi_serve.py
+echo
+echo "all checks passed"
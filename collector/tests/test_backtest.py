@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Unit test: the vectorized backtest reproduces the live evaluator row by row.
+The reference is query_sky_and_obsy_conditions.evaluate() itself (the scalar
+path of the same safety_rules plan), fed one brute-force snapshot per row
+(windows recounted, previous open_ok and closing events carried over) with its
+DB/Mattermost side effects captured. MySQLdb is stubbed, numpy is required.
+Run: python3 test_backtest.py"""
+import os, sys, types, io, random, datetime, contextlib, tempfile
+COLLECTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.modules["MySQLdb"] = types.ModuleType("MySQLdb")    # stub so import works w/o MySQLdb
+sys.path.insert(0, COLLECTOR)
+import numpy as np
+import backtest
+import query_sky_and_obsy_conditions as rules
+import safety_rules
+
+PASS = [0]; FAIL = [0]
+def check(name, cond):
+    print(("PASS " if cond else "FAIL ") + name); (PASS if cond else FAIL)[0] += 1
+
+# ---- synthetic history: 90-minute weather regimes + single-row outliers ----
+T0 = datetime.datetime(2026, 1, 1, 18, 0, 0)
+random.seed(11)
+ROWS = []
+t = T0
+good = False
+for i in range(900):
+    if i % 90 == 0:
+        good = random.random() < 0.6
+    t += datetime.timedelta(seconds=random.choice([60, 60, 60, 61, 59, 180]))
+    ROWS.append({"create_time": t,
+                 "sqm1_sqm": random.choice([19.5, 19.0, 18.0, 17.2]) if good else random.choice([15.0, 17.0, 18.0]),
+                 "rainsensor1_drops": random.choice([0, 0, 0, 0, 0, 0, 0, 0, 0, 3]) if good else random.choice([0, 5]),
+                 "ups1_status": random.choice([1] * 30 + [0]),
+                 "ups1_bcharge": random.choice([100.0] * 20 + [98.0]),
+                 "BAA1_temperature_sensor": 10.0,
+                 "BAA1_temperature_sky": random.choice([-8.0, -6.0, -2.0]) if good else random.choice([-2.0, 5.0]),
+                 "BCC1_temperature_sensor": 11.0,
+                 "BCC1_temperature_sky": random.choice([-5.0, -3.0]) if good else 6.0})
+COLUMNS = ["create_time"] + backtest.HISTORY_COLUMNS
+ROWS = [tuple(r[c] for c in COLUMNS) for r in ROWS]
+
+# ---- reference: the live evaluate(), once per row ----
+def reference():
+    state = {"last_open_ok": False, "closings": [], "open_ok": [], "events": []}
+    def load_snapshot(utcnow, windows, events, sensor_windows=None):
+        i = state["i"]
+        now = ROWS[i][0]
+        snap = dict(zip(COLUMNS, ROWS[i]))
+        snap["sensors_id"] = i + 1
+        prev = dict(zip(COLUMNS, ROWS[i - 1])) if i else {"ups1_status": None, "ups1_bcharge": None}
+        snap["previous"] = {c: prev[c] for c in rules.PREVIOUS_COLUMNS}
+        snap["windows"] = {}
+        for (name, thr, secs) in windows:
+            cols, pred = rules.PLAN.predicates[name]
+            snap["windows"][(name, thr, secs)] = sum(
+                1 for r in ROWS[:i + 1]
+                if r[0] > now - datetime.timedelta(seconds=secs)
+                and pred([dict(zip(COLUMNS, r))[c] for c in cols], thr))
+        snap["last_open_ok"] = state["last_open_ok"]
+        snap["events"] = {("closing", secs): sum(1 for c in state["closings"]
+                                                 if c > now - datetime.timedelta(seconds=secs))
+                          for (event, secs) in events}
+        return snap
+    def store_event(utcnow, event, reason=None):
+        state["events"].append((state["i"], event))
+        if event == "closing":
+            state["closings"].append(ROWS[state["i"]][0])
+    def store_roof_status(utcnow, sensors_id, open_ok, reasons):
+        state["open_ok"].append(open_ok); state["last_open_ok"] = open_ok
+    rules.load_snapshot = load_snapshot
+    rules.check_db = lambda snapshot, minutes: snapshot["sensors_id"]
+    rules.store_event = store_event
+    rules.store_roof_status = store_roof_status
+    rules.sendToMattermost = lambda url, severity, message: None
+    for i in range(len(ROWS)):
+        state["i"] = i
+        with contextlib.redirect_stdout(io.StringIO()):
+            rules.evaluate("http://mattermost.invalid")
+    return state
+
+ref = reference()
+history = backtest.history_from_rows(ROWS)
+result = backtest.backtest(history)
+
+check("history arrays: epoch seconds + float columns",
+      history["create_time"].dtype == np.int64 and history["sqm1_sqm"].dtype == np.float64
+      and len(history["create_time"]) == len(ROWS))
+check("reference history has both openings and closings",
+      any(e == "opening" for _, e in ref["events"]) and any(e == "closing" for _, e in ref["events"]))
+check("open_ok timeline identical to the live evaluator", result["open_ok"].tolist() == ref["open_ok"])
+check("opening/closing events identical", result["events"] == ref["events"])
+
+# ---- rolling window semantics + NULL handling ----
+ct = np.array([0, 60, 120, 180, 600])
+check("rolling_count window is (t - seconds, t]",
+      safety_rules.rolling_count(ct, np.array([1, 1, 0, 1, 1], dtype=bool), 120).tolist() == [1, 2, 1, 1, 1])
+row = dict(zip(COLUMNS, ROWS[0])); row["sqm1_sqm"] = None
+h = backtest.history_from_rows([tuple(row[c] for c in COLUMNS)])
+check("NULL becomes NaN and is never ok", np.isnan(h["sqm1_sqm"][0])
+      and not rules.PLAN.verdicts(h, rules.thresholds(False))["darkness"][0])
+
+# ---- summary, parameters, cache ----
+check("hours open counts open rows' time, capped per gap",
+      backtest.summarize(np.array([0, 60, 120, 3720]), np.array([True, True, False, True]), [])["hours_open"]
+      == 120 / 3600.0)
+stricter = backtest.backtest(history, backtest.parse_set(["required_baa_delta_t=30", "required_bcc_delta_t=30"]))
+check("stricter thresholds open less", stricter["hours_open"] < result["hours_open"])
+try:
+    backtest.parse_set(["no_such_threshold=1"]); check("unknown --set key rejected", False)
+except ValueError:
+    check("unknown --set key rejected", True)
+with tempfile.TemporaryDirectory() as d:
+    backtest.save_history(history, os.path.join(d, "h.npz"))
+    cached = backtest.read_history(os.path.join(d, "h.npz"))
+check("npz cache round-trips", all(np.array_equal(cached[k], history[k], equal_nan=True) for k in history))
+
+print("\n{} passed, {} failed".format(PASS[0], FAIL[0]))
+sys.exit(1 if FAIL[0] else 0)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Unit test: the columnar archive of a SQLite database with three months of
+rows - monthly chunks with a time index, NULL as NaN, loads equal to the DB
+history (memory-mapped views within a chunk), the month-by-month streaming
+export and its all-or-nothing chunk write, incremental append rewriting
+only the newest month, a month re-export, a column older chunks lack, the
+backtest on the archive - plus a load benchmark. MySQLdb is stubbed, numpy is
+required. Run: python3 test_columnar_archive.py"""
+import os, sys, types, datetime, logging, tempfile, time
+COLLECTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.modules["MySQLdb"] = types.ModuleType("MySQLdb")    # stub so import works w/o MySQLdb
+sys.path.insert(0, COLLECTOR)
+import numpy as np
+import columnar_archive as ca
+import backtest
+import storage
+logging.basicConfig(level=logging.CRITICAL)
+
+PASS = [0]; FAIL = [0]
+def check(name, cond):
+    print(("PASS " if cond else "FAIL ") + name); (PASS if cond else FAIL)[0] += 1
+
+def dt(*a): return datetime.datetime(*a)
+def same(a, b): return len(a) == len(b) and bool(np.array_equal(a, b, equal_nan=True))
+tmp = tempfile.mkdtemp()
+archive = os.path.join(tmp, "columns")
+backend = storage.SQLiteStorage(os.path.join(tmp, "obs.sqlite"))
+conn = backend.connect()
+COLS = ["sqm1_sqm", "rainsensor1_drops", "ups1_status", "ups1_bcharge", "BAA1_temperature_sensor",
+        "BAA1_temperature_sky", "BCC1_temperature_sensor", "BCC1_temperature_sky"]
+INSERT = "INSERT INTO sensors (create_time,{}) VALUES (%s,{})".format(",".join(COLS), ",".join(["%s"] * len(COLS)))
+def rows(start, n, step=5):
+    out = []
+    for i in range(n):
+        t = start + datetime.timedelta(minutes=step * i)
+        out.append((t, 16 + (i % 40) / 10.0, None if i % 7 == 0 else i % 3, 1, 100.0,
+                    10.0, -12.0 + i % 9, 11.0, -10.0 + i % 13))
+    return out
+conn.executemany(INSERT, rows(dt(2026, 1, 15), 15000))       # 2026-01-15 .. 2026-03-08
+conn.commit()
+UNTIL = dt(2026, 3, 1)
+
+# ---- export ----
+n = ca.export(conn.cursor(), archive, until=UNTIL)
+index = ca.read_index(archive)
+db = backtest.load_history(conn.cursor(), None, "2026-03-01 00:00:01")
+check("rows up to until exported as monthly chunks", n == len(db["create_time"])
+      and sorted(index["chunks"]) == ["2026-01", "2026-02", "2026-03"]
+      and index["chunks"]["2026-03"]["rows"] == 1 and index["last_time"] == ca.to_epoch(UNTIL))
+history = backtest.load_archive(archive)
+check("archive history equals the DB history, NULL as NaN", all(same(history[c], db[c]) for c in db)
+      and np.isnan(history["rainsensor1_drops"][0]) and history["create_time"].dtype == np.int64)
+feb = ca.load(archive, ["sqm1_sqm"], dt(2026, 2, 3), dt(2026, 2, 4))
+check("a range in one chunk is a view of the mapped file", len(feb["create_time"]) == 288
+      and isinstance(feb["sqm1_sqm"].base, np.memmap) and feb["create_time"][0] == ca.to_epoch(dt(2026, 2, 3)))
+both = ca.load(archive, ["sqm1_sqm"], dt(2026, 1, 31, 23), dt(2026, 2, 1, 1))
+check("a range across chunks via the time index", list(both["create_time"]) == [
+    ca.to_epoch(dt(2026, 1, 31, 23) + datetime.timedelta(minutes=5 * i)) for i in range(24)])
+check("empty range", len(ca.load(archive, ["sqm1_sqm"], dt(2030, 1, 1))["sqm1_sqm"]) == 0)
+
+(month_rows, fetch_rows, ca.MONTH_ROWS, ca.FETCH_ROWS) = (ca.MONTH_ROWS, ca.FETCH_ROWS, 100, 64)
+small = os.path.join(tmp, "small")
+n = ca.export(conn.cursor(), small, until=UNTIL)
+(ca.MONTH_ROWS, ca.FETCH_ROWS) = (month_rows, fetch_rows)
+check("streamed: arrays grown past their preallocation, same result", n == len(db["create_time"])
+      and all(same(backtest.load_archive(small)[c], db[c]) for c in db))
+feb_dir = os.path.join(archive, "2026-02")
+lengths = {f: len(np.load(os.path.join(feb_dir, f))) for f in os.listdir(feb_dir)}
+(save, calls) = (np.save, [])
+def failing_save(f, a):
+    calls.append(1)
+    if len(calls) == 3:
+        raise OSError("disk full")
+    save(f, a)
+ca.np.save = failing_save
+try:
+    ca.write_chunk(archive, dt(2026, 2, 1), {c: a[:10] for c, a in ca.load(archive, None, dt(2026, 2, 1)).items()})
+except OSError:
+    pass
+ca.np.save = save
+check("interrupted chunk write: no column replaced, no temp file left", lengths == {
+    f: len(np.load(os.path.join(feb_dir, f))) for f in os.listdir(feb_dir)})
+
+# ---- incremental append ----
+jan = os.path.join(archive, "2026-01", "sqm1_sqm.npy")
+jan_mtime = os.stat(jan).st_mtime_ns
+check("nothing new, nothing written", ca.export(conn.cursor(), archive, until=UNTIL) == 0)
+n = ca.export(conn.cursor(), archive, until=dt(2026, 3, 5))
+check("append: only the newest month rewritten", n == 4 * 288 and os.stat(jan).st_mtime_ns == jan_mtime
+      and ca.read_index(archive)["chunks"]["2026-03"]["rows"] == 4 * 288 + 1)
+db = backtest.load_history(conn.cursor(), None, "2026-03-05 00:00:01")
+history = backtest.load_archive(archive)
+check("appended archive equals the DB history", all(same(history[c], db[c]) for c in db))
+
+# ---- re-export of a month with a late row, a column older chunks lack ----
+conn.execute(INSERT, (dt(2026, 2, 10, 0, 2),) + rows(dt(2026, 1, 1), 1)[0][1:]); conn.commit()
+check("late row picked up by re-exporting its month", ca.export_month(conn.cursor(), archive, dt(2026, 2, 1)) == 8065
+      and len(ca.load(archive, ["sqm1_sqm"], dt(2026, 2, 10), dt(2026, 2, 10, 0, 5))["create_time"]) == 2)
+index = ca.read_index(archive)
+index["chunks"]["2026-01"]["columns"].remove("sqm1_sqm")
+ca.write_index(archive, index)
+old = ca.load(archive, ["sqm1_sqm"], dt(2026, 1, 31, 23), dt(2026, 2, 1, 1))
+check("a column a chunk predates loads as NaN", np.isnan(old["sqm1_sqm"][:12]).all()
+      and not np.isnan(old["sqm1_sqm"][12:]).any())
+
+# ---- backtest on the archive ----
+index["chunks"]["2026-01"]["columns"].append("sqm1_sqm")
+ca.write_index(archive, index)
+db = backtest.load_history(conn.cursor(), "2026-01-20", "2026-03-05")
+check("backtest result identical from archive and DB", backtest.backtest(
+    backtest.load_archive(archive, "2026-01-20", "2026-03-05"))["open_ok"].tolist() ==
+      backtest.backtest(db)["open_ok"].tolist())
+
+# ---- benchmark: open a decade of minute rows ----
+big = os.path.join(tmp, "decade")
+index = ca.read_index(big)
+month = dt(2016, 1, 1)
+for m in range(120):
+    end = ca.partitions.add_months(month, 1)
+    ct = np.arange(ca.to_epoch(month), ca.to_epoch(end), 60, dtype=np.int64)
+    index["chunks"][ca.chunk_name(month)] = ca.write_chunk(big, month, {"create_time": ct,
+                                                                       "sqm1_sqm": np.full(len(ct), 18.0)})
+    month = end
+ca.write_index(big, index)
+t0 = time.time()
+decade = ca.load(big, ["sqm1_sqm"], dt(2016, 1, 1), dt(2016, 2, 1))
+elapsed = time.time() - t0
+print("  opened one month of a 120-chunk archive in {:.1f} ms".format(elapsed * 1000))
+check("opening a month of a decade does not read the decade", len(decade["sqm1_sqm"]) == 31 * 1440 and elapsed < 0.5)
+t0 = time.time()
+decade = ca.load(big, ["sqm1_sqm"])
+print("  loaded {} minute rows in {:.0f} ms".format(len(decade["sqm1_sqm"]), (time.time() - t0) * 1000))
+check("a decade of one column", len(decade["sqm1_sqm"]) == (dt(2026, 1, 1) - dt(2016, 1, 1)).days * 1440)
+
+print("\n{} passed, {} failed".format(PASS[0], FAIL[0]))
+sys.exit(1 if FAIL[0] else 0)
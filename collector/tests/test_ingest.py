@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""Unit test: update-line parsing/mapping, reconnecting only on a lost
+connection (a bad statement is raised as is), the coalescing minute-row writer
+(one upsert per burst, bucket anchored on its first value), the off-path
+evaluation trigger and the ingest server's bounded queues + stats. MySQLdb is stubbed with an in-memory fake
+that records SQL, so this runs anywhere. Run: python3 test_ingest.py"""
+import os, sys, types, asyncio, datetime, json, logging, threading, time
+COLLECTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_mysqldb = types.ModuleType("MySQLdb")                  # stub so import works w/o MySQLdb
+class _Error(Exception): pass
+_mysqldb.Error = _Error
+_mysqldb.OperationalError = type("OperationalError", (_Error,), {})
+sys.modules["MySQLdb"] = _mysqldb
+sys.path.insert(0, COLLECTOR)
+import sensors_to_database as std
+import evaluation_trigger
+import ingest
+import ingest_server
+logging.basicConfig(level=logging.CRITICAL)
+
+PASS = [0]; FAIL = [0]
+def check(name, cond):
+    print(("PASS " if cond else "FAIL ") + name); (PASS if cond else FAIL)[0] += 1
+
+SQL = []
+LATEST = {"row": None}
+RAISE = []              # errors the next executes raise
+GONE = [False]          # ping fails
+CONNECTS = [0]
+class FakeCursor:
+    def execute(self, sql, args=None):
+        if RAISE:
+            raise RAISE.pop(0)
+        SQL.append((" ".join(sql.split()), args))
+    def fetchone(self): return LATEST["row"]
+class FakeConn:
+    def cursor(self): return FakeCursor()
+    def commit(self): pass
+    def rollback(self): pass
+    def autocommit(self, v): pass
+    def ping(self, reconnect=True):
+        if GONE[0]:
+            raise _mysqldb.OperationalError(2006, "MySQL server has gone away")
+def connect(**kw):
+    CONNECTS[0] += 1
+    return FakeConn()
+_mysqldb.connect = connect
+COMMITTED = []
+
+def upserts(): return [s for s in SQL if s[0].startswith("INSERT")]
+def reset(): SQL.clear(); COMMITTED.clear(); LATEST["row"] = None
+
+T0 = datetime.datetime(2026, 1, 1, 12, 0, 59)
+def at(s): return T0 + datetime.timedelta(seconds=s)
+
+# ---- parse + map ----
+db, keys, values = std.parse_update("update skytemperature-BAA.rrd -t BAA_sensor:BAA_sky N:8.06:4.06")
+check("parse_update splits file/keys/values",
+      (db, keys, values) == ("skytemperature-BAA.rrd", ["BAA_sensor", "BAA_sky"], ["N", "8.06", "4.06"]))
+check("map_update maps to sensors columns",
+      std.map_update(db, keys, values) == {"BAA1_temperature_sensor": "8.06", "BAA1_temperature_sky": "4.06"})
+try:
+    std.parse_update("hello"); check("parse_update rejects non-update lines", False)
+except ValueError:
+    check("parse_update rejects non-update lines", True)
+
+# ---- reconnect only when the connection is gone ----
+def attempts(*errors, gone=False):
+    (RAISE[:], GONE[0]) = (list(errors), gone)
+    d = ingest.Database(ingest.storage.MySQLStorage())
+    d.connect()
+    (n, CONNECTS[0]) = (len(SQL), 0)
+    try:
+        d.execute("SELECT 1")
+        raised = None
+    except _mysqldb.Error as e:
+        raised = e
+    (RAISE[:], GONE[0]) = ([], False)
+    return (CONNECTS[0], len(SQL) - n, raised)
+check("server gone away (2006): reconnected, retried", attempts(_mysqldb.OperationalError(2006, "gone"))
+      == (1, 1, None))
+lost = _mysqldb.OperationalError(2013, "Lost connection to MySQL server during query")
+check("lost again after the reconnect: raised", attempts(lost, lost) == (1, 0, lost))
+bad = _mysqldb.OperationalError(1054, "Unknown column 'Unknown DB_Unknown KEY' in 'field list'")
+check("a bad statement is raised as is, no reconnect", attempts(bad) == (0, 0, bad))
+check("an error code we do not know, ping fails: reconnected", attempts(
+    _mysqldb.OperationalError(2000, "?"), gone=True)[:2] == (1, 1))
+
+# ---- coalescing writer ----
+reset(); si = ingest.SensorIngest(on_row_committed=COMMITTED.append)
+si.ingest("skytemperature-BAA.rrd", ["BAA_sensor", "BAA_sky"], ["N", "8", "4"], now=at(0))
+si.ingest("sqm.rrd", ["frequency", "sqm"], ["N", "1", "U"], now=at(2))
+check("nothing written while the burst is running", not upserts())
+check("tick before quiet period does not flush", si.tick(at(4)) is False and not upserts())
+check("tick after quiet period flushes", si.tick(at(8)) is True and len(upserts()) == 1)
+sql, args = upserts()[0]
+check("one upsert carries every column of the burst",
+      "ON DUPLICATE KEY UPDATE" in sql and "BAA1_temperature_sky" in sql and "sqm1_sqm" in sql)
+check("bucket keyed on its first value's time", args[0] == at(0))
+check("rrdtool 'U' becomes NULL", args[-1] is None)
+
+si.ingest("ups.rrd", ["status"], ["N", "1"], now=at(30))   # straddles the clock minute
+si.tick(at(40))
+check("late value in the same window upserts into the same row", upserts()[-1][1][0] == at(0))
+
+check("no evaluation while the window is open", not COMMITTED)
+
+si.ingest("sqm.rrd", ["frequency", "sqm"], ["N", "1", "19"], now=at(61))
+check("value after the window opens a new row", si.bucket_time == at(61))
+check("closed row reported committed exactly once", COMMITTED == [at(0)])
+check("tick at window end flushes even if not quiet",
+      si.tick(at(121)) is True and upserts()[-1][1][0] == at(61))
+check("window end reports the row committed", COMMITTED == [at(0), at(61)])
+si.tick(at(125))
+check("closed bucket not reported twice", COMMITTED == [at(0), at(61)])
+
+reset(); LATEST["row"] = (at(-20),); si = ingest.SensorIngest()
+si.ingest("ups.rrd", ["status"], ["N", "1"], now=at(0)); si.flush()
+check("restart keeps filling a still-open newest row", upserts()[-1][1][0] == at(-20))
+
+# ---- evaluation trigger: non-blocking, coalescing ----
+GATE = threading.Event(); BUSY = threading.Event(); RAN = []
+def slow_eval(create_time): BUSY.set(); GATE.wait(2); RAN.append(create_time)
+trig = evaluation_trigger.EvaluationTrigger(slow_eval).start()
+trig.fire(1); BUSY.wait(2)
+t = time.time(); trig.fire(2); trig.fire(3); trig.fire(4)
+check("fire() returns immediately while an evaluation runs", time.time() - t < 0.1)
+GATE.set(); trig.stop(timeout=2)
+check("pending triggers coalesce to the newest", RAN == [1, 4] and trig.coalesced == 2)
+def bad_eval(create_time): raise RuntimeError("boom")
+trig = evaluation_trigger.EvaluationTrigger(bad_eval).start(); trig.fire(1); trig.stop(timeout=2)
+check("evaluator failure is counted, worker survives", trig.errors == 1)
+
+# ---- ingest server: queues, backpressure, stats ----
+WRITTEN = []
+def slow_db(db, keys, values): time.sleep(0.05); WRITTEN.append(db)
+def rrd(db, keys, values): WRITTEN.append("rrd")
+
+async def run_server():
+    srv = ingest_server.IngestServer(slow_db, rrd, queue_size=2, put_timeout=0.01)
+    s = await srv.start("127.0.0.1", 0)
+    port = s.sockets[0].getsockname()[1]
+    async def client(msg):
+        r, w = await asyncio.open_connection("127.0.0.1", port)
+        w.write(msg.encode()); await w.drain()
+        data = await r.read(); w.close(); return data
+    await asyncio.gather(*[client("update sqm.rrd -t frequency:sqm N:1:2") for _ in range(20)])
+    await client("junk")
+    stats = json.loads((await client("stats\n")).decode())
+    await srv.stop()
+    return stats, srv.stats()
+live, final = asyncio.run(run_server())
+check("stats reply counts received + unknown", live["received"] == 20 and live["unknown"] == 1)
+check("full DB queue drops and counts", final["db"]["dropped"] > 0 and final["db"]["overflows"] > 0)
+check("fast RRD writer unaffected by the slow DB", final["rrd"]["written"] + final["rrd"]["dropped"] == 20
+      and final["rrd"]["written"] > final["db"]["written"])
+check("accounting adds up", final["db"]["written"] + final["db"]["dropped"] == 20)
+
+print("\n{} passed, {} failed".format(PASS[0], FAIL[0]))
+sys.exit(1 if FAIL[0] else 0)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""Unit test: the latest row / verdict records on a SQLite database - atomic
+publish with a sequence number continued across writers, stale / missing /
+corrupt records ignored, the ingest side's publisher, the evaluator's snapshot
+without a query (equal to the DB snapshot) and its fallbacks, the verdict
+published as stored and served by weather_status / weather_safety_service
+without a query - plus a read benchmark. MySQLdb is stubbed.
+Run: python3 test_latest_cache.py"""
+import os, sys, types, io, datetime, contextlib, json, logging, tempfile, time
+COLLECTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_mysqldb = types.ModuleType("MySQLdb")                  # stub so import works w/o MySQLdb
+class _Error(Exception): pass
+_mysqldb.Error = _Error
+_mysqldb.OperationalError = type("OperationalError", (_Error,), {})
+sys.modules["MySQLdb"] = _mysqldb
+sys.path.insert(0, COLLECTOR)
+import latest_cache
+import query_sky_and_obsy_conditions as rules
+import safety_evaluator
+import sensor_windows
+import storage
+import weather_status
+logging.basicConfig(level=logging.CRITICAL)
+
+PASS = [0]; FAIL = [0]
+def check(name, cond):
+    print(("PASS " if cond else "FAIL ") + name); (PASS if cond else FAIL)[0] += 1
+
+tmp = tempfile.mkdtemp()
+NOW = latest_cache.utcnow().replace(microsecond=0)
+def at(minutes): return NOW + datetime.timedelta(minutes=minutes)
+
+# ---- records ----
+cache = latest_cache.LatestCache(tmp)
+seqs = [cache.publish("roof", {"create_time": at(-i), "open_ok": 0, "reasons": "x"}) for i in (3, 2, 1)]
+record = cache.read("roof")
+check("published atomically, datetimes back", seqs == [1, 2, 3] and record["create_time"] == at(-1)
+      and record["seq"] == 3 and isinstance(record["written"], datetime.datetime)
+      and [f for f in os.listdir(tmp) if f.endswith(".tmp")] == [])
+check("unchanged file not parsed again", cache.read("roof") is record)
+check("sequence continued by a new writer", latest_cache.LatestCache(tmp).publish("roof", {"create_time": at(0)}) == 4
+      and cache.read("roof")["seq"] == 4)
+check("fresh / stale by create_time", cache.get("roof", datetime.timedelta(minutes=1), at(0.5)) is not None
+      and cache.get("roof", datetime.timedelta(minutes=1), at(1)) is None)
+with open(cache.path("sensors"), "w") as f:
+    f.write('{"create_time": "2026-')
+check("missing or torn file: no record", cache.read("nothing") is None and cache.read("sensors") is None)
+
+# ---- the ingest side publishes the committed row and the one before ----
+backend = storage.SQLiteStorage(os.path.join(tmp, "obs.sqlite"))
+conn = backend.connect()
+def insert(t, sqm=19.0):
+    conn.execute("INSERT INTO sensors (create_time,sqm1_sqm,rainsensor1_drops,ups1_status,ups1_bcharge,"
+                 "BAA1_temperature_sensor,BAA1_temperature_sky,BCC1_temperature_sensor,BCC1_temperature_sky)"
+                 " VALUES (%s,%s,0,1,100,10,-10,10,-10)", [t, sqm])
+    conn.commit()
+for m in range(-70, -1):
+    insert(at(m), 15.0 if m % 3 == 0 else 19.0)
+publisher = latest_cache.SensorsPublisher(backend, cache)
+insert(at(-1))
+check("publisher: committed row and the one before", publisher(at(-2)) == 1 and cache.read("sensors")["row"][
+    "create_time"] == at(-2) and cache.read("sensors")["previous"]["create_time"] == at(-3)
+      and cache.read("sensors")["row"]["sqm1_sqm"] == 19.0)
+check("an unwritable cache is logged, not raised",
+      latest_cache.SensorsPublisher(backend, latest_cache.LatestCache(os.path.join(tmp, "gone")))(at(-2)) is None)
+fired = []
+unencodable = latest_cache.SensorsPublisher(backend, cache)
+unencodable.rows = lambda create_time: [{"create_time": create_time, "sqm1_sqm": b"\x13"}]
+seq = cache.read("sensors")["seq"]
+for hook in (unencodable, fired.append):                # as ingest_server._chain runs them
+    hook(at(-1))
+check("a value that does not encode is logged, not raised; the next hook runs", fired == [at(-1)]
+      and cache.read("sensors")["seq"] == seq and [f for f in os.listdir(tmp) if f.endswith(".tmp")] == [])
+check("and the sequence goes on without a gap", publisher(at(-1)) == seq + 1)
+
+# ---- the evaluator's snapshot ----
+class CountingCursor:
+    def __init__(self, cursor): self.cursor = cursor; self.queries = 0
+    def execute(self, sql, args=None): self.queries += 1; return self.cursor.execute(sql, args)
+    def __getattr__(self, name): return getattr(self.cursor, name)
+rules.db_connect(backend)
+rules.cache = cache
+counting = rules.db_cursor = CountingCursor(rules.db_cursor)
+(windows, events) = rules.all_past_windows()
+def evaluator_parts(path):
+    state = safety_evaluator.EvaluatorState(os.path.join(tmp, path))
+    return (sensor_windows.SensorWindows(windows, 60, predicates=rules.PLAN.predicates), state)
+(sw, state) = evaluator_parts("state.json")
+rules.load_snapshot(at(-1), windows, events, sw, state, cache)        # the windows warm up from the DB once
+check("warm-up from the DB", counting.queries == 2 and sw.last_seen == at(-2))
+publisher(at(-1))
+counting.queries = 0
+cached = rules.load_snapshot(at(0.5), windows, events, sw, state, cache)
+check("published row: snapshot without a query", counting.queries == 0 and cached["create_time"] == at(-1)
+      and sw.last_seen == at(-1))
+db_snapshot = rules.load_snapshot(at(0.5), windows, events, *evaluator_parts("state2.json"))
+check("equal to the DB snapshot", cached == db_snapshot and cached["windows"] and any(cached["windows"].values()))
+insert(at(0)); insert(at(1))
+publisher(at(1))
+counting.queries = 0
+snapshot = rules.load_snapshot(at(1.5), windows, events, sw, state, cache)
+check("rows missed by the windows: from the DB", counting.queries == 2 and snapshot["create_time"] == at(1)
+      and sw.last_seen == at(0))
+counting.queries = 0
+check("stale record: from the DB", rules.load_snapshot(at(10), windows, events, sw, state, cache)[
+    "create_time"] == at(1) and counting.queries == 2)
+
+# ---- the verdict, published as stored ----
+class NoQuery:
+    def execute(self, sql, args=None): raise AssertionError("queried")
+real_now = latest_cache.utcnow().replace(microsecond=0)
+rules.store_roof_status(real_now, 7, True, "All sensors are go")
+check("stored verdict published", cache.read("roof")["open_ok"] == 1 and cache.read("roof")["sensors_id"] == 7)
+check("weather status from the record, no query",
+      weather_status.get_weather_status(NoQuery(), cache) == (1, "All sensors are go", real_now))
+cache.publish("roof", {"create_time": real_now - datetime.timedelta(minutes=10), "open_ok": 0, "reasons": "old"})
+db_cursor = CountingCursor(backend.connect().cursor())
+check("stale verdict: from the DB", weather_status.get_weather_status(db_cursor, cache) == (
+    1, "All sensors are go", real_now) and db_cursor.queries == 1)
+try:
+    import weather_safety_service as wss     # needs flask
+    rules.store_roof_status(real_now, 8, False, "Still too cloudy")
+    wss.cache = cache
+    wss.pool = None                          # any DB access would fail
+    body = json.loads(wss.FLASK_APP.test_client().get("/weather/safety").data)
+    check("safety service from the record, no DB", body == {"timestamp_utc": real_now.isoformat(),
+                                                           "roof_status": {"open_ok": 0, "reasons": "Still too cloudy"}})
+except ImportError:
+    print("(flask not installed - skipping the safety service)")
+
+out = io.StringIO()
+sys.argv = ["latest_cache.py", "--cache_dir", tmp]
+with contextlib.redirect_stdout(out):
+    latest_cache.main()
+check("show both records", "sensors: seq 4" in out.getvalue() and "roof: seq" in out.getvalue())
+
+# ---- benchmark: reads of a record (a MySQL roof query is a network round trip) ----
+N = 20000
+t0 = time.time()
+for i in range(N):
+    cache.get("roof", weather_status.MAX_AGE)
+rate = N / (time.time() - t0)
+print("  {:.0f} cached verdict reads/s".format(rate))
+check("a read costs microseconds", rate > 20000)
+
+print("\n{} passed, {} failed".format(PASS[0], FAIL[0]))
+sys.exit(1 if FAIL[0] else 0)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Unit test: monthly partitions on a SQLite database with 30 months of rows -
+settled months move to chunk tables behind the sensors_all view, are rolled
+up into sensors_hourly / sensors_daily (min / max / sum / count checked
+against the rows), archived and dropped past raw_months, rollups pruned, a
+second pass is a no-op, the hot queries still run on indexes - and the MySQL
+partition DDL. MySQLdb is stubbed. Run: python3 test_partitions.py"""
+import os, sys, types, csv, gzip, datetime, logging, tempfile
+COLLECTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.modules["MySQLdb"] = types.ModuleType("MySQLdb")    # stub so import works w/o MySQLdb
+sys.path.insert(0, COLLECTOR)
+import partitions
+import schema
+import storage
+import backtest
+logging.basicConfig(level=logging.CRITICAL)
+
+PASS = [0]; FAIL = [0]
+def check(name, cond):
+    print(("PASS " if cond else "FAIL ") + name); (PASS if cond else FAIL)[0] += 1
+
+def dt(*a): return datetime.datetime(*a)
+tmp = tempfile.mkdtemp()
+archive = os.path.join(tmp, "archive")
+os.mkdir(archive)
+
+# ---- 30 months of rows, one every 3 hours ----
+backend = storage.SQLiteStorage(os.path.join(tmp, "obs.sqlite"))
+conn = backend.connect()
+NOW = dt(2026, 3, 10, 12, 0, 0)
+t = dt(2023, 10, 1)
+rows = []
+while t <= NOW:
+    rows.append((t, 15 + (t.day % 7) + t.hour / 24.0, t.hour % 2 or None))
+    t += datetime.timedelta(hours=3)
+conn.executemany("INSERT INTO sensors (create_time,sqm1_sqm,rainsensor1_drops) VALUES (%s,%s,%s)", rows)
+conn.commit()
+
+policy = partitions.Policy(raw_months=24, hourly_months=12, daily_months=0, archive_dir=archive)
+dry = partitions.maintain(conn, backend, policy, NOW, dry_run=True)
+cur = conn.cursor()
+cur.execute("SELECT COUNT(*) FROM sensors")
+check("dry run changes nothing", cur.fetchone()[0] == len(rows) and len(dry["rolled_up"]) == 29
+      and dry["dropped"] == [dt(2023, m, 1) for m in (10, 11, 12)] + [dt(2024, m, 1) for m in (1, 2)])
+done = partitions.maintain(conn, backend, policy, NOW)
+
+# ---- rotation ----
+chunks = partitions.sqlite_chunks(cur)
+check("settled months moved to chunks, expired ones gone", chunks == list(partitions.months_between(
+    dt(2024, 3, 1), dt(2026, 3, 1))) and done["rotated"][0] == dt(2023, 10, 1) and len(done["rotated"]) == 29)
+def fetch(): return tuple(partitions._datetime(v) for v in cur.fetchone())     # MIN() comes back as text
+cur.execute("SELECT MIN(create_time), COUNT(*) FROM sensors")
+check("sensors holds the current month only", fetch() == (
+    dt(2026, 3, 1), sum(1 for r in rows if r[0] >= dt(2026, 3, 1))))
+cur.execute("SELECT MIN(create_time), COUNT(*) FROM sensors_all")
+check("sensors_all covers the chunks + sensors", fetch() == (
+    dt(2024, 3, 1), sum(1 for r in rows if r[0] >= dt(2024, 3, 1))))
+history = backtest.load_history(cur, dt(2025, 12, 20), dt(2026, 3, 5))
+check("backtest history spans chunks and sensors", len(history["create_time"]) == sum(
+    1 for r in rows if dt(2025, 12, 20) <= r[0] < dt(2026, 3, 5)))
+
+# ---- rollups ----
+def expected(start, end):
+    month = [r for r in rows if start <= r[0] < end]
+    sqm = [r[1] for r in month]
+    drops = [r[2] for r in month if r[2] is not None]
+    return (len(month), min(sqm), max(sqm), sum(sqm), len(sqm), min(drops), max(drops), sum(drops), len(drops))
+cur.execute("SELECT n,sqm1_sqm_min,sqm1_sqm_max,sqm1_sqm_sum,sqm1_sqm_count,rainsensor1_drops_min,"
+            "rainsensor1_drops_max,rainsensor1_drops_sum,rainsensor1_drops_count FROM sensors_daily WHERE bucket = %s",
+            [dt(2025, 6, 14)])
+got = cur.fetchone()
+want = expected(dt(2025, 6, 14), dt(2025, 6, 15))
+check("daily bucket min / max / sum / count match the rows", got[:3] == want[:3] and abs(got[3] - want[3]) < 1e-9
+      and got[4:] == want[4:])
+cur.execute("SELECT bucket, n FROM sensors_hourly WHERE bucket >= %s AND bucket < %s ORDER BY bucket",
+            [dt(2025, 6, 14), dt(2025, 6, 15)])
+check("hourly buckets", cur.fetchall() == [(dt(2025, 6, 14, h), 1) for h in range(0, 24, 3)])
+cur.execute("SELECT MIN(bucket) FROM sensors_hourly")
+(hourly_min,) = fetch()
+cur.execute("SELECT MIN(bucket), COUNT(*) FROM sensors_daily")
+check("hourly pruned to 12 months, daily kept forever, dropped months still rolled up",
+      hourly_min == dt(2025, 3, 1) and fetch() == (dt(2023, 10, 1), (dt(2026, 3, 1) - dt(2023, 10, 1)).days))
+
+# ---- archive + drop ----
+path = os.path.join(archive, "sensors-2023-11.csv.gz")
+with gzip.open(path, "rt", newline="") as f:
+    archived = list(csv.reader(f))
+check("expired months archived before the drop", sorted(os.listdir(archive)) == [
+    "sensors-2023-10.csv.gz", "sensors-2023-11.csv.gz", "sensors-2023-12.csv.gz",
+    "sensors-2024-01.csv.gz", "sensors-2024-02.csv.gz"]
+      and archived[0][:3] == ["sensors_id", "create_time", schema.SENSOR_COLUMNS[0]]
+      and len(archived) - 1 == sum(1 for r in rows if dt(2023, 11, 1) <= r[0] < dt(2023, 12, 1)))
+cur.execute("SELECT month, archived, dropped IS NOT NULL FROM sensors_months WHERE month < %s ORDER BY month",
+            [dt(2024, 1, 1)])
+check("registry records archive + drop", [(m, os.path.basename(a), d) for (m, a, d) in cur.fetchall()] == [
+    (dt(2023, m, 1), "sensors-2023-{:02d}.csv.gz".format(m), 1) for m in (10, 11, 12)])
+
+again = partitions.maintain(conn, backend, policy, NOW + datetime.timedelta(hours=1))
+check("second pass is a no-op", not again.get("rolled_up") and not again.get("dropped")
+      and not again.get("rotated") and again["pruned"] == 0)
+
+# ---- hot queries stay on indexes ----
+conn = backend.connect()
+conn.execute("ANALYZE")
+plans = schema.check(conn, "sqlite", schema.hot_queries(NOW))
+plans["backtest history"] = schema._sqlite_plan(conn.cursor(), *backtest.history_sql(dt(2025, 1, 1), NOW))
+check("no full scan or sort after the rotation", not [p for (d, p) in plans.values() if p])
+
+# ---- MySQL DDL ----
+(pk, part) = partitions.mysql_partition_sql(dt(2025, 11, 15, 3), dt(2026, 1, 5))
+check("MySQL conversion: primary key with create_time, one partition per month + pmax",
+      pk == "ALTER TABLE sensors DROP PRIMARY KEY, ADD PRIMARY KEY (sensors_id, create_time)"
+      and part == "ALTER TABLE sensors PARTITION BY RANGE COLUMNS(create_time) ("
+      "PARTITION p202511 VALUES LESS THAN ('2025-12-01 00:00:00'), "
+      "PARTITION p202512 VALUES LESS THAN ('2026-01-01 00:00:00'), "
+      "PARTITION p202601 VALUES LESS THAN ('2026-02-01 00:00:00'), "
+      "PARTITION pmax VALUES LESS THAN (MAXVALUE))")
+check("MySQL: pmax split ahead, nothing when up to date",
+      partitions.mysql_extend_sql([dt(2026, 1, 1)], dt(2026, 3, 1)) ==
+      "ALTER TABLE sensors REORGANIZE PARTITION pmax INTO ("
+      "PARTITION p202602 VALUES LESS THAN ('2026-03-01 00:00:00'), "
+      "PARTITION p202603 VALUES LESS THAN ('2026-04-01 00:00:00'), "
+      "PARTITION pmax VALUES LESS THAN (MAXVALUE))"
+      and partitions.mysql_extend_sql([dt(2026, 2, 1), dt(2026, 3, 1)], dt(2026, 3, 1)) is None)
+check("rollup SQL per dialect", "DATE_FORMAT(create_time, '%%Y-%%m-%%d %%H:00:00') AS b" in partitions.rollup_sql(
+    storage.MySQLStorage(), "sensors_hourly", "hour")[1])
+
+print("\n{} passed, {} failed".format(PASS[0], FAIL[0]))
+sys.exit(1 if FAIL[0] else 0)
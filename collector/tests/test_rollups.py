@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Unit test: incremental rollups on SQLite - minute rows merged one (or a
+few) at a time give the same hourly / daily buckets as recomputing them from
+the rows, a repeated or failed roll never counts a row twice, the ingest
+path drives it, and query() picks the coarsest table for the resolution.
+Plus a per-row benchmark. MySQLdb is stubbed. Run: python3 test_rollups.py"""
+import os, sys, types, datetime, logging, tempfile, time, sqlite3
+COLLECTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.modules["MySQLdb"] = types.ModuleType("MySQLdb")    # stub so import works w/o MySQLdb
+sys.path.insert(0, COLLECTOR)
+import rollups
+import schema
+import storage
+import ingest
+logging.basicConfig(level=logging.CRITICAL)
+
+PASS = [0]; FAIL = [0]
+def check(name, cond):
+    print(("PASS " if cond else "FAIL ") + name); (PASS if cond else FAIL)[0] += 1
+
+def dt(*a): return datetime.datetime(*a)
+def minutes(m): return datetime.timedelta(minutes=m)
+tmp = tempfile.mkdtemp()
+backend = storage.SQLiteStorage(os.path.join(tmp, "obs.sqlite"))
+conn = backend.connect()
+INSERT = "INSERT INTO sensors (create_time,sqm1_sqm,rainsensor1_drops,BAA1_temperature_sky) VALUES (%s,%s,%s,%s)"
+START = dt(2026, 3, 1, 22, 0)
+def row(m):
+    t = START + minutes(m)
+    return (t, 18 + (m % 37) / 10.0, m % 5 if m % 3 else None, -20 - (m % 11))
+def insert(*ms):
+    conn.executemany(INSERT, [row(m) for m in ms]); conn.commit()
+def buckets():
+    out = {}
+    for table in ("sensors_hourly", "sensors_daily"):
+        cur = conn.execute("SELECT * FROM {} ORDER BY bucket".format(table))
+        out[table] = [tuple(round(v, 6) if isinstance(v, float) else v for v in r) for r in cur.fetchall()]
+    return out
+
+# ---- incremental == recomputed ----
+roller = rollups.Rollups(backend)
+insert(*range(30))
+check("first roll computes the month so far", roller.roll(row(29)[0]) == 30 and roller.rolled_to() == row(29)[0])
+m = 30
+while m < 3000:
+    batch = range(m, m + (3 if m % 200 == 0 else 1))    # now and then a few rows at once
+    insert(*batch)
+    roller.roll(row(batch[-1])[0])
+    m = batch[-1] + 1
+incremental = buckets()
+check("every row merged once", roller.rolled == 3000 - 30)
+check("a repeated roll merges nothing", roller.roll(row(2999)[0]) == 0 and buckets() == incremental)
+roller.rebuild(dt(2026, 3, 1), row(2999)[0])
+check("incremental buckets equal the recomputed ones", buckets() == incremental
+      and len(incremental["sensors_hourly"]) == 50 and len(incremental["sensors_daily"]) == 3)
+cur = conn.execute("SELECT n, sqm1_sqm_count, rainsensor1_drops_count, rainsensor1_drops_sum FROM sensors_hourly "
+                   "WHERE bucket = %s", [dt(2026, 3, 2, 5)])
+hour = [row(m) for m in range(3000) if row(m)[0].replace(minute=0) == dt(2026, 3, 2, 5)]
+check("NULLs are not counted", cur.fetchone() == (60, 60, sum(1 for r in hour if r[2] is not None),
+                                                  sum(r[2] for r in hour if r[2] is not None)))
+
+# ---- a failed roll is caught up ----
+transaction = roller.db.transaction
+def broken(statements): raise sqlite3.OperationalError("database is locked")
+roller.db.transaction = broken
+insert(3000)
+failed = roller.roll(row(3000)[0])
+roller.db.transaction = transaction
+check("failed roll logged, not raised", failed == 0 and roller.rolled_to() == row(2999)[0])
+insert(3001)
+check("next roll catches up", roller.roll(row(3001)[0]) == 2)
+
+# ---- driven by the ingest ----
+si = ingest.SensorIngest(backend, on_row_committed=roller.roll)
+t0 = row(3001)[0] + minutes(2)
+for i in range(5):
+    si.ingest("sqm.rrd", ["frequency", "sqm"], ["N", "1", "20.0"], now=t0 + datetime.timedelta(seconds=65 * i))
+    si.tick(t0 + datetime.timedelta(seconds=65 * i + 10))
+si.tick(t0 + datetime.timedelta(seconds=65 * 5))
+cur = conn.execute("SELECT SUM(n) FROM sensors_daily")
+check("committed ingest rows reach the rollups", cur.fetchone()[0] == 3002 + 5)
+
+# ---- query API ----
+check("coarsest table for the resolution", [rollups.source_for(minutes(m)) for m in (1, 5, 60, 360, 1440, 10080)] ==
+      [None, None] + [("sensors_hourly", "hour")] * 2 + [("sensors_daily", "day")] * 2)
+days = rollups.query(conn.cursor(), ["sqm1_sqm", "rainsensor1_drops"], dt(2026, 3, 2), dt(2026, 3, 4),
+                     rollups.parse_resolution("1d"))
+day = [row(m) for m in range(3002) if row(m)[0].date() == datetime.date(2026, 3, 2)]
+drops = [r[2] for r in day if r[2] is not None]
+check("daily min / avg / max", len(days) == 2 and days[0][0] == dt(2026, 3, 2) and days[0][1:4] == (
+    min(r[1] for r in day), days[0][2], max(r[1] for r in day)) and abs(days[0][2] - sum(r[1] for r in day) / 1440) < 1e-9
+      and days[0][4:] == (min(drops), days[0][5], max(drops)) and abs(days[0][5] - sum(drops) / len(drops)) < 1e-9)
+hours = rollups.query(conn.cursor(), ["sqm1_sqm"], dt(2026, 3, 2, 5, 30), dt(2026, 3, 2, 8), rollups.parse_resolution("1h"))
+check("hourly from the bucket holding start", [h[0] for h in hours] == [dt(2026, 3, 2, h) for h in (5, 6, 7)])
+raw = rollups.query(conn.cursor(), ["sqm1_sqm"], START, START + minutes(10), rollups.parse_resolution("1m"))
+check("minute rows below an hour", [r[1:] for r in raw] == [(row(m)[1],) * 3 for m in range(10)])
+try:
+    rollups.query_sql(["sqm1_sqm; DROP TABLE sensors"], START, START, minutes(60)); check("unknown column rejected", False)
+except ValueError:
+    check("unknown column rejected", True)
+conn.execute("ANALYZE")
+plans = [schema._sqlite_plan(conn.cursor(), *rollups.query_sql(["sqm1_sqm"], START, t0, minutes(r)))
+         for r in (1, 60, 1440)] + [schema._sqlite_plan(conn.cursor(), rollups.ROWS_SQL, [START, t0])]
+check("rollup queries are index range scans", not [p for (d, p) in plans if p])
+check("MySQL merge keeps min / max, adds sums", "sqm1_sqm_max=COALESCE(GREATEST(sqm1_sqm_max,VALUES(sqm1_sqm_max))"
+      in storage.MySQLStorage().upsert_sql("sensors_hourly", "bucket", rollups.ROLLUP_NAMES, 1, rollups.ROLLUP_MERGE)
+      and "n=COALESCE(n+VALUES(n),n,VALUES(n))" in storage.MySQLStorage().upsert_sql(
+          "sensors_hourly", "bucket", rollups.ROLLUP_NAMES, 1, rollups.ROLLUP_MERGE))
+
+# ---- benchmark: one roll per finalised minute row ----
+N = 500
+last = si.closed_bucket_time
+t = time.time()
+for i in range(1, N + 1):
+    conn.execute(INSERT, (last + minutes(i), 19.0, 0, -20)); conn.commit()
+    roller.roll(last + minutes(i))
+rate = N / (time.time() - t)
+print("  {} rows rolled one at a time, {:.0f} rows/s".format(N, rate))
+check("a roll per minute row is cheap", rate > 50)
+
+print("\n{} passed, {} failed".format(PASS[0], FAIL[0]))
+sys.exit(1 if FAIL[0] else 0)
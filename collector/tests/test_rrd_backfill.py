@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""Unit test: RRD backfill into a SQLite database - `rrdtool fetch` output
+parsed, values mapped with db_mapper / key_mapper and merged per minute (and
+per 5 min for consolidated archives), only buckets without a sensors row
+inserted in batches (a bucket within a step of a drifting live row is
+not missing), existing rows untouched, an interrupted run resumed
+from its state file, touched months marked for a rollup recompute - plus a
+points/s benchmark. rrdtool itself is replaced by a fake fetch; MySQLdb is
+stubbed. Run: python3 test_rrd_backfill.py"""
+import os, sys, types, contextlib, datetime, logging, tempfile, time
+COLLECTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.modules["MySQLdb"] = types.ModuleType("MySQLdb")    # stub so import works w/o MySQLdb
+sys.path.insert(0, COLLECTOR)
+import rrd_backfill as rb
+import storage
+logging.basicConfig(level=logging.CRITICAL)
+
+PASS = [0]; FAIL = [0]
+def check(name, cond):
+    print(("PASS " if cond else "FAIL ") + name); (PASS if cond else FAIL)[0] += 1
+
+def dt(*a): return datetime.datetime(*a)
+DAY = datetime.timedelta(days=1)
+
+# ---- rrdtool fetch output ----
+(names, points) = rb.parse_fetch("""                       BAA_sensor              BAA_sky
+
+1767225660: 8.0600000000e+00 4.0600000000e+00
+1767225720: -nan -nan
+1767225780: nan 3.5000000000e+00
+""")
+check("fetch output parsed, nan as None", names == ["BAA_sensor", "BAA_sky"] and points == [
+    (1767225660, [8.06, 4.06]), (1767225720, [None, None]), (1767225780, [None, 3.5])])
+
+# ---- fake rrd files: minute data from RECENT on, 5 min consolidated before ----
+tmp = tempfile.mkdtemp()
+rrd_dir = os.path.join(tmp, "rrd")
+os.mkdir(rrd_dir)
+FILES = {"sqm.rrd": ["frequency", "sqm", "bogus"], "skytemperature-BAA.rrd": ["BAA_sensor", "BAA_sky"],
+         "ups.rrd": ["status", "bcharge"]}
+for name in FILES:
+    open(os.path.join(rrd_dir, name), "w").close()
+START = dt(2026, 1, 1)
+RECENT = rb.to_epoch(START + DAY)
+CALLS = []
+def series(ts, i):
+    return None if ts % 3600 == 0 else round(ts / 60 % 97 + i, 2)     # a gap every hour
+def fetch(path, start, end, resolution=60):
+    CALLS.append((os.path.basename(path), start))
+    step = 60 if start >= RECENT else 300
+    names = FILES[os.path.basename(path)]
+    return (step, names, [(ts, [series(ts, i) for i in range(len(names))])
+                          for ts in range(start - start % step + step, end + 1, step)])
+
+backend = storage.SQLiteStorage(os.path.join(tmp, "obs.sqlite"))
+conn = backend.connect()
+LIVE = [START + DAY + datetime.timedelta(hours=5, minutes=m, seconds=30) for m in range(120)] + [
+    START + datetime.timedelta(hours=2, minutes=2, seconds=10)]
+conn.executemany("INSERT INTO sensors (create_time,sqm1_sqm) VALUES (%s,%s)", [(t, 99.0) for t in LIVE])
+conn.execute("INSERT INTO sensors_months (month, rolled_up) VALUES (%s,%s)", [dt(2026, 1, 1), dt(2026, 2, 1)])
+conn.commit()
+
+# ---- an interrupted run, resumed ----
+state = os.path.join(tmp, "backfill.state")
+bf = rb.Backfill(backend, rrd_dir, fetch=fetch, batch_rows=100)
+broken = [0]
+def crashing(path, start, end, resolution=60):
+    if start >= rb.to_epoch(START + 2 * DAY):
+        raise RuntimeError("rrdtool killed")
+    return fetch(path, start, end, resolution)
+bf.fetch = crashing
+utcnow = rb.partitions.utcnow
+rb.partitions.utcnow = lambda: START + 3 * DAY + datetime.timedelta(seconds=7)    # no --end: now
+try:
+    bf.run(START, None, DAY, state)
+except RuntimeError:
+    broken[0] = 1
+saved = rb.read_state(state)
+check("state saved per committed window", broken[0] and saved["done_until"] == (START + 2 * DAY).isoformat()
+      and saved["end"] == (START + 3 * DAY).isoformat())
+CALLS.clear()
+rb.partitions.utcnow = lambda: START + 5 * DAY                                   # rerun later, no --end
+bf = rb.Backfill(backend, rrd_dir, fetch=fetch, batch_rows=100)
+bf.run(START, None, DAY, state)
+rb.partitions.utcnow = utcnow
+check("resumed at the saved window, up to the stored end", sorted(set(s for (f, s) in CALLS)) == [
+    rb.to_epoch(START + 2 * DAY)] and rb.read_state(state)["end"] == (START + 3 * DAY).isoformat())
+# hour gaps, and the buckets less than a step from a live row (LIVE[-1]: 2 of them; the 120 a minute
+# apart: 121, 2 of them on a gap)
+expected = (288 - 24 - 2) + (1440 - 24 - 121 + 2) + (1440 - 24)
+cur = conn.execute("SELECT COUNT(*) FROM sensors")
+check("only the missing buckets inserted", cur.fetchone()[0] == len(LIVE) + expected
+      and rb.read_state(state)["inserted"] == expected)
+cur = conn.execute("SELECT create_time, sqm1_sqm, sqm1_frequency, BAA1_temperature_sky, ups1_bcharge FROM sensors"
+                   " WHERE create_time = %s", [START + DAY + datetime.timedelta(minutes=10)])
+ts = rb.to_epoch(START + DAY) + 660
+check("values mapped and stamped at the start of their minute", cur.fetchone() == (
+    START + DAY + datetime.timedelta(minutes=10), series(ts, 1), series(ts, 0), series(ts, 1), series(ts, 1)))
+cur = conn.execute("SELECT COUNT(*), MIN(sqm1_sqm) FROM sensors WHERE create_time >= %s AND create_time < %s",
+                   [START + DAY + datetime.timedelta(hours=5), START + DAY + datetime.timedelta(hours=7)])
+check("existing rows untouched, none doubled", cur.fetchone() == (120, 99.0))
+cur = conn.execute("SELECT create_time FROM sensors WHERE create_time >= %s AND create_time < %s ORDER BY create_time",
+                   [START + datetime.timedelta(hours=2), START + datetime.timedelta(hours=2, minutes=15)])
+check("consolidated 5 min archive: 5 min buckets, a live row covers those less than 5 min away",
+      [r[0] for r in cur.fetchall()] == [LIVE[-1], START + datetime.timedelta(hours=2, minutes=10)])
+check("unknown data sources skipped", bf.unmapped == {"sqm1_Unknown KEY"})
+cur = conn.execute("SELECT rolled_up FROM sensors_months WHERE month = %s", [dt(2026, 1, 1)])
+check("touched month marked for a rollup recompute", cur.fetchone()[0] is None)
+
+# ---- a rerun finds nothing ----
+bf = rb.Backfill(backend, rrd_dir, fetch=fetch)
+check("rerun inserts nothing", bf.run(START, START + 3 * DAY, DAY) == 0)
+moved = os.path.join(tmp, "rrd-copy")
+os.rename(rrd_dir, moved)
+CALLS.clear()
+rb.Backfill(backend, moved, fetch=fetch).run(START, START + 3 * DAY, DAY, state)
+check("a state from another rrd directory is not resumed", CALLS and min(s for (f, s) in CALLS) == rb.to_epoch(START)
+      and rb.read_state(state)["rrd_dir"] == moved)
+os.rename(moved, rrd_dir)
+check("dry run counts only", rb.Backfill(backend, rrd_dir, fetch=fetch).run(
+    START, START + 4 * DAY, DAY, dry_run=True) == 1440 - 24)
+cur = conn.execute("SELECT COUNT(*) FROM sensors")
+check("dry run wrote nothing", cur.fetchone()[0] == len(LIVE) + expected)
+
+# ---- live rows drift off the minute: no near-duplicates between them ----
+drift = storage.SQLiteStorage(os.path.join(tmp, "drift.sqlite"))
+t = START + 3 * DAY
+with contextlib.closing(drift.connect()) as c:
+    while t < START + 3 * DAY + datetime.timedelta(hours=6):
+        c.execute("INSERT INTO sensors (create_time,sqm1_sqm) VALUES (%s,%s)", [t, 99.0])
+        t += datetime.timedelta(seconds=62 if t.minute % 3 else 59)     # :59, :02:01, :03:03 ...
+    c.commit()
+check("rows drifting a second or two a minute: nothing inserted", rb.Backfill(drift, rrd_dir, fetch=fetch).run(
+    START + 3 * DAY + datetime.timedelta(hours=1), START + 3 * DAY + datetime.timedelta(hours=5), DAY) == 0)
+
+# ---- batches ----
+rows = [(START + datetime.timedelta(minutes=m), {"sqm1_sqm": 1.0, "ups1_status": 1.0} if m % 2 else {"sqm1_sqm": 2.0})
+        for m in range(250)]
+bf.batch_rows = 100
+statements = bf.insert_statements(rows)
+check("multi-row batches with the batch's columns", [len(a) for (s, a) in statements] == [300, 300, 150]
+      and statements[0][0].startswith("INSERT OR IGNORE INTO sensors (create_time,sqm1_sqm,ups1_status) VALUES (%s,%s,%s)")
+      and statements[0][1][:6] == [START, 2.0, None, START + datetime.timedelta(minutes=1), 1.0, 1.0])
+check("MySQL: INSERT IGNORE", storage.MySQLStorage().insert_missing_sql("sensors", "create_time", ["a"], 2) ==
+      "INSERT IGNORE INTO sensors (create_time,a) VALUES (%s,%s),(%s,%s);")
+
+# ---- benchmark ----
+bench = storage.SQLiteStorage(os.path.join(tmp, "bench.sqlite"))
+bench.connect()
+bf = rb.Backfill(bench, rrd_dir, fetch=fetch)
+t = time.time()
+n = bf.run(START + DAY, START + 71 * DAY)
+rate = bf.points / (time.time() - t)
+print("  {} rrd points -> {} rows in {:.1f}s, {:.0f} points/s".format(bf.points, n, time.time() - t, rate))
+check("millions of points in minutes", rate > 20000)
+
+print("\n{} passed, {} failed".format(PASS[0], FAIL[0]))
+sys.exit(1 if FAIL[0] else 0)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Unit test: the long-lived safety evaluator keeps hysteresis and the closing
+cooldown in memory, persists them atomically for crash recovery (or recovers
+them from the DB when the file is missing or stale), skips a stale DB instead of quitting, reconnects after a
+lost connection and evaluates on UDP triggers. MySQLdb, the snapshot query and
+the DB writes are stubbed. Run: python3 test_safety_evaluator.py"""
+import os, sys, types, io, datetime, contextlib, logging, tempfile, threading, time
+COLLECTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_mysqldb = types.ModuleType("MySQLdb")                  # stub so import works w/o MySQLdb
+class _Error(Exception): pass
+_mysqldb.Error = _Error
+_mysqldb.OperationalError = type("OperationalError", (_Error,), {})
+sys.modules["MySQLdb"] = _mysqldb
+sys.path.insert(0, COLLECTOR)
+import evaluation_trigger
+import query_sky_and_obsy_conditions as rules
+import safety_evaluator
+logging.basicConfig(level=logging.CRITICAL)
+
+PASS = [0]; FAIL = [0]
+def check(name, cond):
+    print(("PASS " if cond else "FAIL ") + name); (PASS if cond else FAIL)[0] += 1
+
+T0 = datetime.datetime(2026, 1, 1, 22, 0, 0)
+def at(m): return T0 + datetime.timedelta(minutes=m)
+
+ROW = {}
+CONNECTS = []; ROOF = []; EVENTS = []; FAIL_NEXT = [False]
+NEWEST_ROOF = [None]; RECOVERIES = []
+class FakeCursor:
+    def execute(self, sql, args=None):
+        self.sql = sql
+        if "FROM events" in sql:
+            RECOVERIES.append(args)
+    def fetchone(self): return (NEWEST_ROOF[0],) if "SELECT create_time" in self.sql else (1,)
+    def fetchall(self): return [("closing", at(-10))]
+class FakeDB:
+    def autocommit(self, v): pass
+def db_connect(storage_backend=None):
+    CONNECTS.append(1); rules.db = FakeDB(); rules.db_cursor = FakeCursor()
+def load_snapshot(utcnow, windows, events, sensor_windows=None, state=None, cache=None):
+    assert state is not None, "service must not query the roof/events tables"
+    if FAIL_NEXT[0]:
+        FAIL_NEXT[0] = False; raise _mysqldb.OperationalError("server has gone away")
+    snap = {"sensors_id": 1, "create_time": utcnow, "sqm1_sqm": 19.0, "rainsensor1_drops": 0,
+            "ups1_status": 1, "ups1_bcharge": 100.0,
+            "BAA1_temperature_sensor": 10.0, "BAA1_temperature_sky": -10.0,
+            "BCC1_temperature_sensor": 10.0, "BCC1_temperature_sky": -10.0}
+    snap.update(ROW)
+    snap["previous"] = {"ups1_status": 1, "ups1_bcharge": 100.0}
+    snap["windows"] = {w: 0 for w in windows}
+    snap["last_open_ok"] = state.last_open_ok
+    snap["events"] = state.event_counts(events, utcnow)
+    return snap
+rules.db_connect = db_connect
+rules.load_snapshot = load_snapshot
+rules.db_fresh = lambda snapshot, minutes: snapshot["sensors_id"] if snapshot["create_time"] > at(-1000) else None
+rules.store_roof_status = lambda utcnow, sensors_id, open_ok, reasons: ROOF.append((open_ok, reasons))
+rules.store_event = lambda utcnow, event, reason=None: EVENTS.append(event)
+rules.sendToMattermost = lambda url, severity, message: None
+
+def run(ev, now, **row):
+    ROW.clear(); ROW.update(row)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return ev.evaluate_once(now)
+
+tmp = tempfile.mkdtemp()
+path = os.path.join(tmp, "state.json")
+state = safety_evaluator.EvaluatorState(path)
+state.last_open_ok = False; state.events = {}; state.updated = at(-1); state.save()
+ev = safety_evaluator.SafetyEvaluator("http://mattermost.invalid", safety_evaluator.EvaluatorState(path))
+
+check("all good opens", run(ev, at(0)) is True and EVENTS == ["opening"])
+check("hysteresis from memory: sqm 17.0 keeps it open", run(ev, at(1), sqm1_sqm=17.0) is True)
+check("dark enough to close", run(ev, at(2), sqm1_sqm=15.0) is False and EVENTS[-1] == "closing")
+check("closing cooldown from memory blocks reopening",
+      run(ev, at(3)) is False and "Roof was just closed" in ROOF[-1][1])
+check("reopens after the cooldown", run(ev, at(64)) is True and EVENTS[-1] == "opening")
+check("one connection for all evaluations", len(CONNECTS) == 1)
+
+check("stale DB skips the cycle without quitting", run(ev, at(-2000)) is None and ev.skipped == 1)
+FAIL_NEXT[0] = True
+check("lost connection is survived", run(ev, at(65)) is None and ev.connected is False)
+check("and reconnected on the next cycle", run(ev, at(66)) is True and len(CONNECTS) == 2)
+
+restored = safety_evaluator.EvaluatorState(path)
+check("state persisted atomically for crash recovery",
+      restored.load() and restored.last_open_ok is True and restored.updated == at(66)
+      and not os.path.exists(path + ".tmp"))
+check("events older than the longest window are pruned", restored.events == {"opening": [at(64)]})
+
+os.remove(path)
+ev = safety_evaluator.SafetyEvaluator("http://mattermost.invalid", safety_evaluator.EvaluatorState(path))
+with contextlib.redirect_stdout(io.StringIO()):
+    ev.connect()
+check("without a state file the state is recovered from the DB once",
+      ev.state.last_open_ok is True and ev.state.events == {"closing": [at(-10)]} and os.path.exists(path))
+
+def restart(now, updated, newest_roof):
+    state = safety_evaluator.EvaluatorState(path)
+    state.last_open_ok = False; state.events = {}; state.updated = updated; state.save()
+    (NEWEST_ROOF[0], RECOVERIES[:]) = (newest_roof, [])
+    ev = safety_evaluator.SafetyEvaluator("http://mattermost.invalid", safety_evaluator.EvaluatorState(path))
+    with contextlib.redirect_stdout(io.StringIO()):
+        ev.connect(now)
+    return (len(RECOVERIES), ev.state.last_open_ok, ev.state.updated)
+check("a state file older than the longest event window is recovered from the DB",
+      restart(at(200), at(139), at(139)) == (1, True, at(200)))
+check("a roof row newer than the state file (cron wrote it): recovered from the DB",
+      restart(at(200), at(190), at(195)) == (1, True, at(200)))
+check("a state file as new as the newest roof row is trusted", restart(at(200), at(190), at(190)) == (
+    0, False, at(190)))
+
+# ---- UDP trigger ----
+ev.evaluate_once = lambda now=None: RUNS.append(time.monotonic())
+RUNS = []
+sock = safety_evaluator.bind("127.0.0.1", 0)
+stop = threading.Event()
+thread = threading.Thread(target=ev.serve, args=(sock, 3600, stop), daemon=True)
+thread.start()
+time.sleep(0.2)
+for i in range(5):
+    evaluation_trigger.notify_evaluator(at(i), sock.getsockname())
+time.sleep(0.3)
+stop.set(); thread.join(3)
+check("evaluates at start and on triggers, a burst coalesced", len(RUNS) in (2, 3) and not thread.is_alive())
+
+print("\n{} passed, {} failed".format(PASS[0], FAIL[0]))
+sys.exit(1 if FAIL[0] else 0)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Unit test: safety_rules.yaml compiles to a plan that gives the same verdict
+and reasons as the hard-coded if-chain it replaced (kept below as the oracle),
+shares window scans, extends to a new sensor without new queries, and rejects
+broken rule files. Run: python3 test_safety_rules.py"""
+import os, sys, random
+COLLECTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, COLLECTOR)
+import yaml
+import safety_rules
+
+PASS = [0]; FAIL = [0]
+def check(name, cond):
+    print(("PASS " if cond else "FAIL ") + name); (PASS if cond else FAIL)[0] += 1
+
+PLAN = safety_rules.load()
+
+# ---- oracle: the pre-YAML rules of query_sky_and_obsy_conditions.main() ----
+def legacy(s, last_open_ok):
+    sqm_h, dt_h = (1, 3) if last_open_ok else (0, 0)
+    sqm_min, sqm_past_min, baa, bcc = 17.5 - sqm_h, 16.5 - sqm_h, 13 - dt_h, 14 - dt_h
+    w = s["windows"]
+    sqm_now = s["sqm1_sqm"] >= sqm_min
+    sqm_past = w[("sqm_below", sqm_past_min, 300)] <= 5
+    rain_now = s["rainsensor1_drops"] <= 1
+    rain_past = w[("drops_above", 1, 3600)] <= 2
+    ups1 = s["ups1_status"] == 1 and s["ups1_bcharge"] >= 99.0
+    ups2 = s["previous"]["ups1_status"] == 1 and s["previous"]["ups1_bcharge"] >= 99.0
+    ir_now = (s["BAA1_temperature_sensor"] - s["BAA1_temperature_sky"] >= baa
+              or s["BCC1_temperature_sensor"] - s["BCC1_temperature_sky"] >= bcc)
+    ir_past = w[("BAA1_delta_below", baa, 3600)] < 5 or w[("BCC1_delta_below", bcc, 3600)] < 5
+    closing_ok = s["events"][("closing", 3600)] < 1
+    o, c = [], []
+    def pair(now, past, ok, past_fail, now_fail, both):
+        if now and past: o.append(ok)
+        elif now: c.append(past_fail)
+        elif past: c.append(now_fail)
+        else: c.append(both)
+    pair(sqm_now, sqm_past, "Dark long enough", "Not dark long enough", "Not dark enough anymore", "Still not dark enough")
+    pair(rain_now, rain_past, "Dry long enough", "Not dry long enough", "Started raining", "Still raining")
+    if ups1: o.append("UPS works")
+    elif ups2: o.append("UPS selftest or on battery")
+    else: c.append("UPS on battery")
+    pair(ir_now, ir_past, "Clear long enough", "Not clear long enough", "Too cloudy", "Still too cloudy")
+    if closing_ok: o.append("Roof has been closed long enough")
+    else: c.append("Roof was just closed")
+    ok = sqm_now and sqm_past and rain_now and rain_past and (ups1 or ups2) and ir_now and ir_past and closing_ok
+    return ok, o, c
+
+random.seed(5)
+(WINDOWS, EVENTS) = PLAN.all_windows()
+same = True
+for i in range(3000):
+    s = {"sqm1_sqm": random.choice([15.0, 16.6, 17.0, 17.5, 19.0]),
+         "rainsensor1_drops": random.choice([0, 1, 2]),
+         "ups1_status": random.choice([0, 1, 1]), "ups1_bcharge": random.choice([98.0, 100.0]),
+         "BAA1_temperature_sensor": 10.0, "BAA1_temperature_sky": random.choice([-5.0, -2.0, 0.0]),
+         "BCC1_temperature_sensor": 10.0, "BCC1_temperature_sky": random.choice([-5.0, -3.0, 0.0])}
+    s["previous"] = {"ups1_status": random.choice([0, 1]), "ups1_bcharge": 100.0}
+    s["windows"] = {w: random.choice([0, 1, 2, 3, 4, 5, 6]) for w in WINDOWS}
+    s["events"] = {e: random.choice([0, 0, 1]) for e in EVENTS}
+    last_open_ok = random.choice([True, False])
+    v = PLAN.evaluate(s, last_open_ok)
+    if (v.open_ok, v.reason_open, v.reason_close) != legacy(s, last_open_ok):
+        same = False
+        print("  differs:", s, last_open_ok, v[:3], legacy(s, last_open_ok))
+        break
+check("YAML plan == the legacy if-chain (verdict + reasons), 3000 random snapshots", same)
+
+v = PLAN.evaluate(dict(s, sqm1_sqm=None), False)
+check("NULL sensor value is not ok, no exception", "darkness: sqm None >= 17.5 -> close" in v.lines)
+check("hysteresis lowers the listed params while open",
+      PLAN.thresholds(True)["sqm_min"] == 16.5 and PLAN.thresholds(True)["required_bcc_delta_t"] == 11
+      and PLAN.thresholds(False)["sqm_min"] == 17.5)
+check("columns cover every sensor the rules read", set(PLAN.columns) == {
+    "sqm1_sqm", "rainsensor1_drops", "ups1_status", "ups1_bcharge", "BAA1_temperature_sensor",
+    "BAA1_temperature_sky", "BCC1_temperature_sensor", "BCC1_temperature_sky"}
+      and PLAN.previous_columns == ["ups1_bcharge", "ups1_status"])
+check("predicates in SQL and Python", PLAN.sql_predicates["BAA1_delta_below"] ==
+      "BAA1_temperature_sensor - BAA1_temperature_sky < %s"
+      and PLAN.predicates["BAA1_delta_below"][1]([10.0, -1.0], 13) is True
+      and PLAN.predicates["sqm_below"][1]([None], 16.5) is False)
+
+# ---- extending: a new sensor + rule, windows shared ----
+config = yaml.safe_load(open(safety_rules.RULES_FILE))
+config["sensors"]["stars"] = "allskycam1_stars"
+config["params"]["stars_min"] = 50
+config["rules"].append({"name": "stars", "now": {"all": ["stars >= stars_min"]},
+                        "past": {"all": [{"count": "stars < stars_min", "seconds": 600, "ok": "count <= 2"},
+                                         {"count": "stars < stars_min", "seconds": 600, "ok": "count <= 3"}]},
+                        "reasons": {"ok": "Stars", "now": "No stars", "past": "Not long enough stars"}})
+plan = safety_rules.compile_rules(config)
+t = plan.thresholds(False)
+check("new sensor's column joins the snapshot columns", "allskycam1_stars" in plan.columns)
+check("identical windows are scanned once", plan.windows(t).count(("stars_below", 50, 600)) == 1
+      and len(plan.windows(t)) == len(PLAN.windows(t)) + 1)
+
+# ---- broken rule files ----
+def rejects(mutate):
+    c = yaml.safe_load(open(safety_rules.RULES_FILE)); mutate(c)
+    try:
+        safety_rules.compile_rules(c); return False
+    except safety_rules.RuleError:
+        return True
+check("unknown sensor rejected", rejects(lambda c: c["rules"][0]["now"].update(all=["moon >= 1"])))
+check("unknown param rejected", rejects(lambda c: c["rules"][0]["now"].update(all=["sqm >= sqm_max"])))
+check("unknown comparator rejected", rejects(lambda c: c["rules"][0]["now"].update(all=["sqm => 1"])))
+check("missing reason rejected", rejects(lambda c: c["rules"][0]["reasons"].pop("past")))
+
+print("\n{} passed, {} failed".format(PASS[0], FAIL[0]))
+sys.exit(1 if FAIL[0] else 0)
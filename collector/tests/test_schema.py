@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Query-plan regression test: the versioned migrations build the schema
+once, in order (rows sharing a create_time merged before the UNIQUE index),
+and every hot query runs on an index (the outlier windows on the covering
+sensors_window index) - checked with EXPLAIN against a local SQLite database
+with a day of rows. Dropping an index must make the check
+fail. With COLLECTOR_TEST_STORAGE=<config file> the plans of that database
+(e.g. a local MySQL) are checked too. Run: python3 test_schema.py"""
+import os, sys, types, datetime, logging, tempfile, sqlite3
+COLLECTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if not os.environ.get("COLLECTOR_TEST_STORAGE"):
+    sys.modules["MySQLdb"] = types.ModuleType("MySQLdb")    # stub so import works w/o MySQLdb
+sys.path.insert(0, COLLECTOR)
+import schema
+import storage
+import query_sky_and_obsy_conditions as rules
+logging.basicConfig(level=logging.CRITICAL)
+
+PASS = [0]; FAIL = [0]
+def check(name, cond):
+    print(("PASS " if cond else "FAIL ") + name); (PASS if cond else FAIL)[0] += 1
+
+tmp = tempfile.mkdtemp()
+
+# ---- migrations ----
+conn = sqlite3.connect(os.path.join(tmp, "steps.sqlite"), factory=storage._Connection)
+check("partial migration up to a target", schema.migrate(conn, "sqlite", target=1) == [1])
+conn.execute("CREATE UNIQUE INDEX sensors_create_time ON sensors (create_time)")    # made by hand earlier
+check("then the rest; an existing index is left alone", schema.migrate(conn, "sqlite") == [2, 3, 4])
+check("nothing left to apply", schema.migrate(conn, "sqlite") == [] and schema.applied_versions(conn) == [1, 2, 3, 4])
+check("covering index holds every column the rules read", schema.WINDOW_COLUMNS == rules.PLAN.columns)
+conn = sqlite3.connect(os.path.join(tmp, "duplicates.sqlite"), factory=storage._Connection)
+schema.migrate(conn, "sqlite", target=1)
+T = datetime.datetime(2026, 1, 1, 22, 0, 0)
+conn.executemany("INSERT INTO sensors (create_time,sqm1_sqm,ups1_status,rainsensor1_drops) VALUES (%s,%s,%s,%s)", [
+    (T, 19.0, None, 0), (T + datetime.timedelta(minutes=1), 18.0, 1, 0), (T, 19.5, 1, None), (T, None, None, 3)])
+conn.commit()
+check("duplicate create_times merged before the UNIQUE index", schema.migrate(conn, "sqlite") == [2, 3, 4]
+      and conn.execute("SELECT sensors_id, create_time, sqm1_sqm, ups1_status, rainsensor1_drops FROM sensors"
+                       " ORDER BY sensors_id").fetchall() == [(1, str(T), 19.5, 1, 3),
+                                                              (2, str(T + datetime.timedelta(minutes=1)), 18.0, 1, 0)])
+
+# ---- plans on a day of rows ----
+backend = storage.SQLiteStorage(os.path.join(tmp, "plans.sqlite"))
+conn = backend.connect()
+NOW = datetime.datetime(2026, 1, 2, 0, 0, 0)
+rows = [(NOW - datetime.timedelta(minutes=m), 19.0, 0, 1, 100, 10, -10, 10, -10) for m in range(1440)]
+conn.executemany("INSERT INTO sensors (create_time,sqm1_sqm,rainsensor1_drops,ups1_status,ups1_bcharge,"
+                 "BAA1_temperature_sensor,BAA1_temperature_sky,BCC1_temperature_sensor,BCC1_temperature_sky)"
+                 " VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)", rows)
+conn.executemany("INSERT INTO roof (create_time,sensors_id,open_ok,reasons) VALUES (%s,%s,%s,%s)",
+                 [(t, i, 1, "ok") for i, (t, *_) in enumerate(rows)])
+conn.executemany("INSERT INTO events (create_time,event) VALUES (%s,%s)",
+                 [(NOW - datetime.timedelta(hours=h), e) for h in range(24) for e in ("opening", "closing")])
+conn.commit()
+conn.execute("ANALYZE")
+plans = schema.check(conn, "sqlite", schema.hot_queries(NOW))
+for name, (details, problems) in plans.items():
+    check("no full scan or sort: " + name, not problems)
+check("outlier windows read the covering index only",
+      "SEARCH sensors USING COVERING INDEX sensors_window (create_time>?)" in plans["snapshot"][0]
+      and plans["sensor_windows catch-up"][0] ==
+      ["SEARCH sensors USING COVERING INDEX sensors_window (create_time>? AND create_time<?)"])
+check("cooldown counts on (event, create_time)",
+      "SEARCH events USING COVERING INDEX events_event_time (event=? AND create_time>?)" in plans["snapshot"][0])
+
+conn.execute("DROP INDEX sensors_create_time")
+conn.execute("DROP INDEX sensors_window")
+conn = backend.connect()            # a fresh statement cache
+plans = schema.check(conn, "sqlite", schema.hot_queries(NOW))
+check("a missing index fails loudly", "full scan: SCAN sensors" in plans["newest sensors row"][1]
+      and plans["snapshot"][1] and plans["sensor_windows catch-up"][1])
+
+# ---- MySQL EXPLAIN rows ----
+class FakeCursor:
+    description = [("id",), ("select_type",), ("table",), ("type",), ("key",), ("rows",), ("Extra",)]
+    def execute(self, sql, args=None): pass
+    def fetchall(self):
+        return [(1, "PRIMARY", "<derived2>", "ALL", None, 1, None),
+                (2, "DERIVED", "sensors", "index", "sensors_create_time", 1, None),
+                (3, "SUBQUERY", "roof", "ALL", None, 5000, "Using where; Using filesort")]
+(details, problems) = schema._mysql_plan(FakeCursor(), "SELECT ..", [])
+check("MySQL: type ALL and filesort flagged, derived tables ignored",
+      problems == ["full scan: roof ALL key=None rows=5000 Using where; Using filesort",
+                   "sort: roof ALL key=None rows=5000 Using where; Using filesort"])
+
+# ---- a real local database, when configured ----
+if os.environ.get("COLLECTOR_TEST_STORAGE"):
+    local = storage.from_config(os.environ["COLLECTOR_TEST_STORAGE"])
+    conn = local.connect()
+    schema.migrate(conn, local.dialect)
+    for name, (details, problems) in schema.check(conn, local.dialect).items():
+        check("{}: no full scan or sort: {}".format(local, name), not problems)
+else:
+    print("(COLLECTOR_TEST_STORAGE not set - skipping the local database plans)")
+
+print("\n{} passed, {} failed".format(PASS[0], FAIL[0]))
+sys.exit(1 if FAIL[0] else 0)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Unit test: sensor_windows ring-buffer counts match a brute-force recount of
+the SQL window semantics (create_time > now - seconds, NULL never a hit),
+expired hits are evicted, and warm-up / catch-up only read unseen, settled
+rows. No DB needed - a fake cursor serves rows. Run: python3 test_sensor_windows.py"""
+import os, sys, random, datetime
+COLLECTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, COLLECTOR)
+import sensor_windows as sw
+
+PASS = [0]; FAIL = [0]
+def check(name, cond):
+    print(("PASS " if cond else "FAIL ") + name); (PASS if cond else FAIL)[0] += 1
+
+WINDOWS = [("sqm_below", 16.5, 300), ("drops_above", 1, 3600), ("BAA1_delta_below", 13, 3600)]
+T0 = datetime.datetime(2026, 1, 1, 20, 0, 0)
+random.seed(7)
+ROWS = []
+for i in range(600):
+    ROWS.append({"create_time": T0 + datetime.timedelta(minutes=i),
+                 "sqm1_sqm": random.choice([None, 15.0, 18.0, 19.0]),
+                 "rainsensor1_drops": random.choice([0, 0, 0, 3]),
+                 "BAA1_temperature_sensor": 10.0,
+                 "BAA1_temperature_sky": random.choice([-10.0, 0.0, None])})
+
+def brute(now):
+    out = {}
+    for (name, thr, secs) in WINDOWS:
+        cols, pred = sw.PREDICATES[name]
+        out[(name, thr, secs)] = sum(
+            1 for r in ROWS
+            if r["create_time"] <= now and r["create_time"] > now - datetime.timedelta(seconds=secs)
+            and None not in [r[c] for c in cols] and pred([r[c] for c in cols], thr))
+    return out
+
+w = sw.SensorWindows(WINDOWS)
+ok = True
+for r in ROWS:
+    w.add_row(r)
+    if w.counts(r["create_time"]) != brute(r["create_time"]):
+        ok = False
+check("incremental counts match brute force at every row", ok)
+late = ROWS[-1]["create_time"] + datetime.timedelta(hours=2)
+check("everything evicted two hours after the last row", set(w.counts(late).values()) == {0})
+
+class FakeCursor:
+    def __init__(self): self.queries = []
+    def execute(self, sql, params): self.queries.append(params); self._p = params
+    def fetchall(self):
+        since, until = self._p
+        cols = ["create_time"] + w2.columns
+        return [tuple(r[c] for c in cols) for r in ROWS if since < r["create_time"] <= until]
+
+now = ROWS[300]["create_time"] + datetime.timedelta(seconds=30)
+w2 = sw.SensorWindows(WINDOWS, settle_seconds=60)
+cur = FakeCursor()
+n = w2.catch_up(cur, now)
+check("warm-up reads the longest window once", n == 59 and cur.queries[0][0] == now - datetime.timedelta(hours=1))
+check("unsettled newest row is not consumed yet", w2.last_seen == ROWS[299]["create_time"])
+n = w2.catch_up(cur, now + datetime.timedelta(minutes=1))
+check("catch-up reads only the newly settled row", n == 1 and w2.last_seen == ROWS[300]["create_time"])
+check("catch-up counts equal brute force", w2.counts(ROWS[300]["create_time"]) == brute(ROWS[300]["create_time"]))
+
+print("\n{} passed, {} failed".format(PASS[0], FAIL[0]))
+sys.exit(1 if FAIL[0] else 0)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""Unit test: the write-ahead spool - ingest appends instead of writing MySQL,
+fsync batching, the drainer's ordered multi-row upserts, survival of a MySQL
+outage, torn tails, restart from the committed offset, one commit per batch,
+truncation (offset 0 saved first, a stale offset clamped), a rejected
+record set aside without holding up the rows after it, and replay
+throughput. MySQLdb is stubbed with a fake that applies the upserts to a dict.
+Run: python3 test_spool.py"""
+import os, sys, types, re, datetime, logging, tempfile, time
+COLLECTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_mysqldb = types.ModuleType("MySQLdb")                  # stub so import works w/o MySQLdb
+class _Error(Exception): pass
+_mysqldb.Error = _Error
+_mysqldb.OperationalError = type("OperationalError", (_Error,), {})
+sys.modules["MySQLdb"] = _mysqldb
+sys.path.insert(0, COLLECTOR)
+import ingest
+import spool
+logging.basicConfig(level=logging.CRITICAL)
+
+PASS = [0]; FAIL = [0]
+def check(name, cond):
+    print(("PASS " if cond else "FAIL ") + name); (PASS if cond else FAIL)[0] += 1
+
+TABLE = {}              # create_time -> {column: value}, insertion order = commit order
+STATEMENTS = []
+COMMITS = [0]
+DOWN = [False]
+class FakeCursor:
+    def execute(self, sql, args=None):
+        if DOWN[0]:
+            raise _mysqldb.OperationalError("server has gone away")
+        sql = " ".join(sql.split())
+        if "Unknown DB_Unknown KEY" in sql:
+            raise _mysqldb.OperationalError(1054, "Unknown column 'Unknown DB_Unknown KEY' in 'field list'")
+        STATEMENTS.append(sql)
+        if sql.startswith("INSERT"):
+            names = re.match(r"INSERT INTO sensors \(create_time,([^)]*)\)", sql).group(1).split(",")
+            width = len(names) + 1
+            for i in range(0, len(args), width):
+                TABLE.setdefault(args[i], {}).update(zip(names, args[i + 1:i + width]))
+    def fetchone(self): return None
+class FakeConn:
+    def cursor(self): return FakeCursor()
+    def commit(self): COMMITS[0] += 1
+    def rollback(self): pass
+    def autocommit(self, v): pass
+    def ping(self, reconnect=True):
+        if DOWN[0]:
+            raise _mysqldb.OperationalError("server has gone away")
+_mysqldb.connect = lambda **kw: FakeConn()
+
+T0 = datetime.datetime(2026, 1, 1, 22, 0, 0)
+def at(s): return T0 + datetime.timedelta(seconds=s)
+tmp = tempfile.mkdtemp()
+path = os.path.join(tmp, "sensors.spool")
+
+# ---- ingest writes the spool, not MySQL ----
+sp = spool.Spool(path, fsync_records=1000, fsync_seconds=3600)
+COMMITTED = []
+si = ingest.SensorIngest(on_row_committed=COMMITTED.append, spool=sp)
+si.ingest("sqm.rrd", ["frequency", "sqm"], ["N", "1", "19.5"], now=at(0))
+si.ingest("rainsensor.rrd", ["drops"], ["N", "0"], now=at(2))
+si.tick(at(10))
+si.ingest("ups.rrd", ["status"], ["N", "U"], now=at(20))
+si.tick(at(30))
+check("ingest appends to the spool, MySQL untouched", sp.appended == 2 and not TABLE)
+check("fsync batched: nothing synced yet", sp.unsynced == 2)
+si.tick(at(61))
+check("bucket close writes a final line and fsyncs", sp.appended == 3 and sp.unsynced == 0)
+check("with a spool the ingest does not report the row itself", COMMITTED == [])
+
+# ---- drain: ordered multi-row upserts, merged per create_time ----
+drainer = spool.SpoolDrainer(sp, on_row_committed=COMMITTED.append)
+check("drainer replays every line", drainer.drain() == 3)
+check("lines of one create_time merged into one row",
+      TABLE == {at(0): {"sqm1_sqm": "19.5", "sqm1_frequency": "1", "rainsensor1_drops": "0", "ups1_status": None}})
+check("drainer reports the committed final row", COMMITTED == [at(0)])
+check("committed offset persisted", sp.read_offset() == sp.size() and drainer.drain() == 0)
+
+# ---- MySQL outage: nothing lost, order kept ----
+for m in range(1, 6):
+    sp.append(at(60 * m), {"sqm1_sqm": str(18 + m)})
+    sp.append(at(60 * m), {"rainsensor1_drops": "0"}, final=True)
+DOWN[0] = True
+try:
+    drainer.drain(); check("drain raises while MySQL is down", False)
+except _mysqldb.OperationalError:
+    check("drain raises while MySQL is down", True)
+check("offset not advanced past uncommitted lines", drainer.offset < sp.size())
+DOWN[0] = False
+check("after the outage the backlog drains", drainer.drain() == 10)
+check("rows committed in create_time order without gaps", list(TABLE) == [at(60 * m) for m in range(6)])
+check("one multi-row statement for the backlog", sum(1 for s in STATEMENTS if s.count("),(") == 4) == 1)
+check("newest final row reported once per batch", COMMITTED[-1] == at(300))
+sp.append(at(360), {"sqm1_sqm": "20"})
+sp.append(at(420), {"ups1_status": "1"}, final=True)
+(n, COMMITS[0]) = (len(STATEMENTS), 0)
+drainer.drain()
+check("a batch of several statements commits once", len(STATEMENTS) - n == 2 and COMMITS[0] == 1)
+
+# ---- torn tail, restart, truncation ----
+with open(path, "ab") as f:
+    f.write(b'{"t":"2026-01-01 22:06:00","v":{"sqm1_sq')
+check("torn tail left for later", drainer.drain() == 0 and drainer.offset < sp.size())
+sp.write_offset(sp.size() + 4096)
+check("an offset past the end reads as the end", sp.read_offset() == sp.size())
+sp.write_offset(drainer.offset)
+sp.close()
+sp = spool.Spool(path)
+check("restart finds the newest complete row", sp.last_time == at(420))
+with open(path, "ab") as f:
+    f.write(b'm":"20"}}\n')
+drainer = spool.SpoolDrainer(sp, truncate_bytes=1)
+check("restart resumes at the committed offset", drainer.drain_once() == 1 and TABLE[at(360)] == {"sqm1_sqm": "20"})
+(ftruncate, os.ftruncate) = (os.ftruncate, lambda fd, n: 1 / 0)     # crash in truncate_if_drained
+try:
+    drainer.drain_once()
+except ZeroDivisionError:
+    pass
+os.ftruncate = ftruncate
+check("crash before the truncate: offset 0 saved first (replay, no skip)",
+      sp.read_offset() == 0 and sp.size() > 0)
+drainer.drain_once()
+check("drained spool truncated", sp.size() == 0 and sp.read_offset() == 0 and drainer.offset == 0)
+
+# ---- a record MySQL rejects: set aside, the rows after it still drain ----
+sp.append(at(480), {"sqm1_sqm": "19"})
+sp.append(at(480), {"Unknown DB_Unknown KEY": "1"})
+sp.append(at(480), {"ups1_status": "1"}, final=True)
+sp.append(at(540), {"sqm1_sqm": "18"}, final=True)
+(drainer.on_row_committed, COMMITTED[:]) = (COMMITTED.append, [])
+check("rejected batch replayed record by record", drainer.drain() == 4 and TABLE[at(480)] == {
+    "sqm1_sqm": "19", "ups1_status": "1"} and TABLE[at(540)] == {"sqm1_sqm": "18"} and COMMITTED == [at(540)])
+with open(path + ".rejected", "rb") as f:
+    check("the failing record moved to .rejected, offset past it", drainer.rejected == 1
+          and [spool.decode(line) for line in f.read().splitlines()] == [(at(480), {"Unknown DB_Unknown KEY": "1"},
+                                                                          False)]
+          and drainer.offset == sp.size())
+
+# ---- throughput ----
+N = 20000
+for i in range(N):
+    sp.append(at(600 + 60 * i), {"sqm1_sqm": "19.1", "rainsensor1_drops": "0", "ups1_status": "1",
+                                 "BAA1_temperature_sky": "-8.5", "BAA1_temperature_sensor": "10.2"}, final=True)
+STATEMENTS.clear()
+t = time.time()
+drainer.drain()
+rate = N / (time.time() - t)
+print("  replayed {} rows in {} statements, {:.0f} rows/s".format(N, len(STATEMENTS), rate))
+check("replay reaches thousands of rows/s", rate > 5000 and len(STATEMENTS) == N // spool.BATCH_ROWS)
+sp.close()
+
+print("\n{} passed, {} failed".format(PASS[0], FAIL[0]))
+sys.exit(1 if FAIL[0] else 0)
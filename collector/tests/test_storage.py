@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""Unit test: storage backend selection, the SQLite (WAL) backend's schema,
+placeholders and upsert, and the whole pipeline on it offline - ingest and
+spool drainer writing rows (unmapped rrd files skipped, a rejected row
+dropped), the safety snapshot / roof / events queries, the evaluator's state
+recovery, the weather status query and a backtest history load - plus an
+ingest benchmark. MySQLdb is stubbed (only the MySQL
+backend's selection is checked). Run: python3 test_storage.py"""
+import os, sys, types, io, datetime, contextlib, logging, tempfile, time
+COLLECTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_mysqldb = types.ModuleType("MySQLdb")                  # stub so import works w/o MySQLdb
+class _Error(Exception): pass
+_mysqldb.Error = _Error
+_mysqldb.OperationalError = type("OperationalError", (_Error,), {})
+sys.modules["MySQLdb"] = _mysqldb
+sys.path.insert(0, COLLECTOR)
+import storage
+import sensors_to_database as std
+import ingest
+import latest_cache
+import spool
+import query_sky_and_obsy_conditions as rules
+import safety_evaluator
+import weather_status
+logging.basicConfig(level=logging.CRITICAL)
+
+PASS = [0]; FAIL = [0]
+def check(name, cond):
+    print(("PASS " if cond else "FAIL ") + name); (PASS if cond else FAIL)[0] += 1
+
+tmp = tempfile.mkdtemp()
+def config(text):
+    path = os.path.join(tmp, "my.cnf")
+    with open(path, "w") as f:
+        f.write(text)
+    return storage.from_config(path)
+
+# ---- backend selection ----
+b = storage.from_config(os.path.join(tmp, "missing.cnf"))
+check("no config: MySQL on localhost as before", b.dialect == "mysql" and b.db_config == storage.DB_CONFIG
+      and b.OperationalError is _mysqldb.OperationalError)
+b = config("[mysqlDB]\nhost = database.domain\nport = 3307\nuser = u\npass = p\ndb = weather\n")
+check("[mysqlDB] section used for MySQL", b.db_config == {"host": "database.domain", "port": 3307, "user": "u",
+                                                          "passwd": "p", "db": "weather"})
+b = config("[storage]\nbackend = sqlite\npath = {}\n".format(os.path.join(tmp, "obs.sqlite")))
+check("[storage] backend = sqlite selects SQLite", b.dialect == "sqlite" and b.path.endswith("obs.sqlite"))
+try:
+    config("[storage]\nbackend = oracle\n"); check("unknown backend rejected", False)
+except ValueError:
+    check("unknown backend rejected", True)
+
+# ---- SQLite backend ----
+backend = b
+conn = backend.connect()
+cur = conn.cursor()
+cur.execute("PRAGMA journal_mode")
+check("WAL journal", cur.fetchone()[0] == "wal")
+cur.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL ORDER BY name")
+check("schema + indexes created", [r[0] for r in cur.fetchall()] == [
+    "events_event_time", "events_time_event", "roof_create_time", "sensors_create_time", "sensors_window"])
+cur.execute("SELECT %s || '%%'", ["50"])
+check("%s placeholders and %% literals translated", cur.fetchone()[0] == "50%")
+sensor_columns = {r[1] for r in conn.execute("PRAGMA table_info(sensors)")}
+mapped = set()
+for line in open(os.path.join(COLLECTOR, "sensors_to_database.py")):
+    parts = line.split()
+    if line.startswith("# ") and len(parts) == 5 and parts[1].endswith(".rrd") and parts[3] == "->":
+        mapped.update(std.map_update(parts[1], [parts[2]], ["N", "1"]))
+check("schema has every column map_update produces", len(mapped) > 20 and mapped <= sensor_columns)
+check("upsert dialects", "ON CONFLICT(create_time) DO UPDATE SET a=excluded.a" in backend.upsert_sql(
+    "sensors", "create_time", ["a"]) and "ON DUPLICATE KEY UPDATE a=VALUES(a)" in storage.MySQLStorage().upsert_sql(
+    "sensors", "create_time", ["a"]))
+
+# ---- ingest + spool drainer on SQLite ----
+NOW = datetime.datetime.now(datetime.UTC).replace(tzinfo=None, microsecond=0)
+def at(s): return NOW + datetime.timedelta(seconds=s)
+si = ingest.SensorIngest(backend)
+GOOD = [("sqm.rrd", ["frequency", "sqm"], ["N", "1", "19.5"]), ("rainsensor.rrd", ["drops"], ["N", "0"]),
+        ("ups.rrd", ["status", "bcharge"], ["N", "1", "100"]),
+        ("skytemperature-BAA.rrd", ["BAA_sensor", "BAA_sky"], ["N", "10", "-10"]),
+        ("skytemperature-BCC.rrd", ["BCC_sensor", "BCC_sky"], ["N", "10", "-10"])]
+for m in range(-70, -5):
+    for (db, keys, values) in GOOD:
+        si.ingest(db, keys, values, now=at(65 * m))
+    si.tick(at(65 * m + 10))
+si.ingest("sqm.rrd", ["sqm"], ["N", "19.0"], now=at(-6 * 65 + 20))     # upsert into the open row
+si.tick(at(-6 * 65 + 30))
+sp = spool.Spool(os.path.join(tmp, "sensors.spool"))
+drainer = spool.SpoolDrainer(sp, backend)
+for m in range(-4, 1):
+    for (db, keys, values) in GOOD:
+        sp.append(at(60 * m), std.map_update(db, keys, values))
+    sp.append(at(60 * m), {}, final=True)
+    if m == -1:
+        drained = drainer.drain()
+        drainer.db.execute(drainer.db.upsert_sql(["ups1_status"]), [at(-60), 0])   # burns an id
+drained += drainer.drain()
+cur.execute("SELECT COUNT(*), MIN(sensors_id), MAX(sensors_id) FROM sensors")
+(n, lo, hi) = cur.fetchone()
+check("ingest + drainer wrote one row per minute", drained == 30 and n == 70)
+cur.execute("SELECT sqm1_sqm, rainsensor1_drops, create_time FROM sensors WHERE create_time = %s", [at(-6 * 65)])
+row = cur.fetchone()
+check("upsert merged, values numeric, datetime back", row == (19.0, 0.0, at(-6 * 65)))
+db = ingest.Database(backend)
+db.execute("SELECT 1")
+connection = db.database
+try:
+    db.execute("INSERT INTO sensors (create_time,nope) VALUES (%s,%s)", [at(1), 1])
+    check("no such column: raised on the same connection, not retried", False)
+except backend.OperationalError:
+    check("no such column: raised on the same connection, not retried", db.database is connection)
+unmapped = ingest.SensorIngest(storage.SQLiteStorage(os.path.join(tmp, "unmapped.sqlite")))
+for m in range(3):                                      # the heater files db_mapper does not know
+    unmapped.ingest("cloud-sensor-heater.rrd", ["heater"], ["N", "1"], now=at(60 * m))
+    unmapped.ingest("cloud-sensor-heater-detail.rrd", ["x", "y"], ["N", "1", "2"], now=at(60 * m + 1))
+    unmapped.ingest("sqm.rrd", ["sqm"], ["N", "19.0"], now=at(60 * m + 2))
+    unmapped.tick(at(60 * m + 10))
+rows = unmapped.db.execute("SELECT COUNT(*) FROM sensors WHERE sqm1_sqm = 19.0").fetchone()[0]
+check("an rrd file without sensors columns: skipped, logged once, rows still written", rows == 3
+      and unmapped.unmapped == {"Unknown DB_Unknown KEY"})
+unmapped.ingest("sqm.rrd", ["sqm"], ["N", "18.0"], now=at(300))
+unmapped.pending["nope"] = 1
+check("a rejected upsert is dropped, not retried", unmapped.flush() is False and not unmapped.pending)
+unmapped.ingest("sqm.rrd", ["sqm"], ["N", "18.5"], now=at(302))
+check("and the next one written", unmapped.flush() and unmapped.db.execute(
+    "SELECT sqm1_sqm FROM sensors WHERE create_time = %s", [at(300)]).fetchone() == (18.5,))
+
+# ---- safety evaluation on SQLite ----
+rules.db_connect(backend)
+rules.cache = latest_cache.LatestCache(tmp)          # never the live /dev/shm records
+(windows, events) = rules.all_past_windows()
+snapshot = rules.load_snapshot(NOW, windows, events)
+check("snapshot query runs on SQLite, previous row found across an id gap", snapshot["sensors_id"] == hi and snapshot["create_time"] == at(0)
+      and snapshot["sqm1_sqm"] == 19.5 and snapshot["previous"]["ups1_status"] == 0 and hi - lo == 71
+      and snapshot["last_open_ok"] is False and all(c == 0 for c in snapshot["windows"].values()))
+with contextlib.redirect_stdout(io.StringIO()):
+    (open_ok, reasons, event, roof_change) = rules.decide(snapshot, hi, False)
+rules.store_roof_status(NOW, hi, open_ok, reasons)
+rules.store_event(NOW, event)
+check("roof + event rows stored", open_ok is True and rules.load_snapshot(NOW, windows, events)["last_open_ok"] is True)
+state = safety_evaluator.EvaluatorState(os.path.join(tmp, "state.json"))
+state.recover(rules.db_cursor, NOW + datetime.timedelta(seconds=1))
+check("evaluator state recovered from SQLite", state.last_open_ok is True and state.events == {"opening": [NOW]})
+fresh = not state.stale(rules.db_cursor, NOW + datetime.timedelta(seconds=2))
+state.updated = NOW - datetime.timedelta(seconds=1)
+check("state older than the newest roof row is stale", fresh and state.stale(rules.db_cursor, NOW))
+(ok, why, when) = weather_status.get_weather_status(backend.connect().cursor())
+check("weather status query runs on SQLite", ok == 1 and why == reasons and when == NOW)
+try:
+    import backtest       # needs numpy
+    history = backtest.load_history(rules.db_cursor)
+    check("backtest history loads from SQLite", len(history["create_time"]) == 70)
+except ImportError:
+    print("(numpy not installed - skipping the backtest load)")
+
+# ---- benchmark: coalesced minute rows into SQLite ----
+bench = storage.SQLiteStorage(os.path.join(tmp, "bench.sqlite"))
+si = ingest.SensorIngest(bench)
+N = 2000
+t = time.time()
+for m in range(N):
+    for (db, keys, values) in GOOD:
+        si.ingest(db, keys, values, now=at(65 * m))
+    si.tick(at(65 * m + 10))
+rate = N / (time.time() - t)
+print("  {} minute rows ({} update lines) in {:.2f}s, {:.0f} rows/s".format(N, N * len(GOOD), N / rate, rate))
+check("SQLite ingest keeps up by orders of magnitude", rate > 200)
+
+print("\n{} passed, {} failed".format(PASS[0], FAIL[0]))
+sys.exit(1 if FAIL[0] else 0)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Unit test: the threshold sweep - grid parsing, memory-mapped history
+shared with the process pool, pool results equal to a direct backtest, ranked
+CSV and the rain-exposure metric. MySQLdb is stubbed, numpy is required.
+Run: python3 test_sweep.py"""
+import os, sys, types, csv, tempfile
+COLLECTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.modules["MySQLdb"] = types.ModuleType("MySQLdb")    # stub so import works w/o MySQLdb
+sys.path.insert(0, COLLECTOR)
+import numpy as np
+import backtest
+import sweep
+
+PASS = [0]; FAIL = [0]
+def check(name, cond):
+    print(("PASS " if cond else "FAIL ") + name); (PASS if cond else FAIL)[0] += 1
+
+# ---- grid ----
+grid = sweep.parse_grid(["required_baa_delta_t=11:15:2", "sqm_min=17,17.5"])
+check("start:stop:step is inclusive, lists parsed", grid == {"required_baa_delta_t": [11, 13, 15], "sqm_min": [17, 17.5]})
+check("combinations cover the product on top of the defaults",
+      len(list(sweep.combinations(grid))) == 6
+      and all(p["outlier_count_max"] == 5 for p in sweep.combinations(grid)))
+try:
+    sweep.parse_grid(["bogus=1"]); check("unknown grid key rejected", False)
+except ValueError:
+    check("unknown grid key rejected", True)
+
+# ---- synthetic history: clear nights with a cloudy / rainy spell ----
+rng = np.random.default_rng(3)
+n = 3000
+history = {"create_time": np.arange(n, dtype=np.int64) * 60}
+cloudy = (np.arange(n) // 200) % 3 == 1
+history["sqm1_sqm"] = np.where(cloudy, 16.0, 18.5) + rng.normal(0, 0.3, n)
+history["rainsensor1_drops"] = np.where(cloudy & (rng.random(n) < 0.2), 4.0, 0.0)
+history["ups1_status"] = np.ones(n)
+history["ups1_bcharge"] = np.full(n, 100.0)
+history["BAA1_temperature_sensor"] = np.full(n, 10.0)
+history["BAA1_temperature_sky"] = np.where(cloudy, 4.0, -6.0) + rng.normal(0, 2, n)
+history["BCC1_temperature_sensor"] = np.full(n, 10.0)
+history["BCC1_temperature_sky"] = np.where(cloudy, 4.0, -5.0) + rng.normal(0, 2, n)
+
+with tempfile.TemporaryDirectory() as d:
+    sweep.write_history_dir(history, d)
+    mapped = sweep.read_history_dir(d)
+    check("history columns are memory-mapped read-only",
+          isinstance(mapped["sqm1_sqm"], np.memmap) and not mapped["sqm1_sqm"].flags.writeable)
+    results = sweep.sweep(d, grid, processes=2, chunksize=2)
+
+check("every combination evaluated", len(results) == 6)
+check("ranked best score first", [m["score"] for _, m in results] == sorted((m["score"] for _, m in results), reverse=True))
+(params, metrics) = results[-1]
+direct = backtest.backtest(history, params)
+check("pool result equals a direct backtest",
+      (metrics["hours_open"], metrics["openings"], metrics["closings"])
+      == (direct["hours_open"], direct["openings"], direct["closings"]))
+check("the sweep saw the roof open", max(m["hours_open"] for _, m in results) > 0)
+
+open_ok = np.array([True, True, False, False])
+h = {"create_time": np.array([0, 60, 120, 180]), "rainsensor1_drops": np.array([0.0, 3.0, 3.0, 0.0])}
+check("rain hours: open by the previous verdict when drops arrive", sweep.rain_hours(h, open_ok) == 120 / 3600.0)
+
+with tempfile.TemporaryDirectory() as d:
+    path = os.path.join(d, "sweep.csv")
+    sweep.write_results(results, grid, path)
+    with open(path) as f:
+        rows = list(csv.DictReader(f))
+check("results CSV ranked with metrics and swept parameters",
+      [r["rank"] for r in rows] == ["1", "2", "3", "4", "5", "6"]
+      and set(rows[0]) >= {"score", "hours_open", "closings", "rain_hours", "sqm_min", "required_baa_delta_t"})
+
+print("\n{} passed, {} failed".format(PASS[0], FAIL[0]))
+sys.exit(1 if FAIL[0] else 0)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Unit test: weather_safety_service on a SQLite database - pooled
+connections reused and dropped after an error, the response encoded once per
+verdict and re-encoded when a new one lands, ETag / If-None-Match answered
+with 304, the database asked at most once per DB_RECHECK when no fresh verdict
+is published, a verdict aged past MAX_AGE not served - plus a request
+benchmark. MySQLdb is stubbed, flask is required.
+Run: python3 test_weather_safety_service.py"""
+import os, sys, types, datetime, json, logging, tempfile, threading, time
+COLLECTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_mysqldb = types.ModuleType("MySQLdb")                  # stub so import works w/o MySQLdb
+class _Error(Exception): pass
+_mysqldb.Error = _Error
+_mysqldb.OperationalError = type("OperationalError", (_Error,), {})
+sys.modules["MySQLdb"] = _mysqldb
+sys.path.insert(0, COLLECTOR)
+import latest_cache
+import storage
+import weather_safety_service as wss
+logging.basicConfig(level=logging.CRITICAL)
+
+PASS = [0]; FAIL = [0]
+def check(name, cond):
+    print(("PASS " if cond else "FAIL ") + name); (PASS if cond else FAIL)[0] += 1
+
+tmp = tempfile.mkdtemp()
+NOW = latest_cache.utcnow().replace(microsecond=0)
+backend = storage.SQLiteStorage(os.path.join(tmp, "obs.sqlite"))
+conn = backend.connect()
+def verdict(t, open_ok, reasons):
+    conn.execute("INSERT INTO roof (create_time,sensors_id,open_ok,reasons) VALUES (%s,1,%s,%s)", [t, open_ok, reasons])
+    conn.commit()
+
+# ---- the pool ----
+pool = storage.ConnectionPool(backend, size=2)
+with pool.connection() as c1:
+    with pool.connection() as c2:
+        with pool.connection() as c3:
+            pass
+with pool.connection() as again:
+    pass
+check("idle connections reused, at most size kept", pool.opened == 3 and again in (c1, c2) and len(pool.idle) == 2)
+try:
+    with pool.connection() as broken:
+        raise backend.OperationalError("server has gone away")
+except backend.OperationalError:
+    pass
+check("a connection that raised is dropped", broken not in pool.idle and len(pool.idle) == 1)
+results = []
+def borrow():
+    with pool.connection() as c:
+        results.append(c.execute("SELECT COUNT(*) FROM roof").fetchone()[0])
+threads = [threading.Thread(target=borrow) for i in range(8)]
+for t in threads: t.start()
+for t in threads: t.join()
+check("pooled connections used from request threads", results == [0] * 8)
+
+# ---- the service, verdicts from the database ----
+wss.cache = latest_cache.LatestCache(tmp)
+wss.pool = storage.ConnectionPool(backend)
+QUERIES = []
+query = wss.query_weather_status
+wss.query_weather_status = lambda utcnow: QUERIES.append(utcnow) or query(utcnow)
+client = wss.FLASK_APP.test_client()
+verdict(NOW, 0, "Still too cloudy")
+r = client.get("/weather/safety")
+body = json.loads(r.data)
+etag = r.headers["ETag"]
+check("verdict served with an ETag", r.status_code == 200 and etag and body == {
+    "timestamp_utc": NOW.isoformat(), "roof_status": {"open_ok": 0, "reasons": "Still too cloudy"}})
+r2 = client.get("/weather/safety")
+check("encoded once, the DB asked once per DB_RECHECK", r2.data == r.data and wss.responses.encoded == 1
+      and len(QUERIES) == 1 and wss.pool.opened == 1)
+r = client.get("/weather/safety", headers={"If-None-Match": etag})
+check("If-None-Match: 304 without a body", r.status_code == 304 and r.data == b"" and r.headers["ETag"] == etag)
+verdict(NOW + datetime.timedelta(seconds=1), 1, "All sensors are go")
+wss._db_status[0] -= wss.DB_RECHECK
+r = client.get("/weather/safety", headers={"If-None-Match": etag})
+check("new verdict: re-encoded, new ETag", r.status_code == 200 and r.headers["ETag"] != etag
+      and json.loads(r.data)["roof_status"]["open_ok"] == 1 and wss.responses.encoded == 2 and len(QUERIES) == 2)
+wss._db_status[:] = [NOW, (1, "All sensors are go", NOW - wss.MAX_AGE)]
+check("a remembered verdict past MAX_AGE is not served",
+      json.loads(client.get("/weather/safety").data) == {"error": "Empty DB result"})
+
+# ---- the service, verdicts published by the evaluator ----
+wss._db_status[:] = [None, (None, None, None)]
+QUERIES.clear()
+wss.cache.publish("roof", {"create_time": NOW + datetime.timedelta(seconds=2), "sensors_id": 2, "open_ok": 0,
+                           "reasons": "Raining"})
+r = client.get("/weather/safety")
+check("published verdict: no DB", json.loads(r.data)["roof_status"]["reasons"] == "Raining" and not QUERIES)
+
+# ---- benchmark: cached requests ----
+N = 2000
+headers = {"If-None-Match": r.headers["ETag"]}
+t0 = time.time()
+for i in range(N):
+    client.get("/weather/safety")
+rate = N / (time.time() - t0)
+t0 = time.time()
+for i in range(N):
+    client.get("/weather/safety", headers=headers)
+rate_304 = N / (time.time() - t0)
+print("  {:.0f} requests/s, {:.0f} requests/s answered 304 (test client, one thread)".format(rate, rate_304))
+check("requests never touch the DB", not QUERIES and wss.responses.encoded == 4 and rate > 200)
+
+print("\n{} passed, {} failed".format(PASS[0], FAIL[0]))
+sys.exit(1 if FAIL[0] else 0)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Unit test: the threaded serve mode against the one-request-at-a-time
+development server under concurrent keep-alive load (request rate and p99 of
+a handler with a slow DB call, via http_load), connections reused (Werkzeug
+< 2.1), closed without keep-alive and after the idle timeout, the requests in
+flight finished at shutdown (and abandoned after the grace). Flask is required.
+Run: python3 test_wsgi_serve.py"""
+import os, sys, logging, socket, threading, time, urllib.request
+COLLECTOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, COLLECTOR)
+from flask import Flask
+from werkzeug.serving import make_server
+import http_load
+import wsgi_serve
+from importlib.metadata import version
+logging.basicConfig(level=logging.CRITICAL)
+logging.getLogger("werkzeug").setLevel(logging.CRITICAL)   # no access log
+
+# Werkzeug >= 2.1 closes every connection after the response
+KEEPS_ALIVE = tuple(int(v) for v in version("werkzeug").split(".")[:2]) < (2, 1)
+PASS = [0]; FAIL = [0]
+def check(name, cond):
+    print(("PASS " if cond else "FAIL ") + name); (PASS if cond else FAIL)[0] += 1
+
+app = Flask(__name__)
+HOLD = threading.Event()
+@app.route("/slow")
+def slow():
+    time.sleep(0.02)            # a DB round trip
+    return "ok"
+@app.route("/hold")
+def hold():
+    HOLD.wait(5)
+    return "held"
+
+def start(server, run):
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return ("http://127.0.0.1:{}".format(server.server_port), thread)
+
+# ---- before / after under load ----
+dev = make_server("127.0.0.1", 0, app, threaded=False)
+(url, thread) = start(dev, dev.serve_forever)
+before = http_load.run(url + "/slow", clients=8, duration=1.5)
+dev.shutdown(); dev.server_close()
+server = wsgi_serve.make_werkzeug_server(app, "127.0.0.1", 0)
+(url, thread) = start(server, lambda: wsgi_serve.run_werkzeug_server(server, grace=2))
+after = http_load.run(url + "/slow", clients=8, duration=1.5)
+for (name, r) in (("dev server", before), ("threaded", after)):
+    print("  {:10s} {requests} requests, {rate:.0f} req/s, p50 {p50_ms} ms, p99 {p99_ms} ms".format(name, **r))
+check("concurrent clients served side by side", after["rate"] > 3 * before["rate"]
+      and after["p99_ms"] < before["p99_ms"] / 2 and not after["errors"])
+check("all answered", after["statuses"] == {200: after["requests"]})
+if KEEPS_ALIVE:
+    check("keep-alive: one connection per client", after["connections"] == 8)
+
+# ---- idle timeout, graceful stop ----
+server.RequestHandlerClass.timeout = 0.3            # --timeout
+idle = socket.create_connection(("127.0.0.1", server.server_port))
+idle.settimeout(2)
+t0 = time.time()
+check("idle connection closed after the timeout", idle.recv(10) == b"" and 0.2 < time.time() - t0 < 1.5)
+idle.close()
+held = []
+client = threading.Thread(target=lambda: held.append(urllib.request.urlopen(url + "/hold", timeout=5).read()))
+client.start()
+time.sleep(0.2)
+server.shutdown()
+time.sleep(0.3)
+check("in-flight request still running after the stop", thread.is_alive() and server.inflight.active == 1)
+HOLD.set(); client.join(3); thread.join(3)
+check("finished before serve returned", held == [b"held"] and not thread.is_alive())
+try:
+    urllib.request.urlopen(url + "/slow", timeout=1)
+    refused = False
+except OSError:
+    refused = True
+check("no new connections after the stop", refused)
+
+HOLD.clear()
+server = wsgi_serve.make_werkzeug_server(app, "127.0.0.1", 0)
+(url, thread) = start(server, lambda: wsgi_serve.run_werkzeug_server(server, grace=0.3))
+client = threading.Thread(target=lambda: urllib.request.urlopen(url + "/hold", timeout=5).read(), daemon=True)
+client.start()
+time.sleep(0.2)
+t0 = time.time()
+server.shutdown(); thread.join(3)
+check("a hung request is left after the grace", 0.2 < time.time() - t0 < 1.5 and server.inflight.active == 1)
+HOLD.set()
+
+# ---- without keep-alive ----
+server = wsgi_serve.make_werkzeug_server(app, "127.0.0.1", 0, keep_alive=False)
+(url, thread) = start(server, lambda: wsgi_serve.run_werkzeug_server(server))
+r = http_load.run(url + "/slow", clients=2, duration=0.5)
+with urllib.request.urlopen(url + "/slow") as response:
+    closing = response.headers["Connection"]
+server.shutdown(); thread.join(3)
+check("--no_keep_alive: a connection per request", r["connections"] >= r["requests"] and closing == "close")
+
+if wsgi_serve.waitress is None:
+    try:
+        wsgi_serve.serve(app, server="waitress")
+        check("waitress missing is an error", False)
+    except RuntimeError:
+        check("waitress missing is an error", True)
+
+print("\n{} passed, {} failed".format(PASS[0], FAIL[0]))
+sys.exit(1 if FAIL[0] else 0)
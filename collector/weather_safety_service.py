@@ -1,13 +1,21 @@
 #!/usr/bin/env python3
 
-import configparser
+import argparse
+import datetime
+import hashlib
 import json
-from pathlib import Path
-import pymysql.cursors
-from flask import Flask
+import logging
+import os
+import sys
+import threading
+from flask import Flask, request
 
-CONFIG_FILE_IN_HOME = ".my.cnf.python"
-# example contents :
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import latest_cache
+import storage
+import wsgi_serve
+
+# example ~/.my.cnf.python contents (or a [storage] section, see storage.py):
 """
 [mysqlDB]
 host = database.domain
@@ -30,51 +38,62 @@ db   = weather
 
 FLASK_APP = Flask(__name__)
 
-config = configparser.ConfigParser()
-config.read(str(Path.home()) + '/' + CONFIG_FILE_IN_HOME)
-
+backend = storage.from_config()
+# The evaluator publishes every verdict it stores (latest_cache.py); a fresh
+# one is served without touching the database.
+cache = latest_cache.LatestCache()
+MAX_AGE = datetime.timedelta(seconds=120)
+# Without a fresh published verdict the database is asked, over a pooled
+# connection and at most once per DB_RECHECK however many clients poll.
+pool = storage.ConnectionPool(backend)
+DB_RECHECK = datetime.timedelta(seconds=5)
+_db_lock = threading.Lock()
+_db_status = [None, (None, None, None)]     # [asked at, (open_ok, reasons, create_time)]
 
-
-def get_weather_status():
-    connection = pymysql.connect(
-        host=config['mysqlDB']['host'],
-        port=int(config['mysqlDB']['port']),
-        user=config['mysqlDB']['user'],
-        passwd=config['mysqlDB']['pass'],
-        db=config['mysqlDB']['db'])
-#, cursorclass=pymysql.cursors.DictCursor)
-    #    return (None, None, None)
-    sql = """
+ROOF_STATUS_SQL = """
     SELECT open_ok, reasons, create_time
       FROM roof
-     WHERE create_time > DATE_SUB(UTC_TIMESTAMP(), INTERVAL 120 second)
+     WHERE create_time > %s
   ORDER BY create_time DESC
      LIMIT 1;
     """
-    try:
-        with connection.cursor() as db_cursor:
-            db_cursor.execute(sql)
-            db_result_tuple = db_cursor.fetchone()
-            if db_result_tuple is not None:
-                #        open_ok = True if db_result_tuple[0] == 1 else False
-                open_ok = db_result_tuple[0]
-                reasons = db_result_tuple[1]
-                create_time = db_result_tuple[2]
-            else:
-                open_ok = None
-                reasons = None
-                create_time = None
-    finally:
-        connection.close()
-#    open_ok = 1 # TEST TEST TEST
+
+
+def query_weather_status(utcnow):
+    with pool.connection() as connection:
+        db_cursor = connection.cursor()
+        db_cursor.execute(ROOF_STATUS_SQL, [utcnow - MAX_AGE])
+        db_result_tuple = db_cursor.fetchone()
+    if db_result_tuple is not None:
+        #        open_ok = True if db_result_tuple[0] == 1 else False
+        open_ok = db_result_tuple[0]
+        reasons = db_result_tuple[1]
+        create_time = db_result_tuple[2]
+    else:
+        open_ok = None
+        reasons = None
+        create_time = None
     return (open_ok, reasons, create_time)
 
 
-@FLASK_APP.route('/weather/safety', methods=['GET'])
-def weather_safety():
-    """ api call """
-    (open_ok, reasons, create_time) = get_weather_status()
+def get_weather_status():
+    utcnow = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+    record = cache.get("roof", MAX_AGE, utcnow)
+    if record is not None:
+        return (record["open_ok"], record["reasons"], record["create_time"])
+    #    return (None, None, None)
+    with _db_lock:          # concurrent requests wait for one query
+        (asked, status) = _db_status
+        if asked is None or not asked <= utcnow < asked + DB_RECHECK:
+            status = query_weather_status(utcnow)
+            _db_status[:] = [utcnow, status]
+    if status[2] is not None and status[2] <= utcnow - MAX_AGE:
+        return (None, None, None)
+#    open_ok = 1 # TEST TEST TEST
+    return status
 
+
+def encode_weather_status(open_ok, reasons, create_time):
     if open_ok is not None:
         create_time_formatted = create_time.isoformat()
         json_string = json.dumps({
@@ -89,11 +108,64 @@ def weather_safety():
         json_string = json.dumps({
             'error': 'Empty DB result',
         })
-    return(json_string)
+    return json_string.encode()
+
+
+class ResponseCache:
+    """The encoded body and ETag of the newest verdict, keyed on its
+    create_time: encoded once per verdict, not once per request."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.key = None
+        self.body = None
+        self.etag = None
+        self.encoded = 0
+
+    def get(self, status):
+        """(body, etag) for get_weather_status()'s result; no ETag for the
+        error body."""
+        (open_ok, reasons, create_time) = status
+        key = create_time if open_ok is not None else None
+        with self.lock:
+            if self.body is not None and key == self.key:
+                return (self.body, self.etag)
+        body = encode_weather_status(open_ok, reasons, create_time)
+        etag = hashlib.sha1(body).hexdigest()[:20] if key is not None else None
+        with self.lock:
+            (self.key, self.body, self.etag) = (key, body, etag)
+            self.encoded += 1
+        return (body, etag)
+
+
+responses = ResponseCache()
+
+
+@FLASK_APP.route('/weather/safety', methods=['GET'])
+def weather_safety():
+    """ api call """
+    (body, etag) = responses.get(get_weather_status())
+    if etag is not None and request.if_none_match.contains(etag):
+        response = FLASK_APP.response_class(status=304)
+    else:
+        response = FLASK_APP.response_class(body)
+    if etag is not None:
+        response.set_etag(etag)
+    return response
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(description="the roof safety verdict over HTTP: GET /weather/safety")
+    wsgi_serve.add_arguments(parser)
+    parser.add_argument('--debug', action='store_true', help='enable debug level verbosity')
+    return parser
 
 
 def main():
-    FLASK_APP.run(debug=False, host='0.0.0.0')
+    args = _build_parser().parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format="%(asctime)s %(levelname)-8s %(name)s %(message)s")
+    wsgi_serve.serve_args(FLASK_APP, args)
 
 
 if __name__ == "__main__":
@@ -1,12 +1,15 @@
 #!/usr/bin/env python3
 
-import configparser
+import datetime
 import json
-from pathlib import Path
-import pymysql as MySQLdb
+import os
+import sys
 
-CONFIG_FILE_IN_HOME = ".my.cnf.python"
-# example contents :
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import latest_cache
+import storage
+
+# example ~/.my.cnf.python contents (or a [storage] section, see storage.py):
 """
 [mysqlDB]
 host = database.domain
@@ -28,27 +31,37 @@ db   = weather
 """
 
 
-def db_connect(config):
-    db = MySQLdb.connect(
-        host=config['mysqlDB']['host'],
-        port=int(config['mysqlDB']['port']),
-        user=config['mysqlDB']['user'],
-        passwd=config['mysqlDB']['pass'],
-        db=config['mysqlDB']['db'])
+def db_connect(backend):
+    db = backend.connect()
     db_cursor = db.cursor()
     return db_cursor
 
 
-def get_weather_status(db_cursor):
-#    return (None, None, None)
-    sql = """
+ROOF_STATUS_SQL = """
     SELECT open_ok, reasons, create_time
       FROM roof
-     WHERE create_time > DATE_SUB(UTC_TIMESTAMP(), INTERVAL 520 second)
+     WHERE create_time > %s
   ORDER BY create_time DESC
      LIMIT 1;
     """
-    db_cursor.execute(sql)
+
+
+MAX_AGE = datetime.timedelta(seconds=520)
+
+
+def get_weather_status(db_cursor=None, cache=None):
+    """(open_ok, reasons, create_time) of the newest roof row within MAX_AGE:
+    from the latest_cache.py record when it is that fresh (no query), else
+    from the database (connecting only then, when no db_cursor is given)."""
+#    return (None, None, None)
+    utcnow = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+    record = cache.get("roof", MAX_AGE, utcnow) if cache is not None else None
+    if record is not None:
+        return (record["open_ok"], record["reasons"], record["create_time"])
+    if db_cursor is None:
+        db_cursor = db_connect(storage.from_config())
+    sql = ROOF_STATUS_SQL
+    db_cursor.execute(sql, [utcnow - MAX_AGE])
     db_result_tuple = db_cursor.fetchone()
     if db_result_tuple is not None:
 #        open_ok = True if db_result_tuple[0] == 1 else False
@@ -63,12 +76,7 @@ def get_weather_status(db_cursor):
 
 
 def main():
-    config = configparser.ConfigParser()
-    config.read(str(Path.home()) + '/' + CONFIG_FILE_IN_HOME)
-
-    db_cursor = db_connect(config)
-
-    (open_ok, reasons, create_time) = get_weather_status(db_cursor)
+    (open_ok, reasons, create_time) = get_weather_status(cache=latest_cache.LatestCache())
 
     if open_ok is not None:
         create_time_formatted = create_time.isoformat()
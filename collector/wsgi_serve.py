@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+wsgi_serve - run a Flask app on a concurrent WSGI server instead of app.run().
+
+app.run() is Werkzeug's development server: on the Flask 0.12 of rpi1 it
+serves one request at a time, so a dashboard polling while an INDI client
+waits on a mount check queues behind it (newer Flask threads it, still with
+no timeouts and no orderly stop). serve() runs the app on
+
+  * waitress, when it is installed: --threads worker threads behind an
+    asynchronous accept / keep-alive loop, so idle connections cost no thread,
+  * else Werkzeug's threaded server: a thread per connection, HTTP/1.1
+    keep-alive, a socket timeout so an idle or stalled client is dropped.
+    Werkzeug >= 2.1 closes every connection after its response (it drains
+    the socket, which would eat a next request); the 0.x of rpi1 keeps them.
+
+"Workers" are threads, not processes: roof/controller.py keeps the roof
+state (and the GPIO) in its one process.
+
+--timeout closes a connection idle (between keep-alive requests) or stalled
+that long; --no_keep_alive answers every request with Connection: close.
+SIGTERM / SIGINT stop accepting, give the requests in flight --grace seconds
+to finish and return from serve().
+
+Stays Python 3.5 compatible: roof/controller.py on rpi1 imports it too.
+"""
+
+import logging
+import signal
+import threading
+import time
+
+from werkzeug.serving import ThreadedWSGIServer, WSGIRequestHandler
+
+try:
+    import waitress
+except ImportError:
+    waitress = None
+
+logger = logging.getLogger("collector.wsgi_serve")
+
+SERVERS = ("auto", "waitress", "werkzeug", "dev")
+THREADS = 8             # waitress worker threads
+TIMEOUT = 30.0          # seconds an idle / stalled connection is kept
+GRACE = 10.0            # seconds in-flight requests get at shutdown
+
+
+class InFlight:
+    """WSGI middleware counting the requests being handled (for the
+    shutdown grace) and adding Connection: close without keep-alive."""
+
+    def __init__(self, app, keep_alive=True):
+        self.app = app
+        self.keep_alive = keep_alive
+        self.active = 0
+        self.served = 0
+        self.idle = threading.Condition()
+
+    def __call__(self, environ, start_response):
+        if not self.keep_alive:
+            def start_closing(status, headers, exc_info=None):
+                return start_response(status, list(headers) + [("Connection", "close")], exc_info)
+            respond = start_closing
+        else:
+            respond = start_response
+        with self.idle:
+            self.active += 1
+        try:
+            return self.app(environ, respond)
+        finally:
+            with self.idle:
+                self.active -= 1
+                self.served += 1
+                self.idle.notify_all()
+
+    def wait(self, timeout):
+        """Wait until no request is in flight. False if timeout passed first."""
+        deadline = time.monotonic() + timeout
+        with self.idle:
+            while self.active:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return False
+                self.idle.wait(left)
+        return True
+
+
+def make_werkzeug_server(app, host, port, timeout=TIMEOUT, keep_alive=True):
+    """Werkzeug's threaded server around InFlight(app) (server.inflight)."""
+    handler = type("RequestHandler", (WSGIRequestHandler,), {
+        "protocol_version": "HTTP/1.1" if keep_alive else "HTTP/1.0",
+        "timeout": timeout})
+    inflight = InFlight(app, keep_alive)
+    server = ThreadedWSGIServer(host, port, inflight, handler=handler)
+    server.inflight = inflight
+    return server
+
+
+def run_werkzeug_server(server, grace=GRACE):
+    """serve_forever() until shutdown() or SIGTERM / SIGINT, then drain."""
+    try:
+        server.serve_forever()
+    except (SystemExit, KeyboardInterrupt):
+        pass
+    finally:
+        server.server_close()
+    _drain(server.inflight, grace)
+
+
+def _drain(inflight, grace):
+    logger.info("stopped accepting, %d requests in flight", inflight.active)
+    if not inflight.wait(grace):
+        logger.warning("%d requests still running after %ss, leaving them", inflight.active, grace)
+
+
+def _raise_system_exit(signo, frame):
+    raise SystemExit(0)
+
+
+def serve(app, host="0.0.0.0", port=5000, server="auto", threads=THREADS, timeout=TIMEOUT,
+          keep_alive=True, grace=GRACE):
+    """Serve app until SIGTERM / SIGINT. Returns the server that ran."""
+    if server == "auto":
+        server = "waitress" if waitress is not None else "werkzeug"
+    if server == "dev":
+        app.run(debug=False, host=host, port=port)
+        return server
+    if server == "waitress" and waitress is None:
+        raise RuntimeError("waitress is not installed (pip3 install waitress)")
+    # A SIGTERM handler of the app's own (roof/controller.py) stays; it must
+    # end in SystemExit like this one.
+    if signal.getsignal(signal.SIGTERM) in (signal.SIG_DFL, None):
+        signal.signal(signal.SIGTERM, _raise_system_exit)
+    logger.info("serving on %s:%d with %s", host, port, server)
+    if server == "waitress":
+        inflight = InFlight(app, keep_alive)
+        # waitress.serve() handles SystemExit / KeyboardInterrupt itself:
+        # it closes the listener and shuts its task threads down.
+        waitress.serve(inflight, host=host, port=port, threads=threads, channel_timeout=timeout,
+                       ident="rolloffroof")
+        _drain(inflight, grace)
+    else:
+        run_werkzeug_server(make_werkzeug_server(app, host, port, timeout, keep_alive), grace)
+    return server
+
+
+def add_arguments(parser, port=5000):
+    """The serve options, on a service's own argument parser."""
+    parser.add_argument('--host', default='0.0.0.0', help='listen address (default %(default)s)')
+    parser.add_argument('--port', type=int, default=port, help='listen port (default %(default)s)')
+    parser.add_argument('--server', choices=SERVERS, default="auto",
+                        help='waitress, werkzeug (threaded), dev (app.run() as before) or auto: waitress if'
+                             ' installed (default %(default)s)')
+    parser.add_argument('--threads', type=int, default=THREADS,
+                        help='waitress worker threads (default %(default)s)')
+    parser.add_argument('--timeout', type=float, default=TIMEOUT,
+                        help='seconds an idle or stalled connection is kept (default %(default)s)')
+    parser.add_argument('--no_keep_alive', action='store_true', help='close the connection after every response')
+    parser.add_argument('--grace', type=float, default=GRACE,
+                        help='seconds in-flight requests get at shutdown (default %(default)s)')
+
+
+def serve_args(app, args):
+    """serve() with the add_arguments() options."""
+    return serve(app, args.host, args.port, args.server, args.threads, args.timeout,
+                 not args.no_keep_alive, args.grace)
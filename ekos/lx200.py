@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+lx200 - persistent LX200 session to the 10Micron mount.
+
+A one-shot query (connect, #:U2#, sleep, send, sleep, read, close) costs
+~400-500 ms, nearly all of it fixed sleeps. LX200 replies end in '#', so
+none are needed: this client keeps one connection open, sets ultra
+precision (#:U2#, no reply) once per connection, and reads each reply up
+to its terminator. Several queries are pipelined - sent back to back, the
+replies read in order - so Gstat + GA + GZ + GR + GD is one round trip.
+
+A connection the mount closed (or that sat idle longer than MAX_IDLE) is
+reopened transparently and the queries resent once; a mount that does not
+answer within the timeout raises socket.timeout. Meant for the '#'-
+terminated queries (Gstat, GA, GZ, GR, GD, ...), which are safe to resend.
+
+Shared by observatorylib (ekos/) and roof/controller.py +
+roof/is-the-mount-parked.py (rpi1): stays Python 3.5 compatible, stdlib only.
+
+    ./lx200.py '#:Gstat#' '#:GA#' '#:GZ#'
+"""
+
+import argparse
+import logging
+import socket
+import threading
+import time
+
+logger = logging.getLogger("observatory.lx200")
+
+MOUNT_HOST = "192.168.100.73"
+MOUNT_PORT = 3490
+TIMEOUT = 5.0
+MAX_IDLE = 300          # seconds; an older connection is reopened before use
+GSTAT_PARKED = "5#"
+
+
+class LX200:
+    """One persistent, lock-serialized LX200 session (thread safe)."""
+
+    def __init__(self, host=MOUNT_HOST, port=MOUNT_PORT, timeout=TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.connects = 0
+        self._sock = None
+        self._buf = b""
+        self._used = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        sock.sendall(b"#:U2#")          # ultra precision: GA/GZ as DD:MM:SS.SS (no reply)
+        self._sock = sock
+        self._buf = b""
+        self.connects += 1
+
+    def _close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _read_reply(self):
+        while b"#" not in self._buf:
+            data = self._sock.recv(256)
+            if not data:
+                raise ConnectionError("connection closed by the mount")
+            self._buf += data
+        (reply, _, self._buf) = self._buf.partition(b"#")
+        return reply.decode("ascii", "ignore").strip() + "#"
+
+    def query_many(self, commands):
+        """Send commands pipelined, return their replies in order ('5#').
+        Raises OSError (socket.timeout when the mount does not answer)."""
+        with self._lock:
+            if self._sock is not None and time.monotonic() - self._used > MAX_IDLE:
+                self._close()
+            for attempt in (1, 2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    self._sock.sendall("".join(commands).encode("ascii"))
+                    replies = [self._read_reply() for _ in commands]
+                    self._used = time.monotonic()
+                    return replies
+                except socket.timeout:
+                    self._close()
+                    raise
+                except OSError as e:
+                    self._close()
+                    if attempt == 2:
+                        raise
+                    logger.info("LX200 %s:%s: %s - reconnecting", self.host, self.port, e)
+
+    def query(self, command):
+        return self.query_many([command])[0]
+
+    def is_parked(self, gstat_parked=GSTAT_PARKED):
+        """Gstat == 5: parked (and the mount lock released)."""
+        return self.query("#:Gstat#") == gstat_parked
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pipelined LX200 queries to the mount")
+    parser.add_argument('commands', nargs='+', help="e.g. '#:Gstat#' '#:GA#'")
+    parser.add_argument('--host', default=MOUNT_HOST, help='mount address (default %(default)s)')
+    parser.add_argument('--port', type=int, default=MOUNT_PORT, help='LX200 port (default %(default)s)')
+    args = parser.parse_args()
+    t0 = time.monotonic()
+    replies = LX200(args.host, args.port).query_many(args.commands)
+    for (command, reply) in zip(args.commands, replies):
+        print("{} {}".format(command, reply))
+    print("{:.1f} ms".format((time.monotonic() - t0) * 1000))
+
+
+if __name__ == "__main__":
+    main()
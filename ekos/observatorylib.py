@@ -5,8 +5,9 @@ observatorylib - shared direct-INDI observatory control for the roll-off roof.
 Single source of truth for the safety-critical hardware operations, used by
 BOTH the Ekos scheduler sequence scripts (observatory-open / observatory-close)
 AND ekos_sentinel.py. Everything talks directly to the standalone INDI server
-(indi_getprop / indi_setprop) and, for the authoritative mount state, to the
-10Micron's own LX200 API - so it keeps working even when Ekos has stopped.
+(one persistent INDI XML connection, indi_getprop / indi_setprop as fallback)
+and, for the authoritative mount state, to the 10Micron's own LX200 API - so
+it keeps working even when Ekos has stopped.
 
 Design rules (learned from incident 2026-05-26):
   * Operations are IDEMPOTENT and VERIFY-FIRST: if already in the wanted state,
@@ -45,10 +46,13 @@ import threading
 import time
 from datetime import datetime, timezone
 from pathlib import Path
+from xml.etree import ElementTree
 
 import requests
 import yaml
 
+import lx200
+
 logger = logging.getLogger("observatory")
 
 # --------------------------------------------------------------------------
@@ -317,19 +321,278 @@ def is_shutdown_complete():
     return os.path.exists(SHUTDOWN_MARK_PATH)
 
 
+# --------------------------------------------------------------------------
+# Native INDI client: one persistent connection, a live property table
+# --------------------------------------------------------------------------
+INDI_PORT = 7624
+
+
+class IndiClient:
+    """Persistent INDI XML connection serving reads from a live property table.
+
+    indi_getprop / indi_setprop fork per call, open a fresh connection and wait
+    out the server's full property dump. This client connects once, sends
+    getProperties, and a reader thread parses the def*Vector / set*Vector /
+    delProperty stream incrementally into {(device, property): vector}, so a
+    read is a table lookup of the value the server last published. A property
+    the server has not defined, or has deleted (driver disconnected), reads as
+    None - exactly what a failing indi_getprop gives.
+
+    Right after connecting the dump is still arriving: a property not yet in
+    the table is waited for until the stream has been quiet for QUIET seconds
+    (at most SETTLE after connecting). A lost connection empties the table;
+    connect() retries it at most once per RECONNECT seconds.
+
+    Every def / set / delete of a property bumps its version, so a waiter
+    takes stamp() of the properties it watches and wait_change() blocks until
+    one of them is published anew (or the connection drops)."""
+
+    QUIET = 0.3
+    SETTLE = 2.0
+    RECONNECT = 5.0
+
+    def __init__(self, host, port=INDI_PORT, timeout=5):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.logger = logging.getLogger("observatory.indi")
+        self._cond = threading.Condition()      # guards everything below
+        self._props = {}
+        self._sent = {}                         # (device, property) -> members written, not yet published
+        self._versions = {}                     # (device, property) -> changes seen
+        self._generation = 0                    # connections dropped
+        self._sock = None
+        self._connected_at = 0
+        self._last_message = 0
+        self._last_attempt = None
+        self._send_lock = threading.Lock()
+
+    @property
+    def connected(self):
+        return self._sock is not None
+
+    def connect(self):
+        """Connect unless connected (or tried less than RECONNECT ago).
+        True when a live connection is up."""
+        with self._cond:
+            if self._sock is not None:
+                return True
+            now = time.monotonic()
+            if self._last_attempt is not None and now - self._last_attempt < self.RECONNECT:
+                return False
+            self._last_attempt = now
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            sock.sendall(b'<getProperties version="1.7"/>\n')
+        except OSError as e:
+            self.logger.warning("INDI %s:%s unreachable: %s", self.host, self.port, e)
+            return False
+        with self._cond:
+            self._sock = sock
+            self._props.clear()
+            self._sent.clear()
+            self._connected_at = self._last_message = time.monotonic()
+        threading.Thread(target=self._read_loop, args=(sock,), name="indi-reader", daemon=True).start()
+        self.logger.info("INDI connected to %s:%s", self.host, self.port)
+        return True
+
+    def close(self):
+        sock = self._sock
+        if sock is not None:
+            self._drop(sock)
+
+    def _drop(self, sock):
+        with self._cond:
+            if self._sock is sock:
+                self._sock = None
+                self._props.clear()
+                self._generation += 1
+                self._cond.notify_all()
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+    def _read_loop(self, sock):
+        # The INDI stream is a sequence of top-level elements with no document
+        # root: feed one, and handle (then discard) each of its children.
+        parser = ElementTree.XMLPullParser(("start", "end"))
+        parser.feed(b"<indi>")
+        root = None
+        depth = 0
+        reason = "closed by the server"
+        try:
+            while True:
+                try:
+                    data = sock.recv(65536)
+                except socket.timeout:
+                    continue
+                if not data:
+                    break
+                parser.feed(data)
+                for (event, elem) in parser.read_events():
+                    if event == "start":
+                        depth += 1
+                        if root is None:
+                            root = elem
+                        continue
+                    depth -= 1
+                    if depth == 1:
+                        self._handle(elem)
+                        root.clear()
+        except (OSError, ElementTree.ParseError) as e:
+            reason = e
+        if self._sock is sock:          # not close()d
+            self.logger.warning("INDI connection to %s:%s lost: %s", self.host, self.port, reason)
+        self._drop(sock)
+
+    def _handle(self, elem):
+        tag = elem.tag
+        key = (elem.get("device"), elem.get("name"))
+        with self._cond:
+            self._last_message = time.monotonic()
+            if tag.startswith("def") and tag.endswith("Vector"):
+                self._props[key] = {"type": tag[3:-6], "perm": elem.get("perm", "ro"),
+                                    "state": elem.get("state"),
+                                    "values": {c.get("name"): (c.text or "").strip() for c in elem}}
+            elif tag.startswith("set") and tag.endswith("Vector"):
+                vector = self._props.get(key)
+                if vector is None:
+                    return
+                if elem.get("state"):
+                    vector["state"] = elem.get("state")
+                for c in elem:
+                    if c.get("name") in vector["values"]:
+                        vector["values"][c.get("name")] = (c.text or "").strip()
+            elif tag == "delProperty":
+                if key[1]:
+                    self._props.pop(key, None)
+                else:
+                    for k in [k for k in self._props if k[0] == key[0]]:
+                        del self._props[k]
+                        self._versions[k] = self._versions.get(k, 0) + 1
+            else:
+                return          # message, getProperties, ...
+            self._sent.pop(key, None)
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self._cond.notify_all()
+
+    @staticmethod
+    def _key(spec):
+        parts = spec.rsplit(".", 2)
+        return (parts[0], parts[1]) if len(parts) == 3 else None
+
+    def stamp(self, specs):
+        """Change stamp of the properties of specs ('device.property.element')."""
+        with self._cond:
+            return self._stamp(specs)
+
+    def _stamp(self, specs):
+        return (self._generation,) + tuple(self._versions.get(self._key(s), 0) for s in specs)
+
+    def wait_change(self, specs, stamp, timeout):
+        """Block until a property of specs is published after stamp() returned
+        stamp, the connection drops, or timeout passes. True unless timed out."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._stamp(specs) == stamp:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return False
+                self._cond.wait(left)
+            return True
+
+    def _lookup(self, device, name):
+        """The vector, waiting while the initial dump may still bring it.
+        Called with _cond held."""
+        while True:
+            vector = self._props.get((device, name))
+            if vector is not None or self._sock is None:
+                return vector
+            wait = min(self._last_message + self.QUIET, self._connected_at + self.SETTLE) - time.monotonic()
+            if wait <= 0:
+                return None
+            self._cond.wait(wait)
+
+    def get(self, spec, write_only=False):
+        """Value of 'device.property.element' as `indi_getprop -1` prints it
+        (element _STATE: the property state), or None when not defined.
+        Write-only properties are hidden unless write_only (indi_getprop -w)."""
+        with self._cond:
+            return self._get(spec, write_only)
+
+    def get_many(self, specs, write_only=False):
+        """{spec: get(spec)} read from one consistent view of the table."""
+        with self._cond:
+            return {spec: self._get(spec, write_only) for spec in specs}
+
+    def _get(self, spec, write_only):
+        try:
+            (device, name, element) = spec.rsplit(".", 2)
+        except ValueError:
+            return None
+        vector = self._lookup(device, name)
+        if vector is None:
+            return None
+        if element == "_STATE":
+            return vector["state"]
+        if vector["perm"] == "wo" and not write_only:
+            return None
+        return vector["values"].get(element)
+
+    def set(self, spec, value):
+        """Send 'device.property.element=value' like indi_setprop: a switch
+        sends just that member, a number / text vector all its members (the
+        others at their current values, or as last written while the server
+        has not published the vector since - so back-to-back writes of two
+        members do not undo each other). False if the property is not
+        defined, read-only, or the send failed."""
+        try:
+            (device, name, element) = spec.rsplit(".", 2)
+        except ValueError:
+            return False
+        with self._cond:
+            vector = self._lookup(device, name)
+            if (vector is None or element not in vector["values"] or vector["perm"] == "ro"
+                    or vector["type"] not in ("Switch", "Number", "Text")):
+                return False
+            if vector["type"] == "Switch":
+                members = {element: str(value)}
+            else:
+                members = dict(vector["values"])
+                members.update(self._sent.get((device, name), {}))
+                members[element] = str(value)
+                self._sent[(device, name)] = members
+            kind = vector["type"]
+            sock = self._sock
+        new = ElementTree.Element("new{}Vector".format(kind), device=device, name=name)
+        for (member, text) in members.items():
+            ElementTree.SubElement(new, "one{}".format(kind), name=member).text = text
+        try:
+            with self._send_lock:
+                sock.sendall(ElementTree.tostring(new) + b"\n")
+            return True
+        except OSError as e:
+            self.logger.warning("INDI send %s failed: %s", spec, e)
+            self._drop(sock)
+            return False
+
+
 # --------------------------------------------------------------------------
 # Observatory: direct-INDI + LX200 hardware control
 # --------------------------------------------------------------------------
 class Observatory:
     """Idempotent, verify-first, retried hardware operations.
 
-    INDI control via indi_getprop/indi_setprop against `indi_host`. Authoritative
+    INDI control over one persistent IndiClient connection to `indi_host`
+    (indi_getprop/indi_setprop while that is unavailable). Authoritative
     mount state via the 10Micron LX200 API (host/port from config, default
     192.168.100.73:3490) - independent of the INDI server.
     """
 
     def __init__(self, indi_host, config, dry_run=False, reporter=None, name=None):
         self.indi_host = config.get("connections.indi_host", indi_host)
+        self.indi_port = int(config.get("connections.indi_port", INDI_PORT))
         self.config = config
         self.dry_run = dry_run
         # Source identity for reports: explicit name > config override > script basename.
@@ -352,6 +615,13 @@ class Observatory:
         self.cap_close_timeout = config.get("timeouts.cap_close", 60)
         self.retry_delay = config.get("safety.retry_delay", 5)
 
+        # Native INDI (connections.indi_native, default on): reads come from the
+        # live property table of one persistent connection, opened on first use.
+        # The indi_getprop/indi_setprop subprocesses remain the fallback while
+        # that connection is down.
+        self.indi = (IndiClient(self.indi_host, self.indi_port, self.cmd_timeout)
+                     if config.get("connections.indi_native", True) else None)
+
         # Optional 10Micron LX200 enhancement (INDI-bypass). DISABLED unless
         # mount.lx200.host is configured, so the generic/public path is pure
         # INDI. Used judiciously: as the definitive confirm at the close-roof
@@ -361,38 +631,78 @@ class Observatory:
         self.lx200_port = int(config.get("indi.mount.lx200.port", 3490))
         self.lx200_gstat_parked = config.get("indi.mount.lx200.gstat_parked", "5#")
         self.lx200_enabled = bool(self.lx200_host)
+        # One persistent session (opened on first use), not a connection per query.
+        self.lx200 = lx200.LX200(self.lx200_host, self.lx200_port, self.cmd_timeout) if self.lx200_enabled else None
 
     # ---- reporting passthrough ----
     def report(self, severity, title, body=None, state=None):
         return self.reporter.report(severity, title, body=body, state=state)
 
     # ---- low-level INDI ----
-    def _run(self, cmd):
+    def _run(self, cmd, check=True):
         try:
             return subprocess.run(shlex.split(cmd), stdout=subprocess.PIPE,
                                   stderr=subprocess.PIPE, universal_newlines=True,
-                                  timeout=self.cmd_timeout, check=True)
+                                  timeout=self.cmd_timeout, check=check)
         except subprocess.CalledProcessError as e:
             self.logger.debug("cmd failed [%s] rc=%s err=%s", cmd, e.returncode, e.stderr.rstrip())
             return None
         except subprocess.TimeoutExpired:
             self.logger.warning("cmd timed out [%s]", cmd)
             return None
+        except OSError as e:                    # e.g. the INDI tools are not installed
+            self.logger.warning("cmd failed [%s]: %s", cmd, e)
+            return None
 
-    def indi_get(self, prop):
+    def _indi_client(self):
+        """The connected native client, or None (use the subprocess tools)."""
+        if self.indi is not None and self.indi.connect():
+            return self.indi
+        return None
+
+    def indi_get(self, prop, write_only=False):
         """Return the property value as a string, or None if missing/in-transition.
-        A None return must never be read as a state - callers keep polling."""
-        ws = self._run("indi_getprop -h {} -1 '{}'".format(self.indi_host, prop))
-        if not ws:
-            return None
-        out = ws.stdout.rstrip()
-        return out if out != "" else None
+        A None return must never be read as a state - callers keep polling.
+        write_only: also see write-only properties (indi_getprop -w)."""
+        client = self._indi_client()
+        if client is not None:
+            out = client.get(prop, write_only)
+        else:
+            ws = self._run("indi_getprop -h {} -p {} {}-1 '{}'".format(
+                self.indi_host, self.indi_port, "-w " if write_only else "", prop))
+            if not ws:
+                return None
+            out = ws.stdout.rstrip()
+        return out if out else None
+
+    def indi_get_many(self, props, write_only=False):
+        """{prop: value} for several properties in one round trip - one look
+        at the live property table, or one indi_getprop for all of them (its
+        'dev.prop.elem=value' lines; a property it cannot find does not fail the
+        others). Values follow indi_get: None means missing/in-transition."""
+        props = list(props)
+        client = self._indi_client()
+        if client is not None:
+            values = client.get_many(props, write_only)
+        else:
+            values = dict.fromkeys(props)
+            ws = self._run("indi_getprop -h {} -p {} {}{}".format(
+                self.indi_host, self.indi_port, "-w " if write_only else "",
+                " ".join(shlex.quote(p) for p in props)), check=False)
+            for line in (ws.stdout.splitlines() if ws else ()):
+                (prop, sep, value) = line.partition("=")
+                if sep and prop in values:
+                    values[prop] = value.rstrip()
+        return {p: (v if v else None) for (p, v) in values.items()}
 
     def indi_set(self, prop, value):
         if self.dry_run:
             self.logger.info("[dry-run] would set %s=%s", prop, value)
             return True
-        ws = self._run("indi_setprop -h {} '{}={}'".format(self.indi_host, prop, value))
+        client = self._indi_client()
+        if client is not None:
+            return client.set(prop, value)
+        ws = self._run("indi_setprop -h {} -p {} '{}={}'".format(self.indi_host, self.indi_port, prop, value))
         return bool(ws) and ws.returncode == 0
 
     # ---- device connection (Ekos-independent) ----
@@ -437,7 +747,8 @@ class Observatory:
         self.logger.warning("INDI device '%s' disconnected - connecting", device)
         self.indi_set("{}.CONNECTION.CONNECT".format(device), "On")
         return self._wait_until(lambda: self.is_device_connected(device) is True,
-                                timeout or self.config.get("timeouts.device_connect", 15))
+                                timeout or self.config.get("timeouts.device_connect", 15),
+                                watch=["{}.CONNECTION.CONNECT".format(device)])
 
     def safety_devices(self):
         """Devices the sentinel must keep connected to READ/ACT on safety: weather,
@@ -486,40 +797,37 @@ class Observatory:
 
     # ---- mount LX200 (authoritative) ----
     def mount_lx200(self, command):
-        """One-shot LX200 query to the mount (10Micron-specific INDI-bypass).
-        Returns response string, or None if LX200 is not configured / fails.
-        Sets Ultra-Precision mode first so GA/GZ come back as DD:MM:SS.SS."""
-        if not self.lx200_enabled:
-            return None
+        """LX200 query to the mount (10Micron-specific INDI-bypass). Returns
+        the response string, or None if LX200 is not configured / fails. The
+        session (lx200.LX200) is in Ultra-Precision mode, so GA/GZ come back
+        as DD:MM:SS.SS."""
+        return self.mount_lx200_many([command])[0]
+
+    def mount_lx200_many(self, commands):
+        """Several LX200 queries pipelined over the session (one round trip):
+        the list of responses, all None if LX200 is not configured / fails."""
+        if self.lx200 is None:
+            return [None] * len(commands)
         try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.settimeout(self.cmd_timeout)
-            s.connect((self.lx200_host, self.lx200_port))
-            s.sendall(b"#:U2#")            # ultra precision (no reply)
-            time.sleep(0.1)
-            s.sendall(command.encode())
-            time.sleep(0.3)
-            resp = b""
-            while b"#" not in resp:
-                chunk = s.recv(128)
-                if not chunk:
-                    break
-                resp += chunk
-            s.close()
-            return resp.decode("ascii", "ignore").strip()
+            return self.lx200.query_many(commands)
         except OSError as e:
-            self.logger.warning("LX200 %s failed: %s", command, e)
-            return None
+            self.logger.warning("LX200 %s failed: %s", " ".join(commands), e)
+            return [None] * len(commands)
 
     # ---- state readers ----
-    def is_parked(self):
+    def is_parked(self, values=None):
         """Generic INDI parked check (the routine path): PARK switch On + tracking
         off + (if a park DEC is configured) DEC within offset. DEC is the stable
         equatorial axis - RA drifts for a parked mount, so it can't be checked.
         Conservative: anything unconfirmable returns False, so a roof close is
         never attempted over a mount we can't verify. If INDI is unreachable AND
-        LX200 is configured, fall back to the definitive Gstat."""
-        park = self.indi_get(self.config.get("indi.mount.park_property"))
+        LX200 is configured, fall back to the definitive Gstat.
+
+        values: the readings of one indi_get_many() (state_snapshot); by
+        default its three properties are read in one batch."""
+        if values is None:
+            values = self.indi_get_many(self._mount_watch())
+        park = values.get(self.config.get("indi.mount.park_property"))
         if park is None:
             if self.lx200_enabled:
                 self.logger.warning("INDI park unreadable; falling back to LX200 Gstat")
@@ -529,14 +837,14 @@ class Observatory:
             return False
         track_prop = self.config.get("indi.mount.track_state_property")
         if track_prop:
-            tr = self.indi_get(track_prop)
+            tr = values.get(track_prop)
             if tr is not None and tr != self.config.get("indi.mount.track_state_setting"):
                 return False
         dec_prop = self.config.get("indi.mount.coord_dec_property")
         park_dec = self.config.get("indi.mount.coord_dec_park_position")
         max_off = self.config.get("indi.mount.coord_dec_max_offset")
         if dec_prop and park_dec is not None and max_off is not None:
-            dec = self.indi_get(dec_prop)
+            dec = values.get(dec_prop)
             if dec is None:
                 return False  # in transition / unreadable -> not confirmed
             try:
@@ -546,6 +854,11 @@ class Observatory:
                 return False
         return True
 
+    def _mount_watch(self):
+        """The properties is_parked() reads."""
+        return self._watch("indi.mount.park_property", "indi.mount.track_state_property",
+                           "indi.mount.coord_dec_property")
+
     def _lx200_parked(self):
         """Definitive 10Micron parked state via LX200 Gstat (INDI-bypass)."""
         return self.lx200_enabled and self.mount_lx200("#:Gstat#") == self.lx200_gstat_parked
@@ -560,14 +873,16 @@ class Observatory:
         return self.is_parked()
 
     def mount_altaz(self):
-        """(alt_deg, az_deg) from the mount, or (None, None)."""
-        return (_parse_dms(self.mount_lx200("#:GA#")), _parse_dms(self.mount_lx200("#:GZ#")))
+        """(alt_deg, az_deg) from the mount (one LX200 session), or (None, None)."""
+        (alt, az) = self.mount_lx200_many(["#:GA#", "#:GZ#"])
+        return (_parse_dms(alt), _parse_dms(az))
 
-    def is_roof_closed(self):
+    def is_roof_closed(self, values=None):
         """True=closed, False=positively open, None=UNKNOWN (dome unreadable).
         Callers MUST treat None as 'don't know' - never as open or closed. An
         absent INDI value means a disconnected/in-transition device, not a state."""
-        val = self.indi_get(self.config.get("indi.dome.park_property"))
+        prop = self.config.get("indi.dome.park_property")
+        val = values.get(prop) if values is not None else self.indi_get(prop)
         if val is None:
             return None
         return val == self.config.get("indi.dome.park_setting")
@@ -581,37 +896,57 @@ class Observatory:
             return None  # unknown
         return val == self.config.get("indi.cap.setting")
 
-    def is_weather_safe(self):
+    def _weather_props(self):
         prop = self.config.get("indi.weather.property")
-        ok = self.config.get("indi.weather.ok_setting")
-        stations = self.config.get("indi.weather.station_indexes", [1])
         if not prop:
-            return True
-        for st in stations:
-            if self.indi_get("{}_{}".format(prop, st)) != ok:
-                return False
-        return True
+            return []
+        return ["{}_{}".format(prop, st) for st in self.config.get("indi.weather.station_indexes", [1])]
+
+    def is_weather_safe(self, values=None):
+        """Every station reads ok_setting (all stations in one batch read)."""
+        props = self._weather_props()
+        if values is None:
+            values = self.indi_get_many(props)
+        ok = self.config.get("indi.weather.ok_setting")
+        return all(values.get(p) == ok for p in props)
 
-    def cooler_power(self):
+    def cooler_power(self, values=None):
         """Cooler power percent as float, or None if not queryable (the cooler
         switch itself reads blank via indi_getprop; power is the observable proxy)."""
         prop = self.config.get("indi.camera.cooler_power_property")
         if not prop:
             return None
-        val = self.indi_get(prop)
+        val = values.get(prop) if values is not None else self.indi_get(prop)
         try:
             return float(val) if val is not None else None
         except ValueError:
             return None
 
     # ---- helpers ----
-    def _wait_until(self, predicate, timeout):
-        """Poll predicate() once/sec until truthy or timeout. Returns final bool."""
+    WATCH_RECHECK = 5   # s; event-driven waits still re-check this often (LX200, clock)
+
+    def _watch(self, *keys):
+        """The configured property specs of these config keys (watch=, batch reads)."""
+        return [p for p in (self.config.get(k) for k in keys) if p]
+
+    def _wait_until(self, predicate, timeout, watch=()):
+        """Wait until predicate() is truthy or timeout. Returns final bool.
+
+        watch: the property specs the predicate reads. Over a live INDI
+        connection the predicate is re-checked as soon as one of them is
+        published (e.g. DOME_PARK.PARK=On), and at least every WATCH_RECHECK
+        seconds for what it reads elsewhere. Without watch or a connection it
+        polls once/sec."""
         deadline = time.time() + timeout
         while time.time() < deadline:
+            client = self._indi_client() if watch else None
+            stamp = client.stamp(watch) if client else None     # before reading: no missed change
             if predicate():
                 return True
-            time.sleep(1)
+            if client is not None:
+                client.wait_change(watch, stamp, min(self.WATCH_RECHECK, max(0, deadline - time.time())))
+            else:
+                time.sleep(1)
         return predicate()
 
     # ---- operations (idempotent, verify-first, command RE-ISSUED on retry) ----
@@ -624,7 +959,7 @@ class Observatory:
         for attempt in range(1, self.max_retries + 1):
             self.logger.warning("park mount (attempt %d/%d)", attempt, self.max_retries)
             self.indi_set(prop, setting)                 # RE-ISSUE each attempt
-            if self._wait_until(self.is_parked, self.mount_park_timeout):
+            if self._wait_until(self.is_parked, self.mount_park_timeout, watch=self._mount_watch()):
                 self.logger.info("mount parked")
                 return True
             self.logger.warning("park did not complete (aborted mid-slew?), retrying")
@@ -642,7 +977,7 @@ class Observatory:
         for attempt in range(1, self.max_retries + 1):
             self.logger.warning("unpark mount (attempt %d/%d)", attempt, self.max_retries)
             self.indi_set(prop, unpark)
-            if self._wait_until(lambda: not self.is_parked(), self.mount_park_timeout):
+            if self._wait_until(lambda: not self.is_parked(), self.mount_park_timeout, watch=self._mount_watch()):
                 return True
             if attempt < self.max_retries:
                 time.sleep(self.retry_delay)
@@ -667,7 +1002,8 @@ class Observatory:
         for attempt in range(1, self.max_retries + 1):
             self.logger.warning("close roof (attempt %d/%d)", attempt, self.max_retries)
             self.indi_set(prop, setting)                 # RE-ISSUE each attempt
-            if self._wait_until(lambda: self.is_roof_closed() is True, self.roof_close_timeout):
+            if self._wait_until(lambda: self.is_roof_closed() is True, self.roof_close_timeout,
+                                watch=self._watch("indi.dome.park_property")):
                 self.logger.info("roof closed")
                 return True
             # If a transient race recurred, re-confirm the mount is still parked
@@ -689,7 +1025,8 @@ class Observatory:
         for attempt in range(1, self.max_retries + 1):
             self.logger.warning("open roof (attempt %d/%d)", attempt, self.max_retries)
             self.indi_set(prop, unpark)
-            if self._wait_until(lambda: self.is_roof_closed() is False, self.roof_close_timeout):
+            if self._wait_until(lambda: self.is_roof_closed() is False, self.roof_close_timeout,
+                                watch=self._watch("indi.dome.park_property")):
                 return True
             if attempt < self.max_retries:
                 time.sleep(self.retry_delay)
@@ -704,7 +1041,8 @@ class Observatory:
         for attempt in range(1, self.max_retries + 1):
             self.logger.warning("close cap (attempt %d/%d)", attempt, self.max_retries)
             self.indi_set(prop, setting)
-            if self._wait_until(lambda: self.is_cap_closed() is True, self.cap_close_timeout):
+            if self._wait_until(lambda: self.is_cap_closed() is True, self.cap_close_timeout,
+                                watch=self._watch("indi.cap.property")):
                 return True
             if attempt < self.max_retries:
                 time.sleep(self.retry_delay)
@@ -718,11 +1056,8 @@ class Observatory:
         prop = self.config.get("indi.camera.cooler_state_property")
         if not prop:
             return None
-        ws = self._run("indi_getprop -h {} -w -1 '{}'".format(self.indi_host, prop))
-        if not ws:
-            return None
-        out = ws.stdout.rstrip()
-        if out == "":
+        out = self.indi_get(prop, write_only=True)
+        if out is None:
             return None
         return (out.split("=", 1)[-1] if "=" in out else out).strip() == "On"
 
@@ -782,13 +1117,17 @@ class Observatory:
 
     def wait_camera_warm(self, threshold_c, timeout):
         """Poll until the sensor has warmed to >= threshold_c, or timeout."""
-        return self._wait_until(lambda: (self.camera_temperature() or -999) >= threshold_c, timeout)
+        return self._wait_until(lambda: (self.camera_temperature() or -999) >= threshold_c, timeout,
+                                watch=self._watch("indi.camera.temperature_property"))
 
     def state_snapshot(self):
-        """Live readings for state-aware reports."""
+        """Live readings for state-aware reports: every INDI property in one
+        batch read, alt/az in one LX200 session."""
+        values = self.indi_get_many(self._mount_watch() + self._weather_props()
+                                    + self._watch("indi.dome.park_property", "indi.camera.cooler_power_property"))
         alt, az = self.mount_altaz()
-        return {"mount_parked": self.is_parked(), "roof_closed": self.is_roof_closed(),
-                "weather_safe": self.is_weather_safe(), "cooler_power": self.cooler_power(),
+        return {"mount_parked": self.is_parked(values), "roof_closed": self.is_roof_closed(values),
+                "weather_safe": self.is_weather_safe(values), "cooler_power": self.cooler_power(values),
                 "alt": alt, "az": az}
 
     # ---- multi-night bootstrap layers (POSTPONED - stubs only) ----
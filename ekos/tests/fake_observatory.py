@@ -0,0 +1,658 @@
+#!/usr/bin/env python3
+"""
+fake_observatory - the observatory's INDI server and 10Micron LX200 port,
+simulated in pure Python, for offline tests and benchmarks.
+
+FakeIndiServer speaks the INDI XML protocol on a local port: it answers
+getProperties with def*Vector, applies new*Vector, and publishes every
+change as set*Vector / delProperty to all clients - enough for IndiClient,
+indi_getprop / indi_setprop and Ekos itself. FakeObservatory runs the
+devices of the production config on it:
+
+  * 10micron: TELESCOPE_PARK, TELESCOPE_TRACK_STATE, EQUATORIAL_EOD_COORD.
+    Like the real driver, PARK reads On as soon as the park starts; DEC
+    slews to the park position over park_time. Tracking stops on park and
+    restarts on unpark (unpark_time).
+  * Dome Scripting Gateway: DOME_PARK, moving for roof_time. Refuses to park
+    (DOME_PARK Alert) unless the mount is parked (Gstat 5), like the
+    gateway's mount-policy interlock.
+  * Weather Meta: WEATHER_STATUS lights STATION_STATUS_<n> (set_weather()).
+  * ZWO CCD ASI2600MM Pro: CCD_COOLER (write-only), CCD_COOLER_POWER,
+    CCD_TEMPERATURE (write: the setpoint, which enables the cooler),
+    CCD_TEMP_RAMP. The temperature moves cool_rate degC/s toward the setpoint
+    (the TEC cannot warm above ambient). While RAMP_SLOPE > 0 and the setpoint
+    is not reached, the ramp loop re-enables a cooler switched off after
+    ramp_reenable seconds, like CCD::checkTemperatureTarget.
+
+Every device has a CONNECTION switch; disconnecting deletes its other
+properties, connecting defines them again after connect_time.
+
+A matching LX200 endpoint answers #:U2# (no reply), #:Gstat# (0 tracking,
+2 parking, 3 unparking, 5 parked, 7 stopped), #:GA#, #:GZ#, #:GR#, #:GD#.
+
+Faults, set on the instance at any time:
+  park_aborts     the next n parks stop halfway (PARK back Off, Alert)
+  dome_refusals   the next n roof closes are refused although the mount is parked
+  dome_vanishes   DOME_PARK is deleted while the roof moves (the gateway's
+                  park.py / open.py transient), defined again when it stops
+  lx200_mute      the LX200 port reads commands but never answers
+and disconnect(device), drop_clients() (an indiserver restart as clients
+see it), set_weather().
+
+Run standalone on the real ports, then point the observatory code at it:
+
+    ./fake_observatory.py --config_out /tmp/fake.yaml
+    ../ekos_sentinel.py --indi_host 127.0.0.1 --config /tmp/fake.yaml --state
+"""
+
+import argparse
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from xml.etree import ElementTree
+
+import yaml
+
+logger = logging.getLogger("fake_observatory")
+
+PRODUCTION_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                 "ekos_sentinel_config_production.yaml")
+
+MOUNT = "10micron"
+DOME = "Dome Scripting Gateway"
+WEATHER = "Weather Meta"
+CAMERA = "ZWO CCD ASI2600MM Pro"
+
+PARK_DEC = 39.0
+OBSERVE_DEC = 20.0
+PARK_ALTAZ = (5.0, 0.0)
+OBSERVE_ALTAZ = (45.0, 180.0)
+AMBIENT = 15.0          # degC
+MAX_DELTA = 35.0        # degC the TEC can cool below ambient at 100%
+
+
+def _text(value):
+    if isinstance(value, bool):
+        return "On" if value else "Off"
+    if isinstance(value, float):
+        return "{:g}".format(round(value, 6))
+    return str(value)
+
+
+class FakeIndiServer:
+    """INDI XML server over a property table {(device, name): vector}.
+
+    A client's new*Vector goes to on_new(device, name, {member: text}) under
+    the lock; when that returns False (or there is no on_new) it is applied
+    as is: members set, a OneOfMany switch's other members Off, state Ok."""
+
+    def __init__(self, host="127.0.0.1", port=0, on_new=None):
+        self.lock = threading.RLock()
+        self.on_new = on_new
+        self.props = {}
+        self.clients = []
+        self.accepted = 0
+        self.received = 0           # new*Vector messages
+        self.listener = socket.socket()
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((host, port))
+        self.listener.listen(8)
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self._accept, name="fake-indi", daemon=True).start()
+
+    # ---- the property table ----
+    def define(self, device, name, kind, members, perm="rw", state="Idle", rule="OneOfMany"):
+        """(Re)define a vector; members: [(name, value)]. kind: Switch, Number,
+        Text or Light."""
+        with self.lock:
+            self.props[(device, name)] = {"kind": kind, "perm": perm, "state": state, "rule": rule,
+                                          "values": dict((m, _text(v)) for (m, v) in members)}
+            self._broadcast(self._def_xml(device, name))
+
+    def update(self, device, name, state=None, **values):
+        """Change members / state; published only if something changed."""
+        with self.lock:
+            vector = self.props.get((device, name))
+            if vector is None:
+                return
+            changed = {m: _text(v) for (m, v) in values.items() if vector["values"].get(m) != _text(v)}
+            if not changed and (state is None or state == vector["state"]):
+                return
+            vector["values"].update(changed)
+            if state is not None:
+                vector["state"] = state
+            elem = ElementTree.Element("set{}Vector".format(vector["kind"]), device=device, name=name,
+                                       state=vector["state"])
+            for (member, text) in changed.items():
+                ElementTree.SubElement(elem, "one{}".format(vector["kind"]), name=member).text = text
+            self._broadcast(elem)
+
+    def delete(self, device, name=None):
+        with self.lock:
+            for key in [k for k in self.props if k[0] == device and name in (None, k[1])]:
+                del self.props[key]
+            elem = ElementTree.Element("delProperty", device=device)
+            if name:
+                elem.set("name", name)
+            self._broadcast(elem)
+
+    def value(self, device, name, member):
+        with self.lock:
+            vector = self.props.get((device, name))
+            return vector["values"].get(member) if vector else None
+
+    def state(self, device, name):
+        with self.lock:
+            vector = self.props.get((device, name))
+            return vector["state"] if vector else None
+
+    def _def_xml(self, device, name):
+        vector = self.props[(device, name)]
+        elem = ElementTree.Element("def{}Vector".format(vector["kind"]), device=device, name=name,
+                                   label=name, group="Main Control", state=vector["state"], timeout="60")
+        if vector["kind"] != "Light":
+            elem.set("perm", vector["perm"])
+        if vector["kind"] == "Switch":
+            elem.set("rule", vector["rule"])
+        for (member, text) in vector["values"].items():
+            ElementTree.SubElement(elem, "def{}".format(vector["kind"]), name=member, label=member).text = text
+        return elem
+
+    # ---- clients ----
+    def _accept(self):
+        while True:
+            try:
+                (conn, _) = self.listener.accept()
+            except OSError:
+                return          # stop()ped
+            conn.settimeout(5)
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self.lock:
+                self.accepted += 1
+                self.clients.append(conn)
+            threading.Thread(target=self._serve, args=(conn,), name="fake-indi-client", daemon=True).start()
+
+    def _serve(self, conn):
+        parser = ElementTree.XMLPullParser(("start", "end"))
+        parser.feed(b"<indi>")
+        (root, depth) = (None, 0)
+        try:
+            while True:
+                try:
+                    data = conn.recv(65536)
+                except socket.timeout:
+                    continue
+                if not data:
+                    break
+                parser.feed(data)
+                for (event, elem) in parser.read_events():
+                    depth += 1 if event == "start" else -1
+                    if root is None:
+                        root = elem
+                    if event == "end" and depth == 1:
+                        self._handle(conn, elem)
+                        root.clear()
+        except (OSError, ElementTree.ParseError):
+            pass
+        self._drop(conn)
+
+    def _handle(self, conn, elem):
+        with self.lock:
+            if elem.tag == "getProperties":
+                for (device, name) in list(self.props):
+                    if elem.get("device") in (None, device) and elem.get("name") in (None, name):
+                        self._send(conn, self._def_xml(device, name))
+                return
+            if not (elem.tag.startswith("new") and elem.tag.endswith("Vector")):
+                return
+            (device, name) = (elem.get("device"), elem.get("name"))
+            vector = self.props.get((device, name))
+            if vector is None or vector["perm"] == "ro":
+                return
+            self.received += 1
+            values = {c.get("name"): (c.text or "").strip() for c in elem if c.get("name") in vector["values"]}
+            if self.on_new is not None and self.on_new(device, name, values):
+                return
+            if vector["kind"] == "Switch" and vector["rule"] == "OneOfMany" and "On" in values.values():
+                on = [m for (m, v) in values.items() if v == "On"][0]
+                values = {m: m == on for m in vector["values"]}
+            self.update(device, name, state="Ok", **values)
+
+    def _send(self, conn, elem):
+        try:
+            conn.sendall(ElementTree.tostring(elem) + b"\n")
+        except OSError:
+            self._drop(conn)
+
+    def _broadcast(self, elem):
+        data = ElementTree.tostring(elem) + b"\n"
+        for conn in list(self.clients):
+            try:
+                conn.sendall(data)
+            except OSError:
+                self._drop(conn)
+
+    def _drop(self, conn):
+        with self.lock:
+            if conn in self.clients:
+                self.clients.remove(conn)
+        try:
+            conn.close()
+        except OSError:
+            pass
+
+    def drop_clients(self):
+        """Close every client connection (an indiserver restart, as seen by them)."""
+        with self.lock:
+            for conn in list(self.clients):
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                self._drop(conn)
+
+    def stop(self):
+        try:
+            self.listener.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.listener.close()
+        self.drop_clients()
+
+
+class FakeLX200:
+    """10Micron LX200 port: '#'-terminated replies from reply(command)."""
+
+    def __init__(self, reply, host="127.0.0.1", port=0):
+        self.reply = reply
+        self.mute = False
+        self.commands = 0
+        self.conns = []
+        self.listener = socket.socket()
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((host, port))
+        self.listener.listen(4)
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self._accept, name="fake-lx200", daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                (conn, _) = self.listener.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.conns.append(conn)
+            threading.Thread(target=self._serve, args=(conn,), name="fake-lx200-client", daemon=True).start()
+
+    def _serve(self, conn):
+        buf = ""
+        while True:
+            try:
+                data = conn.recv(256)
+            except OSError:
+                break
+            if not data:
+                break
+            buf += data.decode("ascii", "ignore")
+            for m in re.finditer(r":(\w+)#", buf):
+                self.commands += 1
+                answer = self.reply(m.group(1))
+                if answer is not None and not self.mute:
+                    try:
+                        conn.sendall(answer.encode("ascii"))
+                    except OSError:
+                        break
+            buf = buf[buf.rfind("#") + 1:]
+        if conn in self.conns:
+            self.conns.remove(conn)
+        conn.close()
+
+    def stop(self):
+        try:
+            self.listener.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.listener.close()
+        for conn in list(self.conns):
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def _dms(deg, signed=True, width=2):
+    sign = "-" if deg < 0 else "+"
+    total = round(abs(deg) * 36000)             # tenths of an arcsecond
+    (d, rest) = divmod(total, 36000)
+    (m, s10) = divmod(rest, 600)
+    return "{}{:0{}d}:{:02d}:{:04.1f}#".format(sign if signed else "", d, width, m, s10 / 10.0)
+
+
+class FakeObservatory:
+    """The production devices on a FakeIndiServer plus a FakeLX200, advanced
+    every tick seconds. Starts observing: roof open, mount unparked and
+    tracking, weather Ok, camera at ambient with the cooler off."""
+
+    def __init__(self, host="127.0.0.1", port=0, lx200_port=0, park_time=2.0, unpark_time=1.0,
+                 roof_time=2.0, connect_time=0.2, cool_rate=2.0, ramp_reenable=1.0, stations=1,
+                 tick=0.05):
+        self.park_time = park_time
+        self.unpark_time = unpark_time
+        self.roof_time = roof_time
+        self.connect_time = connect_time
+        self.cool_rate = cool_rate
+        self.ramp_reenable = ramp_reenable
+        self.stations = stations
+        self.tick = tick
+        # faults
+        self.park_aborts = 0
+        self.dome_refusals = 0
+        self.dome_vanishes = False
+
+        self.connected = {MOUNT: True, DOME: True, WEATHER: True, CAMERA: True}
+        self.gstat = 0
+        self.dec = OBSERVE_DEC
+        self.ra = 6.5
+        self.altaz = OBSERVE_ALTAZ
+        self.tracking = True
+        self.mount_motion = None
+        self.roof_closed = False
+        self.roof_motion = None
+        self.weather = ["Ok"] * stations
+        self.temperature = AMBIENT
+        self.setpoint = None
+        self.cooler_on = False
+        self.cooler_off_at = None
+        self.slope = 0.0
+        self.threshold = 0.2
+        self.commands = []          # (device, property, {member: text}) as received
+        self.parked_at = None       # monotonic time each transition finished
+        self.roof_closed_at = None
+        self._timers = []
+        self._stopped = threading.Event()
+
+        self.server = FakeIndiServer(host, port, on_new=self._on_new)
+        self.lock = self.server.lock
+        self.port = self.server.port
+        self.lx200 = FakeLX200(self._lx200_reply, host, lx200_port)
+        self.lx200_port = self.lx200.port
+        with self.lock:
+            for device in self.connected:
+                self.server.define(device, "CONNECTION", "Switch", [("CONNECT", True), ("DISCONNECT", False)],
+                                   state="Ok")
+                self._define(device)
+        threading.Thread(target=self._run, name="fake-observatory", daemon=True).start()
+
+    @property
+    def lx200_mute(self):
+        return self.lx200.mute
+
+    @lx200_mute.setter
+    def lx200_mute(self, mute):
+        self.lx200.mute = mute
+
+    # ---- device properties ----
+    def _define(self, device):
+        define = self.server.define
+        if device == MOUNT:
+            parked = self.gstat == 5 or (self.mount_motion or {}).get("kind") == "park"
+            define(MOUNT, "TELESCOPE_PARK", "Switch", [("PARK", parked), ("UNPARK", not parked)], state="Ok")
+            define(MOUNT, "TELESCOPE_TRACK_STATE", "Switch",
+                   [("TRACK_ON", self.tracking), ("TRACK_OFF", not self.tracking)], state="Ok")
+            define(MOUNT, "EQUATORIAL_EOD_COORD", "Number", [("RA", self.ra), ("DEC", self.dec)], state="Ok")
+        elif device == DOME:
+            define(DOME, "DOME_PARK", "Switch",
+                   [("PARK", self.roof_closed), ("UNPARK", not self.roof_closed)], state="Ok")
+        elif device == WEATHER:
+            define(WEATHER, "WEATHER_STATUS", "Light",
+                   [("STATION_STATUS_{}".format(i + 1), w) for (i, w) in enumerate(self.weather)], perm="ro",
+                   state=max(self.weather, key=("Idle", "Ok", "Busy", "Alert").index))
+        elif device == CAMERA:
+            define(CAMERA, "CCD_COOLER", "Switch", [("COOLER_ON", self.cooler_on),
+                                                    ("COOLER_OFF", not self.cooler_on)], perm="wo")
+            define(CAMERA, "CCD_COOLER_POWER", "Number", [("CCD_COOLER_VALUE", self._power())], perm="ro")
+            define(CAMERA, "CCD_TEMPERATURE", "Number", [("CCD_TEMPERATURE_VALUE", round(self.temperature, 2))])
+            define(CAMERA, "CCD_TEMP_RAMP", "Number", [("RAMP_SLOPE", self.slope),
+                                                       ("RAMP_THRESHOLD", self.threshold)])
+
+    def _update(self, device, name, state=None, **values):
+        if self.connected[device]:
+            self.server.update(device, name, state, **values)
+
+    def _power(self):
+        if not self.cooler_on:
+            return 0.0
+        return round(min(100.0, max(0.0, (AMBIENT - self.temperature) / MAX_DELTA * 100)), 1)
+
+    # ---- clients' commands ----
+    def _on_new(self, device, name, values):
+        self.commands.append((device, name, values))
+        if name == "CONNECTION":
+            if values.get("CONNECT") == "On" or values.get("DISCONNECT") == "Off":
+                if not self.connected[device]:
+                    self.server.update(device, "CONNECTION", state="Busy")
+                    self._later(self.connect_time, self._connect, device)
+            elif self.connected[device]:
+                self.disconnect(device)
+            return True
+        if device == MOUNT and name == "TELESCOPE_PARK":
+            if values.get("PARK") == "On" or values.get("UNPARK") == "Off":
+                self._start_park()
+            elif values.get("UNPARK") == "On" or values.get("PARK") == "Off":
+                self._start_unpark()
+            return True
+        if device == DOME and name == "DOME_PARK":
+            if values.get("PARK") == "On" or values.get("UNPARK") == "Off":
+                self._move_roof(True)
+            elif values.get("UNPARK") == "On" or values.get("PARK") == "Off":
+                self._move_roof(False)
+            return True
+        if device == CAMERA and name == "CCD_COOLER":
+            self._set_cooler(values.get("COOLER_ON") == "On" or values.get("COOLER_OFF") == "Off")
+            return True
+        if device == CAMERA and name == "CCD_TEMPERATURE":
+            self.setpoint = float(values["CCD_TEMPERATURE_VALUE"])
+            self._set_cooler(True)
+            self._update(CAMERA, "CCD_TEMPERATURE", state="Busy")
+            return True
+        if device == CAMERA and name == "CCD_TEMP_RAMP":
+            self.slope = float(values.get("RAMP_SLOPE", self.slope))
+            self.threshold = float(values.get("RAMP_THRESHOLD", self.threshold))
+        return False
+
+    def _start_park(self):
+        if self.gstat == 5:
+            self._update(MOUNT, "TELESCOPE_PARK", state="Ok")
+            return
+        abort = self.park_aborts > 0
+        self.park_aborts -= 1 if abort else 0
+        self.mount_motion = {"kind": "park", "t0": time.monotonic(), "time": self.park_time,
+                             "from": (self.dec, self.altaz), "to": (PARK_DEC, PARK_ALTAZ), "abort": abort}
+        self.gstat = 2
+        self.tracking = False
+        self._update(MOUNT, "TELESCOPE_TRACK_STATE", state="Ok", TRACK_ON=False, TRACK_OFF=True)
+        self._update(MOUNT, "TELESCOPE_PARK", state="Busy", PARK=True, UNPARK=False)
+
+    def _start_unpark(self):
+        if self.gstat != 5:
+            self._update(MOUNT, "TELESCOPE_PARK", state="Ok")
+            return
+        self.mount_motion = {"kind": "unpark", "t0": time.monotonic(), "time": self.unpark_time,
+                             "from": (self.dec, self.altaz), "to": (OBSERVE_DEC, OBSERVE_ALTAZ), "abort": False}
+        self.gstat = 3
+        self._update(MOUNT, "TELESCOPE_PARK", state="Busy", PARK=False, UNPARK=True)
+
+    def _move_roof(self, close):
+        if self.roof_motion is None and self.roof_closed == close:
+            self._update(DOME, "DOME_PARK", state="Ok")
+            return
+        if close and (self.gstat != 5 or self.dome_refusals > 0):
+            self.dome_refusals -= 1 if self.gstat == 5 else 0
+            logger.info("Cannot Park Dome when mount is locking")
+            self._update(DOME, "DOME_PARK", state="Alert")
+            return
+        self.roof_motion = {"close": close, "t0": time.monotonic()}
+        if self.dome_vanishes:
+            self.server.delete(DOME, "DOME_PARK")
+        else:
+            self._update(DOME, "DOME_PARK", state="Busy")
+
+    def _set_cooler(self, on):
+        self.cooler_on = on
+        self.cooler_off_at = None if on else time.monotonic()
+        self._update(CAMERA, "CCD_COOLER", state="Ok", COOLER_ON=on, COOLER_OFF=not on)
+
+    def _connect(self, device):
+        self.connected[device] = True
+        self.server.update(device, "CONNECTION", state="Ok", CONNECT=True, DISCONNECT=False)
+        self._define(device)
+
+    # ---- the simulation ----
+    def _later(self, delay, fn, *args):
+        self._timers.append((time.monotonic() + delay, fn, args))
+
+    def _run(self):
+        while not self._stopped.wait(self.tick):
+            with self.lock:
+                self._step(time.monotonic())
+
+    def _step(self, now):
+        for timer in [t for t in self._timers if t[0] <= now]:
+            self._timers.remove(timer)
+            timer[1](*timer[2])
+        motion = self.mount_motion
+        if motion is not None:
+            frac = min(1.0, (now - motion["t0"]) / motion["time"]) if motion["time"] > 0 else 1.0
+            if motion["abort"] and frac >= 0.5:
+                logger.info("park aborted mid-slew")
+                self.mount_motion = None
+                self.gstat = 7
+                self._update(MOUNT, "TELESCOPE_PARK", state="Alert", PARK=False, UNPARK=True)
+            else:
+                ((dec0, (alt0, az0)), (dec1, (alt1, az1))) = (motion["from"], motion["to"])
+                self.dec = dec0 + (dec1 - dec0) * frac
+                self.altaz = (alt0 + (alt1 - alt0) * frac, az0 + (az1 - az0) * frac)
+                self._update(MOUNT, "EQUATORIAL_EOD_COORD", state="Busy" if frac < 1 else "Ok",
+                             DEC=round(self.dec, 4))
+                if frac >= 1:
+                    self.mount_motion = None
+                    if motion["kind"] == "park":
+                        self.gstat = 5
+                        self.parked_at = now
+                        self._update(MOUNT, "TELESCOPE_PARK", state="Ok")
+                    else:
+                        self.gstat = 0
+                        self.tracking = True
+                        self._update(MOUNT, "TELESCOPE_TRACK_STATE", state="Ok", TRACK_ON=True, TRACK_OFF=False)
+                        self._update(MOUNT, "TELESCOPE_PARK", state="Ok")
+        roof = self.roof_motion
+        if roof is not None and now - roof["t0"] >= self.roof_time:
+            self.roof_motion = None
+            self.roof_closed = roof["close"]
+            if roof["close"]:
+                self.roof_closed_at = now
+            if self.connected[DOME] and (DOME, "DOME_PARK") not in self.server.props:
+                self._define(DOME)
+            self._update(DOME, "DOME_PARK", state="Ok", PARK=self.roof_closed, UNPARK=not self.roof_closed)
+        self._step_camera(now)
+
+    def _step_camera(self, now):
+        if not self.connected[CAMERA]:
+            return
+        if (not self.cooler_on and self.cooler_off_at is not None and self.slope > 0 and self.setpoint is not None
+                and abs(self.temperature - self.setpoint) > self.threshold
+                and now - self.cooler_off_at >= self.ramp_reenable):
+            logger.info("temperature ramp re-enables the cooler")
+            self._set_cooler(True)
+        goal = max(self.setpoint, AMBIENT - MAX_DELTA) if self.cooler_on and self.setpoint is not None else AMBIENT
+        goal = min(goal, AMBIENT)
+        step = self.cool_rate * self.tick
+        self.temperature += max(-step, min(step, goal - self.temperature))
+        reached = self.setpoint is not None and abs(self.temperature - self.setpoint) <= self.threshold
+        self._update(CAMERA, "CCD_TEMPERATURE", state="Ok" if reached or not self.cooler_on else "Busy",
+                     CCD_TEMPERATURE_VALUE=round(self.temperature, 2))
+        self._update(CAMERA, "CCD_COOLER_POWER", CCD_COOLER_VALUE=self._power())
+
+    def _lx200_reply(self, command):
+        with self.lock:
+            if command == "Gstat":
+                return "{}#".format(self.gstat)
+            if command == "GA":
+                return _dms(self.altaz[0])
+            if command == "GZ":
+                return _dms(self.altaz[1], signed=False, width=3)
+            if command == "GD":
+                return _dms(self.dec)
+            if command == "GR":
+                return _dms(self.ra, signed=False)
+        return None             # U2 and the rest: no reply
+
+    # ---- test controls ----
+    def set_weather(self, status, station=1):
+        """Light STATION_STATUS_<station>: Idle, Ok, Busy or Alert."""
+        with self.lock:
+            self.weather[station - 1] = status
+            worst = max(self.weather, key=("Idle", "Ok", "Busy", "Alert").index)
+            self._update(WEATHER, "WEATHER_STATUS", state=worst, **{"STATION_STATUS_{}".format(station): status})
+
+    def disconnect(self, device):
+        """The driver disconnects: every property but CONNECTION is deleted."""
+        with self.lock:
+            self.connected[device] = False
+            for (dev, name) in [k for k in self.server.props if k[0] == device and k[1] != "CONNECTION"]:
+                self.server.delete(dev, name)
+            self.server.update(device, "CONNECTION", state="Idle", CONNECT=False, DISCONNECT=True)
+
+    def drop_clients(self):
+        self.server.drop_clients()
+
+    def write_config(self, path, base=PRODUCTION_CONFIG, host="127.0.0.1"):
+        """base (the production config) pointed at this fake: connections.indi_*
+        and indi.mount.lx200 host / port."""
+        with open(base) as f:
+            config = yaml.safe_load(f)
+        config["connections"] = {"indi_host": host, "indi_port": self.port}
+        config["indi"]["mount"]["lx200"].update({"host": host, "port": self.lx200_port})
+        with open(path, "w") as f:
+            yaml.safe_dump(config, f, default_flow_style=False, sort_keys=False)
+        return path
+
+    def stop(self):
+        self._stopped.set()
+        self.server.stop()
+        self.lx200.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="fake INDI server + 10Micron LX200 port for offline testing",
+                                     epilog=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1', help='listen address (default %(default)s)')
+    parser.add_argument('--port', type=int, default=7624, help='INDI port (default %(default)s)')
+    parser.add_argument('--lx200_port', type=int, default=3490, help='LX200 port (default %(default)s)')
+    parser.add_argument('--park_time', type=float, default=10, help='seconds a park slew takes (default %(default)s)')
+    parser.add_argument('--roof_time', type=float, default=20, help='seconds the roof moves (default %(default)s)')
+    parser.add_argument('--config_out', help='write the production config pointed at this fake here')
+    parser.add_argument('--debug', action='store_true', help='enable debug level verbosity')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format="%(asctime)s %(levelname)-8s %(name)s %(message)s")
+    fake = FakeObservatory(args.host, args.port, args.lx200_port, park_time=args.park_time,
+                           unpark_time=args.park_time / 2, roof_time=args.roof_time)
+    if args.config_out:
+        logger.info("config written to %s", fake.write_config(args.config_out, host=args.host))
+    logger.info("INDI on %s:%d, LX200 on %s:%d", args.host, fake.port, args.host, fake.lx200_port)
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 #!/bin/bash
 # Static checks (pyflakes, if installed) + unit tests for the observatory code.
-# No INDI / dbus / Mattermost needed (all mocked) - safe anywhere, including CI.
+# No INDI / dbus / Mattermost needed (mocked, or fake_observatory.py's simulated
+# INDI server and LX200 port on local ports) - safe anywhere, including CI.
 # Install the linter with:  sudo apt install python3-pyflakes
 set -e
 cd "$(dirname "$0")"
@@ -9,9 +10,10 @@ EKOS="$(cd .. && pwd)"
 if python3 -c "import pyflakes" 2>/dev/null; then
     echo "== pyflakes =="
     python3 -m pyflakes \
-        "$EKOS/observatorylib.py" "$EKOS/ekos_sentinel.py" "$EKOS/ekos_cli.py" \
+        "$EKOS/observatorylib.py" "$EKOS/lx200.py" "$EKOS/ekos_sentinel.py" "$EKOS/ekos_cli.py" \
         "$EKOS/observatory-open" "$EKOS/observatory-close" \
-        test_reporter.py test_sentinel.py test_observatorylib.py
+        test_reporter.py test_sentinel.py test_observatorylib.py test_indi_client.py test_lx200.py \
+        fake_observatory.py test_end_to_end.py
     echo "pyflakes clean"
 else
     echo "(pyflakes not installed - skipping static checks; sudo apt install python3-pyflakes)"
@@ -22,6 +24,12 @@ python3 test_reporter.py
 echo
 python3 test_observatorylib.py
 echo
+python3 test_indi_client.py
+echo
+python3 test_lx200.py
+echo
 python3 test_sentinel.py
 echo
+python3 test_end_to_end.py
+echo
 echo "all checks passed"
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""End-to-end test: the real Observatory (IndiClient + LX200 session) and
+ekos_sentinel.evaluate_cycle against fake_observatory's INDI server and LX200
+port on local ports - nothing of observatorylib stubbed. Covers the failsafe
+close after the weather debounce, the fan guard against the ramp loop,
+open / unpark, retries under injected faults (park aborted mid-slew, dome
+refusal, DOME_PARK vanishing while it moves), a device reconnect, an INDI
+connection drop, a mute mount and INDI down - plus state_snapshot, sentinel
+cycle and completion-lag benchmarks. Only dbus is stubbed; the lease and
+safety hold live in a temporary XDG_RUNTIME_DIR. Run: python3 test_end_to_end.py"""
+import os, sys, types, logging, tempfile, time
+TMP = tempfile.mkdtemp(prefix="observatory-e2e-")
+os.environ["XDG_RUNTIME_DIR"] = TMP                     # lease / safety hold / marker
+EKOS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.modules["dbus"] = types.ModuleType("dbus")          # stub so import works w/o dbus
+_ekos_cli = types.ModuleType("ekos_cli")
+class _StubDbus: pass
+_ekos_cli.EkosDbus = _StubDbus
+sys.modules["ekos_cli"] = _ekos_cli
+sys.path.insert(0, EKOS)
+import observatorylib as obs
+import ekos_sentinel as S
+import fake_observatory as F
+logging.basicConfig(level=logging.CRITICAL)
+
+PASS = [0]; FAIL = [0]
+def check(name, cond):
+    print(("PASS " if cond else "FAIL ") + name); (PASS if cond else FAIL)[0] += 1
+
+class Reports:
+    def __init__(self): self.sent = []
+    def report(self, severity, title, body=None, state=None): self.sent.append((severity, title)); return True
+    def titles(self): return [t for (_, t) in self.sent]
+class FakeDbus:
+    def __init__(self): self.calls = []
+    def stop_scheduler(self): self.calls.append("stop_scheduler")
+    def abort_all_operations(self): self.calls.append("abort_all_operations"); return True
+
+fake = F.FakeObservatory(park_time=1.0, unpark_time=0.5, roof_time=1.0, connect_time=0.2, cool_rate=10,
+                         ramp_reenable=0.5)
+cfg = obs.ObservatoryConfig(fake.write_config(os.path.join(TMP, "fake.yaml")))
+reports = Reports()
+o = obs.Observatory("ignored", cfg, reporter=reports, name="e2e")
+(o.mount_park_timeout, o.roof_close_timeout, o.retry_delay, o.max_retries) = (2, 2, 0.1, 3)
+o.lx200.timeout = 0.5
+def until(predicate, timeout=5):
+    """Wait for the client to see a change made on the fake side."""
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return predicate()
+def commands(name):
+    return [c for c in fake.commands if c[1] == name]
+def st0():
+    return {"unsafe_count": 0, "hold_set": False, "indi_down": False, "roof_unknown_since": None,
+            "cooler_on_since": None, "shutdown_complete_prev": False, "shutdown_observing_reported": False,
+            "shutdown_observed_reported": False, "startup_prev_roof_closed": False,
+            "startup_observing_reported": True, "startup_observed_reported": True}
+
+# ---- state over the INDI connection and the LX200 session ----
+check("observing: state_snapshot", o.state_snapshot() == {
+    "mount_parked": False, "roof_closed": False, "weather_safe": True, "cooler_power": 0.0,
+    "alt": 45.0, "az": 180.0})
+check("one INDI connection, one LX200 session", fake.server.accepted == 1 and len(fake.lx200.conns) == 1)
+check("sentinel: safe, roof open - no hold", S.read_weather(o, cfg) == (True, True)
+      and not S.evaluate_cycle(o, FakeDbus(), cfg, st0()) and not obs.is_safety_hold())
+
+# ---- weather turns: debounce, then the failsafe closes ----
+fake.set_weather("Alert")
+seen = until(lambda: o.is_weather_safe() is False)
+(dbus, st) = (FakeDbus(), st0())
+S.evaluate_cycle(o, dbus, cfg, st)
+check("unsafe: hold set at once, debouncing", seen and obs.is_safety_hold() and st["unsafe_count"] == 1
+      and not fake.roof_closed and not commands("TELESCOPE_PARK"))
+S.evaluate_cycle(o, dbus, cfg, st)
+S.evaluate_cycle(o, dbus, cfg, st)
+check("failsafe: Ekos stopped, mount parked, roof closed", dbus.calls == ["stop_scheduler", "abort_all_operations"]
+      and fake.gstat == 5 and fake.roof_closed and o.is_parked() and o.is_roof_closed() is True)
+check("failsafe: camera warming at the warm setpoint", fake.setpoint == 40 and fake.slope == 5)
+check("failsafe: reported complete", "FAILSAFE complete: mount parked, roof closed, camera warming"
+      in reports.titles() and obs.read_lease() is None)
+
+# ---- the fan guard, and the ramp loop it has to beat ----
+fake.set_weather("Ok")
+seen = until(lambda: o.is_weather_safe() is True)
+st = st0()
+S.evaluate_cycle(o, FakeDbus(), cfg, st)
+armed = st["cooler_on_since"] is not None
+check("safe again: hold cleared, cooler on -> guard armed", seen and not obs.is_safety_hold() and armed)
+o.indi_set("ZWO CCD ASI2600MM Pro.CCD_COOLER.COOLER_OFF", "On")
+off = until(lambda: o.cooler_is_on() is False)
+check("bare COOLER_OFF: the ramp loop turns it back on", off and until(lambda: o.cooler_is_on() is True))
+if armed:
+    st["cooler_on_since"] -= cfg.get("sequence.warm_timeout") + 1
+S.evaluate_cycle(o, FakeDbus(), cfg, st)
+off = until(lambda: fake.slope == 0 and o.cooler_is_on() is False)
+time.sleep(2 * fake.ramp_reenable)
+check("guard elapsed: cooler_off zeroes the ramp first, stays off", armed and off and st["cooler_on_since"] is None
+      and fake.slope == 0 and o.cooler_is_on() is False and o.cooler_power() == 0.0)
+
+# ---- open, and the close precondition ----
+opened = o.open_roof() and o.unpark_mount()
+check("open roof, unpark", opened and until(lambda: fake.gstat == 0 and fake.tracking) and not fake.roof_closed)
+n = len(commands("DOME_PARK"))
+check("close refused over an unparked mount (no dome command)", not o.close_roof()
+      and len(commands("DOME_PARK")) == n)
+
+# ---- faults ----
+fake.park_aborts = 1
+n = len(commands("TELESCOPE_PARK"))
+check("park aborted mid-slew: re-issued, parked", o.park_mount() and o.is_parked()
+      and len(commands("TELESCOPE_PARK")) - n == 2)
+fake.dome_refusals = 1
+n = len(commands("DOME_PARK"))
+check("dome refuses once: re-issued, closed", o.close_roof() and fake.roof_closed
+      and len(commands("DOME_PARK")) - n == 2)
+fake.dome_vanishes = True
+n = len(commands("DOME_PARK"))
+t0 = time.monotonic()
+opened = o.open_roof()
+check("DOME_PARK gone while moving: waited out, one command", opened and not fake.roof_closed
+      and len(commands("DOME_PARK")) - n == 1 and time.monotonic() - t0 < 2)
+fake.dome_vanishes = False
+fake.disconnect(F.DOME)
+check("dome driver disconnected: roof unknown", until(lambda: o.is_device_connected(F.DOME) is False)
+      and o.is_roof_closed() is None)
+check("ensure_devices_connected reconnects it", o.ensure_devices_connected()
+      and o.is_roof_closed() is False and ("Dome Scripting Gateway", "CONNECTION", {"CONNECT": "On"})
+      in fake.commands)
+o.indi.RECONNECT = 0.2
+fake.drop_clients()
+check("INDI connection dropped: reconnected on the next read", until(lambda: not o.indi.connected)
+      and o.indi_get("10micron.TELESCOPE_PARK.PARK") == "On" and fake.server.accepted == 2)
+fake.lx200_mute = True
+t0 = time.monotonic()
+check("mount does not answer: alt/az None after the timeout", o.mount_altaz() == (None, None)
+      and time.monotonic() - t0 < 1.0)
+fake.lx200_mute = False
+check("and back on the next query", o.mount_altaz() == (5.0, 0.0) and o._lx200_parked())
+
+# ---- benchmarks ----
+N = 200
+t0 = time.monotonic()
+for i in range(N):
+    snap = o.state_snapshot()
+snapshot_ms = (time.monotonic() - t0) * 1000 / N
+st = st0()
+t0 = time.monotonic()
+for i in range(N):
+    S.evaluate_cycle(o, FakeDbus(), cfg, st)
+cycle_ms = (time.monotonic() - t0) * 1000 / N
+closed = o.close_roof()
+roof_lag = time.monotonic() - fake.roof_closed_at
+print("  state_snapshot {:.2f} ms, sentinel cycle {:.2f} ms, roof close seen {:.1f} ms after it is published".format(
+    snapshot_ms, cycle_ms, roof_lag * 1000))
+check("a snapshot / cycle takes milliseconds", snapshot_ms < 20 and cycle_ms < 20)
+check("completion seen as it is published", closed and roof_lag < 0.1)
+
+# ---- INDI down ----
+fake.stop()
+o.indi.close()
+o.indi.RECONNECT = 60
+st = st0()
+S.evaluate_cycle(o, FakeDbus(), cfg, st)
+check("INDI down: reported once, no action (subprocess fallback fails cleanly)",
+      st["indi_down"] and reports.titles()[-1] == "INDI unreachable - sentinel cannot read observatory state")
+
+print("\n{} passed, {} failed".format(PASS[0], FAIL[0]))
+sys.exit(1 if FAIL[0] else 0)
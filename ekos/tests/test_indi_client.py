@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""Unit test: observatorylib.IndiClient against a scripted INDI server on a
+local port - the property table built from def*Vector, kept current by
+set*Vector / delProperty, the indi_getprop conventions (None for undefined /
+deleted / write-only without -w, _STATE), new*Vector writes like indi_setprop,
+batch reads (one table view, or one indi_getprop), the subprocess fallback
+while the connection is down, reconnect, waits woken by the published
+property - plus read and wait benchmarks. No INDI / Mattermost needed. Run: python3 test_indi_client.py"""
+import os, sys, logging, socket, threading, time
+EKOS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, EKOS)
+import observatorylib as obs
+logging.basicConfig(level=logging.CRITICAL)
+
+PASS = [0]; FAIL = [0]
+def check(name, cond):
+    print(("PASS " if cond else "FAIL ") + name); (PASS if cond else FAIL)[0] += 1
+
+DUMP = b"""<defSwitchVector device="10micron" name="TELESCOPE_PARK" state="Ok" perm="rw" rule="OneOfMany">
+  <defSwitch name="PARK">
+On
+  </defSwitch>
+  <defSwitch name="UNPARK">Off</defSwitch>
+</defSwitchVector>
+<defNumberVector device="10micron" name="EQUATORIAL_EOD_COORD" state="Idle" perm="rw">
+  <defNumber name="RA" format="%010.6m">2.5</defNumber><defNumber name="DEC" format="%010.6m">39.0001</defNumber>
+</defNumberVector>
+<defTextVector device="Weather Meta" name="WEATHER_STATUS" state="Ok" perm="ro">
+  <defText name="STATION_STATUS_1">Ok</defText>
+</defTextVector>
+<defSwitchVector device="ZWO CCD ASI2600MM Pro" name="CCD_COOLER" state="Idle" perm="wo" rule="OneOfMany">
+  <defSwitch name="COOLER_ON">Off</defSwitch><defSwitch name="COOLER_OFF">On</defSwitch>
+</defSwitchVector>
+<defSwitchVector device="Dome Scripting Gateway" name="DOME_PARK" state="Idle" perm="rw" rule="OneOfMany">
+  <defSwitch name="PARK">Off</defSwitch><defSwitch name="UNPARK">On</defSwitch>
+</defSwitchVector>
+<message device="10micron" message="hello &amp; welcome"/>
+"""
+
+class ScriptedServer:
+    """Accepts connections, answers getProperties with DUMP, records what the
+    client sends, and pushes whatever the test hands to send()."""
+    def __init__(self):
+        self.listener = socket.socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(4)
+        self.port = self.listener.getsockname()[1]
+        self.received = b""
+        self.accepted = 0
+        self.conn = None
+        threading.Thread(target=self._serve, daemon=True).start()
+    def _serve(self):
+        while True:
+            try:
+                (conn, _) = self.listener.accept()
+            except OSError:
+                return          # stop()ped
+            self.accepted += 1
+            self.conn = conn
+            while b"getProperties" not in self.received:
+                self.received += conn.recv(4096)
+            conn.sendall(DUMP[:200]); time.sleep(0.05); conn.sendall(DUMP[200:])   # split mid-element
+            while True:
+                data = conn.recv(4096)
+                if not data:
+                    break
+                self.received += data
+    def send(self, data):
+        self.conn.sendall(data); time.sleep(0.05)
+    def drop(self):
+        self.conn.shutdown(socket.SHUT_RDWR); self.conn.close(); time.sleep(0.1)
+    def stop(self):
+        self.listener.shutdown(socket.SHUT_RDWR); self.listener.close()
+
+server = ScriptedServer()
+client = obs.IndiClient("127.0.0.1", server.port, timeout=2)
+check("connects once", client.connect() and client.connect() and server.accepted == 1)
+
+# ---- reads ----
+check("switch / number / text read as indi_getprop -1 prints them",
+      client.get("10micron.TELESCOPE_PARK.PARK") == "On" and client.get("10micron.EQUATORIAL_EOD_COORD.DEC") == "39.0001"
+      and client.get("Weather Meta.WEATHER_STATUS.STATION_STATUS_1") == "Ok")
+check("_STATE is the property state", client.get("10micron.TELESCOPE_PARK._STATE") == "Ok")
+check("write-only hidden unless write_only", client.get("ZWO CCD ASI2600MM Pro.CCD_COOLER.COOLER_ON") is None
+      and client.get("ZWO CCD ASI2600MM Pro.CCD_COOLER.COOLER_ON", write_only=True) == "Off")
+t0 = time.monotonic()
+check("undefined property / element / malformed spec: None",
+      client.get("10micron.NO_SUCH.X") is None and client.get("10micron.TELESCOPE_PARK.NOPE") is None
+      and client.get("nodots") is None and time.monotonic() - t0 < 1.0)
+
+# ---- the table follows the stream ----
+server.send(b'<setNumberVector device="10micron" name="EQUATORIAL_EOD_COORD" state="Busy">'
+            b'<oneNumber name="DEC">12.5</oneNumber></setNumberVector>')
+check("set*Vector updates value and state", client.get("10micron.EQUATORIAL_EOD_COORD.DEC") == "12.5"
+      and client.get("10micron.EQUATORIAL_EOD_COORD.RA") == "2.5"
+      and client.get("10micron.EQUATORIAL_EOD_COORD._STATE") == "Busy")
+server.send(b'<delProperty device="10micron" name="TELESCOPE_PARK"/>')
+check("delProperty of a property: None (in transition)", client.get("10micron.TELESCOPE_PARK.PARK") is None
+      and client.get("10micron.EQUATORIAL_EOD_COORD.DEC") == "12.5")
+server.send(b'<defSwitchVector device="10micron" name="TELESCOPE_PARK" state="Busy" perm="rw" rule="OneOfMany">'
+            b'<defSwitch name="PARK">Off</defSwitch><defSwitch name="UNPARK">On</defSwitch></defSwitchVector>')
+check("redefined", client.get("10micron.TELESCOPE_PARK.PARK") == "Off")
+
+# ---- writes ----
+server.received = b""
+ok = client.set("10micron.TELESCOPE_PARK.PARK", "On")
+time.sleep(0.05)
+check("switch write: just that member", ok and server.received.strip() ==
+      b'<newSwitchVector device="10micron" name="TELESCOPE_PARK"><oneSwitch name="PARK">On</oneSwitch></newSwitchVector>')
+server.received = b""
+client.set("10micron.EQUATORIAL_EOD_COORD.DEC", 39)
+time.sleep(0.05)
+check("number write: all members, others current", b'<oneNumber name="RA">2.5</oneNumber>' in server.received
+      and b'<oneNumber name="DEC">39</oneNumber>' in server.received)
+server.received = b""
+client.set("10micron.EQUATORIAL_EOD_COORD.RA", 3)
+time.sleep(0.05)
+check("back-to-back writes: the unpublished one is kept", b'<oneNumber name="RA">3</oneNumber>' in server.received
+      and b'<oneNumber name="DEC">39</oneNumber>' in server.received
+      and client.get("10micron.EQUATORIAL_EOD_COORD.DEC") == "12.5")
+check("read-only / undefined not written", not client.set("Weather Meta.WEATHER_STATUS.STATION_STATUS_1", "Alert")
+      and not client.set("10micron.NO_SUCH.X", "On"))
+
+# ---- Observatory: native path, fallback, reconnect ----
+cfg = obs.ObservatoryConfig(os.path.join(EKOS, "ekos_sentinel_config_production.yaml"))
+o = obs.Observatory("127.0.0.1", cfg, name="test")
+o.indi = client
+RUNS = []
+o._run = lambda cmd: RUNS.append(cmd)
+check("Observatory reads over the connection", o.indi_get("10micron.EQUATORIAL_EOD_COORD.DEC") == "12.5"
+      and o.cooler_is_on() is False and not RUNS)
+# ---- batch reads ----
+PARKED = ["10micron.TELESCOPE_PARK.PARK", "10micron.EQUATORIAL_EOD_COORD.DEC", "10micron.NO_SUCH.X"]
+check("get_many: one view, None for the missing", client.get_many(PARKED) == {
+    PARKED[0]: "Off", PARKED[1]: "12.5", PARKED[2]: None})
+check("indi_get_many over the connection", o.indi_get_many(PARKED) == {
+    PARKED[0]: "Off", PARKED[1]: "12.5", PARKED[2]: None} and not RUNS)
+
+# ---- event-driven waits ----
+DOME = "Dome Scripting Gateway.DOME_PARK.PARK"
+def publish_park_after(delay, value="On"):
+    def publish():
+        time.sleep(delay)
+        published.append(time.monotonic())
+        server.send('<setSwitchVector device="Dome Scripting Gateway" name="DOME_PARK" state="Ok">'
+                    '<oneSwitch name="PARK">{}</oneSwitch></setSwitchVector>'.format(value).encode())
+    published = []
+    threading.Thread(target=publish, daemon=True).start()
+    return published
+published = publish_park_after(0.3)
+ok = o._wait_until(lambda: o.is_roof_closed() is True, 5, watch=[DOME])
+event_lag = time.monotonic() - published[0] if published else float("inf")
+check("returns as soon as DOME_PARK.PARK=On is published", ok and event_lag < 0.1)
+stamp = client.stamp([DOME])
+server.send(b'<setNumberVector device="10micron" name="EQUATORIAL_EOD_COORD" state="Busy">'
+            b'<oneNumber name="DEC">13</oneNumber></setNumberVector>')
+check("other properties do not end the wait", not client.wait_change([DOME], stamp, 0.3)
+      and client.get("10micron.EQUATORIAL_EOD_COORD.DEC") == "13")
+o.WATCH_RECHECK = 0.2
+FLAG = []
+threading.Timer(0.3, FLAG.append, [1]).start()
+t0 = time.monotonic()
+check("not-INDI state re-checked every WATCH_RECHECK", o._wait_until(lambda: bool(FLAG), 5, watch=[DOME])
+      and time.monotonic() - t0 < 0.6)
+t0 = time.monotonic()
+check("timeout honoured", not o._wait_until(lambda: False, 0.5, watch=[DOME]) and time.monotonic() - t0 < 0.8)
+publish_park_after(0.0, "Off")
+check("DOME_PARK.PARK=Off seen before the polling case", o._wait_until(lambda: client.get(DOME) == "Off", 5,
+                                                                        watch=[DOME]))
+(indi, o.indi) = (o.indi, None)
+published = publish_park_after(0.3)
+ok = o._wait_until(lambda: client.get(DOME) == "On", 5, watch=[DOME])
+poll_lag = time.monotonic() - published[0] if published else float("inf")
+o.indi = indi
+check("no connection: polls once/sec", ok and 0.3 < poll_lag < 1.2)
+print("  completion seen {:.1f} ms after publish (event) vs {:.0f} ms (1 Hz poll)".format(
+    event_lag * 1000, poll_lag * 1000))
+
+server.drop()
+check("connection lost: table emptied", not client.connected and client.get("10micron.EQUATORIAL_EOD_COORD.DEC") is None
+      and client.wait_change([DOME], stamp, 0) is True)
+client.RECONNECT = 0.3
+server.stop()
+check("server down: indi_getprop / indi_setprop fallback", o.indi_get("10micron.TELESCOPE_PARK.PARK") is None
+      and not o.indi_set("10micron.TELESCOPE_PARK.PARK", "On") and len(RUNS) == 2
+      and "indi_getprop -h 127.0.0.1 -p 7624 -1 '10micron.TELESCOPE_PARK.PARK'" == RUNS[0])
+class Ran:
+    stdout = "10micron.TELESCOPE_PARK.PARK=On\n10micron.EQUATORIAL_EOD_COORD.DEC=39.0001\n"
+o._run = lambda cmd, check=True: RUNS.append((cmd, check)) or Ran
+check("batch fallback: one indi_getprop for all, missing ones None", o.indi_get_many(PARKED) == {
+    PARKED[0]: "On", PARKED[1]: "39.0001", PARKED[2]: None} and RUNS[-1] == (
+    "indi_getprop -h 127.0.0.1 -p 7624 10micron.TELESCOPE_PARK.PARK 10micron.EQUATORIAL_EOD_COORD.DEC"
+    " 10micron.NO_SUCH.X", False))
+server = ScriptedServer()
+client.port = server.port
+time.sleep(0.3)
+check("reconnects after RECONNECT", o.indi_get("10micron.TELESCOPE_PARK.PARK") == "On" and server.accepted == 1)
+
+# ---- benchmark: reads from the table (indi_getprop: a fork + connect + dump each) ----
+N = 20000
+t0 = time.time()
+for i in range(N):
+    o.indi_get("10micron.EQUATORIAL_EOD_COORD.DEC")
+rate = N / (time.time() - t0)
+print("  {:.0f} property reads/s".format(rate))
+check("a read costs microseconds", rate > 10000)
+
+print("\n{} passed, {} failed".format(PASS[0], FAIL[0]))
+sys.exit(1 if FAIL[0] else 0)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Unit test: lx200.LX200 against a fake mount on a local port - U2 sent once
+per connection, pipelined queries answered in order (replies split across
+packets), transparent reconnect after the mount hangs up or the session sat
+idle, timeout raised - plus a Gstat latency benchmark against the one-shot
+query it replaced. Run: python3 test_lx200.py"""
+import os, re, sys, logging, socket, threading, time
+EKOS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, EKOS)
+import lx200
+logging.basicConfig(level=logging.CRITICAL)
+
+PASS = [0]; FAIL = [0]
+def check(name, cond):
+    print(("PASS " if cond else "FAIL ") + name); (PASS if cond else FAIL)[0] += 1
+
+REPLIES = {"Gstat": "5#", "GA": "+45:00:00.0#", "GZ": "180:30:00.0#", "GR": "12:34:56.78#", "GD": "+39:00:00.0#"}
+class FakeMount:
+    """Answers LX200 queries per connection; SESSIONS lists each connection's
+    commands. split: send replies a byte at a time; mute: never answer."""
+    def __init__(self):
+        self.listener = socket.socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(4)
+        self.port = self.listener.getsockname()[1]
+        self.sessions = []
+        self.conns = []
+        self.split = False
+        self.mute = False
+        threading.Thread(target=self._accept, daemon=True).start()
+    def _accept(self):
+        while True:
+            (conn, _) = self.listener.accept()
+            self.conns.append(conn)
+            threading.Thread(target=self._serve, args=(conn, []), daemon=True).start()
+    def _serve(self, conn, session):
+        self.sessions.append(session)
+        buf = ""
+        while True:
+            try:
+                data = conn.recv(128)
+            except OSError:
+                return
+            if not data:
+                return
+            buf += data.decode()
+            for m in re.finditer(r":(\w+)#", buf):
+                session.append(m.group(1))
+                reply = REPLIES.get(m.group(1), "").encode()
+                if self.mute:
+                    continue
+                for i in range(len(reply)) if self.split else [None]:
+                    conn.sendall(reply if i is None else reply[i:i + 1])
+                    if i is not None:
+                        time.sleep(0.002)
+            buf = buf[buf.rfind("#") + 1:]
+    def hang_up(self):
+        for c in self.conns:
+            c.shutdown(socket.SHUT_RDWR); c.close()
+        del self.conns[:]
+        time.sleep(0.05)
+
+mount = FakeMount()
+client = lx200.LX200("127.0.0.1", mount.port, timeout=1)
+check("one query", client.query("#:Gstat#") == "5#" and client.is_parked())
+check("pipelined, in order", client.query_many(["#:Gstat#", "#:GA#", "#:GZ#", "#:GR#", "#:GD#"]) == [
+    "5#", "+45:00:00.0#", "180:30:00.0#", "12:34:56.78#", "+39:00:00.0#"])
+time.sleep(0.05)
+check("one connection, U2 once", client.connects == 1 and mount.sessions == [
+    ["U2", "Gstat", "Gstat", "Gstat", "GA", "GZ", "GR", "GD"]])
+mount.split = True
+check("replies split across packets", client.query_many(["#:GA#", "#:GZ#"]) == ["+45:00:00.0#", "180:30:00.0#"])
+mount.split = False
+mount.hang_up()
+check("mount hung up: reconnected, resent", client.query("#:GZ#") == "180:30:00.0#" and client.connects == 2)
+time.sleep(0.05)
+check("U2 again on the new connection", mount.sessions[-1] == ["U2", "GZ"])
+(max_idle, lx200.MAX_IDLE) = (lx200.MAX_IDLE, 0)
+time.sleep(0.01)
+check("idle past MAX_IDLE: fresh connection", client.query("#:Gstat#") == "5#" and client.connects == 3)
+lx200.MAX_IDLE = max_idle
+mount.mute = True
+t0 = time.monotonic()
+try:
+    client.query("#:Gstat#")
+    timed_out = False
+except socket.timeout:
+    timed_out = True
+check("no answer: socket.timeout after the timeout, not retried",
+      timed_out and 0.9 < time.monotonic() - t0 < 1.5 and client.connects == 3)
+mount.mute = False
+check("next query reconnects", client.query("#:Gstat#") == "5#" and client.connects == 4)
+mount.listener.close()
+
+# ---- benchmark: Gstat, one-shot (as mount_lx200 / simple_netcat did) vs the session ----
+mount = FakeMount()
+def one_shot(command):
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.settimeout(5)
+    s.connect(("127.0.0.1", mount.port))
+    s.sendall(b"#:U2#")
+    time.sleep(0.1)
+    s.sendall(command.encode())
+    time.sleep(0.3)
+    resp = b""
+    while b"#" not in resp:
+        resp += s.recv(128)
+    s.close()
+    return resp.decode().strip()
+t0 = time.monotonic()
+before = one_shot("#:Gstat#")
+before_ms = (time.monotonic() - t0) * 1000
+client = lx200.LX200("127.0.0.1", mount.port)
+client.query("#:Gstat#")
+N = 200
+t0 = time.monotonic()
+for i in range(N):
+    client.query("#:Gstat#")
+after_ms = (time.monotonic() - t0) * 1000 / N
+print("  Gstat: one-shot {:.0f} ms, persistent session {:.2f} ms".format(before_ms, after_ms))
+check("a Gstat check takes milliseconds", before == "5#" and after_ms < 5)
+
+print("\n{} passed, {} failed".format(PASS[0], FAIL[0]))
+sys.exit(1 if FAIL[0] else 0)
@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 """Unit test for observatorylib tri-state device-connection logic and the
-lease-aware ensure_devices_connected. No INDI/dbus/MM needed - indi_get/set
-are stubbed and lease helpers monkey-patched. Run: python3 test_observatorylib.py"""
-import os, sys
+lease-aware ensure_devices_connected, and state_snapshot / is_parked /
+is_weather_safe reading in one batch (LX200 alt/az pipelined on the one
+session, against a local fake mount). No INDI/dbus/MM needed - indi_get/set are stubbed and lease
+helpers monkey-patched. Run: python3 test_observatorylib.py"""
+import os, re, sys, socket, threading
 EKOS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, EKOS)
 import observatorylib as obs
@@ -21,7 +23,7 @@ def _set(prop, val):
 o.indi_get = lambda p: _indi.get(p)
 o.indi_set = _set
 # Immediate-eval _wait_until (no real polling).
-o._wait_until = lambda pred, timeout: pred()
+o._wait_until = lambda pred, timeout, watch=(): pred()
 # Lease state monkey-patched at module level (read_lease + lease_is_fresh).
 _lease = {"val": None, "fresh": False}
 obs.read_lease     = lambda *a, **k: _lease["val"]
@@ -85,5 +87,48 @@ reset(); _indi[CONN] = "Off"
 check("ensure: state False -> reconnects (CONNECT=On sent)",
       o.ensure_devices_connected() is True and (CONN, "On") in _set_calls)
 
+# ---- state_snapshot: one batch read, one LX200 session ----
+BATCHES = []
+o.indi_get_many = lambda props, write_only=False: BATCHES.append(list(props)) or {p: _indi.get(p) for p in props}
+SESSIONS = []
+REPLIES = {"GA": "+45:00:00.0#", "GZ": "180:30:00.0#", "Gstat": "5#"}
+def fake_mount(listener):
+    while True:
+        (conn, _) = listener.accept()
+        SESSIONS.append([])
+        buf = ""
+        while True:
+            data = conn.recv(128)
+            if not data:
+                break
+            buf += data.decode()
+            while re.search(r":(\w+)#", buf):
+                m = re.search(r":(\w+)#", buf)
+                SESSIONS[-1].append(m.group(1))
+                conn.sendall(REPLIES.get(m.group(1), "").encode())
+                buf = buf[m.end():]
+        conn.close()
+listener = socket.socket()
+listener.bind(("127.0.0.1", 0)); listener.listen(2)
+threading.Thread(target=fake_mount, args=(listener,), daemon=True).start()
+o.lx200 = obs.lx200.LX200(*listener.getsockname())
+reset()
+_indi.update({"10micron.TELESCOPE_PARK.PARK": "On", "10micron.TELESCOPE_TRACK_STATE.TRACK_ON": "Off",
+              "10micron.EQUATORIAL_EOD_COORD.DEC": "39.2", "Dome Scripting Gateway.DOME_PARK.PARK": "On",
+              "Weather Meta.WEATHER_STATUS.STATION_STATUS_1": "Ok",
+              "ZWO CCD ASI2600MM Pro.CCD_COOLER_POWER.CCD_COOLER_VALUE": "12.5"})
+snap = o.state_snapshot()
+check("state_snapshot: readings", snap == {"mount_parked": True, "roof_closed": True, "weather_safe": True,
+                                           "cooler_power": 12.5, "alt": 45.0, "az": 180.5})
+check("state_snapshot: one batch read, one LX200 session for GA + GZ",
+      len(BATCHES) == 1 and len(BATCHES[0]) == 6 and SESSIONS == [["U2", "GA", "GZ"]])
+del BATCHES[:]
+_indi["10micron.EQUATORIAL_EOD_COORD.DEC"] = "30"
+check("is_parked / is_weather_safe: one batch each", o.is_parked() is False and o.is_weather_safe() is True
+      and [len(b) for b in BATCHES] == [3, 1])
+del _indi["10micron.TELESCOPE_PARK.PARK"]
+check("INDI park unreadable: LX200 Gstat on the same session", o.is_parked() is True
+      and SESSIONS == [["U2", "GA", "GZ", "Gstat"]])
+
 print("\n{} passed, {} failed".format(PASS[0], FAIL[0]))
 sys.exit(1 if FAIL[0] else 0)
@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+import argparse
 import atexit
 import json
 import threading
@@ -13,6 +14,21 @@ from datetime import datetime, timezone
 import requests
 from flask import Flask, jsonify, request, render_template
 
+# collector/wsgi_serve.py (Python 3.5 compatible) serves the API threaded;
+# without the collector checkout next to roof/ it is app.run() as before.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "collector"))
+try:
+    import wsgi_serve
+except ImportError:
+    wsgi_serve = None
+# ekos/lx200.py (Python 3.5 compatible): one persistent mount session, a
+# Gstat in milliseconds; without the ekos checkout, simple_netcat as before.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ekos"))
+try:
+    import lx200
+except ImportError:
+    lx200 = None
+
 if os.uname()[4].startswith("arm"):
     import wiringpi
 else:
@@ -42,8 +58,11 @@ ROOF_TRAVEL_TIMEOUT_S = 70   # measured open/close ~54 s in 2015; abort + alert
 
 MOUNT_IP = "192.168.100.73"
 MOUNT_PORT = 3490
+MOUNT = lx200.LX200(MOUNT_IP, MOUNT_PORT) if lx200 is not None else None
 
 FLASK_APP = Flask(__name__)
+# The API is served by several threads: one motor command at a time.
+MOTOR_API_LOCK = threading.Lock()
 
 logging.basicConfig(
     level=logging.DEBUG,
@@ -160,6 +179,17 @@ def simple_netcat(host, port, content, sleep):
     return response_ascii
 
 
+def mount_gstat():
+    """The mount's Gstat reply ('5#' == parked), None if it cannot be asked."""
+    if MOUNT is None:
+        return simple_netcat(MOUNT_IP, MOUNT_PORT, "#:Gstat#", 0.5)
+    try:
+        return MOUNT.query("#:Gstat#")
+    except OSError as e:
+        logging.warning('mount Gstat failed: {}'.format(e))
+        return None
+
+
 @FLASK_APP.route('/roof/sensors/open', methods=['GET'])
 def roof_sensors_open():
     """ api call """
@@ -177,6 +207,11 @@ def roof_sensors_close():
 @FLASK_APP.route('/roof/motor/stop', methods=['POST'])
 def roof_motor_stop():
     """ api call """
+    with MOTOR_API_LOCK:
+        return _roof_motor_stop()
+
+
+def _roof_motor_stop():
     global roof_closing
     global roof_opening
     global received_signal
@@ -195,6 +230,11 @@ def roof_motor_stop():
 @FLASK_APP.route('/roof/motor/close', methods=['POST'])
 def roof_motor_close():
     """ api call """
+    with MOTOR_API_LOCK:
+        return _roof_motor_close()
+
+
+def _roof_motor_close():
     global roof_closing
     global received_signal
     if read_roof_sensor_close():
@@ -203,7 +243,7 @@ def roof_motor_close():
         return jsonify({'roof_motor_close': False})
     else:
         # First check if the mount is parked in order to prevent the roof from knocking over the mount.
-        response = simple_netcat(MOUNT_IP, MOUNT_PORT, "#:Gstat#", 0.5)
+        response = mount_gstat()
         if response == '5#':
             logging.debug('mount is parked, continue to roof_motor_close')
             roof_closing = True
@@ -219,6 +259,11 @@ def roof_motor_close():
 @FLASK_APP.route('/roof/motor/open', methods=['POST'])
 def roof_motor_open():
     """ api call """
+    with MOTOR_API_LOCK:
+        return _roof_motor_open()
+
+
+def _roof_motor_open():
     global roof_opening
     global received_signal
     if read_roof_sensor_open():
@@ -479,8 +524,16 @@ def _exit_motor_stop():
 atexit.register(_exit_motor_stop)
 
 
+def _build_parser():
+    parser = argparse.ArgumentParser(description="roll-off roof controller: green button, motor relays and HTTP API")
+    if wsgi_serve is not None:
+        wsgi_serve.add_arguments(parser)
+    return parser
+
+
 def main():
     """ main """
+    args = _build_parser().parse_args()
     init()
 
     roof_control_thread = RoofControlThread()
@@ -488,9 +541,15 @@ def main():
     roof_control_thread.start()
 
     try:
-        FLASK_APP.run(debug=False, host='0.0.0.0')
-    except KeyboardInterrupt:
-        print(time.strftime("%Y%m%d_%H%M%S"), "KeyboardInterrupt caught in flask. Stop any running motor")
+        if wsgi_serve is not None:
+            wsgi_serve.serve_args(FLASK_APP, args)      # returns after SIGTERM / SIGINT
+        else:
+            try:
+                FLASK_APP.run(debug=False, host='0.0.0.0')
+            except KeyboardInterrupt:
+                pass
+    finally:
+        print(time.strftime("%Y%m%d_%H%M%S"), "Server stopped. Stop any running motor")
         write_roof_motor_stop()
 
 
@@ -1,26 +1,13 @@
 #!/usr/bin/env python3
-import socket
-import time
+import os
+import sys
 
+# ekos/lx200.py: reads the reply up to its '#' terminator, no fixed sleeps.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ekos"))
+import lx200
 
-def simple_netcat(host, port, content, sleep):
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.connect((host, port))
-    s.sendall(content.encode())
-    time.sleep(sleep)
-    s.shutdown(socket.SHUT_WR)
-    response_ascii = ''
-    while True:
-        data = s.recv(128)
-        if not data:
-            break
-        response_ascii += data.decode('ascii')
-        # print(repr(data))
-    s.close()
-    return response_ascii
 
-
-response = simple_netcat("192.168.100.73", 3490, "#:Gstat#", 0.5)
+response = lx200.LX200("192.168.100.73", 3490).query("#:Gstat#")
 print(response)
 if response == '5#':
     print("yes")